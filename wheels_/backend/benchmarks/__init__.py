@@ -0,0 +1,2 @@
+# Benchmarks del matchmaking de Wheels
+# Generador de cargas sintéticas de Bogotá y medición de los motores de match_rides_enhanced
@@ -0,0 +1,191 @@
+"""
+Benchmark de match_rides_enhanced sobre cargas sintéticas de Bogotá
+
+Uso (desde wheels_/backend):
+
+    python -m benchmarks.run
+    python -m benchmarks.run --api wheels_api --sizes 1000 10000 --variants vectorized:optimal road
+    python -m benchmarks.run --json resultados.json
+
+Cada variante (motor:asignación) se mide con un pool nuevo del mismo tamaño y semilla.
+El tiempo es el mejor de --repeat ejecuciones sin tracemalloc; la memoria pico se mide
+en una ejecución aparte con tracemalloc (incluye los arrays de NumPy). La clave de
+Google Maps se quita del entorno para no consumir cuota: los motores usan la distancia
+espacial de respaldo, salvo con --use-google.
+"""
+import argparse
+import gc
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+# Añadir el directorio backend al path para importar las APIs y el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.workload import generate_workload
+from wheels.pool_engine import IncrementalMatchEngine
+
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+
+# Variantes de match_rides_enhanced como (motor, asignación)
+VARIANTS = (
+    ("legacy", "first_fit"),
+    ("vectorized", "first_fit"),
+    ("vectorized", "greedy"),
+    ("vectorized", "optimal"),
+    ("vectorized", "nearest"),
+    ("indexed", "first_fit"),
+    ("incremental", "first_fit"),
+    ("road", "first_fit"),
+)
+
+# El motor iterativo compara pares fila a fila; por encima de este tamaño tarda minutos
+DEFAULT_MAX_LEGACY_ROWS = 10000
+
+def parse_variant(text):
+    """Convierte 'motor' o 'motor:asignación' en una tupla (motor, asignación)"""
+    engine, _, assignment = text.partition(":")
+    return engine, assignment or "first_fit"
+
+def load_api(name):
+    """Importa el módulo de la API (matchmaking_api o wheels_api)"""
+    return importlib.import_module(name)
+
+def run_variant(api, searching_pool_df, profiles_df, engine, assignment, max_distance_km=5):
+    """
+    Ejecuta una variante de match_rides_enhanced en frío
+
+    El motor incremental se reemplaza por uno nuevo para medir la carga completa del
+    pool y no una lectura sin cambios.
+
+    Returns:
+        list: Emparejamientos devueltos por la API
+    """
+    if engine == "incremental":
+        api.pool_engine = IncrementalMatchEngine(
+            time_window_minutes=api.MATCHMAKING_TIME_WINDOW_MINUTES, pickup_mode=api.MATCHMAKING_PICKUP_MODE,
+            assignment=assignment, **api.POOL_OPTIONS
+        )
+    return api.match_rides_enhanced(
+        searching_pool_df, profiles_df, max_distance_km=max_distance_km, engine=engine, assignment=assignment
+    )
+
+def measure(api, searching_pool_df, profiles_df, engine, assignment, repeat=1, track_memory=True):
+    """
+    Mide tiempo y memoria pico de una variante
+
+    Returns:
+        dict: {'seconds', 'rows_per_second', 'peak_mib', 'matches'}
+    """
+    best = None
+    matches = []
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        start = time.perf_counter()
+        matches = run_variant(api, searching_pool_df, profiles_df, engine, assignment)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak_mib = None
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run_variant(api, searching_pool_df, profiles_df, engine, assignment)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mib = peak / (1024 * 1024)
+
+    return {
+        "seconds": best,
+        "rows_per_second": len(searching_pool_df) / best if best > 0 else float("inf"),
+        "peak_mib": peak_mib,
+        "matches": len(matches),
+    }
+
+def run_benchmark(api_name="matchmaking_api", sizes=DEFAULT_SIZES, variants=VARIANTS, seed=0, repeat=1,
+                  track_memory=True, max_legacy_rows=DEFAULT_MAX_LEGACY_ROWS, report=None):
+    """
+    Mide cada variante de match_rides_enhanced en cada tamaño de pool
+
+    Args:
+        api_name (str): 'matchmaking_api' o 'wheels_api'
+        sizes (iterable): Registros del searching_pool por carga
+        variants (iterable): Tuplas (motor, asignación)
+        seed (int): Semilla del generador de cargas
+        repeat (int): Ejecuciones por medición de tiempo (se conserva la mejor)
+        track_memory (bool): Medir la memoria pico con tracemalloc
+        max_legacy_rows (int): Tamaño máximo para el motor 'legacy' (None sin límite)
+        report (callable): Se llama con cada resultado en cuanto está listo
+
+    Returns:
+        list: Un dict por (tamaño, variante) con api, rows, engine, assignment y las medidas
+    """
+    api = load_api(api_name)
+    results = []
+    for size in sizes:
+        profiles_df, searching_pool_df = generate_workload(size, seed=seed)
+        for engine, assignment in variants:
+            result = {"api": api_name, "rows": size, "engine": engine, "assignment": assignment}
+            if engine == "legacy" and max_legacy_rows is not None and size > max_legacy_rows:
+                result["skipped"] = f"legacy limitado a {max_legacy_rows} registros"
+            else:
+                result.update(measure(api, searching_pool_df, profiles_df, engine, assignment, repeat, track_memory))
+            results.append(result)
+            if report:
+                report(result)
+    return results
+
+def format_result(result):
+    """Línea de la tabla de resultados"""
+    variant = f"{result['engine']}:{result['assignment']}"
+    if "skipped" in result:
+        return f"{result['rows']:>7}  {variant:<22}  omitido ({result['skipped']})"
+    peak = "-" if result["peak_mib"] is None else f"{result['peak_mib']:9.1f}"
+    return (f"{result['rows']:>7}  {variant:<22}  {result['seconds']:9.3f}  "
+            f"{result['rows_per_second']:12.0f}  {peak:>9}  {result['matches']:>7}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de match_rides_enhanced con cargas sintéticas de Bogotá")
+    parser.add_argument("--api", default="matchmaking_api", choices=("matchmaking_api", "wheels_api"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--variants", nargs="+", type=parse_variant, default=list(VARIANTS),
+                        help="motor[:asignación], p. ej. vectorized:optimal")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="No medir la memoria pico")
+    parser.add_argument("--max-legacy-rows", type=int, default=DEFAULT_MAX_LEGACY_ROWS,
+                        help="Tamaño máximo para el motor legacy (0 sin límite)")
+    parser.add_argument("--use-google", action="store_true", help="Conservar GOOGLE_MAPS_API_KEY (consume cuota)")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs de la API")
+    args = parser.parse_args(argv)
+
+    # Los logs por conductor de la API dominarían el tiempo medido
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    # La API carga .env al importarse, así que la clave se quita después
+    load_api(args.api)
+    if not args.use_google:
+        os.environ.pop("GOOGLE_MAPS_API_KEY", None)
+
+    print(f"{'rows':>7}  {'variante':<22}  {'segundos':>9}  {'registros/s':>12}  {'pico MiB':>9}  {'matches':>7}")
+    results = run_benchmark(
+        args.api, args.sizes, args.variants, seed=args.seed, repeat=args.repeat,
+        track_memory=not args.no_memory, max_legacy_rows=args.max_legacy_rows or None,
+        report=lambda result: print(format_result(result), flush=True)
+    )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
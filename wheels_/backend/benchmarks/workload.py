@@ -0,0 +1,152 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Barrios de origen: (nombre, lat, lng, dispersión en grados, peso relativo de usuarios)
+NEIGHBORHOODS = (
+    ("Chapinero", 4.6486, -74.0628, 0.010, 3),
+    ("Usaquén", 4.6950, -74.0306, 0.012, 2),
+    ("Cedritos", 4.7240, -74.0420, 0.010, 2),
+    ("Suba", 4.7410, -74.0840, 0.018, 3),
+    ("Engativá", 4.7060, -74.1100, 0.015, 2),
+    ("Fontibón", 4.6780, -74.1440, 0.012, 1),
+    ("Modelia", 4.6700, -74.1200, 0.008, 1),
+    ("Salitre", 4.6550, -74.1050, 0.008, 1),
+    ("Teusaquillo", 4.6350, -74.0800, 0.008, 2),
+    ("Kennedy", 4.6290, -74.1530, 0.018, 2),
+    ("Bosa", 4.6180, -74.1900, 0.015, 1),
+    ("La Candelaria", 4.5980, -74.0760, 0.006, 1),
+    ("Ciudad Bolívar", 4.5600, -74.1500, 0.015, 1),
+)
+
+# Campus de destino: (coordenadas, variantes del texto como las escriben los usuarios, peso)
+CAMPUSES = (
+    ((4.6381, -74.0862), ("Universidad Nacional", "universidad nacional ", "Universidad  Nacional"), 4),
+    ((4.6015, -74.0661), ("Universidad de los Andes", "Universidad de Los Andes", "universidad de los andes"), 3),
+    ((4.6281, -74.0649), ("Pontificia Universidad Javeriana", "pontificia universidad javeriana"), 3),
+    ((4.6003, -74.0733), ("Universidad del Rosario", "Universidad del Rosario "), 1),
+    ((4.8614, -74.0332), ("Universidad de La Sabana", "Universidad de la Sabana"), 1),
+)
+
+# Estados del searching_pool y su frecuencia: NULL, vacío y 'searching' están activos
+STATUSES = ((None, 0.35), ("", 0.10), ("searching", 0.40), ("matched", 0.10), ("cancelled", 0.05))
+
+FIRST_NAMES = ("Ana", "Andrés", "Camila", "Carlos", "Daniela", "David", "Felipe", "Juliana",
+               "Laura", "María", "Mateo", "Natalia", "Santiago", "Sofía", "Valentina", "Juan")
+LAST_NAMES = ("Gómez", "Rodríguez", "Martínez", "López", "García", "Hernández", "Ramírez",
+              "Torres", "Díaz", "Vargas", "Castro", "Moreno", "Rojas", "Suárez")
+
+# Día de los viajes (hora de Bogotá, UTC-5)
+TRIP_DATE = "2025-10-01"
+
+def _weights(values):
+    """Normaliza pesos a probabilidades"""
+    weights = np.asarray(values, dtype=np.float64)
+    return weights / weights.sum()
+
+def _minutes_to_iso(minutes, offset="-05:00"):
+    """Minutos desde la medianoche a fecha ISO 8601 del día TRIP_DATE"""
+    minutes = int(minutes)
+    return f"{TRIP_DATE}T{minutes // 60:02d}:{minutes % 60:02d}:00{offset}"
+
+def generate_workload(n_rows, seed=0, driver_share=0.25, repost_share=0.15, missing_profile_share=0.05,
+                      missing_departure_share=0.2):
+    """
+    Genera un searching_pool y sus profiles sintéticos con la forma de producción
+
+    Los usuarios viven alrededor de barrios de Bogotá y viajan a unos pocos campus, con
+    el nombre del destino escrito de varias formas. Como en producción hay estados NULL
+    y vacíos además de 'searching', y algunos usuarios publican varias veces (correos
+    repetidos, el registro más reciente es el que cuenta). La misma semilla produce
+    exactamente los mismos DataFrames.
+
+    Args:
+        n_rows (int): Registros del searching_pool
+        seed (int): Semilla del generador
+        driver_share (float): Fracción de usuarios conductores
+        repost_share (float): Fracción de registros que repiten el correo de otro registro
+        missing_profile_share (float): Fracción de usuarios sin fila en profiles
+        missing_departure_share (float): Fracción de pasajeros sin hora de salida
+
+    Returns:
+        tuple: DataFrames (profiles_df, searching_pool_df)
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(1, n_rows - int(n_rows * repost_share))
+
+    # Usuarios: rol, barrio, campus, hora habitual de salida y nombre
+    is_driver = rng.random(n_users) < driver_share
+    home = rng.choice(len(NEIGHBORHOODS), size=n_users, p=_weights([n[4] for n in NEIGHBORHOODS]))
+    campus = rng.choice(len(CAMPUSES), size=n_users, p=_weights([c[2] for c in CAMPUSES]))
+    usual_departure = np.clip(rng.normal(7 * 60, 50, size=n_users), 5 * 60, 10 * 60)
+    emails = np.array([f"usuario{i}@unal.edu.co" for i in range(n_users)], dtype=object)
+
+    # Registros: cada usuario publica una vez y algunos vuelven a publicar
+    users = np.concatenate([np.arange(n_users), rng.integers(0, n_users, size=n_rows - n_users)])
+    users = users[rng.permutation(n_rows)]
+
+    center_lat = np.array([n[1] for n in NEIGHBORHOODS])[home[users]]
+    center_lng = np.array([n[2] for n in NEIGHBORHOODS])[home[users]]
+    spread = np.array([n[3] for n in NEIGHBORHOODS])[home[users]]
+    pickup_lat = np.round(center_lat + rng.normal(0, 1, n_rows) * spread, 6)
+    pickup_lng = np.round(center_lng + rng.normal(0, 1, n_rows) * spread, 6)
+
+    row_campus = campus[users]
+    destination = np.array([
+        CAMPUSES[c][1][v % len(CAMPUSES[c][1])]
+        for c, v in zip(row_campus.tolist(), rng.integers(0, 6, size=n_rows).tolist())
+    ], dtype=object)
+    dropoff_lat = np.array([c[0][0] for c in CAMPUSES])[row_campus]
+    dropoff_lng = np.array([c[0][1] for c in CAMPUSES])[row_campus]
+
+    role = np.where(is_driver[users], "conductor", "pasajero").astype(object)
+    seats = np.where(is_driver[users], rng.integers(1, 5, size=n_rows), 0).astype(object)
+    seats[~is_driver[users]] = None
+
+    departure = usual_departure[users] + rng.integers(-10, 11, size=n_rows)
+    trip_datetime = np.array([_minutes_to_iso(m) for m in departure.tolist()], dtype=object)
+    trip_datetime[(~is_driver[users]) & (rng.random(n_rows) < missing_departure_share)] = None
+
+    status_idx = rng.choice(len(STATUSES), size=n_rows, p=_weights([s[1] for s in STATUSES]))
+    status = np.array([STATUSES[i][0] for i in status_idx.tolist()], dtype=object)
+
+    # Publicaciones a lo largo de la mañana; el id crece con created_at como en Supabase
+    created_seconds = np.sort(rng.integers(0, 4 * 3600, size=n_rows))
+    created_at = [
+        f"{TRIP_DATE}T{5 + s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+        for s in created_seconds.tolist()
+    ]
+
+    names = [
+        f"{FIRST_NAMES[a]} {LAST_NAMES[b]}"
+        for a, b in zip(rng.integers(0, len(FIRST_NAMES), n_users).tolist(),
+                        rng.integers(0, len(LAST_NAMES), n_users).tolist())
+    ]
+
+    searching_pool_df = pd.DataFrame({
+        "id": np.arange(1, n_rows + 1),
+        "correo_usuario": emails[users],
+        "nombre_usuario": np.array(names, dtype=object)[users],
+        "tipo_de_usuario": role,
+        "pickup_lat": pickup_lat,
+        "pickup_lng": pickup_lng,
+        "pickup_address": [f"{NEIGHBORHOODS[h][0]}, Bogotá" for h in home[users].tolist()],
+        "destino": destination,
+        "dropoff_address": destination,
+        "dropoff_lat": dropoff_lat,
+        "dropoff_lng": dropoff_lng,
+        "available_seats": seats,
+        "price_per_seat": np.where(is_driver[users], rng.choice([4000, 5000, 6000, 8000], size=n_rows), 0),
+        "trip_datetime": trip_datetime,
+        "status": status,
+        "created_at": created_at,
+    })
+
+    with_profile = np.flatnonzero(rng.random(n_users) >= missing_profile_share)
+    profiles_df = pd.DataFrame({
+        "id": [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(len(with_profile))],
+        "email": emails[with_profile],
+        "full_name": np.array(names, dtype=object)[with_profile],
+    })
+    return profiles_df, searching_pool_df
@@ -10,80 +10,47 @@ Mejoras:
 import os
 import json
 import logging
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+import numpy as np
 import pandas as pd
 from supabase import create_client, Client
-from geopy.distance import geodesic
-import requests
+
+from wheels.compact_pool import CompactPool, match_compact_pool
+from wheels.sharded_matching import DEFAULT_MIN_PARALLEL_SIZE
+from wheels.time_windows import record_departure_minutes, time_compatible
+from wheels.distance_provider import DEFAULT_CACHE_PRECISION, build_distance_provider
+from wheels.travel_time import load_travel_time_estimator
+from wheels.async_distance import DEFAULT_MAX_CONCURRENCY
+from wheels.maps_client import get_maps_client
+from wheels.road_matching import DEFAULT_PREFILTER_SLACK, DEFAULT_ROAD_TOP_K, two_stage_match
+from wheels.pool_engine import IncrementalMatchEngine, fetch_user_neighborhood, record_seats
+from wheels.match_cache import MatchResultCache, pool_snapshot_version
+from wheels.match_store import MatchRefresher, MatchStore
+from wheels.profile_directory import profile_directory, profile_name_map
+from wheels.work_queue import DEFAULT_DEBOUNCE_SECONDS, CoalescingWorkQueue
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def calculate_google_maps_distance(origin, destination, api_key=None):
-    """Calcula distancia real usando Google Maps Distance Matrix API"""
-    try:
-        if not api_key:
-            api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-        
-        if not api_key:
-            logger.warning("⚠️ Google Maps API key no configurada, usando distancia espacial")
-            return calculate_haversine_distance(origin, destination)
-        
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-        params = {
-            'origins': f"{origin[0]},{origin[1]}",
-            'destinations': f"{destination[0]},{destination[1]}",
-            'key': api_key,
-            'units': 'metric',
-            'mode': 'driving',
-            'traffic_model': 'best_guess',
-            'departure_time': 'now'
-        }
-        
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if data['status'] != 'OK':
-            logger.error(f"❌ Error en Google Maps API: {data['status']}")
-            return calculate_haversine_distance(origin, destination)
-        
-        element = data['rows'][0]['elements'][0]
-        if element['status'] != 'OK':
-            logger.warning("⚠️ No se pudo calcular ruta, usando distancia espacial")
-            return calculate_haversine_distance(origin, destination)
-        
-        distance_km = element['distance']['value'] / 1000
-        duration = element['duration']['text']
-        duration_in_traffic = element.get('duration_in_traffic', {}).get('text', duration)
-        
-        return {
-            'distance': round(distance_km, 2),
-            'duration': duration_in_traffic,
-            'source': 'google_maps'
-        }
-        
-    except Exception as e:
-        logger.error(f"❌ Error al calcular distancia con Google Maps: {str(e)}")
-        return calculate_haversine_distance(origin, destination)
+def format_haversine_distance(distance_km, seconds=None):
+    """
+    Formatea una distancia espacial con el mismo esquema que DistanceBatch.result
 
-def calculate_haversine_distance(origin, destination):
-    """Fallback: Calcula distancia espacial usando fórmula de Haversine"""
-    try:
-        distance_km = geodesic(origin, destination).km
-        return {
-            'distance': round(distance_km, 2),
-            'duration': f"~{round(distance_km * 1.5)} min",
-            'source': 'haversine'
-        }
-    except:
-        return {
-            'distance': 999,
-            'duration': 'N/A',
-            'source': 'error'
-        }
+    Sin seconds la duración se estima solo con la distancia (travel_time_estimator.predict_km).
+    """
+    if seconds is None:
+        seconds = travel_time_estimator.predict_km(distance_km)
+    return {
+        'distance': round(float(distance_km), 2),
+        'duration': f"~{round(float(seconds) / 60)} min",
+        'duration_seconds': float(seconds),
+        'source': 'haversine'
+    }
 
 # Flask app setup
 app = Flask(__name__)
@@ -103,7 +70,13 @@ def health_check():
             "services": {
                 "supabase": "connected",
                 "google_maps": "available" if os.getenv('GOOGLE_MAPS_API_KEY') else "not_configured"
-            }
+            },
+            "match_cache": match_cache.stats(),
+            "distance_cache": distance_provider.stats(),
+            "matchmaking_queue": matchmaking_queue.stats(),
+            "match_store": match_store.stats(),
+            "maps_client": get_maps_client().stats(),
+            "travel_time": travel_time_estimator.stats()
         })
     except Exception as e:
         logger.error(f"❌ Health check failed: {str(e)}")
@@ -118,6 +91,113 @@ def health_check():
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://ozvjmkvmpxxviveniuwt.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "your-supabase-key")
 
+# Motor de matchmaking por defecto: 'legacy' (iterrows + Google Maps), 'vectorized' (matriz NumPy),
+# 'indexed' (NumPy + índice espacial de rejilla), 'incremental' (pool en memoria que solo
+# recalcula los conductores afectados por cada cambio del searching_pool) o 'road' (prefiltro
+# Haversine y confirmación por carretera en lotes de Distance Matrix, ver wheels.road_matching)
+MATCHMAKING_ENGINE = os.getenv("MATCHMAKING_ENGINE", "legacy")
+
+# Asignación de cupos: 'first_fit' (orden del pool), 'optimal' (asignación global de costo mínimo,
+# un conductor por pasajero), 'greedy' (asignación global voraz por distancia) o 'nearest' (cada
+# conductor toma sus pasajeros más cercanos; también en los motores incremental y road)
+MATCHMAKING_ASSIGNMENT = os.getenv("MATCHMAKING_ASSIGNMENT", "first_fit")
+
+# Procesos de trabajo de los motores vectorizados: con más de uno, los pools de al menos
+# MATCHMAKING_PARALLEL_MIN_POOL registros se reparten por destino entre procesos
+MATCHMAKING_WORKERS = int(os.getenv("MATCHMAKING_WORKERS", "1"))
+MATCHMAKING_PARALLEL_MIN_POOL = int(os.getenv("MATCHMAKING_PARALLEL_MIN_POOL", str(DEFAULT_MIN_PARALLEL_SIZE)))
+
+# Ventana de salida en minutos: solo se emparejan conductores y pasajeros cuyas horas de salida
+# (trip_datetime / hora_viaje) difieren a lo sumo en este valor. Vacío desactiva el filtro;
+# los registros sin hora de salida se emparejan con cualquier hora
+MATCHMAKING_TIME_WINDOW_MINUTES = (
+    float(os.getenv("MATCHMAKING_TIME_WINDOW_MINUTES")) if os.getenv("MATCHMAKING_TIME_WINDOW_MINUTES") else None
+)
+
+# Motor 'road': candidatos por conductor que pasan a Distance Matrix y fracción de la distancia
+# máxima usada como radio en línea recta del prefiltro (1.0 no descarta pares válidos)
+MATCHMAKING_ROAD_TOP_K = int(os.getenv("MATCHMAKING_ROAD_TOP_K", str(DEFAULT_ROAD_TOP_K)))
+MATCHMAKING_PREFILTER_SLACK = float(os.getenv("MATCHMAKING_PREFILTER_SLACK", str(DEFAULT_PREFILTER_SLACK)))
+
+# Modo de recogida: 'radius' (a menos de la distancia máxima del punto de partida del conductor)
+# o 'corridor' (también a lo largo del trayecto hasta dropoff_lat/dropoff_lng, ver wheels.corridor)
+MATCHMAKING_PICKUP_MODE = os.getenv("MATCHMAKING_PICKUP_MODE", "radius")
+
+# Segundos entre lecturas completas del searching_pool en el motor incremental
+# (entre ellas solo se leen las filas con updated_at posterior a la última lectura)
+POOL_FULL_RESYNC_SECONDS = int(os.getenv("POOL_FULL_RESYNC_SECONDS", "300"))
+
+# Consulta de /api/matches/<user_email>: 'targeted' (solo los registros cercanos al usuario)
+# o 'global' (matchmaking completo filtrado por correo). Solo los motores en línea recta de
+# TARGETED_ENGINES usan 'targeted': 'legacy' y 'road' confirman los pares por carretera con
+# distance_provider, y las asignaciones globales ('optimal', 'greedy') y el modo corredor
+# dependen de todo el pool; todos ellos siempre usan 'global'.
+USER_MATCHES_MODE = os.getenv("USER_MATCHES_MODE", "targeted")
+TARGETED_ENGINES = ("vectorized", "indexed", "incremental")
+
+# Caché de resultados de matchmaking indexada por la versión del searching_pool
+# (MATCH_CACHE_MAX_ENTRIES=0 la desactiva)
+match_cache = MatchResultCache(
+    max_entries=int(os.getenv("MATCH_CACHE_MAX_ENTRIES", "256")),
+    max_age_seconds=float(os.getenv("MATCH_CACHE_MAX_AGE_SECONDS", "300"))
+)
+
+# Tiempo de manejo de las estimaciones en línea recta: con TRAVEL_TIME_MODEL_PATH la tabla de
+# coeficientes ajustada con las observaciones de Google de la caché en disco
+# (python -m wheels.travel_time DISTANCE_CACHE_PATH salida.json); sin ella 1.5 min/km
+travel_time_estimator = load_travel_time_estimator()
+
+# Proveedor de distancias por carretera de los motores 'legacy' y 'road': 'google' (Distance
+# Matrix, con Haversine para los pares sin respuesta o sin clave), 'road_graph' (rutas sobre el
+# grafo vial local de ROAD_GRAPH_PATH, sin red ni costo) o 'haversine' (sin red).
+# Las consultas a Google pasan por una caché de dos niveles: DISTANCE_CACHE_MAX_ENTRIES pares en
+# memoria y, con DISTANCE_CACHE_PATH, un archivo SQLite que sobrevive a los reinicios. Los pares
+# duran DISTANCE_CACHE_MAX_AGE_SECONDS (el cache_expiry de config_google_maps) y las coordenadas
+# se redondean a DISTANCE_CACHE_PRECISION decimales (ver wheels.distance_provider). Los bloques
+# de Distance Matrix que faltan se piden en paralelo, hasta DISTANCE_CONCURRENCY a la vez
+distance_provider = build_distance_provider(
+    os.getenv("DISTANCE_PROVIDER", "google"),
+    cache_entries=int(os.getenv("DISTANCE_CACHE_MAX_ENTRIES", "10000")),
+    cache_max_age_seconds=float(os.getenv("DISTANCE_CACHE_MAX_AGE_SECONDS", "3600")),
+    cache_precision=int(os.getenv("DISTANCE_CACHE_PRECISION", str(DEFAULT_CACHE_PRECISION))),
+    cache_path=os.getenv("DISTANCE_CACHE_PATH") or None,
+    concurrency=int(os.getenv("DISTANCE_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY))),
+    graph_path=os.getenv("ROAD_GRAPH_PATH") or None,
+    travel_time=travel_time_estimator
+)
+
+# Pares descartados por cada etapa en el último cálculo del motor 'road'
+road_pipeline_stats = {}
+
+# Cola de los disparos de matchmaking (LISTEN y /api/trigger-matchmaking): los disparos que
+# llegan dentro de MATCHMAKING_DEBOUNCE_SECONDS, o mientras los MATCHMAKING_QUEUE_WORKERS
+# trabajadores están ocupados, se fusionan en una sola pasada (ver wheels.work_queue).
+# El endpoint espera el resultado hasta MATCHMAKING_TRIGGER_WAIT_SECONDS y si no responde 202
+matchmaking_queue = CoalescingWorkQueue(
+    lambda notifications: run_queued_matchmaking(notifications),
+    workers=int(os.getenv("MATCHMAKING_QUEUE_WORKERS", "1")),
+    debounce_seconds=float(os.getenv("MATCHMAKING_DEBOUNCE_SECONDS", str(DEFAULT_DEBOUNCE_SECONDS)))
+)
+MATCHMAKING_TRIGGER_WAIT_SECONDS = float(os.getenv("MATCHMAKING_TRIGGER_WAIT_SECONDS", "30"))
+
+# Resultados precalculados: cada pasada de matchmaking_queue publica un snapshot en match_store.
+# Con MATCH_STORE_REFRESH_SECONDS > 0 un hilo encola además una pasada con esa cadencia y
+# /api/python-matchmaking y /api/matches/<user_email> leen el último snapshot en lugar de
+# calcular en la petición. MATCH_STORE_PATH guarda el snapshot en disco (ver wheels.match_store)
+MATCH_STORE_REFRESH_SECONDS = float(os.getenv("MATCH_STORE_REFRESH_SECONDS", "0"))
+match_store = MatchStore(path=os.getenv("MATCH_STORE_PATH") or None)
+match_refresher = MatchRefresher(lambda: refresh_match_store(), MATCH_STORE_REFRESH_SECONDS)
+
+# Opciones del pool de esta API: todos los registros de cada correo, en el orden de la tabla,
+# y el destino exacto (las mismas de CompactPool en los motores vectorizados)
+POOL_OPTIONS = {"latest_per_user": False, "normalize_destinations": False}
+
+# Motor incremental compartido por todas las peticiones del proceso
+pool_engine = IncrementalMatchEngine(
+    time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES, pickup_mode=MATCHMAKING_PICKUP_MODE,
+    assignment=MATCHMAKING_ASSIGNMENT, **POOL_OPTIONS
+)
+
 def get_supabase_client():
     """Create and return Supabase client"""
     return create_client(SUPABASE_URL, SUPABASE_KEY)
@@ -136,6 +216,9 @@ def get_wheels_dataframes():
         profiles_df = pd.DataFrame(profiles_response.data)
         searching_pool_df = pd.DataFrame(searching_pool_response.data)
         
+        # La lectura completa deja el directorio de perfiles al día
+        profile_directory.prime(profiles_response.data or [])
+        
         logger.info(f"✅ Loaded {len(profiles_df)} profiles, {len(searching_pool_df)} searching pool records")
         return profiles_df, searching_pool_df
         
@@ -143,15 +226,369 @@ def get_wheels_dataframes():
         logger.error(f"❌ Error fetching data: {str(e)}")
         raise
 
-def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
+def get_searching_pool_records():
+    """Lee los registros crudos del searching_pool (sin convertirlos a DataFrame)"""
+    return get_supabase_client().table('searching_pool').select("*").execute().data or []
+
+def get_profile_names(emails):
+    """Nombres de los correos dados desde el directorio de perfiles (una consulta para los que falten)"""
+    return profile_directory.names(get_supabase_client(), emails)
+
+def matched_emails(driver_matches):
+    """Correos de los conductores y pasajeros de los emparejamientos del motor en memoria"""
+    emails = {driver["correo_usuario"] for driver, _ in driver_matches}
+    emails.update(passenger["correo_usuario"] for _, passengers in driver_matches for passenger, _ in passengers)
+    return emails
+
+def get_pool_engine():
+    """Sincroniza el motor incremental con los cambios del searching_pool y lo devuelve"""
+    pool_engine.sync(get_supabase_client(), full_resync_seconds=POOL_FULL_RESYNC_SECONDS)
+    return pool_engine
+
+def get_pool_version():
+    """
+    Versión del searching_pool usada en las claves de match_cache
+
+    Con el motor incremental es su contador de cambios (tras sincronizarlo, así
+    el cálculo posterior puede usar pool_engine sin volver a leer el pool); si no,
+    el número de filas y el updated_at más reciente.
+    """
+    if MATCHMAKING_ENGINE == "incremental":
+        return ("incremental", get_pool_engine().version)
+    return pool_snapshot_version(get_supabase_client())
+
+def enqueue_matchmaking(data):
+    """
+    Registra un cambio del searching_pool y encola una pasada de matchmaking
+
+    La caché se invalida y el motor incremental aplica el cambio de inmediato; la
+    pasada completa se fusiona con los demás disparos del mismo lote.
+
+    Args:
+        data (dict): Payload de la notificación (record_id, operation, record)
+
+    Returns:
+        Future: Lista de matches de la pasada que cubre este disparo
+    """
+    # La notificación invalida los resultados guardados aunque el cambio
+    # todavía no se vea en la versión del pool
+    match_cache.bump()
+    
+    if MATCHMAKING_ENGINE == "incremental":
+        # Aplica el cambio notificado sin releer el pool; la pasada solo trae
+        # lo que haya cambiado por updated_at desde entonces
+        pool_engine.apply_notification(data, fetch_record=fetch_pool_record)
+    
+    return matchmaking_queue.submit(data)
+
+def run_queued_matchmaking(notifications):
+    """Una pasada de matchmaking para un lote de disparos fusionados por matchmaking_queue"""
+    logger.info(f"🔁 Matchmaking run for {len(notifications)} merged trigger(s)")
+    version = get_pool_version()
+    matches = [] if version == (0, None) else match_cache.get_or_compute((version, "all"), compute_all_matches)
+    match_store.publish(version, matches)
+    return matches
+
+def refresh_match_store():
+    """Pasada de refresco del almacén, fusionada con los disparos pendientes de la cola"""
+    return matchmaking_queue.submit({"source": "refresh"}).result()
+
+def latest_snapshot():
     """
-    🔧 VERSIÓN CORREGIDA del algoritmo de matchmaking
+    Último snapshot para las lecturas (None si MATCH_STORE_REFRESH_SECONDS lo desactiva)
+
+    La primera lectura arranca el hilo de refresco y, si todavía no hay snapshot,
+    espera la primera pasada.
+    """
+    if not match_refresher.start():
+        return None
+    snapshot = match_store.latest()
+    if snapshot is None:
+        match_refresher.refresh_now()
+        snapshot = match_store.latest()
+    return snapshot
+
+def fetch_pool_record(record_id):
+    """Lee un registro del searching_pool por id (None si ya no existe)"""
+    response = get_supabase_client().table('searching_pool').select("*").eq("id", record_id).execute()
+    return response.data[0] if response.data else None
+
+def get_profile_name(profile_names, pool_row, default):
+    """Obtiene el nombre del usuario desde profiles (o desde el propio registro del pool)"""
+    if profile_names:
+        return profile_names.get(pool_row.get("correo_usuario"), default)
+    return pool_row.get("nombre_usuario", default)
+
+def build_passenger_match(passenger, passenger_name, distance_result, pickup_eta):
+    """Construye la entrada de un pasajero dentro de 'pasajeros_asignados'"""
+    passenger_email = passenger.get("correo_usuario")
+    return {
+        "pasajero_correo": passenger_email,
+        "nombre": passenger_name,
+        "correo": passenger_email,
+        "pickup": passenger["pickup_address"],
+        "destino": passenger["destino"],
+        "distance_km": distance_result['distance'],
+        "duration": distance_result['duration'],
+        "distance_source": distance_result['source'],
+        "pickup_address": passenger["pickup_address"],
+        "dropoff_address": passenger["destino"],
+        "pickup_lat": passenger.get("pickup_lat", 0),
+        "pickup_lng": passenger.get("pickup_lng", 0),
+        "dropoff_lat": passenger.get("dropoff_lat", 0),
+        "dropoff_lng": passenger.get("dropoff_lng", 0),
+        "pickup_eta": pickup_eta
+    }
+
+def build_driver_match(driver, driver_name, available_seats, matched_passengers):
+    """Construye el match de un conductor con sus pasajeros asignados"""
+    driver_email = driver.get("correo_usuario")
+    return {
+        "conductor_correo": driver_email,
+        "conductor_id": driver["id"],
+        "nombre_conductor": driver_name,
+        "correo_conductor": driver_email,
+        "pickup": driver["pickup_address"],
+        "destino": driver["destino"],
+        "available_seats": available_seats,
+        "price_per_seat": float(driver.get("price_per_seat") or 0),
+        "pickup_address": driver["pickup_address"],
+        "dropoff_address": driver["destino"],
+        "pickup_lat": driver.get("pickup_lat", 0),
+        "pickup_lng": driver.get("pickup_lng", 0),
+        "dropoff_lat": driver.get("dropoff_lat", 0),
+        "dropoff_lng": driver.get("dropoff_lng", 0),
+        "driver_pool_id": driver["id"],
+        "pasajeros_asignados": matched_passengers
+    }
+
+def match_rides_vectorized(pool, profile_names=None, max_distance_km=5,
+                           use_spatial_index=False, assignment="first_fit"):
+    """
+    Matchmaking vectorizado sobre el pool compacto: matriz Haversine conductor x pasajero
+    en una sola pasada de NumPy. La distancia se mide siempre desde el punto de partida del
+    conductor y el ETA de recogida se acumula con la estimación espacial de cada pasajero
+    asignado. Sin profile_names los nombres se resuelven con el directorio de perfiles.
+    """
+    drivers = pool.role("conductor")
+    passengers = pool.role("pasajero")
+    assigned = match_compact_pool(
+        drivers, passengers, max_distance_km, use_spatial_index=use_spatial_index, assignment=assignment,
+        workers=MATCHMAKING_WORKERS, min_parallel_size=MATCHMAKING_PARALLEL_MIN_POOL,
+        time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES, pickup_mode=MATCHMAKING_PICKUP_MODE
+    )
+    if profile_names is None:
+        emails = {drivers.emails[driver_pos] for driver_pos, _, _ in assigned}
+        emails.update(passengers.emails[pos] for _, positions, _ in assigned for pos in positions)
+        profile_names = get_profile_names(emails)
+    
+    matches = []
+    for driver_pos, passenger_positions, distances in assigned:
+        driver = drivers.records[driver_pos]
+        matched_passengers = []
+        current_time = 0
+        positions = np.asarray(passenger_positions, dtype=np.int64)
+        seconds = travel_time_estimator.predict(
+            drivers.lat[driver_pos], drivers.lng[driver_pos], passengers.lat[positions], passengers.lng[positions]
+        )
+        
+        for pos, distance, duration in zip(passenger_positions, distances, seconds):
+            passenger = passengers.records[pos]
+            current_time += round(duration / 60)
+            matched_passengers.append(build_passenger_match(
+                passenger,
+                get_profile_name(profile_names, passenger, "Pasajero"),
+                format_haversine_distance(distance, duration),
+                current_time
+            ))
+        
+        driver_name = get_profile_name(profile_names, driver, "Conductor")
+        matches.append(build_driver_match(driver, driver_name, int(drivers.seats[driver_pos]), matched_passengers))
+    
+    return matches
+
+def match_rides_road(pool, profile_names=None, max_distance_km=5, use_spatial_index=False, assignment="first_fit"):
+    """
+    Matchmaking en dos etapas sobre el pool compacto: prefiltro Haversine vectorizado con
+    los top-k candidatos por conductor y confirmación por carretera en lotes de Distance
+    Matrix (una solicitud por conductor en lugar de una por par). Guarda en
+    road_pipeline_stats cuántos pares descartó cada etapa.
+    """
+    drivers = pool.role("conductor")
+    passengers = pool.role("pasajero")
+    assigned, road, stats = two_stage_match(
+        drivers.lat, drivers.lng, drivers.destination_codes, drivers.seats,
+        passengers.lat, passengers.lng, passengers.destination_codes, distance_provider,
+        max_distance_km=max_distance_km, top_k=MATCHMAKING_ROAD_TOP_K, prefilter_slack=MATCHMAKING_PREFILTER_SLACK,
+        use_spatial_index=use_spatial_index, assignment=assignment,
+        driver_minutes=drivers.departure, passenger_minutes=passengers.departure,
+        time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES, eta_estimator=travel_time_estimator
+    )
+    road_pipeline_stats.clear()
+    road_pipeline_stats.update(stats)
+    logger.info(f"🛣️ Pipeline road: {stats}")
+    if profile_names is None:
+        emails = {drivers.emails[driver_pos] for driver_pos, _, _ in assigned}
+        emails.update(passengers.emails[pos] for _, positions, _ in assigned for pos in positions)
+        profile_names = get_profile_names(emails)
+    
+    matches = []
+    for driver_pos, passenger_positions, _ in assigned:
+        driver = drivers.records[driver_pos]
+        matched_passengers = []
+        current_time = 0
+        
+        for pos in passenger_positions:
+            passenger = passengers.records[pos]
+            distance_result = road[(driver_pos, int(pos))]
+            current_time += round(distance_result['duration_seconds'] / 60) if distance_result['duration_seconds'] else 0
+            matched_passengers.append(build_passenger_match(
+                passenger,
+                get_profile_name(profile_names, passenger, "Pasajero"),
+                distance_result,
+                current_time
+            ))
+        
+        driver_name = get_profile_name(profile_names, driver, "Conductor")
+        matches.append(build_driver_match(driver, driver_name, int(drivers.seats[driver_pos]), matched_passengers))
+    
+    return matches
+
+def build_engine_matches(driver_matches, profile_names):
+    """Convierte los emparejamientos del motor en memoria al formato de respuesta"""
+    matches = []
+    for driver, passengers in driver_matches:
+        matched_passengers = []
+        current_time = 0
+        
+        for passenger, distance in passengers:
+            distance_result = format_haversine_distance(distance)
+            current_time += round(distance_result['duration_seconds'] / 60)
+            matched_passengers.append(build_passenger_match(
+                passenger,
+                get_profile_name(profile_names, passenger, "Pasajero"),
+                distance_result,
+                current_time
+            ))
+        
+        driver_name = get_profile_name(profile_names, driver, "Conductor")
+        matches.append(build_driver_match(driver, driver_name, record_seats(driver), matched_passengers))
+    
+    return matches
+
+def match_rides_incremental(engine, profile_names=None):
+    """
+    Matchmaking desde el motor en memoria: solo se recalculan los conductores afectados
+    por cambios del searching_pool desde la última lectura. Sin profile_names los
+    nombres de los usuarios emparejados se resuelven con el directorio de perfiles.
+    """
+    driver_matches = engine.matches()
+    if profile_names is None:
+        profile_names = get_profile_names(matched_emails(driver_matches))
+    matches = build_engine_matches(driver_matches, profile_names)
+    logger.info(f"🎉 Total matches created (incremental, v{engine.version}): {len(matches)}")
+    return matches
+
+def use_targeted_user_matches():
+    """True si /api/matches/<user_email> da el mismo resultado leyendo solo el vecindario del usuario"""
+    return (
+        USER_MATCHES_MODE == "targeted" and MATCHMAKING_ENGINE in TARGETED_ENGINES
+        and MATCHMAKING_ASSIGNMENT in ("first_fit", "nearest") and MATCHMAKING_PICKUP_MODE == "radius"
+    )
+
+def match_rides_for_user(user_email, max_distance_km=5):
+    """
+    Emparejamientos de un solo usuario sin procesar todo el pool
+
+    Con el motor incremental se consulta su estado en memoria; si no, se leen solo
+    los registros cercanos al usuario (ver fetch_user_neighborhood) y se emparejan
+    con las reglas del motor vectorizado de esta API (POOL_OPTIONS, 'first_fit' o
+    'nearest', distancia Haversine). Ver use_targeted_user_matches.
+    """
+    if MATCHMAKING_ENGINE == "incremental":
+        # Ya sincronizado por get_pool_version
+        driver_matches = pool_engine.user_matches(user_email)
+    else:
+        records = fetch_user_neighborhood(
+            get_supabase_client(), user_email, max_distance_km, latest_per_user=POOL_OPTIONS["latest_per_user"]
+        )
+        engine = IncrementalMatchEngine(
+            max_distance_km=max_distance_km, time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES,
+            assignment=MATCHMAKING_ASSIGNMENT, **POOL_OPTIONS
+        )
+        engine.load_records(records)
+        driver_matches = engine.user_matches(user_email)
+    
+    matches = build_engine_matches(driver_matches, get_profile_names(matched_emails(driver_matches)))
+    logger.info(f"🎯 Targeted matches for {user_email}: {len(matches)}")
+    return matches
+
+def iter_all_matches():
+    """Matchmaking completo con el motor configurado, un match de conductor a la vez"""
+    if MATCHMAKING_ENGINE == "incremental":
+        # Ya sincronizado por get_pool_version
+        yield from match_rides_incremental(pool_engine)
+        return
+    
+    if MATCHMAKING_ENGINE in ("vectorized", "indexed", "road"):
+        # Los registros se leen directo al pool compacto, sin DataFrames ni lectura de profiles
+        pool = CompactPool.from_records(get_searching_pool_records(), **POOL_OPTIONS)
+        match_rides = match_rides_road if MATCHMAKING_ENGINE == "road" else match_rides_vectorized
+        matches = match_rides(
+            pool, max_distance_km=5, use_spatial_index=(MATCHMAKING_ENGINE == "indexed"), assignment=MATCHMAKING_ASSIGNMENT
+        )
+        logger.info(f"🎉 Total matches created ({MATCHMAKING_ENGINE}, compact): {len(matches)}")
+        yield from matches
+        return
+    
+    profiles_df, searching_pool_df = get_wheels_dataframes()
+    if searching_pool_df.empty:
+        return
+    yield from iter_rides_enhanced(searching_pool_df, profiles_df)
+
+def compute_all_matches():
+    """Matchmaking completo con el motor configurado (lo que guarda match_cache)"""
+    return list(iter_all_matches())
+
+def iter_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5, engine=None, assignment=None):
+    """
+    🔧 VERSIÓN CORREGIDA del algoritmo de matchmaking, como generador: cada match de
+    conductor se entrega en cuanto está completo (el motor legacy lo hace conductor a conductor)
     Mejoras:
     1. Filtros más flexibles (acepta NULL y 'searching')
     2. Mejor logging para debugging
     3. Validación de datos robusta
     """
     try:
+        # Nombres por correo en un diccionario: una búsqueda O(1) por usuario emparejado
+        profile_names = profile_name_map(profiles_df)
+        
+        if (engine or MATCHMAKING_ENGINE) == "incremental":
+            # El motor compara la lectura con su estado y solo recalcula lo que cambió
+            pool_engine.load_dataframe(searching_pool_df)
+            yield from match_rides_incremental(pool_engine, profile_names)
+            return
+        
+        engine = engine or MATCHMAKING_ENGINE
+        assignment = assignment or MATCHMAKING_ASSIGNMENT
+        if (assignment != "first_fit" or MATCHMAKING_PICKUP_MODE == "corridor") and engine == "legacy":
+            # La asignación global y el modo corredor se resuelven sobre el grafo de candidatos
+            # del motor vectorizado
+            engine = "vectorized"
+        
+        if engine in ("vectorized", "indexed", "road"):
+            # El pool se convierte una sola vez a columnas NumPy, sin copias ni iterrows
+            pool = CompactPool.from_dataframe(searching_pool_df, **POOL_OPTIONS)
+            logger.info(f"📊 Registros activos en el pool compacto: {len(pool)}")
+            match_rides = match_rides_road if engine == "road" else match_rides_vectorized
+            matches = match_rides(
+                pool, profile_names, max_distance_km,
+                use_spatial_index=(engine == "indexed"), assignment=assignment
+            )
+            logger.info(f"🎉 Total matches created ({engine}): {len(matches)}")
+            yield from matches
+            return
+        
         # Debug: Mostrar todos los registros
         logger.info(f"📊 Total registros en searching_pool: {len(searching_pool_df)}")
         if not searching_pool_df.empty:
@@ -180,7 +617,7 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
         if active_pool.empty:
             logger.warning("⚠️ No hay registros activos en searching pool")
             logger.info("💡 TIP: Verifica que los registros tengan status NULL o 'searching'")
-            return []
+            return
         
         # Validar columnas requeridas
         required_columns = ['tipo_de_usuario', 'pickup_lat', 'pickup_lng', 'destino']
@@ -188,7 +625,7 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
         
         if missing_columns:
             logger.error(f"❌ Columnas faltantes en searching_pool: {missing_columns}")
-            return []
+            return
         
         # Separate drivers and passengers
         drivers = active_pool[active_pool["tipo_de_usuario"] == "conductor"].copy()
@@ -215,9 +652,9 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
             logger.info("💡 TIP: Verifica que existan registros con tipo_de_usuario='pasajero'")
         
         if len(drivers) == 0 or len(passengers) == 0:
-            return []
+            return
         
-        matches = []
+        total_matches = 0
         
         for _, driver in drivers.iterrows():
             try:
@@ -252,17 +689,18 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
                         if passenger["destino"] != driver_destination:
                             continue
                         
+                        # Ventana de salida: se descarta antes de consultar la distancia
+                        if MATCHMAKING_TIME_WINDOW_MINUTES is not None and not time_compatible(
+                            record_departure_minutes(driver), record_departure_minutes(passenger), MATCHMAKING_TIME_WINDOW_MINUTES
+                        ):
+                            continue
+                        
                         # Calculate distance
                         passenger_location = (passenger["pickup_lat"], passenger["pickup_lng"])
-                        distance_result = calculate_google_maps_distance(last_location, passenger_location)
+                        distance_result = distance_provider.distance(last_location, passenger_location)
                         
-                        # Extract ETA
-                        eta_minutes = 0
-                        if 'duration' in distance_result and isinstance(distance_result['duration'], str):
-                            try:
-                                eta_minutes = int(distance_result['duration'].split()[0])
-                            except:
-                                eta_minutes = 0
+                        # ETA numérico del proveedor (sin interpretar el texto de la duración)
+                        eta_minutes = round(distance_result['duration_seconds'] / 60) if distance_result['duration_seconds'] else 0
                         
                         current_time += eta_minutes
                         last_location = passenger_location
@@ -280,31 +718,11 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
                             continue
                         
                         # Get passenger name
-                        passenger_name = "Pasajero"
-                        if not profiles_df.empty and "email" in profiles_df.columns:
-                            passenger_profile = profiles_df[profiles_df["email"] == passenger_email]
-                            if not passenger_profile.empty:
-                                passenger_name = passenger_profile["full_name"].iloc[0]
-                        else:
-                            passenger_name = passenger.get("nombre_usuario", "Pasajero")
+                        passenger_name = get_profile_name(profile_names, passenger, "Pasajero")
                         
-                        matched_passengers.append({
-                            "pasajero_correo": passenger_email,
-                            "nombre": passenger_name,
-                            "correo": passenger_email,
-                            "pickup": passenger["pickup_address"],
-                            "destino": passenger["destino"],
-                            "distance_km": distance_result['distance'],
-                            "duration": distance_result['duration'],
-                            "distance_source": distance_result['source'],
-                            "pickup_address": passenger["pickup_address"],
-                            "dropoff_address": passenger["destino"],
-                            "pickup_lat": passenger.get("pickup_lat", 0),
-                            "pickup_lng": passenger.get("pickup_lng", 0),
-                            "dropoff_lat": passenger.get("dropoff_lat", 0),
-                            "dropoff_lng": passenger.get("dropoff_lng", 0),
-                            "pickup_eta": current_time
-                        })
+                        matched_passengers.append(
+                            build_passenger_match(passenger, passenger_name, distance_result, current_time)
+                        )
                         
                         logger.info(f"✅ Matched passenger: {passenger_email} - {distance_result['distance']}km - ETA: {current_time} min")
                         
@@ -314,32 +732,10 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
                 
                 if matched_passengers:
                     # Get driver name
-                    driver_name = "Conductor"
-                    if not profiles_df.empty and "email" in profiles_df.columns:
-                        driver_profile = profiles_df[profiles_df["email"] == driver_email]
-                        if not driver_profile.empty:
-                            driver_name = driver_profile["full_name"].iloc[0]
-                    else:
-                        driver_name = driver.get("nombre_usuario", "Conductor")
+                    driver_name = get_profile_name(profile_names, driver, "Conductor")
                     
-                    matches.append({
-                        "conductor_correo": driver_email,
-                        "conductor_id": driver["id"],
-                        "nombre_conductor": driver_name,
-                        "correo_conductor": driver_email,
-                        "pickup": driver["pickup_address"],
-                        "destino": driver_destination,
-                        "available_seats": available_seats,
-                        "price_per_seat": float(driver.get("price_per_seat", 0)),
-                        "pickup_address": driver["pickup_address"],
-                        "dropoff_address": driver_destination,
-                        "pickup_lat": driver.get("pickup_lat", 0),
-                        "pickup_lng": driver.get("pickup_lng", 0),
-                        "dropoff_lat": driver.get("dropoff_lat", 0),
-                        "dropoff_lng": driver.get("dropoff_lng", 0),
-                        "driver_pool_id": driver["id"],
-                        "pasajeros_asignados": matched_passengers
-                    })
+                    total_matches += 1
+                    yield build_driver_match(driver, driver_name, available_seats, matched_passengers)
                     
                     logger.info(f"🎯 Created match for driver: {driver_email} with {len(matched_passengers)} passengers")
             
@@ -347,25 +743,105 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
                 logger.error(f"❌ Error processing driver {driver.get('id', 'unknown')}: {e}")
                 continue
         
-        logger.info(f"🎉 Total matches created: {len(matches)}")
-        return matches
+        logger.info(f"🎉 Total matches created: {total_matches}")
         
     except Exception as e:
         logger.error(f"❌ Error in matching algorithm: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        return []
+
+def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5, engine=None, assignment=None):
+    """Lista completa de matches de iter_rides_enhanced ([] si falla el algoritmo)"""
+    return list(iter_rides_enhanced(searching_pool_df, profiles_df, max_distance_km, engine, assignment))
+
+def wants_ndjson():
+    """Indica si la petición pide los matches en streaming NDJSON (?stream=1 o Accept: application/x-ndjson)"""
+    return (
+        request.args.get("stream", "").lower() in ("1", "true", "yes")
+        or "application/x-ndjson" in request.headers.get("Accept", "")
+    )
+
+def ndjson_line(record):
+    """Serializa un registro como una línea NDJSON (mismo codificador que jsonify)"""
+    return app.json.dumps(record) + "\n"
+
+def stream_matchmaking(version):
+    """
+    Respuesta NDJSON de /api/python-matchmaking
+
+    Escribe una línea {"type": "match", "match": ...} por conductor en cuanto su match
+    está completo y termina con {"type": "summary"} (total y tiempos) o, si el cálculo
+    falla a mitad de camino, con {"type": "error"}: el código HTTP ya se envió.
+    """
+    started = time.perf_counter()
+    
+    def generate():
+        total = 0
+        first_match_ms = None
+        try:
+            if version != (0, None):
+                for match in match_cache.iter_or_compute((version, "all"), iter_all_matches):
+                    if first_match_ms is None:
+                        first_match_ms = round((time.perf_counter() - started) * 1000, 1)
+                    total += 1
+                    yield ndjson_line({"type": "match", "match": match})
+            
+            summary = {
+                "type": "summary",
+                "success": True,
+                "total_matches": total,
+                "first_match_ms": first_match_ms,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                "timestamp": datetime.now().isoformat(),
+                "message": f"Matchmaking completed successfully. Found {total} matches."
+            }
+            if MATCHMAKING_ENGINE == "road":
+                summary["pipeline"] = dict(road_pipeline_stats)
+            logger.info(f"✅ Matchmaking streamed: {total} matches found")
+            yield ndjson_line(summary)
+        
+        except Exception as e:
+            logger.error(f"❌ Error streaming matchmaking: {str(e)}")
+            yield ndjson_line({
+                "type": "error",
+                "success": False,
+                "error": str(e),
+                "total_matches": total,
+                "timestamp": datetime.now().isoformat()
+            })
+    
+    # X-Accel-Buffering evita que un proxy nginx junte las líneas antes de enviarlas
+    return Response(
+        stream_with_context(generate()), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"}
+    )
 
 @app.route('/api/python-matchmaking', methods=['POST', 'GET'])
 def run_matchmaking():
-    """Main API endpoint for running the matchmaking algorithm"""
+    """Main API endpoint for running the matchmaking algorithm (NDJSON con ?stream=1)"""
     try:
         logger.info("🚀 Starting matchmaking process...")
         
-        # Get data from Supabase
-        profiles_df, searching_pool_df = get_wheels_dataframes()
+        snapshot = None if wants_ndjson() else latest_snapshot()
+        if snapshot is not None:
+            # Lectura del resultado precalculado por el trabajador de fondo
+            response = {
+                "success": True,
+                "matches": snapshot.matches,
+                "total_matches": len(snapshot.matches),
+                "snapshot": snapshot.describe(),
+                "timestamp": datetime.now().isoformat(),
+                "message": f"Matchmaking snapshot served. Found {len(snapshot.matches)} matches."
+            }
+            if MATCHMAKING_ENGINE == "road":
+                response["pipeline"] = dict(road_pipeline_stats)
+            return jsonify(response)
+        
+        version = get_pool_version()
         
-        if searching_pool_df.empty:
+        if wants_ndjson():
+            return stream_matchmaking(version)
+        
+        if version == (0, None):
             return jsonify({
                 "success": True,
                 "matches": [],
@@ -374,8 +850,8 @@ def run_matchmaking():
                 "timestamp": datetime.now().isoformat()
             })
         
-        # Run matching algorithm
-        matches = match_rides_enhanced(searching_pool_df, profiles_df)
+        # Run matching algorithm (o resultado guardado si el pool no cambió)
+        matches = match_cache.get_or_compute((version, "all"), compute_all_matches)
         
         response = {
             "success": True,
@@ -384,6 +860,8 @@ def run_matchmaking():
             "timestamp": datetime.now().isoformat(),
             "message": f"Matchmaking completed successfully. Found {len(matches)} matches."
         }
+        if MATCHMAKING_ENGINE == "road":
+            response["pipeline"] = dict(road_pipeline_stats)
         
         logger.info(f"✅ Matchmaking completed: {len(matches)} matches found")
         return jsonify(response)
@@ -402,13 +880,37 @@ def run_matchmaking():
 
 @app.route('/api/trigger-matchmaking', methods=['POST'])
 def trigger_matchmaking():
-    """Endpoint for database triggers or webhooks"""
+    """Endpoint for database triggers or webhooks (pasa por matchmaking_queue)"""
     try:
         logger.info("🔔 Matchmaking triggered automatically")
         data = request.get_json() or {}
         logger.info(f"Trigger data: {data}")
         
-        return run_matchmaking()
+        future = enqueue_matchmaking(data)
+        try:
+            matches = future.result(timeout=MATCHMAKING_TRIGGER_WAIT_SECONDS)
+        except FutureTimeoutError:
+            logger.warning("⏳ Matchmaking still queued, answering 202")
+            return jsonify({
+                "success": True,
+                "queued": True,
+                "queue": matchmaking_queue.stats(),
+                "timestamp": datetime.now().isoformat()
+            }), 202
+        
+        response = {
+            "success": True,
+            "matches": matches,
+            "total_matches": len(matches),
+            "queue": matchmaking_queue.stats(),
+            "timestamp": datetime.now().isoformat(),
+            "message": f"Matchmaking completed successfully. Found {len(matches)} matches."
+        }
+        if MATCHMAKING_ENGINE == "road":
+            response["pipeline"] = dict(road_pipeline_stats)
+        
+        logger.info(f"✅ Matchmaking completed: {len(matches)} matches found")
+        return jsonify(response)
             
     except Exception as e:
         logger.error(f"❌ Error in trigger endpoint: {str(e)}")
@@ -424,8 +926,26 @@ def get_user_matches(user_email):
     try:
         logger.info(f"🔍 Getting matches for user: {user_email}")
         
-        profiles_df, searching_pool_df = get_wheels_dataframes()
-        all_matches = match_rides_enhanced(searching_pool_df, profiles_df)
+        snapshot = latest_snapshot()
+        if snapshot is not None:
+            # Índice por correo del resultado precalculado
+            user_matches = list(snapshot.for_user(user_email))
+            return jsonify({
+                "success": True,
+                "user_email": user_email,
+                "matches": user_matches,
+                "total_matches": len(user_matches),
+                "snapshot": snapshot.describe(),
+                "timestamp": datetime.now().isoformat()
+            })
+        
+        version = get_pool_version()
+        if use_targeted_user_matches():
+            all_matches = match_cache.get_or_compute(
+                (version, "user", user_email), lambda: match_rides_for_user(user_email)
+            )
+        else:
+            all_matches = match_cache.get_or_compute((version, "all"), compute_all_matches)
         
         user_matches = []
         
@@ -467,10 +987,9 @@ def get_passenger_trip(user_email):
         logger.info(f"🔍 Getting active trip for passenger: {user_email}")
         supabase = get_supabase_client()
 
-        profile_response = supabase.table('profiles').select("id").eq("email", user_email).single().execute()
-        if not profile_response.data:
+        passenger_id = profile_directory.get_id(supabase, user_email)
+        if passenger_id is None:
             return jsonify({"success": False, "error": "Passenger not found"}), 404
-        passenger_id = profile_response.data['id']
 
         trip_data_response = supabase.table('trip_data').select("*").contains(
             "passengers_data", [{"passenger_id": str(passenger_id)}]
@@ -1,11 +1,14 @@
 import os
 import json
-import requests
 import pandas as pd
 from datetime import datetime, timezone
 from supabase import create_client, Client
 from typing import Dict, List, Tuple, Optional
 
+from wheels.async_distance import DEFAULT_MAX_CONCURRENCY
+from wheels.distance_provider import DEFAULT_CACHE_PRECISION, CachedDistanceProvider, build_distance_provider
+from wheels.travel_time import load_travel_time_estimator
+
 # ================================================
 # 🔹 Conexión a Supabase
 # ================================================
@@ -44,75 +47,66 @@ def get_wheels_dataframes():
 # ================================================
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY", "your-google-maps-api-key")
 
-def get_distance_duration(origin, destination, api_key=GOOGLE_MAPS_API_KEY):
-    """Calcula distancia y duración entre dos puntos"""
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    params = {
-        "origins": origin,
-        "destinations": destination,
-        "key": api_key,
-        "mode": "driving",
-        "departure_time": "now"
-    }
-    response = requests.get(url, params=params).json()
-    
-    if response["status"] == "OK":
-        element = response["rows"][0]["elements"][0]
-        if element["status"] == "OK":
-            return (
-                element["distance"]["value"],  # metros
-                element["duration"]["value"]   # segundos
-            )
-    return (0, 0)
+# Proveedor de distancias del optimizador: 'google' (Distance Matrix con las direcciones de
+# viaje), 'road_graph' o 'haversine' (estos dos solo sirven si los lugares son coordenadas:
+# school_route_algorithm acepta tuplas (lat, lng)), con la misma caché de
+# distancias de las APIs de matchmaking (DISTANCE_CACHE_*) y las solicitudes en paralelo
+# (DISTANCE_CONCURRENCY). Las estimaciones Haversine usan el estimador de TRAVEL_TIME_MODEL_PATH.
+# Ver wheels.distance_provider
+distance_provider = build_distance_provider(
+    os.getenv("DISTANCE_PROVIDER", "google"), api_key=GOOGLE_MAPS_API_KEY,
+    cache_entries=int(os.getenv("DISTANCE_CACHE_MAX_ENTRIES", "10000")),
+    cache_max_age_seconds=float(os.getenv("DISTANCE_CACHE_MAX_AGE_SECONDS", "3600")),
+    cache_precision=int(os.getenv("DISTANCE_CACHE_PRECISION", str(DEFAULT_CACHE_PRECISION))),
+    cache_path=os.getenv("DISTANCE_CACHE_PATH") or None,
+    concurrency=int(os.getenv("DISTANCE_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY))),
+    graph_path=os.getenv("ROAD_GRAPH_PATH") or None,
+    travel_time=load_travel_time_estimator()
+)
 
-def get_distance_matrix(origins: List[str], destinations: List[str], api_key=GOOGLE_MAPS_API_KEY):
-    """Obtiene matriz de distancias entre múltiples puntos"""
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    
-    origins_str = "|".join(origins)
-    destinations_str = "|".join(destinations)
-    
-    params = {
-        "origins": origins_str,
-        "destinations": destinations_str,
-        "key": api_key,
-        "mode": "driving",
-        "departure_time": "now"
-    }
-    
-    response = requests.get(url, params=params).json()
+def resolve_provider(api_key=GOOGLE_MAPS_API_KEY, provider=None):
+    """Proveedor a usar: el recibido, el del módulo o uno de Google con otra clave"""
+    if provider is not None:
+        return provider
+    if api_key == GOOGLE_MAPS_API_KEY:
+        return distance_provider
+    return build_distance_provider("google", api_key=api_key)
+
+def whole_units(values, missing):
+    """Metros o segundos enteros por fila, con infinito para los pares sin resultado"""
+    return [
+        [float('inf') if absent else int(round(value)) for value, absent in zip(row, absent_row)]
+        for row, absent_row in zip(values.tolist(), missing.tolist())
+    ]
+
+def get_distance_duration(origin, destination, api_key=GOOGLE_MAPS_API_KEY, provider=None):
+    """Calcula distancia (metros) y duración (segundos) entre dos puntos; (0, 0) sin resultado"""
+    batch = resolve_provider(api_key, provider).distances([origin], [destination])
+    if batch.missing()[0]:
+        return (0, 0)
+    return (int(round(batch.metres[0])), int(round(batch.seconds[0])))
+
+def get_distance_matrix(origins: List[str], destinations: List[str], api_key=GOOGLE_MAPS_API_KEY, provider=None):
+    """Obtiene matriz de distancias (metros) y duraciones (segundos) entre múltiples puntos"""
+    batch = resolve_provider(api_key, provider).matrix(origins, destinations)
+    missing = batch.missing()
     
-    if response["status"] != "OK":
-        print(f"❌ Error en Distance Matrix API: {response['status']}")
+    if missing.all():
+        print("❌ Error en Distance Matrix: sin resultados")
         return None
     
-    matrix = {
-        'distances': [],
-        'durations': []
+    # Los pares sin ruta quedan a distancia infinita
+    return {
+        'distances': whole_units(batch.metres, missing),
+        'durations': whole_units(batch.seconds, missing)
     }
-    
-    for row in response["rows"]:
-        distance_row = []
-        duration_row = []
-        
-        for element in row["elements"]:
-            if element["status"] == "OK":
-                distance_row.append(element["distance"]["value"])
-                duration_row.append(element["duration"]["value"])
-            else:
-                distance_row.append(float('inf'))
-                duration_row.append(float('inf'))
-        
-        matrix['distances'].append(distance_row)
-        matrix['durations'].append(duration_row)
-    
-    return matrix
 
 # ================================================
 # 🔹 Algoritmo de Ruta Escolar
 # ================================================
 def school_route_algorithm(start_address: str, waypoint_addresses: List[str], 
-                          destination_address: str, trip_type: str, api_key=GOOGLE_MAPS_API_KEY):
+                          destination_address: str, trip_type: str, api_key=GOOGLE_MAPS_API_KEY,
+                          provider=None):
     """
     Algoritmo de ruta escolar optimizado:
     
@@ -135,7 +129,7 @@ def school_route_algorithm(start_address: str, waypoint_addresses: List[str],
     
     # Obtener matriz de distancias
     print("📊 Obteniendo matriz de distancias...")
-    matrix = get_distance_matrix(all_addresses, all_addresses, api_key)
+    matrix = get_distance_matrix(all_addresses, all_addresses, api_key, provider)
     
     if not matrix:
         print("❌ Error obteniendo matriz, usando orden secuencial")
@@ -220,8 +214,15 @@ def school_route_algorithm(start_address: str, waypoint_addresses: List[str],
 # 🔹 Clase PickupOptimizer
 # ================================================
 class PickupOptimizer:
-    def __init__(self, api_key=GOOGLE_MAPS_API_KEY):
+    def __init__(self, api_key=GOOGLE_MAPS_API_KEY, provider=None):
+        """
+        Args:
+            api_key (str): Clave de Google Maps (solo si no se pasa provider)
+            provider (DistanceProvider): Proveedor de distancias; por defecto el del módulo,
+                o uno de Google con api_key si la clave es distinta
+        """
         self.api_key = api_key
+        self.provider = resolve_provider(api_key, provider)
         
     def calculate_optimal_pickup_order(self, conductor_data: Dict, pasajeros_data: List[Dict], 
                                      destination: str, trip_type: str = "ida") -> Dict:
@@ -247,7 +248,8 @@ class PickupOptimizer:
             passenger_addresses, 
             destination,
             "ida",
-            self.api_key
+            self.api_key,
+            self.provider
         )
         
         if not waypoint_order:
@@ -288,7 +290,8 @@ class PickupOptimizer:
                     current_address = optimized_order[-1]["direccion"]
                     distance, duration = get_distance_duration(
                         current_address,
-                        passenger["direccion_de_viaje"]
+                        passenger["direccion_de_viaje"],
+                        provider=self.provider
                     )
                 
                 cumulative_distance += distance
@@ -317,7 +320,7 @@ class PickupOptimizer:
             final_duration = final_leg['duration_s']
         else:
             current_address = optimized_order[-1]["direccion"]
-            final_distance, final_duration = get_distance_duration(current_address, destination)
+            final_distance, final_duration = get_distance_duration(current_address, destination, provider=self.provider)
         
         cumulative_distance += final_distance
         cumulative_duration += final_duration
@@ -366,7 +369,8 @@ class PickupOptimizer:
             passenger_addresses,
             conductor_home,
             "regreso",
-            self.api_key
+            self.api_key,
+            self.provider
         )
         
         if not waypoint_order:
@@ -407,7 +411,8 @@ class PickupOptimizer:
                     current_address = optimized_order[-1]["direccion"]
                     distance, duration = get_distance_duration(
                         current_address,
-                        passenger["direccion_de_viaje"]
+                        passenger["direccion_de_viaje"],
+                        provider=self.provider
                     )
                 
                 cumulative_distance += distance
@@ -503,9 +508,43 @@ def get_trip_data_for_driver(trip_id: str, trip_type: str = "ida") -> Optional[D
         print(f"❌ Error: {e}")
         return None
 
+def trip_addresses(df_trip):
+    """Direcciones de la matriz de school_route_algorithm de un viaje: conductor, pasajeros y destino"""
+    conductores = df_trip[df_trip["tipo_de_usuario"] == "conductor"]
+    if conductores.empty:
+        return []
+    conductor = conductores.iloc[0].to_dict()
+    pasajeros = df_trip[df_trip["tipo_de_usuario"] == "pasajero"]
+    return ([conductor["direccion_de_viaje"]] + list(pasajeros["direccion_de_viaje"])
+            + [conductor.get("destino", "Universidad")])
+
+def prefetch_trip_distances(start_of_trip_df, provider=None):
+    """
+    Llena la caché de distancias con las matrices de todos los viajes en una sola llamada
+
+    Así los bloques de Distance Matrix de todos los viajes salen en paralelo y cada
+    school_route_algorithm encuentra su matriz en la caché en lugar de pedirla en serie.
+
+    Returns:
+        int: Pares consultados (0 si el proveedor no tiene caché)
+    """
+    provider = distance_provider if provider is None else provider
+    if not isinstance(provider, CachedDistanceProvider):
+        return 0
+    origins, destinations = [], []
+    for _, df_trip in start_of_trip_df.groupby("trip_id"):
+        addresses = trip_addresses(df_trip)
+        for origin in addresses:
+            origins.extend([origin] * len(addresses))
+            destinations.extend(addresses)
+    if origins:
+        provider.distances(origins, destinations)
+    return len(origins)
+
 def process_all_trips(start_of_trip_df, output_dir="./out", trip_type="ida"):
     """Procesa todos los viajes"""
     resultados = {}
+    prefetch_trip_distances(start_of_trip_df)
     for trip_id, df_trip in start_of_trip_df.groupby("trip_id"):
         print(f"\n🔹 Procesando viaje {trip_id} ({trip_type})...")
         resultados[trip_id] = process_trip_with_optimization(df_trip, output_dir, trip_type)
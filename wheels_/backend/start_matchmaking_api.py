@@ -67,6 +67,8 @@ def start_notification_listener():
         
         logger.info("👂 Starting PostgreSQL notification listener...")
         
+        from matchmaking_api import enqueue_matchmaking
+        
         conn = psycopg2.connect(DATABASE_URL)
         conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
         
@@ -83,12 +85,10 @@ def start_notification_listener():
                     data = json.loads(notify.payload)
                     logger.info(f"🔔 Received notification: {data}")
                     
-                    # Trigger matchmaking in a separate thread
-                    threading.Thread(
-                        target=trigger_matchmaking_api,
-                        args=(data,),
-                        daemon=True
-                    ).start()
+                    # Same queue as /api/trigger-matchmaking: a burst of
+                    # notifications is merged into a single matchmaking run
+                    logger.info(f"🎯 Queueing matchmaking for record: {data.get('record_id')}")
+                    enqueue_matchmaking(data).add_done_callback(log_matchmaking_result)
                     
                 except Exception as e:
                     logger.error(f"❌ Error processing notification: {e}")
@@ -98,26 +98,13 @@ def start_notification_listener():
     except Exception as e:
         logger.error(f"❌ Error in notification listener: {e}")
 
-def trigger_matchmaking_api(data):
-    """Trigger the matchmaking API when a notification is received"""
+def log_matchmaking_result(future):
+    """Log the result of a matchmaking run queued by the listener"""
     try:
-        import requests
-        
-        api_url = f"http://localhost:{os.environ.get('PORT', 5000)}/api/trigger-matchmaking"
-        
-        logger.info(f"🎯 Triggering matchmaking API for record: {data.get('record_id')}")
-        
-        response = requests.post(api_url, json=data, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            matches_count = result.get('total_matches', 0)
-            logger.info(f"✅ Matchmaking completed: {matches_count} matches found")
-        else:
-            logger.warning(f"⚠️ Matchmaking API returned status: {response.status_code}")
-            
+        matches = future.result()
+        logger.info(f"✅ Matchmaking completed: {len(matches)} matches found")
     except Exception as e:
-        logger.error(f"❌ Error triggering matchmaking API: {e}")
+        logger.error(f"❌ Error in queued matchmaking: {e}")
 
 def check_dependencies():
     """Check if all required dependencies are installed"""
@@ -0,0 +1,115 @@
+import unittest
+import itertools
+import os
+import sys
+
+import numpy as np
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.assignment import greedy_assignment, limit_candidates, nearest_assignment, nearest_first, optimal_assignment
+
+def brute_force_best(driver_idx, passenger_idx, cost, seats, n_passengers):
+    """Mejor solución (más pasajeros, menor distancia) por enumeración exhaustiva"""
+    options = [[-1] + [e for e in range(len(driver_idx)) if passenger_idx[e] == p] for p in range(n_passengers)]
+    best = None
+    for combo in itertools.product(*options):
+        chosen = [e for e in combo if e >= 0]
+        used = np.bincount(driver_idx[chosen], minlength=len(seats)) if chosen else np.zeros(len(seats))
+        if (used > seats).any():
+            continue
+        key = (-len(chosen), round(float(cost[chosen].sum()), 9))
+        if best is None or key < best:
+            best = key
+    return best
+
+class TestAssignment(unittest.TestCase):
+    """Pruebas del solucionador de asignación global con capacidades"""
+
+    def setUp(self):
+        """Grafo pequeño donde el orden del pool no es óptimo"""
+        # El conductor 0 (1 cupo) es el único que alcanza al pasajero 1
+        self.driver_idx = np.array([0, 0, 1])
+        self.passenger_idx = np.array([0, 1, 0])
+        self.cost = np.array([0.5, 4.0, 1.0])
+        self.seats = np.array([1, 1])
+
+    def test_optimal_maximizes_passengers_then_distance(self):
+        """Prueba 1: Se asignan todos los pasajeros posibles aunque no sea el par más cercano"""
+        assigned = optimal_assignment(self.driver_idx, self.passenger_idx, self.cost, self.seats)
+
+        self.assertEqual(assigned.tolist(), [False, True, True])
+
+    def test_optimal_matches_brute_force(self):
+        """Prueba 2: Coincide con la enumeración exhaustiva en grafos aleatorios"""
+        rng = np.random.default_rng(3)
+        for _ in range(100):
+            n_drivers, n_passengers = int(rng.integers(1, 4)), int(rng.integers(1, 6))
+            pairs = [(d, p) for d in range(n_drivers) for p in range(n_passengers) if rng.random() < 0.6]
+            if not pairs:
+                continue
+            driver_idx = np.array([d for d, _ in pairs])
+            passenger_idx = np.array([p for _, p in pairs])
+            cost = rng.random(len(pairs)) * 5
+            seats = rng.integers(0, 3, n_drivers)
+
+            assigned = optimal_assignment(driver_idx, passenger_idx, cost, seats, max_candidates_per_passenger=None)
+            expected = brute_force_best(driver_idx, passenger_idx, cost, seats, n_passengers)
+
+            self.assertEqual(-int(assigned.sum()), expected[0])
+            self.assertAlmostEqual(float(cost[assigned].sum()), expected[1], places=6)
+
+    def test_each_passenger_once_and_seats_respected(self):
+        """Prueba 3: Un conductor por pasajero y nunca más pasajeros que cupos"""
+        rng = np.random.default_rng(11)
+        driver_idx = rng.integers(0, 40, 2000)
+        passenger_idx = rng.integers(0, 300, 2000)
+        pairs = np.unique(np.c_[driver_idx, passenger_idx], axis=0)
+        cost = rng.random(len(pairs)) * 5
+        seats = rng.integers(1, 5, 40)
+
+        for solver in (optimal_assignment, greedy_assignment):
+            assigned = solver(pairs[:, 0], pairs[:, 1], cost, seats)
+            self.assertEqual(len(set(pairs[assigned, 1])), int(assigned.sum()))
+            self.assertTrue((np.bincount(pairs[assigned, 0], minlength=40) <= seats).all())
+
+    def test_limit_candidates_keeps_nearest(self):
+        """Prueba 4: La poda conserva los k conductores más cercanos de cada pasajero"""
+        passenger_idx = np.array([0, 0, 0, 1])
+        cost = np.array([3.0, 1.0, 2.0, 9.0])
+
+        self.assertEqual(limit_candidates(passenger_idx, cost, 2).tolist(), [False, True, True, True])
+
+    def test_greedy_takes_nearest_pair_first(self):
+        """Prueba 5: La asignación voraz global toma primero el par más cercano"""
+        assigned = greedy_assignment(self.driver_idx, self.passenger_idx, self.cost, self.seats)
+
+        self.assertEqual(assigned.tolist(), [True, False, False])
+
+    def test_nearest_fills_seats_by_distance(self):
+        """Prueba 6: Cada conductor toma sus pasajeros más cercanos, no los primeros del pool"""
+        driver_idx = np.array([0, 0, 0, 0, 1, 1])
+        passenger_idx = np.array([0, 1, 2, 3, 0, 3])
+        cost = np.array([4.0, 3.5, 0.2, 0.9, 1.0, 1.0])
+        seats = np.array([2, 1])
+
+        assigned = nearest_assignment(driver_idx, passenger_idx, cost, seats)
+
+        # Como 'first_fit', un pasajero puede aparecer en varios conductores; empate por orden
+        self.assertEqual(assigned.tolist(), [False, False, True, True, True, False])
+        self.assertEqual(nearest_first([("a", 3.0), ("b", 1.0), ("c", 2.0)], 2), [("b", 1.0), ("c", 2.0)])
+        self.assertEqual(nearest_first([("a", 3.0)], 0), [])
+
+        rng = np.random.default_rng(7)
+        driver_idx = np.sort(rng.integers(0, 20, 400))
+        cost = rng.random(400) * 5
+        seats = rng.integers(0, 4, 20)
+        assigned = nearest_assignment(driver_idx, np.arange(400), cost, seats)
+        for driver in range(20):
+            pairs = np.flatnonzero(driver_idx == driver)
+            expected = pairs[np.argsort(cost[pairs], kind="stable")[:seats[driver]]]
+            self.assertEqual(sorted(np.flatnonzero(assigned & (driver_idx == driver)).tolist()), sorted(expected.tolist()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pickup_optimization_service
+from wheels.async_distance import AsyncDistanceFetcher
+from wheels.distance_provider import DISTANCE_MATRIX_URL, GoogleDistanceProvider, build_distance_provider
+from wheels.maps_client import TokenBucket
+from tests.unit.test_road_matching import FakeDistanceMatrix
+
+def mock_transport(session, delay=0.0, failures=0):
+    """Transporte httpx que responde como la sesión falsa tras `delay` segundos (y `failures` 503 al inicio)"""
+    state = {"failures": failures}
+
+    async def handler(request):
+        await asyncio.sleep(delay)
+        if state["failures"] > 0:
+            state["failures"] -= 1
+            return httpx.Response(503)
+        return httpx.Response(200, json=session.get(str(request.url), params=dict(request.url.params)).json())
+
+    return httpx.MockTransport(handler)
+
+def distance_params(count):
+    return [{"origins": f"4.{i:02d},-74.05", "destinations": "4.60,-74.08|4.70,-74.04"} for i in range(count)]
+
+class TestAsyncDistance(unittest.TestCase):
+    """Pruebas de las solicitudes concurrentes a Distance Matrix"""
+
+    def fetcher(self, session, delay=0.0, failures=0, **kwargs):
+        kwargs.setdefault("rate_limiter", TokenBucket(None))
+        return AsyncDistanceFetcher(transport=mock_transport(session, delay, failures), **kwargs)
+
+    def test_latency_bounded_by_slowest(self):
+        """Prueba 1: Ocho solicitudes de 0.2 s tardan cerca de 0.2 s, no 1.6 s, y respetan el semáforo"""
+        session = FakeDistanceMatrix()
+        fetcher = self.fetcher(session, delay=0.2, max_concurrency=8)
+        started = time.perf_counter()
+        results = fetcher.fetch(DISTANCE_MATRIX_URL, distance_params(8))
+        elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual([r["status"] for r in results], ["OK"] * 8)
+        self.assertEqual(fetcher.stats()["max_in_flight"], 8)
+
+        narrow = self.fetcher(session, delay=0.05, max_concurrency=2)
+        narrow.fetch(DISTANCE_MATRIX_URL, distance_params(6))
+        self.assertEqual(narrow.stats()["max_in_flight"], 2)
+
+    def test_retries_and_bridge(self):
+        """Prueba 2: Los 503 se reintentan y el puente funciona también desde código asíncrono"""
+        session = FakeDistanceMatrix()
+        fetcher = self.fetcher(session, failures=2, backoff_seconds=0.01)
+        self.assertEqual([r["status"] for r in fetcher.fetch(DISTANCE_MATRIX_URL, distance_params(3))], ["OK"] * 3)
+        self.assertEqual(fetcher.stats()["retries"], 2)
+
+        async def caller():
+            return fetcher.fetch(DISTANCE_MATRIX_URL, distance_params(2))
+        self.assertEqual(len(asyncio.run(caller())), 2)
+
+        failing = self.fetcher(session, failures=10, max_retries=1, backoff_seconds=0.01)
+        self.assertEqual(failing.fetch(DISTANCE_MATRIX_URL, distance_params(1)), [None])
+        self.assertEqual(failing.stats()["failures"], 1)
+
+    def test_provider_matches_sequential(self):
+        """Prueba 3: Con fetcher, distances() y matrix() dan lo mismo que las solicitudes en serie"""
+        rng = np.random.default_rng(4)
+        places = [tuple(p) for p in np.round(np.column_stack([rng.uniform(4.55, 4.75, 40),
+                                                              rng.uniform(-74.15, -74.03, 40)]), 5)]
+        session = FakeDistanceMatrix()
+        sequential = GoogleDistanceProvider(api_key="test-key", session=session)
+        concurrent = GoogleDistanceProvider(api_key="test-key", session=session,
+                                            fetcher=self.fetcher(FakeDistanceMatrix()))
+
+        expected, result = sequential.matrix(places, places[:30]), concurrent.matrix(places, places[:30])
+        np.testing.assert_allclose(result.metres, expected.metres)
+        self.assertEqual(concurrent.requests, sequential.requests)
+        self.assertGreater(concurrent.fetcher.stats()["requests"], 1)
+
+        origins, destinations = places[:20] * 3, places[20:] * 3
+        np.testing.assert_allclose(concurrent.distances(origins, destinations).metres,
+                                   sequential.distances(origins, destinations).metres)
+        self.assertIn("concurrent", build_distance_provider("google", concurrency=4).stats())
+
+    def test_prefetch_trip_distances(self):
+        """Prueba 4: process_all_trips llena la caché con las matrices de todos los viajes de una vez"""
+        rows = []
+        for trip in range(3):
+            rows.append({"trip_id": trip, "tipo_de_usuario": "conductor", "correo": f"c{trip}@unal.edu.co",
+                         "direccion_de_viaje": f"Calle {trip}", "destino": "Universidad"})
+            for k in range(2):
+                rows.append({"trip_id": trip, "tipo_de_usuario": "pasajero", "correo": f"p{trip}{k}@unal.edu.co",
+                             "direccion_de_viaje": f"Carrera {trip}{k}"})
+        trips = pd.DataFrame(rows)
+        cached = build_distance_provider("google", api_key="test-key", cache_entries=100,
+                                         session=FakeDistanceMatrix())
+        self.assertEqual(pickup_optimization_service.trip_addresses(trips[trips.trip_id == 0]),
+                         ["Calle 0", "Carrera 00", "Carrera 01", "Universidad"])
+        # Sin Google las direcciones quedan sin resultado; igual cuenta los pares consultados
+        self.assertEqual(pickup_optimization_service.prefetch_trip_distances(trips, cached), 3 * 16)
+        self.assertEqual(cached.stats()["misses"], 3 * 16)
+        self.assertEqual(pickup_optimization_service.prefetch_trip_distances(trips, GoogleDistanceProvider()), 0)
+
+if __name__ == '__main__':
+    unittest.main()
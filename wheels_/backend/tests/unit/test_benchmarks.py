@@ -0,0 +1,79 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+import pandas as pd
+
+# Añadir el directorio backend al path para importar el paquete benchmarks
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import matchmaking_api
+import wheels_api
+from benchmarks.run import parse_variant, run_benchmark, run_variant
+from benchmarks.workload import CAMPUSES, generate_workload
+from wheels.destinations import normalize_destination_text
+from wheels.vector_matching import filter_active_pool
+
+class TestBenchmarks(unittest.TestCase):
+    """Pruebas del generador de cargas y del benchmark de matchmaking"""
+
+    def test_workload_is_deterministic(self):
+        """Prueba 1: La misma semilla produce los mismos DataFrames y otra semilla no"""
+        profiles_a, pool_a = generate_workload(500, seed=7)
+        profiles_b, pool_b = generate_workload(500, seed=7)
+        pd.testing.assert_frame_equal(pool_a, pool_b)
+        pd.testing.assert_frame_equal(profiles_a, profiles_b)
+        self.assertFalse(pool_a.equals(generate_workload(500, seed=8)[1]))
+
+    def test_workload_shape(self):
+        """Prueba 2: Estados NULL y vacíos, correos repetidos, campus y conductores con cupos"""
+        profiles_df, pool_df = generate_workload(2000, seed=1)
+
+        self.assertEqual(len(pool_df), 2000)
+        self.assertTrue(pool_df["status"].isna().any())
+        self.assertTrue((pool_df["status"] == "").any())
+        self.assertLess(len(filter_active_pool(pool_df)), len(pool_df))
+        self.assertTrue(pool_df["correo_usuario"].duplicated().any())
+        self.assertTrue(pool_df["pickup_lat"].between(4.4, 4.9).all())
+        self.assertTrue(pool_df["pickup_lng"].between(-74.3, -73.9).all())
+
+        campuses = {normalize_destination_text(name) for _, names, _ in CAMPUSES for name in names}
+        self.assertLessEqual(set(pool_df["destino"].map(normalize_destination_text)), campuses)
+        self.assertGreater(pool_df["destino"].nunique(), len(CAMPUSES))
+
+        drivers = pool_df[pool_df["tipo_de_usuario"] == "conductor"]
+        self.assertTrue(drivers["available_seats"].between(1, 4).all())
+        self.assertLess(len(profiles_df), pool_df["correo_usuario"].nunique())
+        self.assertTrue(profiles_df["email"].isin(pool_df["correo_usuario"]).all())
+
+    def test_run_benchmark(self):
+        """Prueba 3: El benchmark mide cada variante y omite legacy por encima del límite"""
+        results = run_benchmark(
+            sizes=[300], variants=[parse_variant("legacy"), parse_variant("vectorized:greedy")],
+            max_legacy_rows=100
+        )
+        self.assertEqual([(r["engine"], r["assignment"]) for r in results],
+                         [("legacy", "first_fit"), ("vectorized", "greedy")])
+        self.assertIn("skipped", results[0])
+        self.assertGreater(results[1]["matches"], 0)
+        self.assertGreater(results[1]["rows_per_second"], 0)
+        self.assertGreater(results[1]["peak_mib"], 0)
+
+    def test_incremental_variant_uses_api_pool_options(self):
+        """Prueba 4: La variante incremental usa las opciones del pool de cada API y coincide con la vectorizada"""
+        profiles_df, pool_df = generate_workload(600, seed=4)
+        for api in (matchmaking_api, wheels_api):
+            with patch.object(api, "pool_engine", api.pool_engine):
+                incremental = run_variant(api, pool_df, profiles_df, "incremental", "first_fit")
+                self.assertEqual(api.pool_engine.latest_per_user, api.POOL_OPTIONS["latest_per_user"])
+                self.assertEqual(api.pool_engine.normalize_destinations, api.POOL_OPTIONS["normalize_destinations"])
+            vectorized = run_variant(api, pool_df, profiles_df, "vectorized", "first_fit")
+            self.assertGreater(len(incremental), 0)
+            self.assertEqual(
+                sorted((m["conductor_correo"], len(m["pasajeros_asignados"])) for m in incremental),
+                sorted((m["conductor_correo"], len(m["pasajeros_asignados"])) for m in vectorized)
+            )
+
+if __name__ == '__main__':
+    unittest.main()
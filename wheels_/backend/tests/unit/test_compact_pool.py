@@ -0,0 +1,76 @@
+import unittest
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.compact_pool import CompactPool, match_compact_pool
+from wheels.pool_engine import dataframe_records
+from wheels.vector_matching import filter_active_pool, match_pool_vectorized
+from tests.unit.test_vector_matching import make_pool_row
+from tests.unit.test_pool_engine import random_pool, vectorized_matches
+
+def compact_matches(pool, **kwargs):
+    """Emparejamientos del pool compacto como (id conductor, [ids pasajeros])"""
+    drivers, passengers = pool.role("conductor"), pool.role("pasajero")
+    return [
+        (drivers.ids[d], passengers.ids[p].tolist())
+        for d, p, _ in match_compact_pool(drivers, passengers, max_distance_km=5, **kwargs)
+    ]
+
+class TestCompactPool(unittest.TestCase):
+    """Pruebas del searching_pool compacto basado en arrays"""
+
+    def test_columns_and_dedup(self):
+        """Prueba 1: Solo registros activos, el más reciente por correo y columnas tipadas"""
+        records = [
+            make_pool_row(1, "conductor1@unal.edu.co", "conductor", 4.6486, -74.0628, seats=2),
+            make_pool_row(2, "pasajero1@unal.edu.co", "pasajero", "4.65", None, created_at="2025-10-01T07:05:00"),
+            make_pool_row(3, "pasajero1@unal.edu.co", "pasajero", 4.6400, -74.0700),
+            dict(make_pool_row(4, "pasajero2@unal.edu.co", "pasajero", 4.6400, -74.0700), status="matched"),
+            make_pool_row(5, "otro@unal.edu.co", "pasajero", 4.6400, -74.0700, destination="universidad nacional"),
+        ]
+        pool = CompactPool.from_records(records)
+
+        self.assertEqual(pool.ids.tolist(), [2, 1, 5])
+        self.assertEqual(pool.lat.dtype, np.float64)
+        self.assertAlmostEqual(pool.lat[0], 4.65)
+        self.assertTrue(np.isnan(pool.lng[0]))
+        self.assertEqual(pool.seats.tolist(), [1, 2, 1])
+        # La clave canónica agrupa 'Universidad Nacional' y 'universidad nacional'
+        self.assertEqual(pool.destination_codes[1], pool.destination_codes[2])
+        self.assertIs(pool.records[1], records[0])
+
+        exact = CompactPool.from_records(records, latest_per_user=False, normalize_destinations=False)
+        self.assertEqual(exact.ids.tolist(), [1, 2, 3, 5])
+        self.assertNotEqual(exact.destination_codes[0], exact.destination_codes[3])
+
+    def test_matches_dataframe_engine(self):
+        """Prueba 2: Coincide con el motor vectorizado sobre DataFrames, con y sin índice"""
+        pool_df = random_pool(1500, seed=11)
+        pool = CompactPool.from_dataframe(pool_df)
+
+        self.assertEqual(compact_matches(pool), vectorized_matches(pool_df))
+        self.assertEqual(compact_matches(pool, use_spatial_index=True), vectorized_matches(pool_df))
+
+    def test_matches_without_dedup(self):
+        """Prueba 3: Sin deduplicar conserva el orden del pool y compara el destino exacto"""
+        pool_df = random_pool(800, seed=12)
+        active = filter_active_pool(pool_df)
+        drivers = active[active["tipo_de_usuario"] == "conductor"]
+        passengers = active[active["tipo_de_usuario"] == "pasajero"]
+        expected = [
+            (drivers.iloc[d]["id"], passengers.iloc[p]["id"].tolist())
+            for d, p, _ in match_pool_vectorized(drivers, passengers, max_distance_km=5, normalize_destinations=False)
+        ]
+
+        pool = CompactPool.from_records(dataframe_records(pool_df), latest_per_user=False, normalize_destinations=False)
+        self.assertEqual(compact_matches(pool), expected)
+        self.assertEqual(compact_matches(CompactPool.from_records([])), [])
+
+if __name__ == '__main__':
+    unittest.main()
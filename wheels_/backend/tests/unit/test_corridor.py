@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+
+import numpy as np
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.compact_pool import CompactPool, match_compact_pool
+from wheels.corridor import DriverCorridors, corridor_feasible
+from wheels.geo import haversine_km
+from wheels.pool_engine import IncrementalMatchEngine
+from wheels.vector_matching import corridor_candidate_pairs, dense_candidate_pairs
+from tests.unit.test_vector_matching import make_pool_row
+from tests.unit.test_pool_engine import engine_matches, random_pool
+
+def routed_pool(n, seed=1):
+    """Pool aleatorio cuyos conductores tienen destino en coordenadas (algunos sin él)"""
+    pool_df = random_pool(n, seed=seed)
+    rng = np.random.default_rng(seed)
+    pool_df["dropoff_lat"] = [None if i % 16 == 0 else 4.5 + rng.random() * 0.3 for i in range(n)]
+    pool_df["dropoff_lng"] = -74.2 + rng.random(n) * 0.15
+    return pool_df
+
+def compact_ids(pool, **kwargs):
+    """Emparejamientos del pool compacto como (id conductor, [ids pasajeros])"""
+    drivers, passengers = pool.role("conductor"), pool.role("pasajero")
+    return [
+        (drivers.ids[d], passengers.ids[p].tolist())
+        for d, p, _ in match_compact_pool(drivers, passengers, **kwargs)
+    ]
+
+class TestCorridor(unittest.TestCase):
+    """Pruebas del modo corredor de recogida"""
+
+    def test_segment_distance(self):
+        """Prueba 1: Distancia al segmento en el trayecto, después del destino y sin destino"""
+        corridors = DriverCorridors([4.60, 4.60], [-74.10, -74.10], [4.70, np.nan], [-74.10, np.nan])
+        drivers = np.array([0, 0, 1])
+        lat = np.array([4.65, 4.72, 4.65])
+        lng = np.array([-74.09, -74.10, -74.10])
+
+        distances = corridors.distance_km(drivers, lat, lng)
+        self.assertAlmostEqual(distances[0], haversine_km(4.65, -74.10, 4.65, -74.09), delta=0.01)
+        self.assertAlmostEqual(distances[1], haversine_km(4.70, -74.10, 4.72, -74.10), delta=0.01)
+        self.assertAlmostEqual(distances[2], haversine_km(4.60, -74.10, 4.65, -74.10), delta=0.01)
+
+        inside, from_origin = corridor_feasible(corridors, drivers, lat, lng, 5)
+        self.assertEqual(inside.tolist(), [True, True, False])
+        self.assertAlmostEqual(from_origin[2], haversine_km(4.60, -74.10, 4.65, -74.10))
+
+    def test_pairs_match_brute_force(self):
+        """Prueba 2: La caja del corredor no pierde pares y el corredor contiene al radio"""
+        pool = CompactPool.from_dataframe(routed_pool(1000, seed=3))
+        drivers, passengers = pool.role("conductor"), pool.role("pasajero")
+        args = (drivers.destination_codes, passengers.lat, passengers.lng, passengers.destination_codes, 3)
+
+        d, p, km = corridor_candidate_pairs(drivers.lat, drivers.lng, drivers.dropoff_lat, drivers.dropoff_lng, *args)
+
+        corridors = DriverCorridors(drivers.lat, drivers.lng, drivers.dropoff_lat, drivers.dropoff_lng, 3)
+        all_d, all_p = np.divmod(np.arange(len(drivers) * len(passengers)), len(passengers))
+        same = (drivers.destination_codes[all_d] == passengers.destination_codes[all_p]) & (drivers.destination_codes[all_d] >= 0)
+        all_d, all_p = all_d[same], all_p[same]
+        inside, _ = corridor_feasible(corridors, all_d, passengers.lat[all_p], passengers.lng[all_p], 3)
+        self.assertEqual(list(zip(d.tolist(), p.tolist())), list(zip(all_d[inside].tolist(), all_p[inside].tolist())))
+
+        radius_d, radius_p, _ = dense_candidate_pairs(drivers.lat, drivers.lng, *args)
+        self.assertTrue(set(zip(radius_d.tolist(), radius_p.tolist())) < set(zip(d.tolist(), p.tolist())))
+        np.testing.assert_allclose(km, haversine_km(drivers.lat[d], drivers.lng[d], passengers.lat[p], passengers.lng[p]))
+
+    def test_engine_matches_compact_pool(self):
+        """Prueba 3: El motor incremental en modo corredor coincide con el pool compacto"""
+        pool_df = routed_pool(1500, seed=4)
+        engine = IncrementalMatchEngine(pickup_mode="corridor")
+        engine.load_dataframe(pool_df)
+        expected = compact_ids(CompactPool.from_dataframe(pool_df), pickup_mode="corridor")
+
+        self.assertEqual(engine_matches(engine), expected)
+        self.assertNotEqual(expected, compact_ids(CompactPool.from_dataframe(pool_df)))
+
+    def test_passenger_along_route(self):
+        """Prueba 4: Un pasajero a mitad de camino, lejos del origen, se empareja al llegar"""
+        driver = dict(make_pool_row(1, "conductor@unal.edu.co", "conductor", 4.55, -74.10, seats=2),
+                      dropoff_lat=4.75, dropoff_lng=-74.10)
+        engine = IncrementalMatchEngine(pickup_mode="corridor")
+        engine.load_records([driver])
+        self.assertEqual(engine_matches(engine), [])
+
+        engine.upsert(make_pool_row(2, "pasajero@unal.edu.co", "pasajero", 4.65, -74.11))
+        self.assertEqual(engine_matches(engine), [(1, [2])])
+
+        radius_engine = IncrementalMatchEngine()
+        radius_engine.load_records([driver, make_pool_row(2, "pasajero@unal.edu.co", "pasajero", 4.65, -74.11)])
+        self.assertEqual(engine_matches(radius_engine), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+import unittest
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.distance_provider import (
+    MAX_ELEMENTS_PER_REQUEST, MAX_PLACES_PER_REQUEST, CachedDistanceProvider, DistanceBatch, DistanceProvider,
+    FallbackDistanceProvider, GoogleDistanceProvider, HaversineDistanceProvider, SqliteDistanceStore,
+    build_distance_provider, format_duration, pack_pairs
+)
+from wheels.geo import haversine_km
+from wheels.road_matching import DEFAULT_ROAD_TOP_K
+import wheels_api
+from benchmarks.workload import generate_workload
+from pickup_optimization_service import PickupOptimizer
+from tests.unit.test_road_matching import FakeDistanceMatrix, FakeResponse, fake_road
+
+class CountingProvider(DistanceProvider):
+    """Proveedor Haversine que cuenta los pares que se le piden"""
+
+    name = "counting"
+
+    def __init__(self):
+        self.pairs = 0
+
+    def distances(self, origins, destinations):
+        self.pairs += len(origins)
+        return HaversineDistanceProvider().distances(origins, destinations)
+
+class PerOriginProvider(DistanceProvider):
+    """Pide los pares origen por origen, como el bucle por conductor antes del lote"""
+
+    name = "per_origin"
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def distances(self, origins, destinations):
+        positions = {}
+        for position, origin in enumerate(origins):
+            positions.setdefault(origin, []).append(position)
+        metres, seconds = np.full(len(origins), np.nan), np.full(len(origins), np.nan)
+        sources = np.full(len(origins), "error", dtype=object)
+        for origin, group in positions.items():
+            batch = self.provider.one_to_many(origin, [destinations[position] for position in group])
+            metres[group], seconds[group], sources[group] = batch.metres, batch.seconds, batch.sources
+        return DistanceBatch(metres, seconds, sources)
+
+class TestDistanceProvider(unittest.TestCase):
+    """Pruebas de los proveedores de distancia"""
+
+    def setUp(self):
+        self.origin = (4.6486, -74.0628)
+        self.points = [(4.65, -74.06), (4.70, -74.04), (4.60, -74.10)]
+
+    def test_haversine_batch(self):
+        """Prueba 1: Metros y segundos numéricos; las direcciones no tienen resultado"""
+        batch = HaversineDistanceProvider().one_to_many(self.origin, self.points + ["Calle 26 # 10-20"])
+        km = haversine_km(self.origin[0], self.origin[1], *np.array(self.points).T)
+
+        np.testing.assert_allclose(batch.metres[:3], km * 1000)
+        np.testing.assert_allclose(batch.seconds[:3], km * 90)
+        self.assertEqual(batch.missing().tolist(), [False, False, False, True])
+        self.assertEqual(batch.result(0)["duration"], f"~{round(km[0] * 1.5)} min")
+        self.assertEqual(batch.result(3)["source"], "error")
+
+    def test_google_batching(self):
+        """Prueba 2: Orígenes sin destinos comunes van por separado; matrix() en bloques de 100 elementos"""
+        session = FakeDistanceMatrix()
+        provider = GoogleDistanceProvider(api_key="test-key", session=session)
+        points = [(4.6 + i * 0.001, -74.1) for i in range(60)]
+
+        batch = provider.distances([self.origin] * 30 + [points[0]] * 30, points)
+        self.assertEqual(len(session.requests), 4)
+        self.assertFalse(batch.missing().any())
+        self.assertEqual(batch.result(0)["duration"], "5 mins")
+        self.assertEqual(batch.result(0)["duration_seconds"], 300)
+
+        session.requests.clear()
+        matrix = provider.matrix(points[:30], points[:30])
+        self.assertEqual(matrix.metres.shape, (30, 30))
+        self.assertTrue(all(len(o) <= MAX_PLACES_PER_REQUEST and len(d) <= MAX_PLACES_PER_REQUEST
+                            and len(o) * len(d) <= MAX_ELEMENTS_PER_REQUEST for o, d in session.requests))
+        np.testing.assert_allclose(
+            matrix.metres[3], haversine_km(points[3][0], points[3][1], *np.array(points[:30]).T) * 1000
+        )
+
+    def test_google_fallback(self):
+        """Prueba 3: Sin clave o con elementos fallidos se completa con Haversine"""
+        with patch.dict(os.environ, {"GOOGLE_MAPS_API_KEY": ""}):
+            batch = build_distance_provider("google").one_to_many(self.origin, self.points)
+        self.assertEqual(set(batch.sources), {"haversine"})
+
+        session = FakeDistanceMatrix()
+        failing = {"status": "OK", "rows": [{"elements": [
+            {"status": "ZERO_RESULTS"},
+            {"status": "OK", "distance": {"value": 1234}, "duration": {"value": 60},
+             "duration_in_traffic": {"value": 125}},
+            {"status": "NOT_FOUND"}
+        ]}]}
+        session.get = lambda url, params=None, timeout=None: FakeResponse(failing)
+        batch = build_distance_provider("google", api_key="test-key", session=session).one_to_many(self.origin, self.points)
+        self.assertEqual(batch.sources.tolist(), ["haversine", "google_maps", "haversine"])
+        self.assertEqual(batch.result(1), {"distance": 1.23, "duration": "2 mins", "duration_seconds": 125.0,
+                                           "source": "google_maps"})
+        self.assertEqual(format_duration(3900), "1 hour 5 mins")
+
+    def test_cache(self):
+        """Prueba 4: Los pares repetidos no se vuelven a pedir y la caché respeta su tamaño"""
+        counting = CountingProvider()
+        cache = CachedDistanceProvider(counting, max_entries=3)
+
+        first = cache.one_to_many(self.origin, self.points + [self.points[0]])
+        self.assertEqual(counting.pairs, 3)
+        second = cache.one_to_many(self.origin, self.points)
+        self.assertEqual(counting.pairs, 3)
+        self.assertEqual(cache.hits, 3)
+        np.testing.assert_allclose(first.metres[:3], second.metres)
+
+        cache.one_to_many(self.points[0], [self.origin, "Calle 26 # 10-20"])
+        self.assertEqual(len(cache), 3)
+        cache.one_to_many(self.origin, [self.points[0]])
+        self.assertEqual(counting.pairs, 6)
+
+        with self.assertRaises(ValueError):
+            build_distance_provider("osrm")
+
+    def test_pickup_optimizer_uses_provider(self):
+        """Prueba 5: El optimizador ordena con la matriz del proveedor (del más lejos al más cerca)"""
+        destination = (4.6381, -74.0862)
+        optimizer = PickupOptimizer(provider=HaversineDistanceProvider())
+        route = optimizer.calculate_optimal_pickup_order(
+            {"correo": "conductor@unal.edu.co", "direccion_de_viaje": (4.75, -74.05)},
+            [{"correo": f"p{i}@unal.edu.co", "direccion_de_viaje": point} for i, point in enumerate(self.points)],
+            destination
+        )
+        pickups = [step["original_index"] for step in route["steps"] if step["type"] == "pickup"]
+        self.assertEqual(pickups, [1, 2, 0])
+        self.assertGreater(route["total_distance_m"], 0)
+        self.assertIsInstance(route["total_duration_s"], int)
+
+    def test_two_tier_cache(self):
+        """Prueba 6: Claves cuantizadas, nivel SQLite entre instancias y vencimiento por antigüedad"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "distances.sqlite")
+            counting = CountingProvider()
+            cache = CachedDistanceProvider(counting, max_entries=100, precision=4, store=SqliteDistanceStore(path))
+
+            # Dos puntos a menos de 5 m comparten la entrada
+            cache.one_to_many(self.origin, [self.points[0], (4.65002, -74.06003)])
+            self.assertEqual(counting.pairs, 1)
+
+            # Un proceso nuevo (memoria vacía) encuentra los pares en disco
+            restarted = CountingProvider()
+            second = CachedDistanceProvider(restarted, max_entries=100, precision=4, store=SqliteDistanceStore(path))
+            batch = second.one_to_many(self.origin, self.points)
+            self.assertEqual(restarted.pairs, 2)
+            self.assertEqual(second.stats()["disk_hits"], 1)
+            second.one_to_many(self.origin, self.points)
+            self.assertEqual(second.stats()["hits"], 3)
+            self.assertEqual(second.stats()["hit_rate"], round(4 / 6, 3))
+            np.testing.assert_allclose(batch.metres[0], cache.one_to_many(self.origin, [self.points[0]]).metres[0])
+
+            # Con el tiempo los pares del disco vencen
+            later = CachedDistanceProvider(CountingProvider(), max_entries=100, max_age_seconds=3600,
+                                           store=SqliteDistanceStore(path))
+            with patch("wheels.distance_provider.time.time", return_value=time.time() + 7200):
+                later.one_to_many(self.origin, self.points)
+            self.assertEqual(later.provider.pairs, 3)
+            self.assertEqual(len(SqliteDistanceStore(path)), 3)
+
+    def test_cache_skips_fallback_estimates(self):
+        """Prueba 7: Las estimaciones Haversine de respaldo no se guardan y Haversine no usa caché"""
+        class Unavailable(DistanceProvider):
+            name = "google_maps"
+
+            def distances(self, origins, destinations):
+                return DistanceBatch.unavailable(len(origins))
+
+        cache = CachedDistanceProvider(FallbackDistanceProvider(Unavailable(), HaversineDistanceProvider()))
+        self.assertEqual(set(cache.one_to_many(self.origin, self.points).sources), {"haversine"})
+        self.assertEqual(len(cache), 0)
+        self.assertIsInstance(build_distance_provider("haversine", cache_entries=100), HaversineDistanceProvider)
+        self.assertIsInstance(build_distance_provider("google", cache_entries=100), CachedDistanceProvider)
+
+    def test_pack_pairs(self):
+        """Prueba 8: Bloques dentro de los límites, cada par una vez y sin producto cruzado en pares dispersos"""
+        dense = [(o, d) for o in range(8) for d in range(12)]
+        self.assertEqual(pack_pairs(dense), [(list(range(8)), list(range(12)))])
+
+        diagonal = [(i, i) for i in range(10)]
+        self.assertEqual(len(pack_pairs(diagonal)), 10)
+
+        rng = np.random.default_rng(4)
+        pairs = {(int(o), int(d)) for o, d in zip(rng.integers(0, 60, 900), rng.integers(0, 90, 900))}
+        tiles = pack_pairs(sorted(pairs))
+        covered = [(o, d) for rows, columns in tiles for o in rows for d in columns if (o, d) in pairs]
+        self.assertEqual(sorted(covered), sorted(pairs))
+        for rows, columns in tiles:
+            self.assertLessEqual(max(len(rows), len(columns)), MAX_PLACES_PER_REQUEST)
+            self.assertLessEqual(len(rows) * len(columns), MAX_ELEMENTS_PER_REQUEST)
+            useful = sum((o, d) in pairs for o in rows for d in columns)
+            self.assertTrue(len(rows) == 1 or useful >= 0.75 * len(rows) * len(columns))
+
+        # Conductores que comparten pasajeros: menos solicitudes que orígenes
+        session = FakeDistanceMatrix()
+        provider = GoogleDistanceProvider(api_key="test-key", session=session)
+        drivers = [(4.60 + i * 0.001, -74.1) for i in range(6)]
+        passengers = [(4.61 + j * 0.001, -74.09) for j in range(15)]
+        batch = provider.distances([d for d in drivers for _ in passengers], passengers * len(drivers))
+        self.assertEqual(len(session.requests), 1)
+        np.testing.assert_allclose(batch.metres, np.concatenate([
+            haversine_km(d[0], d[1], *np.array(passengers).T) * 1000 for d in drivers
+        ]))
+
+    def test_store_get_many_chunks(self):
+        """Prueba 9: get_many hace una consulta por bloque y conserva el filtro de antigüedad"""
+        with tempfile.TemporaryDirectory() as directory:
+            store = SqliteDistanceStore(os.path.join(directory, "distances.sqlite"))
+            now = time.time()
+            keys = [((4.6, -74.1 + i * 0.0001), (4.65, -74.06)) for i in range(1000)]
+            store.put_many([(key, now - (7200 if i % 10 == 0 else 0), 1000.0 + i, 90.0, "google_maps")
+                            for i, key in enumerate(keys)])
+
+            statements = []
+            store._connection.set_trace_callback(statements.append)
+            found = store.get_many(keys + [((4.6, -74.1), "Calle 26 # 40")], max_age_seconds=3600)
+            self.assertEqual(len(statements), 3)
+            self.assertEqual(len(found), 900)
+            self.assertNotIn(keys[0], found)
+            self.assertEqual(found[keys[1]][1:], (1001.0, 90.0, "google_maps"))
+            self.assertEqual(len(store.get_many(keys)), 1000)
+            self.assertEqual(store.get_many([]), {})
+
+    def test_legacy_batch_billing(self):
+        """Prueba 10: El lote del motor legacy no cobra más elementos que pedir conductor por conductor"""
+        profiles_df, pool_df = generate_workload(600, seed=11)
+        billed, matches = {}, {}
+        for variant, top_k in (("per_driver", 10 ** 6), ("batched", 10 ** 6), ("capped", DEFAULT_ROAD_TOP_K)):
+            road, session = fake_road()
+            provider = PerOriginProvider(road) if variant == "per_driver" else road
+            with patch.object(wheels_api, "distance_provider", provider), \
+                 patch.object(wheels_api, "MATCHMAKING_ROAD_TOP_K", top_k):
+                matches[variant] = wheels_api.match_rides_enhanced(pool_df, profiles_df, engine="legacy")
+            billed[variant] = sum(len(origins) * len(destinations) for origins, destinations in session.requests)
+
+        self.assertEqual(matches["batched"], matches["per_driver"])
+        self.assertLessEqual(billed["batched"], billed["per_driver"])
+        self.assertLess(billed["capped"], billed["per_driver"])
+        self.assertGreater(len(matches["capped"]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
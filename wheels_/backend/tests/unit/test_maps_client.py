@@ -0,0 +1,117 @@
+import unittest
+import os
+import sys
+import threading
+import time
+
+import requests
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.distance_provider import GoogleDistanceProvider
+from wheels.maps_client import MapsClient, TokenBucket, get_maps_client
+
+class FakeResponse:
+    """Respuesta mínima con status_code, headers y json()"""
+
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._data = data
+
+    def json(self):
+        if self._data is None:
+            raise ValueError("sin JSON")
+        return self._data
+
+class ScriptedSession:
+    """Sesión que devuelve (o lanza) las respuestas de un guion, en orden"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append(timeout)
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+class TestMapsClient(unittest.TestCase):
+    """Pruebas del cliente HTTP compartido para Google Maps"""
+
+    def setUp(self):
+        self.sleeps = []
+
+    def client(self, script, **kwargs):
+        session = ScriptedSession(script)
+        kwargs.setdefault("rate_limit_delay", 0)
+        return MapsClient(session=session, sleep=self.sleeps.append, **kwargs), session
+
+    def test_retries_transient_responses(self):
+        """Prueba 1: 503 y OVER_QUERY_LIMIT se reintentan con backoff creciente; OK se devuelve"""
+        client, session = self.client([
+            FakeResponse(503),
+            FakeResponse(200, {"status": "OVER_QUERY_LIMIT"}),
+            FakeResponse(200, {"status": "OK"}),
+        ], timeout=7, backoff_seconds=0.5)
+        response = client.get("https://maps.example/api", params={"key": "k"})
+
+        self.assertEqual(response.json()["status"], "OK")
+        self.assertEqual(session.calls, [7, 7, 7])
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertLessEqual(self.sleeps[0], 0.5)
+        self.assertLessEqual(self.sleeps[1], 1.0)
+        self.assertEqual((client.stats()["requests"], client.stats()["retries"], client.stats()["failures"]), (3, 2, 0))
+
+    def test_gives_up_after_max_retries(self):
+        """Prueba 2: Agotados los reintentos se propaga el error de red o se devuelve la última respuesta"""
+        client, session = self.client([requests.ConnectionError("sin red")] * 3, max_retries=2)
+        with self.assertRaises(requests.ConnectionError):
+            client.get("https://maps.example/api")
+        self.assertEqual(client.stats()["failures"], 1)
+
+        client, session = self.client([FakeResponse(429, headers={"Retry-After": "2"})] * 2, max_retries=1)
+        self.assertEqual(client.get("https://maps.example/api").status_code, 429)
+        self.assertEqual(self.sleeps[-1], 2.0)
+        self.assertEqual(client.stats()["failures"], 1)
+
+        # Los errores definitivos de la API no se reintentan
+        client, session = self.client([FakeResponse(200, {"status": "REQUEST_DENIED"})])
+        client.get("https://maps.example/api")
+        self.assertEqual(len(session.calls), 1)
+
+    def test_token_bucket(self):
+        """Prueba 3: El token bucket espacia las solicitudes según rate_limit_delay, también entre hilos"""
+        now = [0.0]
+        waits = []
+        bucket = TokenBucket(10, clock=lambda: now[0], sleep=waits.append)
+        self.assertEqual([round(bucket.acquire(), 3) for _ in range(4)], [0.0, 0.1, 0.2, 0.3])
+        # Tras una pausa larga no se acumula más de `capacity` fichas
+        now[0] = 10.0
+        self.assertEqual([round(bucket.acquire(), 3) for _ in range(2)], [0.0, 0.1])
+        self.assertEqual(TokenBucket(None).acquire(), 0.0)
+        # Con capacity > 1 la ráfaga sale sin espera y la tasa sostenida no cambia
+        burst = TokenBucket(10, capacity=3, clock=lambda: now[0], sleep=waits.append)
+        self.assertEqual([round(burst.acquire(), 3) for _ in range(5)], [0.0, 0.0, 0.0, 0.1, 0.2])
+
+        bucket = TokenBucket(100)
+        started = time.monotonic()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(11)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertGreaterEqual(time.monotonic() - started, 0.095)
+
+    def test_shared_client_default(self):
+        """Prueba 4: Google Distance Matrix usa por defecto el cliente compartido del proceso"""
+        provider = GoogleDistanceProvider(api_key="test-key")
+        self.assertIs(provider.session, get_maps_client())
+        self.assertIsInstance(get_maps_client().session, requests.Session)
+        self.assertEqual(MapsClient.from_config({"request_timeout": 30, "max_retries": 3}).max_retries, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.match_cache import MatchResultCache, pool_snapshot_version
+
+class PostgresOrderQuery:
+    """Consulta falsa con el orden de Postgres: en orden descendente los NULL van primero por defecto"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = None
+
+    def select(self, columns, count=None):
+        self.count = len(self.rows) if count == "exact" else None
+        return self
+
+    def order(self, column, desc=False, nullsfirst=None):
+        nulls_first = desc if nullsfirst is None else nullsfirst
+        present = sorted((row for row in self.rows if row.get(column) is not None),
+                         key=lambda row: row[column], reverse=desc)
+        missing = [row for row in self.rows if row.get(column) is None]
+        self.rows = missing + present if nulls_first else present + missing
+        return self
+
+    def limit(self, count):
+        self.rows = self.rows[:count]
+        return self
+
+    def execute(self):
+        return MagicMock(count=self.count, data=self.rows)
+
+class TestMatchCache(unittest.TestCase):
+    """Pruebas de la caché de resultados de matchmaking"""
+
+    def setUp(self):
+        self.cache = MatchResultCache(max_entries=2)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return [{"driver_pool_id": self.calls}]
+
+    def test_hit_until_version_changes(self):
+        """Prueba 1: Mientras la versión del pool no cambie se reutiliza el resultado"""
+        first = self.cache.get_or_compute(((3, "2025-10-01T07:00:00"), "all"), self.compute)
+        again = self.cache.get_or_compute(((3, "2025-10-01T07:00:00"), "all"), self.compute)
+        changed = self.cache.get_or_compute(((3, "2025-10-01T07:05:00"), "all"), self.compute)
+
+        self.assertIs(first, again)
+        self.assertNotEqual(first, changed)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_lru_bound(self):
+        """Prueba 2: No se guardan más de max_entries resultados y sale el menos usado"""
+        for key in ("a", "b", "a", "c"):
+            self.cache.get_or_compute(key, self.compute)
+
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertTrue(self.cache.get("a")[0])
+        self.assertFalse(self.cache.get("b")[0])
+
+    def test_bump_and_expiry(self):
+        """Prueba 3: bump() y max_age_seconds invalidan los resultados"""
+        self.cache.get_or_compute("all", self.compute)
+        self.cache.bump()
+        self.assertFalse(self.cache.get("all")[0])
+
+        # Un bump durante el cálculo impide guardar un resultado desactualizado
+        def compute_and_bump():
+            self.cache.bump()
+            return self.compute()
+        self.cache.get_or_compute("all", compute_and_bump)
+        self.assertFalse(self.cache.get("all")[0])
+
+        cache = MatchResultCache(max_age_seconds=10)
+        with patch("wheels.match_cache.time.monotonic", return_value=100.0):
+            cache.put("all", [])
+        with patch("wheels.match_cache.time.monotonic", return_value=111.0):
+            self.assertFalse(cache.get("all")[0])
+
+    def test_pool_snapshot_version(self):
+        """Prueba 4: La versión combina el conteo y el updated_at más reciente"""
+        supabase = MagicMock()
+        query = supabase.table.return_value.select.return_value.order.return_value.limit.return_value
+        query.execute.return_value = MagicMock(count=7, data=[{"updated_at": "2025-10-01T07:00:00"}])
+
+        self.assertEqual(pool_snapshot_version(supabase), (7, "2025-10-01T07:00:00"))
+        supabase.table.return_value.select.assert_called_with("updated_at", count="exact")
+
+        query.execute.return_value = MagicMock(count=0, data=[])
+        self.assertEqual(pool_snapshot_version(supabase), (0, None))
+
+    def test_iter_or_compute(self):
+        """Prueba 5: El streaming guarda el resultado solo si la iteración termina"""
+        def iterate():
+            self.calls += 1
+            yield from ({"driver_pool_id": i} for i in range(3))
+
+        partial = self.cache.iter_or_compute("all", iterate)
+        next(partial)
+        partial.close()
+        self.assertFalse(self.cache.get("all")[0])
+
+        self.assertEqual(len(list(self.cache.iter_or_compute("all", iterate))), 3)
+        self.assertEqual(list(self.cache.iter_or_compute("all", iterate)), self.cache.get("all")[1])
+        self.assertEqual(self.calls, 2)
+
+    def test_pool_snapshot_version_null_updated_at(self):
+        """Prueba 6: Una fila con updated_at NULL no congela la versión"""
+        rows = [{"updated_at": None}, {"updated_at": "2025-10-01T07:00:00"}, {"updated_at": "2025-10-01T07:05:00"}]
+        supabase = MagicMock()
+        supabase.table.side_effect = lambda name: PostgresOrderQuery([dict(row) for row in rows])
+        self.assertEqual(pool_snapshot_version(supabase), (3, "2025-10-01T07:05:00"))
+
+        # Una actualización de estado (p. ej. status 'cancelled') cambia la versión
+        rows[1]["updated_at"] = "2025-10-01T07:10:00"
+        self.assertEqual(pool_snapshot_version(supabase), (3, "2025-10-01T07:10:00"))
+
+        rows[1:] = []
+        self.assertEqual(pool_snapshot_version(supabase), (1, None))
+
+if __name__ == '__main__':
+    unittest.main()
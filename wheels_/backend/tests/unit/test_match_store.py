@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+# Añadir el directorio backend al path para importar las APIs y el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import matchmaking_api
+import wheels_api
+from wheels.match_cache import MatchResultCache
+from wheels.match_store import MatchRefresher, MatchSnapshot, MatchStore
+from wheels.work_queue import CoalescingWorkQueue
+
+def make_match(driver, passengers):
+    """Match de conductor mínimo con el formato de las APIs"""
+    return {
+        "correo_conductor": driver,
+        "pasajeros_asignados": [{"correo": passenger, "nombre": passenger} for passenger in passengers]
+    }
+
+class TestMatchStore(unittest.TestCase):
+    """Pruebas del almacén de resultados precalculados"""
+
+    def setUp(self):
+        self.matches = [
+            make_match("c1@unal.edu.co", ["p1@unal.edu.co", "p2@unal.edu.co"]),
+            make_match("c2@unal.edu.co", ["p1@unal.edu.co"]),
+        ]
+
+    def test_snapshot_index(self):
+        """Prueba 1: El índice por correo reproduce el filtrado de /api/matches/<user_email>"""
+        snapshot = MatchSnapshot((3, "v1"), self.matches)
+
+        self.assertEqual([entry["role"] for entry in snapshot.for_user("p1@unal.edu.co")], ["passenger", "passenger"])
+        self.assertEqual(snapshot.for_user("c2@unal.edu.co"), ({"role": "driver", "match": self.matches[1]},))
+        self.assertEqual(snapshot.for_user("p2@unal.edu.co")[0]["passenger_details"]["correo"], "p2@unal.edu.co")
+        self.assertEqual(snapshot.for_user("nadie@unal.edu.co"), ())
+        self.assertEqual(snapshot.describe()["total_matches"], 2)
+
+    def test_publish_and_persistence(self):
+        """Prueba 2: La misma lista y versión no crea otro snapshot; el snapshot sobrevive al reinicio"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "matches.json")
+            store = MatchStore(path=path)
+            first = store.publish((3, "v1"), self.matches)
+            self.assertIs(store.publish((3, "v1"), self.matches), first)
+            second = store.publish((4, "v2"), self.matches[:1])
+            self.assertIsNot(second, first)
+            self.assertEqual(store.stats()["publications"], 2)
+
+            restored = MatchStore(path=path).latest()
+            self.assertEqual(restored.version, (4, "v2"))
+            self.assertEqual(restored.matches, second.matches)
+            self.assertEqual(restored.computed_at, second.computed_at)
+
+    def test_refresher(self):
+        """Prueba 3: Sin cadencia el refresco está desactivado; refresh_now cuenta fallos"""
+        self.assertFalse(MatchRefresher(lambda: None, 0).start())
+
+        def failing():
+            raise RuntimeError("Supabase no disponible")
+        refresher = MatchRefresher(failing, 3600)
+        with self.assertRaises(RuntimeError):
+            refresher.refresh_now()
+        self.assertEqual(refresher.failures, 1)
+
+    def test_endpoints_read_snapshot(self):
+        """Prueba 4: Con el almacén activo los endpoints leen el snapshot y reportan su antigüedad"""
+        for api in (matchmaking_api, wheels_api):
+            calls = []
+
+            def compute():
+                calls.append(1)
+                return self.matches
+
+            store = MatchStore()
+            refresher = MatchRefresher(lambda: api.refresh_match_store(), 3600)
+            patches = [
+                patch.object(api, "match_store", store),
+                patch.object(api, "match_refresher", refresher),
+                patch.object(api, "match_cache", MatchResultCache()),
+                patch.object(api, "get_pool_version", return_value=(2, "v1")),
+                patch.object(api, "compute_all_matches", side_effect=compute),
+            ]
+            if api is matchmaking_api:
+                queue = CoalescingWorkQueue(lambda notifications: api.run_queued_matchmaking(notifications),
+                                            debounce_seconds=0)
+                patches.append(patch.object(api, "matchmaking_queue", queue))
+            for p in patches:
+                p.start()
+            try:
+                client = api.app.test_client()
+                body = client.get("/api/python-matchmaking").get_json()
+                again = client.get("/api/python-matchmaking").get_json()
+                user = client.get("/api/matches/p1@unal.edu.co").get_json()
+            finally:
+                refresher.stop()
+                for p in reversed(patches):
+                    p.stop()
+
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(body["total_matches"], 2)
+            self.assertEqual(again["snapshot"]["computed_at"], body["snapshot"]["computed_at"])
+            self.assertGreaterEqual(again["snapshot"]["age_seconds"], 0)
+            self.assertEqual(user["total_matches"], 2)
+            self.assertIn("snapshot", user)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+import unittest
+import os
+import sys
+from collections import Counter
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+# Añadir el directorio backend al path para importar las APIs y el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import matchmaking_api
+import wheels_api
+from benchmarks.workload import generate_workload
+from wheels.compact_pool import CompactPool, match_compact_pool
+from wheels.match_cache import MatchResultCache
+from wheels.pool_engine import IncrementalMatchEngine, dataframe_records, fetch_user_neighborhood
+from wheels.vector_matching import filter_active_pool, match_pool_vectorized, split_unique_users
+from tests.unit.test_vector_matching import make_pool_row
+
+def random_pool(n, seed=1):
+    """Pool aleatorio en Bogotá con correos repetidos y varios destinos"""
+    rng = np.random.default_rng(seed)
+    destinations = ["Universidad Nacional", "universidad nacional ", "Universidad de los Andes", "Centro"]
+    return pd.DataFrame([
+        make_pool_row(
+            i, f"u{int(rng.integers(0, n * 0.8))}@unal.edu.co", "conductor" if i % 4 == 0 else "pasajero",
+            4.5 + rng.random() * 0.3, -74.2 + rng.random() * 0.15,
+            destination=destinations[int(rng.integers(0, 4))], seats=int(rng.integers(0, 4)),
+            created_at=f"2025-10-01T07:{i // 60 % 60:02d}:{i % 60:02d}"
+        )
+        for i in range(n)
+    ])
+
+def engine_matches(engine):
+    """Emparejamientos del motor como (id conductor, [ids pasajeros])"""
+    return [(driver["id"], [passenger["id"] for passenger, _ in passengers]) for driver, passengers in engine.matches()]
+
+def api_matches(matches):
+    """Resumen de la respuesta de una API: (registro del conductor, [(correo, km) de cada pasajero])"""
+    return [
+        (match["driver_pool_id"], [(p["correo"], p["distance_km"]) for p in match["pasajeros_asignados"]])
+        for match in matches
+    ]
+
+def vectorized_matches(pool_df):
+    """Emparejamientos de referencia del motor vectorizado sobre el pool completo"""
+    drivers, passengers = split_unique_users(filter_active_pool(pool_df))
+    return [
+        (drivers.iloc[d]["id"], passengers.iloc[p]["id"].tolist())
+        for d, p, _ in match_pool_vectorized(drivers, passengers, max_distance_km=5)
+    ]
+
+class FakeQuery:
+    """Consulta mínima de Supabase sobre una lista de registros en memoria"""
+
+    def __init__(self, rows, log):
+        self.rows = rows
+        log.append(self)
+
+    def select(self, columns):
+        return self
+
+    def _filter(self, predicate):
+        self.rows = [row for row in self.rows if predicate(row)]
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda row: row.get(column) == value)
+
+    def gte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] >= value)
+
+    def lte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] <= value)
+
+    def in_(self, column, values):
+        return self._filter(lambda row: row.get(column) in set(values))
+
+    def execute(self):
+        return type("Response", (), {"data": [dict(row) for row in self.rows]})()
+
+class FakeSupabase:
+    """Cliente falso que registra las consultas hechas al searching_pool"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def table(self, name):
+        return FakeQuery(self.rows, self.queries)
+
+def involving(matches, email):
+    """Filtra emparejamientos globales como lo hace /api/matches/<user_email>"""
+    return [
+        (driver["id"], [passenger["id"] for passenger, _ in passengers])
+        for driver, passengers in matches
+        if driver["correo_usuario"] == email or any(p["correo_usuario"] == email for p, _ in passengers)
+    ]
+
+def endpoint_user_matches(api, records, emails, **settings):
+    """Respuesta de /api/matches/<email> de cada correo, con el pool en un cliente falso"""
+    with ExitStack() as stack:
+        for name, value in settings.items():
+            stack.enter_context(patch.object(api, name, value))
+        stack.enter_context(patch.object(api, "get_supabase_client", return_value=FakeSupabase(records)))
+        stack.enter_context(patch.object(api, "get_pool_version", return_value=("test", len(records))))
+        stack.enter_context(patch.object(api, "match_cache", MatchResultCache()))
+        if hasattr(api, "get_profile_names"):
+            stack.enter_context(patch.object(api, "get_profile_names", return_value={}))
+        client = api.app.test_client()
+        return {email: client.get(f"/api/matches/{email}").get_json()["matches"] for email in emails}
+
+class TestPoolEngine(unittest.TestCase):
+    """Pruebas del motor de matchmaking incremental en memoria"""
+
+    def setUp(self):
+        """Pool pequeño: un conductor con dos pasajeros cercanos y uno lejano"""
+        self.records = [
+            make_pool_row(1, "conductor1@unal.edu.co", "conductor", 4.6486, -74.0628, seats=2),
+            make_pool_row(2, "pasajero1@unal.edu.co", "pasajero", 4.6500, -74.0600, created_at="2025-10-01T07:05:00"),
+            make_pool_row(3, "pasajero2@unal.edu.co", "pasajero", 4.6400, -74.0700),
+            make_pool_row(4, "lejano@unal.edu.co", "pasajero", 4.5000, -74.2000),
+        ]
+        self.engine = IncrementalMatchEngine(max_distance_km=5)
+        self.engine.load_records(self.records)
+
+    def test_load_matches_vectorized_engine(self):
+        """Prueba 1: Tras una carga completa coincide con el motor vectorizado"""
+        pool_df = random_pool(1500)
+        engine = IncrementalMatchEngine(max_distance_km=5)
+        engine.load_dataframe(pool_df)
+
+        self.assertEqual(engine_matches(engine), vectorized_matches(pool_df))
+
+    def test_updates_recompute_only_affected_drivers(self):
+        """Prueba 2: Los cambios recalculan solo los conductores cercanos y el resultado sigue igual"""
+        pool_df = random_pool(1500, seed=2)
+        records = dataframe_records(pool_df)
+        engine = IncrementalMatchEngine(max_distance_km=5)
+        engine.load_records(records)
+        engine.flush()
+        drivers = engine.stats()["drivers"]
+
+        rng = np.random.default_rng(4)
+        for step in range(40):
+            position = int(rng.integers(0, len(records)))
+            record = dict(records[position])
+            if step % 3 == 0:
+                record["pickup_lat"] += 0.02
+            elif step % 3 == 1:
+                record["status"] = "matched"
+            else:
+                record["created_at"] = f"2025-10-02T08:00:{step:02d}"
+            records[position] = record
+            engine.upsert(record)
+
+            self.assertLess(engine.flush(), drivers)
+            self.assertEqual(engine_matches(engine), vectorized_matches(pd.DataFrame(records)))
+
+    def test_dedup_keeps_latest_record_per_email(self):
+        """Prueba 3: Solo cuenta el registro más reciente de cada correo"""
+        newer = make_pool_row(5, "pasajero2@unal.edu.co", "pasajero", 4.5000, -74.2000, created_at="2025-10-01T08:00:00")
+        self.engine.upsert(newer)
+        self.assertEqual(engine_matches(self.engine), [(1, [2])])
+
+        self.engine.remove(5)
+        self.assertEqual(engine_matches(self.engine), [(1, [2, 3])])
+
+    def test_inactive_update_removes_record(self):
+        """Prueba 4: Un registro que deja de estar en búsqueda sale del pool"""
+        matched = dict(self.records[1], status="matched")
+
+        self.assertTrue(self.engine.upsert(matched))
+        self.assertFalse(self.engine.upsert(matched))
+        self.assertEqual(engine_matches(self.engine), [(1, [3])])
+
+    def test_apply_notification(self):
+        """Prueba 5: Notificaciones con registro completo, solo id y eliminación"""
+        version = self.engine.version
+        moved = dict(self.records[3], pickup_lat=4.6490, pickup_lng=-74.0610, created_at="2025-10-01T07:01:00")
+
+        self.assertTrue(self.engine.apply_notification({"record_id": 4}, fetch_record=lambda record_id: moved))
+        self.assertEqual(engine_matches(self.engine), [(1, [2, 4])])
+        self.assertTrue(self.engine.apply_notification({"operation": "DELETE", "record_id": 2}))
+        self.assertTrue(self.engine.apply_notification({"record_id": 3}, fetch_record=lambda record_id: None))
+        self.assertEqual(engine_matches(self.engine), [(1, [4])])
+        self.assertEqual(self.engine.version, version + 3)
+
+    def test_user_matches_equal_filtered_global(self):
+        """Prueba 6: Los emparejamientos de un usuario coinciden con el resultado global filtrado"""
+        pool_df = random_pool(1500, seed=3)
+        engine = IncrementalMatchEngine(max_distance_km=5)
+        engine.load_dataframe(pool_df)
+        global_matches = engine.matches()
+
+        targeted = IncrementalMatchEngine(max_distance_km=5)
+        targeted.load_dataframe(pool_df)
+        for email in pool_df["correo_usuario"].unique()[:200]:
+            found = [(d["id"], [p["id"] for p, _ in ps]) for d, ps in targeted.user_matches(email)]
+            self.assertEqual(found, involving(global_matches, email))
+
+    def test_fetch_user_neighborhood(self):
+        """Prueba 7: La lectura por vecindario basta para reproducir los emparejamientos del usuario"""
+        records = dataframe_records(random_pool(1500, seed=5))
+        engine = IncrementalMatchEngine(max_distance_km=5)
+        engine.load_records(records)
+        global_matches = engine.matches()
+        supabase = FakeSupabase(records)
+
+        for email in sorted({record["correo_usuario"] for record in records})[:40]:
+            neighborhood = fetch_user_neighborhood(supabase, email, max_distance_km=5)
+            self.assertLess(len(neighborhood), len(records))
+
+            targeted = IncrementalMatchEngine(max_distance_km=5)
+            targeted.load_records(neighborhood)
+            found = [(d["id"], [p["id"] for p, _ in ps]) for d, ps in targeted.user_matches(email)]
+            self.assertEqual(found, involving(global_matches, email))
+
+        self.assertEqual(fetch_user_neighborhood(supabase, "nadie@unal.edu.co"), [])
+
+    def test_nearest_assignment_matches_vectorized(self):
+        """Prueba 8: Con assignment='nearest' coincide con el motor vectorizado, más cercanos primero"""
+        pool_df = random_pool(1500, seed=6)
+        engine = IncrementalMatchEngine(max_distance_km=5, assignment="nearest")
+        engine.load_dataframe(pool_df)
+
+        drivers, passengers = split_unique_users(filter_active_pool(pool_df))
+        expected = [
+            (drivers.iloc[d]["id"], passengers.iloc[p]["id"].tolist())
+            for d, p, _ in match_pool_vectorized(drivers, passengers, max_distance_km=5, assignment="nearest")
+        ]
+        self.assertEqual(engine_matches(engine), expected)
+        for _, matched in engine.matches():
+            distances = [distance for _, distance in matched]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_compact_pool_options(self):
+        """Prueba 9: Con las opciones de CompactPool (deduplicar, destino canónico) coincide con su motor"""
+        _, pool_df = generate_workload(2000, seed=3)
+        records = dataframe_records(pool_df)
+        for options in ({}, {"latest_per_user": False, "normalize_destinations": False}):
+            pool = CompactPool.from_records(records, **options)
+            drivers, passengers = pool.role("conductor"), pool.role("pasajero")
+            expected = [
+                (drivers.ids[d], passengers.ids[p].tolist())
+                for d, p, _ in match_compact_pool(drivers, passengers, max_distance_km=5)
+            ]
+            engine = IncrementalMatchEngine(max_distance_km=5, **options)
+            engine.load_records(records)
+            self.assertEqual(engine_matches(engine), expected)
+
+        # Sin deduplicar cuentan los dos registros de un correo repetido
+        engine = IncrementalMatchEngine(max_distance_km=5, latest_per_user=False)
+        engine.load_records(self.records + [
+            make_pool_row(5, "pasajero2@unal.edu.co", "pasajero", 4.6480, -74.0620, created_at="2025-10-01T08:00:00")
+        ])
+        self.assertEqual(engine_matches(engine), [(1, [2, 3])])
+
+        # Con el destino exacto 'universidad nacional ' ya no es el destino del conductor
+        respelled = [dict(self.records[1], destino="universidad nacional ")] + self.records[2:]
+        for normalize, expected in ((True, [(1, [2, 3])]), (False, [(1, [3])])):
+            engine = IncrementalMatchEngine(max_distance_km=5, normalize_destinations=normalize)
+            engine.load_records(self.records[:1] + respelled)
+            self.assertEqual(engine_matches(engine), expected)
+
+    def test_incremental_matches_vectorized_per_api(self):
+        """Prueba 10: En cada API el motor incremental da lo mismo que el vectorizado"""
+        profiles_df, pool_df = generate_workload(2000, seed=3)
+        for api in (matchmaking_api, wheels_api):
+            with patch.object(api, "pool_engine", IncrementalMatchEngine(
+                latest_per_user=api.pool_engine.latest_per_user,
+                normalize_destinations=api.pool_engine.normalize_destinations
+            )):
+                incremental = api.match_rides_enhanced(pool_df, profiles_df, engine="incremental")
+            vectorized = api.match_rides_enhanced(pool_df, profiles_df, engine="vectorized")
+            self.assertGreater(len(vectorized), 100)
+            self.assertEqual(api_matches(incremental), api_matches(vectorized))
+        self.assertFalse(matchmaking_api.pool_engine.latest_per_user)
+        self.assertTrue(wheels_api.pool_engine.latest_per_user)
+
+    def test_targeted_user_matches_equal_global(self):
+        """Prueba 11: /api/matches/<email> por vecindario coincide con el matchmaking global de cada API"""
+        _, pool_df = generate_workload(2000, seed=3)
+        records = dataframe_records(pool_df)
+        counts = Counter(record["correo_usuario"] for record in records)
+        # Correos con varios registros primero: ahí difieren las reglas de las dos APIs
+        emails = sorted(counts, key=lambda email: (-counts[email], email))[:30] + sorted(counts)[:30]
+        for api in (matchmaking_api, wheels_api):
+            targeted = endpoint_user_matches(api, records, emails, MATCHMAKING_ENGINE="vectorized",
+                                             USER_MATCHES_MODE="targeted")
+            global_ = endpoint_user_matches(api, records, emails, MATCHMAKING_ENGINE="vectorized",
+                                            USER_MATCHES_MODE="global")
+            self.assertEqual(targeted, global_)
+            self.assertGreater(sum(len(matches) for matches in targeted.values()), 40)
+
+    def test_targeted_only_for_straight_line_engines(self):
+        """Prueba 12: Los motores que confirman por carretera responden siempre con el matchmaking global"""
+        for api in (matchmaking_api, wheels_api):
+            for engine, expected in (("legacy", False), ("road", False), ("vectorized", True),
+                                     ("indexed", True), ("incremental", True)):
+                with patch.object(api, "MATCHMAKING_ENGINE", engine), patch.object(api, "USER_MATCHES_MODE", "targeted"):
+                    self.assertEqual(api.use_targeted_user_matches(), expected)
+
+            with patch.object(api, "MATCHMAKING_ENGINE", "legacy"), \
+                 patch.object(api, "match_rides_for_user", side_effect=AssertionError("vecindario")), \
+                 patch.object(api, "compute_all_matches", return_value=[]) as compute:
+                self.assertEqual(endpoint_user_matches(api, [], ["a@unal.edu.co"]), {"a@unal.edu.co": []})
+            compute.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.profile_directory import ProfileDirectory, profile_name_map
+
+PROFILES = [
+    {"id": "uuid-1", "email": "conductor1@unal.edu.co", "full_name": "Conductor Uno"},
+    {"id": "uuid-2", "email": "pasajero1@unal.edu.co", "full_name": "Pasajero Uno"},
+    {"id": "uuid-3", "email": "pasajero2@unal.edu.co", "full_name": "Pasajero Dos"},
+]
+
+def fake_supabase():
+    """Cliente falso cuya consulta in_('email', [...]) devuelve los perfiles pedidos"""
+    supabase = MagicMock()
+    query = supabase.table.return_value.select.return_value
+
+    def in_(column, values):
+        result = MagicMock()
+        result.execute.return_value = MagicMock(data=[p for p in PROFILES if p[column] in values])
+        return result
+
+    query.in_.side_effect = in_
+    return supabase, query
+
+class TestProfileDirectory(unittest.TestCase):
+    """Pruebas del directorio de perfiles con LRU y TTL"""
+
+    def setUp(self):
+        self.supabase, self.query = fake_supabase()
+        self.directory = ProfileDirectory(max_entries=2, ttl_seconds=60)
+
+    def test_batched_lookup_and_hits(self):
+        """Prueba 1: Los correos que faltan se leen en una sola consulta y luego se reutilizan"""
+        names = self.directory.names(self.supabase, ["conductor1@unal.edu.co", "pasajero1@unal.edu.co", "nadie@unal.edu.co"])
+
+        self.assertEqual(names, {"conductor1@unal.edu.co": "Conductor Uno", "pasajero1@unal.edu.co": "Pasajero Uno"})
+        self.assertEqual(self.query.in_.call_count, 1)
+
+        self.assertEqual(self.directory.get_id(self.supabase, "pasajero1@unal.edu.co"), "uuid-2")
+        self.assertEqual(self.query.in_.call_count, 1)
+        self.assertIsNone(self.directory.get_id(self.supabase, "nadie@unal.edu.co"))
+        self.assertEqual(self.directory.stats()["hits"], 1)
+
+    def test_lru_and_ttl(self):
+        """Prueba 2: El directorio está acotado y los perfiles vencen con el TTL"""
+        with patch("wheels.profile_directory.time.monotonic", return_value=100.0):
+            self.directory.prime(PROFILES)
+        self.assertEqual(self.directory.stats()["entries"], 2)
+
+        with patch("wheels.profile_directory.time.monotonic", return_value=120.0):
+            self.directory.get(self.supabase, "pasajero2@unal.edu.co")
+        self.assertEqual(self.query.in_.call_count, 0)
+
+        with patch("wheels.profile_directory.time.monotonic", return_value=200.0):
+            self.directory.get(self.supabase, "pasajero2@unal.edu.co")
+        self.assertEqual(self.query.in_.call_count, 1)
+
+    def test_profile_name_map(self):
+        """Prueba 3: El mapa de nombres conserva el primer perfil de cada correo"""
+        profiles_df = pd.DataFrame(PROFILES + [{"id": "uuid-4", "email": "pasajero1@unal.edu.co", "full_name": "Duplicado"}])
+
+        names = profile_name_map(profiles_df)
+        self.assertEqual(names["pasajero1@unal.edu.co"], "Pasajero Uno")
+        self.assertEqual(profile_name_map(pd.DataFrame()), {})
+
+if __name__ == '__main__':
+    unittest.main()
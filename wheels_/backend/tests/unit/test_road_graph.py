@@ -0,0 +1,125 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pickup_optimization_service
+from wheels import road_graph
+from wheels.distance_provider import RoadGraphDistanceProvider, build_distance_provider
+from wheels.geo import haversine_km
+from wheels.road_graph import RoadGraph
+
+def grid_edges(size=12, spacing=0.004, seed=3):
+    """Cuadrícula de calles alrededor de Bogotá con velocidades aleatorias (sin empates)"""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.divmod(np.arange(size * size), size)
+    lat, lng = 4.60 + rows * spacing, -74.10 + cols * spacing
+    pairs = [(n, n + 1) for n in range(size * size) if (n + 1) % size] + \
+            [(n, n + size) for n in range(size * size - size)]
+    sources, targets = np.array(pairs).T
+    metres = haversine_km(lat[sources], lng[sources], lat[targets], lng[targets]) * 1000
+    seconds = metres / (rng.uniform(20, 60, len(pairs)) / 3.6)
+    return lat, lng, sources, targets, metres, seconds
+
+def grid_graph(**kwargs):
+    lat, lng, sources, targets, metres, seconds = grid_edges(**kwargs)
+    return RoadGraph.from_edges(lat, lng, np.r_[sources, targets], np.r_[targets, sources],
+                                np.r_[metres, metres], np.r_[seconds, seconds * 1.1])
+
+class TestRoadGraph(unittest.TestCase):
+    """Pruebas del motor de rutas sobre el grafo vial local"""
+
+    def test_fastest_route(self):
+        """Prueba 1: Se elige la ruta más rápida, con sus metros; sentido único y límite de tiempo"""
+        # 0 -> 1 directo: 1000 m en 200 s; 0 -> 2 -> 1: 1500 m en 100 s
+        graph = RoadGraph.from_edges([4.60, 4.61, 4.605], [-74.10, -74.10, -74.09],
+                                     [0, 0, 2, 0], [1, 2, 1, 1], [1000, 700, 800, 1200], [200, 40, 60, 300])
+        self.assertEqual(graph.edges, 3)
+        seconds, metres = graph.one_to_many(0, [1, 2, 0])
+        np.testing.assert_allclose(seconds, [100, 40, 0])
+        np.testing.assert_allclose(metres, [1500, 700, 0])
+
+        seconds, metres = graph.route_pairs([1, 0, -1], [0, 1, 1], max_seconds=90)
+        self.assertTrue(np.isnan(seconds).all())
+        self.assertTrue(np.isnan(metres).all())
+
+    def test_route_pairs_and_nearest_nodes(self):
+        """Prueba 2: Los pares sueltos dan lo mismo que la matriz y el nodo más cercano es el exhaustivo"""
+        graph = grid_graph()
+        sources, targets = [0, 17, 143, 70, 5], [143, 0, 66, 12, 99, 17, 131]
+        expected = graph.many_to_many(sources, targets)
+        with patch.object(road_graph, "SOURCE_CHUNK", 2):
+            seconds, metres = graph.route_pairs(np.repeat(sources, len(targets))[::-1],
+                                                np.tile(targets, len(sources))[::-1])
+        np.testing.assert_allclose(seconds[::-1].reshape(expected[0].shape), expected[0])
+        np.testing.assert_allclose(metres[::-1].reshape(expected[1].shape), expected[1])
+        self.assertTrue((expected[0][np.array(sources)[:, None] != np.array(targets)] > 0).all())
+
+        points = np.array([[4.6041, -74.0959], [4.6399, -74.0601]])
+        nodes, _ = graph.nearest_nodes(points[:, 0], points[:, 1])
+        exhaustive = [int(np.argmin(haversine_km(lat, lng, graph.lat, graph.lng))) for lat, lng in points]
+        np.testing.assert_array_equal(nodes, exhaustive)
+
+    def test_save_and_csv(self):
+        """Prueba 3: El grafo se guarda en .npz y se carga igual desde un CSV de aristas"""
+        lat, lng, sources, targets, metres, seconds = grid_edges(size=6)
+        graph = RoadGraph.from_edges(lat, lng, np.r_[sources, targets], np.r_[targets, sources],
+                                     np.r_[metres, metres], np.r_[seconds, seconds])
+        with tempfile.TemporaryDirectory() as directory:
+            npz = os.path.join(directory, "bogota.npz")
+            graph.save(npz)
+            restored = RoadGraph.load(npz)
+            csv = os.path.join(directory, "bogota.csv")
+            pd.DataFrame({
+                "from_lat": lat[sources], "from_lng": lng[sources], "to_lat": lat[targets], "to_lng": lng[targets],
+                "seconds": seconds, "oneway": 0
+            }).to_csv(csv, index=False)
+            from_csv = RoadGraph.load(csv)
+
+        self.assertEqual((len(restored), restored.edges), (36, 120))
+        self.assertEqual((len(from_csv), from_csv.edges), (36, 120))
+        np.testing.assert_allclose(restored.many_to_many([0, 7], [35, 20])[0], graph.many_to_many([0, 7], [35, 20])[0])
+        # Los nodos del CSV se numeran por coordenadas: se comparan las rutas entre los mismos puntos
+        ends = from_csv.nearest_nodes(lat[[0, 35]], lng[[0, 35]])[0]
+        np.testing.assert_allclose(from_csv.route_pairs(ends[:1], ends[1:])[0], graph.route_pairs([0], [35])[0], rtol=1e-5)
+        np.testing.assert_allclose(from_csv.route_pairs(ends[:1], ends[1:])[1], graph.route_pairs([0], [35])[1], rtol=1e-3)
+
+    def test_provider(self):
+        """Prueba 4: El proveedor suma los tramos de acceso, usa Haversine fuera de la red y sirve a la ruta escolar"""
+        graph = grid_graph()
+        provider = RoadGraphDistanceProvider(graph)
+        home, stop, far = (4.6001, -74.1001), (4.6440, -74.0560), (4.90, -74.40)
+        batch = provider.matrix([home, stop], [stop, far, "Calle 26 # 40"])
+        self.assertEqual(list(batch.sources[0]), ["road_graph", "error", "error"])
+        seconds, metres = graph.one_to_many(0, [143])
+        access_km = haversine_km(home[0], home[1], graph.lat[0], graph.lng[0]) + \
+            haversine_km(stop[0], stop[1], graph.lat[143], graph.lng[143])
+        self.assertAlmostEqual(batch.metres[0, 0], metres[0] + access_km * 1000, places=3)
+        self.assertEqual(provider.distances([home], [stop]).metres[0], batch.metres[0, 0])
+        self.assertGreater(batch.metres[0, 0], haversine_km(*home, *stop) * 1000)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bogota.npz")
+            graph.save(path)
+            built = build_distance_provider("road_graph", graph_path=path)
+        self.assertEqual(built.distance(home, far)["source"], "haversine")
+        with self.assertRaises(ValueError):
+            build_distance_provider("road_graph")
+
+        passengers = [(4.6200, -74.0800), (4.6080, -74.0950), (4.6400, -74.0700)]
+        order, legs = pickup_optimization_service.school_route_algorithm(
+            home, passengers, stop, "ida", provider=built
+        )
+        self.assertEqual(sorted(order), [0, 1, 2])
+        self.assertEqual(len(legs), 4)
+        self.assertTrue(all(np.isfinite(leg["duration_s"]) and leg["duration_s"] > 0 for leg in legs))
+
+if __name__ == '__main__':
+    unittest.main()
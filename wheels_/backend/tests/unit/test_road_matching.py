@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+
+import numpy as np
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.compact_pool import CompactPool
+from wheels.distance_provider import (
+    MAX_ELEMENTS_PER_REQUEST, MAX_PLACES_PER_REQUEST, CachedDistanceProvider, FallbackDistanceProvider,
+    GoogleDistanceProvider, HaversineDistanceProvider
+)
+from wheels.geo import haversine_km
+from wheels.road_matching import top_k_per_driver, two_stage_match
+from wheels.vector_matching import match_pool_arrays
+from tests.unit.test_pool_engine import random_pool
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+class FakeDistanceMatrix:
+    """Sesión HTTP falsa de Distance Matrix: Haversine por un factor, registrando las solicitudes"""
+
+    def __init__(self, factor=1.0):
+        self.factor = factor
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        origins = [tuple(map(float, place.split(","))) for place in params["origins"].split("|")]
+        destinations = [tuple(map(float, place.split(","))) for place in params["destinations"].split("|")]
+        self.requests.append((origins, destinations))
+        return FakeResponse({"status": "OK", "rows": [
+            {"elements": [
+                {"status": "OK",
+                 "distance": {"value": float(haversine_km(o[0], o[1], lat, lng)) * self.factor * 1000},
+                 "duration": {"value": 300}}
+                for lat, lng in destinations
+            ]}
+            for o in origins
+        ]})
+
+def fake_road(factor=1.0):
+    """Proveedor de Google sobre la sesión falsa"""
+    session = FakeDistanceMatrix(factor)
+    return GoogleDistanceProvider(api_key="test-key", session=session), session
+
+def pool_columns(pool):
+    """Columnas de conductores y pasajeros en el orden de two_stage_match"""
+    drivers, passengers = pool.role("conductor"), pool.role("pasajero")
+    return (drivers.lat, drivers.lng, drivers.destination_codes, drivers.seats,
+            passengers.lat, passengers.lng, passengers.destination_codes)
+
+def as_lists(results):
+    return [(d, p.tolist()) for d, p, _ in results]
+
+class TestRoadMatching(unittest.TestCase):
+    """Pruebas del matchmaking en dos etapas"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.columns = pool_columns(CompactPool.from_dataframe(random_pool(1500, seed=9)))
+
+    def test_top_k_per_driver(self):
+        """Prueba 1: Se conservan los pares más cercanos de cada conductor según su límite"""
+        driver_idx = np.array([0, 0, 0, 1, 1, 2])
+        distances = np.array([3.0, 1.0, 2.0, 4.0, 0.5, 1.0])
+        keep = top_k_per_driver(driver_idx, distances, np.array([2, 1, 0]))
+        self.assertEqual(keep.tolist(), [False, True, True, False, True, False])
+
+    def test_lossless_with_straight_line_roads(self):
+        """Prueba 2: Con top-k amplio y carretera = línea recta coincide con el motor vectorizado"""
+        road, session = fake_road()
+        results, distances, stats = two_stage_match(*self.columns, road, top_k=1000)
+
+        self.assertEqual(as_lists(results), as_lists(match_pool_arrays(*self.columns)))
+        self.assertEqual(stats["top_k_pruned"], 0)
+        self.assertEqual(
+            stats["same_destination_pairs"],
+            stats["prefilter_pruned"] + stats["top_k_pruned"] + stats["road_checked"]
+        )
+        self.assertEqual(stats["road_requests"], len(session.requests))
+        self.assertTrue(all(len(origins) <= MAX_PLACES_PER_REQUEST and len(destinations) <= MAX_PLACES_PER_REQUEST
+                            and len(origins) * len(destinations) <= MAX_ELEMENTS_PER_REQUEST
+                            for origins, destinations in session.requests))
+        self.assertEqual(len(distances), stats["road_checked"])
+
+    def test_road_confirmation_prunes(self):
+        """Prueba 3: Solo se piden los top-k por conductor y se descartan los pares largos por carretera"""
+        road, session = fake_road(factor=20)
+        results, distances, stats = two_stage_match(*self.columns, road, top_k=3, prefilter_slack=0.9)
+        seats = self.columns[3]
+
+        self.assertGreater(stats["top_k_pruned"], 0)
+        self.assertGreater(stats["road_pruned"], 0)
+        self.assertEqual(stats["confirmed_pairs"], stats["road_checked"] - stats["road_pruned"])
+        # Los conductores que comparten pasajeros van en la misma solicitud
+        self.assertLess(len(session.requests), len({d for d, _ in distances}))
+        self.assertEqual(stats["road_requests"], len(session.requests))
+        for d, passengers, km in results:
+            self.assertLessEqual(len(passengers), seats[d])
+            self.assertTrue(np.all(km <= 5))
+            self.assertTrue(all(distances[(d, int(p))]["distance"] <= 5 for p in passengers))
+
+    def test_road_requests_from_provider(self):
+        """Prueba 4: road_requests cuenta solo las solicitudes enviadas (caché caliente y Haversine en 0)"""
+        road, session = fake_road()
+        cached = CachedDistanceProvider(FallbackDistanceProvider(road, HaversineDistanceProvider()), max_entries=100000)
+        _, _, cold = two_stage_match(*self.columns, cached, top_k=3)
+        self.assertEqual(cold["road_requests"], len(session.requests))
+        self.assertGreater(cold["road_requests"], 0)
+
+        _, _, warm = two_stage_match(*self.columns, cached, top_k=3)
+        self.assertEqual(warm["road_requests"], 0)
+        self.assertEqual(warm["road_checked"], cold["road_checked"])
+
+        _, _, offline = two_stage_match(*self.columns, HaversineDistanceProvider(), top_k=3)
+        self.assertEqual(offline["road_requests"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
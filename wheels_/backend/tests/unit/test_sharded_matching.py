@@ -0,0 +1,58 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.compact_pool import CompactPool, match_compact_pool
+from wheels.sharded_matching import SharedArrays, attach_shared, match_arrays_sharded
+from tests.unit.test_pool_engine import random_pool
+
+def as_lists(results):
+    """Resultados como listas comparables"""
+    return [(int(d), np.asarray(p).tolist(), np.round(distances, 9).tolist()) for d, p, distances in results]
+
+class TestShardedMatching(unittest.TestCase):
+    """Pruebas del matchmaking repartido por destino entre procesos"""
+
+    @classmethod
+    def setUpClass(cls):
+        pool = CompactPool.from_dataframe(random_pool(1500, seed=21))
+        cls.drivers = pool.role("conductor")
+        cls.passengers = pool.role("pasajero")
+
+    def test_shared_arrays(self):
+        """Prueba 1: Los arrays compartidos se leen con la misma forma y tipo"""
+        arrays = {"lat": np.array([4.6, 4.7]), "codes": np.array([3, -1], dtype=np.int64)}
+        with SharedArrays(arrays) as shared:
+            attached, blocks = attach_shared(shared.spec)
+            np.testing.assert_array_equal(attached["lat"], arrays["lat"])
+            self.assertEqual(attached["codes"].dtype, np.int64)
+            del attached
+            for block in blocks:
+                block.close()
+        self.assertEqual(shared.blocks, [])
+
+    def test_same_result_as_single_pass(self):
+        """Prueba 2: Repartir por destino da el mismo resultado que una sola pasada"""
+        for assignment in ("first_fit", "greedy"):
+            expected = match_compact_pool(self.drivers, self.passengers, assignment=assignment)
+            sharded = match_compact_pool(
+                self.drivers, self.passengers, assignment=assignment, workers=2, min_parallel_size=0
+            )
+            self.assertEqual(as_lists(sharded), as_lists(expected))
+
+    def test_small_pool_runs_in_process(self):
+        """Prueba 3: Con pocos registros o un solo proceso no se usa el ejecutor"""
+        with patch("wheels.sharded_matching.get_executor") as get_executor:
+            match_compact_pool(self.drivers, self.passengers, workers=4)
+            match_compact_pool(self.drivers, self.passengers, workers=1, min_parallel_size=0)
+            self.assertEqual(match_arrays_sharded(*[np.empty(0)] * 7, workers=4, min_parallel_size=0), [])
+        get_executor.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import json
+import os
+import sys
+from unittest.mock import patch
+
+# Añadir el directorio backend al path para importar las APIs y el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import matchmaking_api
+import wheels_api
+from benchmarks.workload import generate_workload
+from wheels.distance_provider import HaversineDistanceProvider
+from wheels.match_cache import MatchResultCache
+
+def ndjson_records(response):
+    """Registros de una respuesta NDJSON"""
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+class TestStreaming(unittest.TestCase):
+    """Pruebas del modo streaming NDJSON de /api/python-matchmaking"""
+
+    def setUp(self):
+        self.profiles_df, self.pool_df = generate_workload(400, seed=5)
+
+    def test_generator_matches_list(self):
+        """Prueba 1: iter_rides_enhanced entrega los mismos matches que match_rides_enhanced, de a uno"""
+        for api in (matchmaking_api, wheels_api):
+            with patch.object(api, "distance_provider", HaversineDistanceProvider()):
+                matches = api.match_rides_enhanced(self.pool_df, self.profiles_df, engine="legacy")
+                generator = api.iter_rides_enhanced(self.pool_df, self.profiles_df, engine="legacy")
+                self.assertGreater(len(matches), 1)
+                self.assertEqual(next(generator), matches[0])
+                self.assertEqual([matches[0]] + list(generator), matches)
+
+    def test_stream_endpoint(self):
+        """Prueba 2: ?stream=1 y Accept: application/x-ndjson devuelven una línea por match y un resumen"""
+        for api in (matchmaking_api, wheels_api):
+            matches = api.match_rides_enhanced(self.pool_df, self.profiles_df, engine="vectorized")
+            client = api.app.test_client()
+            with patch.object(api, "get_pool_version", return_value=(400, "v1")), \
+                 patch.object(api, "iter_all_matches", side_effect=lambda: iter(matches)), \
+                 patch.object(api, "match_cache", MatchResultCache()):
+                requests = (lambda: client.get("/api/python-matchmaking?stream=1"),
+                            lambda: client.post("/api/python-matchmaking", headers={"Accept": "application/x-ndjson"}))
+                for send in requests:
+                    response = send()
+                    self.assertEqual(response.mimetype, "application/x-ndjson")
+                    records = ndjson_records(response)
+                    response.close()
+                    self.assertEqual([r["match"] for r in records[:-1]], json.loads(json.dumps(matches)))
+                    self.assertEqual(records[-1]["type"], "summary")
+                    self.assertEqual(records[-1]["total_matches"], len(matches))
+                    self.assertIn("elapsed_ms", records[-1])
+
+                # Sin streaming la respuesta sigue siendo un solo JSON
+                body = client.get("/api/python-matchmaking").get_json()
+                self.assertEqual(body["total_matches"], len(matches))
+
+    def test_stream_error_record(self):
+        """Prueba 3: Un fallo a mitad del cálculo termina el stream con un registro de error"""
+        def failing():
+            yield {"conductor_correo": "conductor@unal.edu.co"}
+            raise RuntimeError("Supabase no disponible")
+
+        client = matchmaking_api.app.test_client()
+        with patch.object(matchmaking_api, "get_pool_version", return_value=(1, "v1")), \
+             patch.object(matchmaking_api, "iter_all_matches", side_effect=failing), \
+             patch.object(matchmaking_api, "match_cache", MatchResultCache()):
+            records = ndjson_records(client.get("/api/python-matchmaking?stream=1"))
+        self.assertEqual([r["type"] for r in records], ["match", "error"])
+        self.assertEqual(records[-1]["total_matches"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import os
+import sys
+import math
+
+import numpy as np
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.compact_pool import CompactPool, match_compact_pool
+from wheels.pool_engine import IncrementalMatchEngine
+from wheels.time_windows import departure_minutes, record_departure_minutes, time_compatible
+from wheels.vector_matching import (
+    dense_candidate_pairs, destination_codes, indexed_candidate_pairs, match_pool_vectorized,
+    pool_coordinates, pool_destination_keys, split_unique_users, filter_active_pool
+)
+from tests.unit.test_vector_matching import make_pool_row
+from tests.unit.test_pool_engine import engine_matches, random_pool
+
+def timed_pool(n, seed=1):
+    """Pool aleatorio con horas de salida repartidas en el día (algunas sin hora)"""
+    pool_df = random_pool(n, seed=seed)
+    rng = np.random.default_rng(seed)
+    minutes = rng.integers(6 * 60, 20 * 60, size=n)
+    pool_df["trip_datetime"] = [
+        None if i % 7 == 0 else f"2025-10-01T{m // 60:02d}:{m % 60:02d}:00" for i, m in enumerate(minutes)
+    ]
+    return pool_df
+
+class TestTimeWindows(unittest.TestCase):
+    """Pruebas del filtro por ventana de salida"""
+
+    def test_departure_minutes(self):
+        """Prueba 1: Horas ISO con y sin zona, columnas en orden de preferencia y valores faltantes"""
+        self.assertEqual(
+            departure_minutes("2025-10-01T12:00:00Z") - departure_minutes("2025-10-01T07:00:00-05:00"), 0
+        )
+        self.assertEqual(departure_minutes("2025-10-01T06:30:00") - departure_minutes("2025-10-01T06:00:00"), 30)
+        self.assertTrue(math.isnan(departure_minutes(None)))
+        self.assertTrue(math.isnan(departure_minutes("mañana")))
+
+        record = {"trip_datetime": None, "hora_viaje": "2025-10-01T06:00:00"}
+        self.assertEqual(record_departure_minutes(record), departure_minutes("2025-10-01T06:00:00"))
+        self.assertTrue(time_compatible(math.nan, 10.0, 5))
+        self.assertFalse(time_compatible(0.0, 10.0, 5))
+
+    def test_candidate_pairs_match_exact_filter(self):
+        """Prueba 2: Las franjas de salida dan los mismos pares que filtrar todos los pares por hora"""
+        pool_df = timed_pool(1200, seed=5)
+        drivers, passengers = split_unique_users(filter_active_pool(pool_df))
+        d_lat, d_lng = pool_coordinates(drivers)
+        p_lat, p_lng = pool_coordinates(passengers)
+        d_codes, p_codes = destination_codes(pool_destination_keys(drivers), pool_destination_keys(passengers))
+        d_minutes = np.array([record_departure_minutes(r) for r in drivers.to_dict("records")])
+        p_minutes = np.array([record_departure_minutes(r) for r in passengers.to_dict("records")])
+
+        d, p, _ = dense_candidate_pairs(d_lat, d_lng, d_codes, p_lat, p_lng, p_codes, 5)
+        keep = time_compatible(d_minutes[d], p_minutes[p], 45)
+        expected = (d[keep].tolist(), p[keep].tolist())
+        self.assertLess(keep.sum(), len(keep))
+
+        for generate in (dense_candidate_pairs, indexed_candidate_pairs):
+            d, p, _ = generate(
+                d_lat, d_lng, d_codes, p_lat, p_lng, p_codes, 5,
+                driver_minutes=d_minutes, passenger_minutes=p_minutes, time_window_minutes=45
+            )
+            self.assertEqual((d.tolist(), p.tolist()), expected)
+
+    def test_compact_pool_and_engine(self):
+        """Prueba 3: El pool compacto, el motor sobre DataFrames y el incremental aplican la misma ventana"""
+        pool_df = timed_pool(1500, seed=8)
+        drivers, passengers = split_unique_users(filter_active_pool(pool_df))
+        expected = [
+            (drivers.iloc[d]["id"], passengers.iloc[p]["id"].tolist())
+            for d, p, _ in match_pool_vectorized(drivers, passengers, max_distance_km=5, time_window_minutes=30)
+        ]
+
+        pool = CompactPool.from_dataframe(pool_df)
+        compact_drivers, compact_passengers = pool.role("conductor"), pool.role("pasajero")
+        compact = [
+            (compact_drivers.ids[d], compact_passengers.ids[p].tolist())
+            for d, p, _ in match_compact_pool(compact_drivers, compact_passengers, time_window_minutes=30)
+        ]
+        self.assertEqual(compact, expected)
+
+        engine = IncrementalMatchEngine(time_window_minutes=30)
+        engine.load_dataframe(pool_df)
+        self.assertEqual(engine_matches(engine), expected)
+
+    def test_far_departures_not_matched(self):
+        """Prueba 4: Un conductor de las 6:00 no lleva al pasajero de las 14:00"""
+        rows = [
+            dict(make_pool_row(1, "conductor@unal.edu.co", "conductor", 4.6486, -74.0628, seats=3),
+                 trip_datetime="2025-10-01T06:00:00"),
+            dict(make_pool_row(2, "tarde@unal.edu.co", "pasajero", 4.6490, -74.0630), trip_datetime="2025-10-01T14:00:00"),
+            dict(make_pool_row(3, "temprano@unal.edu.co", "pasajero", 4.6490, -74.0630), trip_datetime="2025-10-01T06:20:00"),
+            make_pool_row(4, "sinhora@unal.edu.co", "pasajero", 4.6490, -74.0630),
+        ]
+        engine = IncrementalMatchEngine(time_window_minutes=30)
+        engine.load_records(rows)
+        [(driver_id, passenger_ids)] = engine_matches(engine)
+        self.assertEqual((driver_id, sorted(passenger_ids)), (1, [3, 4]))
+
+        pool = CompactPool.from_records(rows)
+        result = match_compact_pool(pool.role("conductor"), pool.role("pasajero"), time_window_minutes=30)
+        self.assertEqual(sorted(pool.role("pasajero").ids[result[0][1]].tolist()), [3, 4])
+        result = match_compact_pool(pool.role("conductor"), pool.role("pasajero"))
+        self.assertEqual(len(result[0][1]), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.distance_provider import SqliteDistanceStore, build_distance_provider
+from wheels.geo import haversine_km
+from wheels.road_matching import two_stage_match
+from wheels.travel_time import (
+    TravelTimeEstimator, fit_observations, hour_of_day, load_observations, load_travel_time_estimator
+)
+
+RUSH_HOURS = [6, 7, 8, 17, 18, 19]
+
+def synthetic_observations(count=5000, seed=0):
+    """Viajes en Bogotá: 95 s/km, +45 s/km en hora pico y +30 s/km saliendo del norte, con ruido"""
+    rng = np.random.default_rng(seed)
+    origin_lat, origin_lng = rng.uniform(4.55, 4.75, count), rng.uniform(-74.15, -74.03, count)
+    destination_lat, destination_lng = rng.uniform(4.55, 4.75, count), rng.uniform(-74.15, -74.03, count)
+    hours = rng.integers(0, 24, count).astype(float)
+    km = haversine_km(origin_lat, origin_lng, destination_lat, destination_lng)
+    rate = 95 + np.isin(hours, RUSH_HOURS) * 45 + (origin_lat > 4.68) * 30
+    seconds = (60 + km * rate) * rng.lognormal(0, 0.1, count)
+    return {"origin_lat": origin_lat, "origin_lng": origin_lng, "destination_lat": destination_lat,
+            "destination_lng": destination_lng, "hours": hours, "seconds": seconds}
+
+class TestTravelTime(unittest.TestCase):
+    """Pruebas del estimador de tiempos calibrado con observaciones de Google"""
+
+    def test_default_matches_fixed_speed(self):
+        """Prueba 1: Sin tabla se conserva 1.5 min/km, también en matrices con broadcasting"""
+        estimator = load_travel_time_estimator(None)
+        self.assertFalse(estimator.calibrated)
+        np.testing.assert_allclose(estimator.predict_km([0, 2, 10], hour=8), [0, 180, 900])
+
+        drivers = np.array([[4.60, -74.08], [4.65, -74.06], [4.70, -74.05]])
+        passengers = np.array([[4.61, -74.07], [4.62, -74.09], [4.66, -74.04], [4.69, -74.10]])
+        matrix = estimator.predict(drivers[:, :1], drivers[:, 1:], passengers[:, 0], passengers[:, 1])
+        self.assertEqual(matrix.shape, (3, 4))
+        km = haversine_km(drivers[:, :1], drivers[:, 1:], passengers[:, 0], passengers[:, 1])
+        np.testing.assert_allclose(matrix, km * 90)
+        self.assertTrue(np.isnan(estimator.predict(np.nan, -74.08, 4.61, -74.07)))
+
+        bogota_noon = datetime(2026, 3, 2, 17, 0, tzinfo=timezone.utc).timestamp()
+        self.assertEqual(float(hour_of_day(bogota_noon)), 12.0)
+
+    def test_fit_beats_fixed_speed(self):
+        """Prueba 2: El ajuste recupera la hora pico y la zona y reduce el error de la partición apartada"""
+        estimator = fit_observations(synthetic_observations(), holdout_fraction=0.2)
+        holdout = estimator.report["holdout"]
+        self.assertEqual((estimator.report["train_samples"], holdout["samples"]), (4000, 1000))
+        self.assertLess(holdout["mape"], 0.12)
+        self.assertLess(holdout["mae_seconds"], holdout["baseline_mae_seconds"] / 2)
+        self.assertLess(abs(holdout["bias_seconds"]), 30)
+
+        south, north = (4.58, -74.10), (4.72, -74.10)
+        center = (4.65, -74.07)
+        rush = estimator.predict(*south, *center, hour=7)
+        noon = estimator.predict(*south, *center, hour=12)
+        km = haversine_km(*south, *center)
+        self.assertAlmostEqual(float(rush - noon) / km, 45, delta=12)
+        slower = estimator.predict(*north, *center, hour=12) / haversine_km(*north, *center)
+        self.assertGreater(float(slower), float(noon / km) + 15)
+
+    def test_save_and_store(self):
+        """Prueba 3: La tabla se guarda y se carga igual; solo los pares de Google con coordenadas entrenan"""
+        estimator = fit_observations(synthetic_observations(count=1500))
+        points = np.random.default_rng(5).uniform([4.55, -74.15], [4.75, -74.03], (50, 2))
+        hours = np.arange(50) % 24
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "travel_time.json")
+            estimator.save(path)
+            restored = load_travel_time_estimator(path)
+            self.assertFalse(load_travel_time_estimator(os.path.join(directory, "falta.json")).calibrated)
+
+            store = SqliteDistanceStore(os.path.join(directory, "distances.sqlite"))
+            stored_at = datetime(2026, 3, 2, 12, 30, tzinfo=timezone.utc).timestamp()
+            store.put_many([
+                (((4.6, -74.08), (4.65, -74.06)), stored_at, 7000, 900, "google_maps"),
+                (((4.6, -74.08), "Calle 26 # 40"), stored_at, 5000, 600, "google_maps"),
+                (((4.6, -74.08), (4.70, -74.05)), stored_at, 11000, 990, "road_graph"),
+            ])
+            observations = load_observations(store)
+            self.assertEqual(len(store.rows()), 3)
+
+        self.assertTrue(restored.calibrated)
+        self.assertEqual(restored.report, estimator.report)
+        np.testing.assert_allclose(restored.predict(points[:, 0], points[:, 1], 4.65, -74.07, hours),
+                                   estimator.predict(points[:, 0], points[:, 1], 4.65, -74.07, hours))
+        self.assertEqual(observations["seconds"].tolist(), [900.0])
+        self.assertEqual(observations["hours"].tolist(), [7.0])
+        self.assertEqual(observations["destination_lng"].tolist(), [-74.06])
+
+    def test_providers_and_prefilter(self):
+        """Prueba 4: Haversine usa el estimador y el prefiltro ordena los candidatos por tiempo estimado"""
+        # Llegar a la zona del primer pasajero cuesta 300 s/km más
+        slow = TravelTimeEstimator(
+            zones=TravelTimeEstimator().zone_codes([4.605], [-74.08]),
+            origin_seconds_per_km=[0.0], destination_seconds_per_km=[300.0]
+        )
+        provider = build_distance_provider("haversine", travel_time=slow)
+        near, far = (4.605, -74.08), (4.58, -74.08)
+        batch = provider.distances([(4.60, -74.08)] * 2, [near, far])
+        self.assertGreater(batch.seconds[0], batch.seconds[1])
+        np.testing.assert_allclose(batch.seconds[1], batch.km[1] * 90)
+
+        driver_lat, driver_lng = np.array([4.60]), np.array([-74.08])
+        passenger_lat, passenger_lng = np.array([near[0], far[0]]), np.array([near[1], far[1]])
+        codes = np.zeros(1, dtype=np.int64), np.zeros(2, dtype=np.int64)
+        by_distance, _, _ = two_stage_match(driver_lat, driver_lng, codes[0], np.array([1]),
+                                            passenger_lat, passenger_lng, codes[1], provider, top_k=1)
+        by_eta, _, stats = two_stage_match(driver_lat, driver_lng, codes[0], np.array([1]),
+                                           passenger_lat, passenger_lng, codes[1], provider, top_k=1,
+                                           eta_estimator=slow)
+        self.assertEqual(list(by_distance[0][1]), [0])
+        self.assertEqual(list(by_eta[0][1]), [1])
+        self.assertEqual(stats["top_k_pruned"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
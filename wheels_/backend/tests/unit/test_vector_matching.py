@@ -0,0 +1,170 @@
+import unittest
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Añadir el directorio backend al path para importar el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wheels.geo import haversine_km, haversine_matrix
+from wheels.vector_matching import allocate_seats, destination_buckets, destination_codes, match_pool_vectorized
+from wheels.destinations import canonical_destination_key, destination_keys
+from wheels.spatial_index import GridIndex
+from wheels.matchmaking_service import match_rides_enhanced
+
+def make_pool_row(row_id, email, role, lat, lng, destination="Universidad Nacional", seats=None, created_at="2025-10-01T07:00:00"):
+    """Construye un registro de searching_pool para las pruebas"""
+    return {
+        "id": row_id,
+        "correo_usuario": email,
+        "tipo_de_usuario": role,
+        "pickup_lat": lat,
+        "pickup_lng": lng,
+        "pickup_address": f"Dirección {row_id}",
+        "destino": destination,
+        "dropoff_address": destination,
+        "available_seats": seats,
+        "price_per_seat": 5000,
+        "status": "searching",
+        "created_at": created_at
+    }
+
+class TestVectorMatching(unittest.TestCase):
+    """Pruebas del motor de matchmaking vectorizado"""
+
+    def setUp(self):
+        """Pool de prueba en Bogotá con dos destinos"""
+        self.pool_df = pd.DataFrame([
+            make_pool_row(1, "conductor1@unal.edu.co", "conductor", 4.6486, -74.0628, seats=2),
+            make_pool_row(2, "conductor2@unal.edu.co", "conductor", 4.7010, -74.0420, seats=1, destination="Universidad de los Andes"),
+            make_pool_row(3, "pasajero1@unal.edu.co", "pasajero", 4.6500, -74.0600),
+            make_pool_row(4, "pasajero2@unal.edu.co", "pasajero", 4.6400, -74.0700),
+            make_pool_row(5, "pasajero3@unal.edu.co", "pasajero", 4.6450, -74.0650),
+            make_pool_row(6, "pasajero4@unal.edu.co", "pasajero", 4.7000, -74.0400, destination="Universidad de los Andes"),
+            make_pool_row(7, "lejano@unal.edu.co", "pasajero", 4.5000, -74.2000),
+        ])
+        self.profiles_df = pd.DataFrame([
+            {"email": "conductor1@unal.edu.co", "full_name": "Conductor Uno"},
+            {"email": "pasajero1@unal.edu.co", "full_name": "Pasajero Uno"},
+        ])
+
+    def test_haversine_known_distance(self):
+        """Prueba 1: Distancia Haversine conocida (1 grado de latitud ≈ 111.2 km)"""
+        self.assertAlmostEqual(float(haversine_km(0.0, 0.0, 1.0, 0.0)), 111.195, places=2)
+
+        matrix = haversine_matrix([4.6, 4.7], [-74.1, -74.0], [4.6, 4.65, 4.7], [-74.1, -74.05, -74.0])
+        self.assertEqual(matrix.shape, (2, 3))
+        self.assertAlmostEqual(matrix[0, 0], 0.0)
+        self.assertAlmostEqual(matrix[1, 2], 0.0)
+
+    def test_canonical_destination_keys(self):
+        """Prueba 2: Claves canónicas de destino (texto normalizado, place_id y coordenadas)"""
+        self.assertEqual(canonical_destination_key(" Universidad  NACIONAL"), canonical_destination_key("universidad nacional"))
+        self.assertEqual(canonical_destination_key("Pontificia Universidad Javeriana"), canonical_destination_key("pontificia universidad javeriana."))
+        self.assertNotEqual(canonical_destination_key("Universidad Nacional"), canonical_destination_key("Universidad de los Andes"))
+        self.assertIsNone(canonical_destination_key(None))
+        self.assertEqual(canonical_destination_key("UNAL", place_id="abc"), "place:abc")
+        self.assertEqual(canonical_destination_key("UNAL", lat=4.63812, lng=-74.08401, coordinate_precision=2), "geo:4.64,-74.08")
+
+        df = pd.DataFrame({"destino": ["Universidad Nacional", "Universidad Nacional"], "dropoff_place_id": [None, "xyz"]})
+        self.assertEqual(destination_keys(df).tolist(), ["text:universidad nacional", "place:xyz"])
+
+    def test_destination_buckets_hash_join(self):
+        """Prueba 3: Solo se agrupan conductores y pasajeros con el mismo destino"""
+        driver_codes, passenger_codes = destination_codes(
+            ["text:a", "text:b", None], ["text:b", "text:c", "text:a", "text:b", None]
+        )
+        buckets = {tuple(d): p.tolist() for d, p in destination_buckets(driver_codes, passenger_codes)}
+
+        self.assertEqual(buckets, {(0,): [2], (1,): [0, 3]})
+
+    def test_allocate_seats_in_order(self):
+        """Prueba 4: Los cupos se asignan a los primeros pasajeros factibles"""
+        feasible = np.array([[True, False, True, True], [True, True, True, True]])
+        assigned = allocate_seats(feasible, np.array([2, 0]))
+
+        np.testing.assert_array_equal(assigned[0], [True, False, True, False])
+        self.assertFalse(assigned[1].any())
+
+    def test_match_pool_vectorized_radius_and_seats(self):
+        """Prueba 5: Radio, destino y cupos sobre arrays"""
+        drivers = self.pool_df[self.pool_df["tipo_de_usuario"] == "conductor"]
+        passengers = self.pool_df[self.pool_df["tipo_de_usuario"] == "pasajero"]
+
+        results = match_pool_vectorized(drivers, passengers, max_distance_km=5)
+        by_driver = {drivers.iloc[d]["correo_usuario"]: list(passengers.iloc[p]["correo_usuario"]) for d, p, _ in results}
+
+        self.assertEqual(by_driver["conductor1@unal.edu.co"], ["pasajero1@unal.edu.co", "pasajero2@unal.edu.co"])
+        self.assertEqual(by_driver["conductor2@unal.edu.co"], ["pasajero4@unal.edu.co"])
+
+    def test_vectorized_engine_matches_legacy_schema(self):
+        """Prueba 6: El motor vectorizado produce la misma salida que el algoritmo par a par"""
+        legacy = match_rides_enhanced(self.pool_df, self.profiles_df)
+        vectorized = match_rides_enhanced(self.pool_df, self.profiles_df, engine="vectorized")
+
+        self.assertEqual(len(legacy), len(vectorized))
+        for legacy_match, vector_match in zip(legacy, vectorized):
+            self.assertEqual(set(legacy_match.keys()), set(vector_match.keys()))
+            self.assertEqual(
+                [p["pasajero_correo"] for p in legacy_match["pasajeros_asignados"]],
+                [p["pasajero_correo"] for p in vector_match["pasajeros_asignados"]]
+            )
+            for legacy_p, vector_p in zip(legacy_match["pasajeros_asignados"], vector_match["pasajeros_asignados"]):
+                self.assertAlmostEqual(legacy_p["distance_km"], vector_p["distance_km"], delta=0.05)
+
+    def test_grid_index_matches_brute_force(self):
+        """Prueba 7: El índice de rejilla devuelve los mismos vecinos que la búsqueda exhaustiva"""
+        rng = np.random.default_rng(7)
+        lat = 4.55 + rng.random(500) * 0.25
+        lng = -74.20 + rng.random(500) * 0.20
+        index = GridIndex.from_points(range(500), lat, lng, cell_km=3)
+
+        for center in range(0, 500, 50):
+            keys, distances = index.query_radius(lat[center], lng[center], 3)
+            expected = np.flatnonzero(haversine_km(lat[center], lng[center], lat, lng) <= 3)
+            self.assertEqual(sorted(keys.tolist()), expected.tolist())
+            self.assertTrue((distances <= 3).all())
+
+    def test_grid_index_insert_remove(self):
+        """Prueba 8: Inserción, movimiento y eliminación en el índice vivo"""
+        index = GridIndex(cell_km=2)
+        self.assertTrue(index.insert("a", 4.65, -74.06))
+        self.assertFalse(index.insert("b", None, -74.06))
+        index.insert("a", 4.70, -74.04)
+
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.query_radius(4.65, -74.06, 1)[0].tolist(), [])
+        self.assertEqual(index.query_radius(4.70, -74.04, 1)[0].tolist(), ["a"])
+        self.assertTrue(index.remove("a"))
+        self.assertFalse(index.remove("a"))
+        self.assertEqual(len(index), 0)
+
+    def test_indexed_engine_matches_vectorized(self):
+        """Prueba 9: El motor con índice espacial produce los mismos emparejamientos"""
+        vectorized = match_rides_enhanced(self.pool_df, self.profiles_df, engine="vectorized")
+        indexed = match_rides_enhanced(self.pool_df, self.profiles_df, engine="indexed")
+        legacy = match_rides_enhanced(self.pool_df, self.profiles_df)
+
+        self.assertEqual(vectorized, indexed)
+        self.assertEqual(len(legacy), len(indexed))
+
+    def test_optimal_assignment_engine(self):
+        """Prueba 10: La asignación global no repite pasajeros entre conductores"""
+        pool_df = pd.DataFrame([
+            make_pool_row(1, "c1@unal.edu.co", "conductor", 4.6486, -74.0628, seats=1),
+            make_pool_row(2, "c2@unal.edu.co", "conductor", 4.6490, -74.0630, seats=1),
+            make_pool_row(3, "p1@unal.edu.co", "pasajero", 4.6500, -74.0600),
+            make_pool_row(4, "p2@unal.edu.co", "pasajero", 4.6400, -74.0700),
+        ])
+        first_fit = match_rides_enhanced(pool_df, self.profiles_df, engine="vectorized")
+        optimal = match_rides_enhanced(pool_df, self.profiles_df, assignment="optimal")
+
+        first_fit_emails = [p["pasajero_correo"] for m in first_fit for p in m["pasajeros_asignados"]]
+        optimal_emails = [p["pasajero_correo"] for m in optimal for p in m["pasajeros_asignados"]]
+        self.assertEqual(first_fit_emails, ["p1@unal.edu.co", "p1@unal.edu.co"])
+        self.assertEqual(sorted(optimal_emails), ["p1@unal.edu.co", "p2@unal.edu.co"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+# Añadir el directorio backend al path para importar las APIs y el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import matchmaking_api
+from wheels.match_cache import MatchResultCache
+from wheels.match_store import MatchStore
+from wheels.work_queue import CoalescingWorkQueue
+
+class TestWorkQueue(unittest.TestCase):
+    """Pruebas de la cola de trabajo que fusiona disparos de matchmaking"""
+
+    def setUp(self):
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def run_batch(self, payloads, seconds=0.05):
+        with self.lock:
+            self.batches.append(list(payloads))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(seconds)
+        with self.lock:
+            self.active -= 1
+        return len(payloads)
+
+    def test_burst_is_merged(self):
+        """Prueba 1: Una ráfaga dentro de la ventana produce una sola ejecución"""
+        queue = CoalescingWorkQueue(self.run_batch, workers=2, debounce_seconds=0.2)
+        futures = [queue.submit({"record_id": i}) for i in range(50)]
+        self.assertEqual(queue.stats()["queue_depth"], 50)
+
+        self.assertEqual({future.result(timeout=5) for future in futures}, {50})
+        self.assertTrue(queue.join(timeout=5))
+        stats = queue.stats()
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual((stats["runs"], stats["merged_triggers"], stats["max_batch_size"]), (1, 49, 50))
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreaterEqual(stats["last_run_ms"], 50)
+        queue.close()
+
+    def test_bounded_workers(self):
+        """Prueba 2: Nunca hay más ejecuciones simultáneas que trabajadores y no se pierden disparos"""
+        queue = CoalescingWorkQueue(self.run_batch, workers=2, debounce_seconds=0)
+        for i in range(40):
+            queue.submit(i)
+            time.sleep(0.005)
+        self.assertTrue(queue.join(timeout=10))
+
+        self.assertLessEqual(self.max_active, 2)
+        self.assertLess(len(self.batches), 40)
+        self.assertEqual(sorted(p for batch in self.batches for p in batch), list(range(40)))
+        queue.close()
+
+    def test_failure_reaches_every_trigger(self):
+        """Prueba 3: Un error en la ejecución llega a todos los disparos del lote"""
+        def failing(payloads):
+            raise RuntimeError("Supabase no disponible")
+
+        queue = CoalescingWorkQueue(failing, debounce_seconds=0.05)
+        futures = [queue.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+        queue.join(timeout=5)
+        self.assertEqual(queue.stats()["failures"], 1)
+        queue.close()
+        with self.assertRaises(RuntimeError):
+            queue.submit(4)
+
+    def test_trigger_endpoint_uses_queue(self):
+        """Prueba 4: Los POST simultáneos a /api/trigger-matchmaking comparten una pasada"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return [{"correo_conductor": "conductor@unal.edu.co", "pasajeros_asignados": []}]
+
+        queue = CoalescingWorkQueue(
+            lambda notifications: matchmaking_api.run_queued_matchmaking(notifications), debounce_seconds=0.3
+        )
+        responses = []
+
+        def post(i):
+            client = matchmaking_api.app.test_client()
+            responses.append(client.post("/api/trigger-matchmaking", json={"record_id": i}))
+
+        with patch.object(matchmaking_api, "matchmaking_queue", queue), \
+             patch.object(matchmaking_api, "match_cache", MatchResultCache()), \
+             patch.object(matchmaking_api, "match_store", MatchStore()), \
+             patch.object(matchmaking_api, "get_pool_version", return_value=(5, "v1")), \
+             patch.object(matchmaking_api, "compute_all_matches", side_effect=compute):
+            threads = [threading.Thread(target=post, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([response.status_code for response in responses], [200] * 8)
+        body = responses[0].get_json()
+        self.assertEqual(body["total_matches"], 1)
+        self.assertEqual(body["queue"]["merged_triggers"], 7)
+        queue.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import heapq
+from operator import itemgetter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+# Número de conductores más cercanos que se conservan por pasajero en el grafo de candidatos
+DEFAULT_MAX_CANDIDATES_PER_PASSENGER = 8
+
+def limit_candidates(passenger_idx, cost, max_candidates):
+    """
+    Conserva, para cada pasajero, solo sus max_candidates pares de menor costo
+
+    Args:
+        passenger_idx (ndarray): Pasajero de cada par
+        cost (ndarray): Costo (distancia en km) de cada par
+        max_candidates (int): Pares por pasajero a conservar (None = todos)
+
+    Returns:
+        ndarray: Máscara booleana de los pares conservados
+    """
+    if max_candidates is None or len(passenger_idx) == 0:
+        return np.ones(len(passenger_idx), dtype=bool)
+
+    order = np.lexsort((cost, passenger_idx))
+    sorted_passengers = passenger_idx[order]
+    group_start = np.r_[True, sorted_passengers[1:] != sorted_passengers[:-1]]
+    start_pos = np.maximum.accumulate(np.where(group_start, np.arange(len(order)), 0))
+    rank = np.arange(len(order)) - start_pos
+
+    keep = np.zeros(len(passenger_idx), dtype=bool)
+    keep[order[rank < max_candidates]] = True
+    return keep
+
+def nearest_first(candidates, k, key=itemgetter(1)):
+    """
+    Los k candidatos de menor distancia, del más cercano al más lejano
+
+    Usa un montículo acotado a k elementos: O(P log k) para P candidatos en lugar de
+    ordenar toda la lista. Con distancias iguales se conserva el orden de entrada.
+
+    Args:
+        candidates (iterable): Candidatos factibles de un conductor
+        k (int): Cupos del conductor
+        key (callable): Distancia de cada candidato (por defecto el segundo elemento)
+
+    Returns:
+        list: Hasta k candidatos ordenados por distancia
+    """
+    if k <= 0:
+        return []
+    return heapq.nsmallest(k, candidates, key=key)
+
+def nearest_assignment(driver_idx, passenger_idx, cost, seats):
+    """
+    Cada conductor toma sus pasajeros factibles más cercanos, hasta llenar sus cupos
+
+    Igual que 'first_fit' cada conductor se resuelve por separado (un pasajero puede
+    aparecer en varios conductores), pero los cupos se llenan por distancia y no en
+    orden del pool.
+
+    Args:
+        driver_idx (ndarray): Conductor de cada par, pares agrupados por conductor
+        passenger_idx (ndarray): Pasajero de cada par
+        cost (ndarray): Costo de cada par (distancia en km)
+        seats (ndarray): Cupos por conductor
+
+    Returns:
+        ndarray: Máscara booleana de los pares asignados
+    """
+    assigned = np.zeros(len(driver_idx), dtype=bool)
+    if len(driver_idx) == 0:
+        return assigned
+
+    driver_idx = np.asarray(driver_idx)
+    pair_cost = np.asarray(cost, dtype=np.float64).tolist()
+    boundaries = np.flatnonzero(np.r_[True, driver_idx[1:] != driver_idx[:-1], True]).tolist()
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        chosen = nearest_first(range(start, stop), int(seats[driver_idx[start]]), key=pair_cost.__getitem__)
+        assigned[chosen] = True
+    return assigned
+
+def greedy_assignment(driver_idx, passenger_idx, cost, seats):
+    """
+    Asignación global voraz: recorre los pares de menor a mayor costo
+
+    Cada pasajero recibe como máximo un conductor y ningún conductor supera sus cupos.
+
+    Args:
+        driver_idx (ndarray): Conductor de cada par
+        passenger_idx (ndarray): Pasajero de cada par
+        cost (ndarray): Costo de cada par
+        seats (ndarray): Cupos por conductor
+
+    Returns:
+        ndarray: Máscara booleana de los pares asignados
+    """
+    assigned = np.zeros(len(driver_idx), dtype=bool)
+    remaining = np.array(seats, dtype=np.int64).copy()
+    taken = set()
+
+    for pair in np.argsort(cost, kind="stable"):
+        driver = driver_idx[pair]
+        passenger = passenger_idx[pair]
+        if remaining[driver] <= 0 or passenger in taken:
+            continue
+        assigned[pair] = True
+        remaining[driver] -= 1
+        taken.add(passenger)
+
+    return assigned
+
+def optimal_assignment(driver_idx, passenger_idx, cost, seats,
+                       max_candidates_per_passenger=DEFAULT_MAX_CANDIDATES_PER_PASSENGER):
+    """
+    Asignación bipartita con capacidades de costo mínimo
+
+    Maximiza el número de pasajeros asignados y, entre esas soluciones, minimiza la
+    distancia total de recogida. Cada conductor se expande en tantas columnas como
+    cupos tenga y cada pasajero tiene una columna ficticia ("sin conductor") con un
+    costo mayor que cualquier mejora posible, de modo que siempre existe un
+    emparejamiento completo de los pasajeros. Se resuelve con LAPJVsp (scipy).
+
+    Args:
+        driver_idx (ndarray): Conductor de cada par candidato
+        passenger_idx (ndarray): Pasajero de cada par candidato
+        cost (ndarray): Costo de cada par (distancia en km)
+        seats (ndarray): Cupos por conductor
+        max_candidates_per_passenger (int): Poda del grafo a los k conductores más cercanos
+
+    Returns:
+        ndarray: Máscara booleana de los pares asignados
+    """
+    driver_idx = np.asarray(driver_idx, dtype=np.int64)
+    passenger_idx = np.asarray(passenger_idx, dtype=np.int64)
+    cost = np.asarray(cost, dtype=np.float64)
+    seats = np.asarray(seats, dtype=np.int64)
+
+    assigned = np.zeros(len(driver_idx), dtype=bool)
+    if len(driver_idx) == 0:
+        return assigned
+
+    candidates = np.flatnonzero(
+        limit_candidates(passenger_idx, cost, max_candidates_per_passenger) & (seats[driver_idx] > 0)
+    )
+    if len(candidates) == 0:
+        return assigned
+
+    pair_drivers = driver_idx[candidates]
+    pair_cost = cost[candidates] + 1.0  # los pesos deben ser distintos de cero
+    rows_of_pairs = np.unique(passenger_idx[candidates], return_inverse=True)[1]
+    n_rows = rows_of_pairs.max() + 1
+
+    # Columnas de cupos: un bloque contiguo por cada conductor con candidatos
+    used_drivers, driver_block = np.unique(pair_drivers, return_inverse=True)
+    block_size = seats[used_drivers]
+    block_offset = np.r_[0, np.cumsum(block_size)[:-1]]
+    n_slots = int(block_size.sum())
+
+    repeats = block_size[driver_block]
+    edge_pair = np.repeat(np.arange(len(candidates)), repeats)
+    slot_in_block = np.arange(len(edge_pair)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    edge_rows = rows_of_pairs[edge_pair]
+    edge_cols = block_offset[driver_block][edge_pair] + slot_in_block
+    edge_cost = pair_cost[edge_pair]
+
+    # Columna ficticia por pasajero: más cara que cualquier cadena de reasignaciones
+    unassigned_cost = (pair_cost.max() + 1.0) * (n_rows + 1)
+    rows = np.r_[edge_rows, np.arange(n_rows)]
+    cols = np.r_[edge_cols, n_slots + np.arange(n_rows)]
+    weights = np.r_[edge_cost, np.full(n_rows, unassigned_cost)]
+
+    graph = csr_matrix((weights, (rows, cols)), shape=(n_rows, n_slots + n_rows))
+    matched_rows, matched_cols = min_weight_full_bipartite_matching(graph)
+
+    real = matched_cols < n_slots
+    slot_block = np.repeat(np.arange(len(used_drivers)), block_size)
+    matched_drivers = used_drivers[slot_block[matched_cols[real]]]
+    matched_rows = matched_rows[real]
+
+    # Recupera el índice del par (conductor, pasajero) de cada arista elegida
+    pair_keys = rows_of_pairs * (driver_idx.max() + 1) + pair_drivers
+    chosen_keys = matched_rows * (driver_idx.max() + 1) + matched_drivers
+    assigned[candidates[np.isin(pair_keys, chosen_keys)]] = True
+    return assigned
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import threading
+
+import httpx
+
+from .maps_client import DEFAULT_BACKOFF_SECONDS, DEFAULT_MAX_RETRIES, backoff_delay, get_maps_client, is_retryable
+
+logger = logging.getLogger(__name__)
+
+# Solicitudes a Google en vuelo a la vez, sumando todos los hilos que usan el mismo fetcher
+DEFAULT_MAX_CONCURRENCY = 8
+
+class AsyncBridge:
+    """
+    Event loop en un hilo de fondo para ejecutar corrutinas desde código síncrono
+
+    Flask atiende cada request en un hilo sin event loop; run() entrega la corrutina al
+    loop del puente y espera el resultado. Como el loop vive mientras viva el proceso,
+    el cliente httpx (y sus conexiones keep-alive) se reutiliza entre llamadas.
+    """
+
+    def __init__(self, name="distance-fetcher"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def serve():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coroutine, timeout=None):
+        """
+        Ejecuta una corrutina en el loop del puente y devuelve su resultado
+
+        Args:
+            coroutine: Corrutina a ejecutar
+            timeout (float): Segundos máximos de espera (None sin límite)
+
+        Returns:
+            Resultado de la corrutina
+        """
+        loop = self._start()
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError("AsyncBridge.run() no puede llamarse desde su propio event loop")
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout)
+
+    def close(self):
+        """Detiene el loop del puente"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+class AsyncDistanceFetcher:
+    """
+    Solicitudes HTTP concurrentes a Google Maps con asyncio y httpx
+
+    Un semáforo limita las solicitudes en vuelo a max_concurrency y cada solicitud pasa
+    por el mismo TokenBucket del cliente compartido (get_maps_client()), así la cuota de
+    Google se respeta aunque las solicitudes salgan en paralelo. Los errores transitorios
+    se reintentan con el mismo backoff de MapsClient. Con N bloques de Distance Matrix la
+    latencia es la del bloque más lento (por tandas de max_concurrency), no la suma.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=10, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_seconds=DEFAULT_BACKOFF_SECONDS, rate_limiter=None, transport=None, bridge=None):
+        """
+        Args:
+            max_concurrency (int): Solicitudes simultáneas como máximo
+            timeout (float): Segundos máximos por solicitud
+            max_retries (int): Reintentos después del primer intento
+            backoff_seconds (float): Espera base del backoff
+            rate_limiter (TokenBucket): Límite de tasa (por defecto el de get_maps_client())
+            transport: Transporte httpx (inyectable en pruebas)
+            bridge (AsyncBridge): Loop donde corren las solicitudes (por defecto uno propio)
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = rate_limiter or get_maps_client().rate_limiter
+        self.transport = transport
+        self.bridge = bridge or AsyncBridge()
+        # El cliente y el semáforo pertenecen al loop del puente: se crean en él
+        self._client = None
+        self._semaphore = None
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.batches = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+
+    def _session(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits, transport=self.transport)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _get_json(self, url, params):
+        """Una solicitud con reintentos; None si no hubo respuesta utilizable"""
+        client = self._session()
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            wait = self.rate_limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self._semaphore:
+                self.requests += 1
+                self._in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self._in_flight)
+                try:
+                    response = await client.get(url, params=params)
+                except httpx.TransportError as e:
+                    response, error = None, e
+                finally:
+                    self._in_flight -= 1
+            if response is None:
+                if last:
+                    self.failures += 1
+                    logger.error(f"❌ Error de red en Google Maps tras {attempt + 1} intentos: {error}")
+                    return None
+                self.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_seconds))
+                continue
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+            if not is_retryable(response.status_code, data):
+                return data
+            if last:
+                self.failures += 1
+                return data
+            self.retries += 1
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_seconds, response.headers.get("Retry-After")))
+
+    async def fetch_all(self, url, params_list):
+        """
+        Todas las solicitudes a la vez (acotadas por el semáforo)
+
+        Args:
+            url (str): URL de la API
+            params_list (list): Parámetros de cada solicitud
+
+        Returns:
+            list: JSON de cada solicitud en el mismo orden (None si falló)
+        """
+        self.batches += 1
+        return await asyncio.gather(*(self._get_json(url, params) for params in params_list))
+
+    def fetch(self, url, params_list, timeout=None):
+        """Versión síncrona de fetch_all(), a través del AsyncBridge"""
+        if not params_list:
+            return []
+        return self.bridge.run(self.fetch_all(url, list(params_list)), timeout)
+
+    def stats(self):
+        """Solicitudes, reintentos, fallos y máximo de solicitudes simultáneas observado"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "batches": self.batches,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "max_in_flight": self.max_in_flight
+        }
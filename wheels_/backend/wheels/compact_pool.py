@@ -0,0 +1,173 @@
+import numpy as np
+
+from .corridor import coordinate
+from .destinations import record_destination_key
+from .pool_engine import dataframe_records, is_active_record, is_missing, record_seats
+from .time_windows import record_departure_minutes
+from .sharded_matching import DEFAULT_MIN_PARALLEL_SIZE, match_arrays_sharded
+
+# Código de cada rol en CompactPool.roles
+ROLE_CODES = {"conductor": 0, "pasajero": 1}
+
+class CompactPool:
+    """
+    Searching_pool compacto: una columna NumPy por campo que usa el matchmaking
+
+    Los registros de Supabase se recorren una sola vez para llenar id, correo, rol,
+    coordenadas de recogida y de destino, código de destino, cupos, hora de salida y
+    created_at. Los dicts originales se conservan (sin copiarlos) solo para construir
+    la respuesta, y las vistas por rol son índices sobre las columnas, sin copias ni
+    Series por fila.
+    """
+
+    __slots__ = ("records", "ids", "emails", "roles", "lat", "lng", "destination_codes", "seats", "created_at",
+                 "departure", "dropoff_lat", "dropoff_lng")
+
+    def __init__(self, records, ids, emails, roles, lat, lng, destination_codes, seats, created_at, departure,
+                 dropoff_lat, dropoff_lng):
+        self.records = records
+        self.ids = ids
+        self.emails = emails
+        self.roles = roles
+        self.lat = lat
+        self.lng = lng
+        self.destination_codes = destination_codes
+        self.seats = seats
+        self.created_at = created_at
+        # Hora de salida en minutos (NaN sin trip_datetime/hora_viaje), ver wheels.time_windows
+        self.departure = departure
+        # Destino en coordenadas para el modo corredor (NaN si falta), ver wheels.corridor
+        self.dropoff_lat = dropoff_lat
+        self.dropoff_lng = dropoff_lng
+
+    @classmethod
+    def from_records(cls, records, destination_column="destino", normalize_destinations=True, latest_per_user=True):
+        """
+        Construye el pool compacto a partir de los registros crudos del searching_pool
+
+        Args:
+            records (list): Registros del searching_pool (dicts de Supabase)
+            destination_column (str): Columna con el destino
+            normalize_destinations (bool): Usa la clave canónica de destino; si es False
+                compara el valor exacto de la columna
+            latest_per_user (bool): Conserva solo el registro más reciente de cada correo
+                y rol, ordenando el pool por created_at descendente
+
+        Returns:
+            CompactPool: Registros activos con rol y correo
+        """
+        active = [record for record in records if is_active_record(record)]
+        if latest_per_user:
+            # Orden estable: igual que sort_values('created_at') + drop_duplicates
+            active.sort(
+                key=lambda record: "" if is_missing(record.get("created_at")) else str(record["created_at"]),
+                reverse=True
+            )
+            seen = set()
+            unique = []
+            for record in active:
+                user = (record["tipo_de_usuario"], record["correo_usuario"])
+                if user not in seen:
+                    seen.add(user)
+                    unique.append(record)
+            active = unique
+
+        n = len(active)
+        roles = np.empty(n, dtype=np.int8)
+        lat = np.empty(n, dtype=np.float64)
+        lng = np.empty(n, dtype=np.float64)
+        codes = np.empty(n, dtype=np.int64)
+        seats = np.empty(n, dtype=np.int64)
+        departure = np.empty(n, dtype=np.float64)
+        dropoff_lat = np.empty(n, dtype=np.float64)
+        dropoff_lng = np.empty(n, dtype=np.float64)
+        # Diccionario de destinos compartido por conductores y pasajeros
+        destinations = {}
+
+        for i, record in enumerate(active):
+            if normalize_destinations:
+                key = record_destination_key(record, destination_column)
+            else:
+                key = record.get(destination_column)
+                key = None if is_missing(key) else key
+            roles[i] = ROLE_CODES[record["tipo_de_usuario"]]
+            lat[i] = coordinate(record.get("pickup_lat"))
+            lng[i] = coordinate(record.get("pickup_lng"))
+            codes[i] = -1 if key is None else destinations.setdefault(key, len(destinations))
+            seats[i] = record_seats(record)
+            departure[i] = record_departure_minutes(record)
+            dropoff_lat[i] = coordinate(record.get("dropoff_lat"))
+            dropoff_lng[i] = coordinate(record.get("dropoff_lng"))
+
+        return cls(
+            active,
+            np.array([record.get("id") for record in active], dtype=object),
+            np.array([record["correo_usuario"] for record in active], dtype=object),
+            roles, lat, lng, codes, seats,
+            np.array([record.get("created_at") for record in active], dtype=object),
+            departure, dropoff_lat, dropoff_lng
+        )
+
+    @classmethod
+    def from_dataframe(cls, searching_pool_df, **kwargs):
+        """Construye el pool compacto desde un DataFrame (ver from_records)"""
+        return cls.from_records(dataframe_records(searching_pool_df), **kwargs)
+
+    def __len__(self):
+        return len(self.records)
+
+    def take(self, positions):
+        """
+        Sub-pool con las filas indicadas (mismo diccionario de destinos)
+
+        Args:
+            positions (ndarray): Posiciones de las filas
+
+        Returns:
+            CompactPool: Sub-pool
+        """
+        return CompactPool(
+            [self.records[i] for i in positions],
+            self.ids[positions], self.emails[positions], self.roles[positions],
+            self.lat[positions], self.lng[positions], self.destination_codes[positions],
+            self.seats[positions], self.created_at[positions], self.departure[positions],
+            self.dropoff_lat[positions], self.dropoff_lng[positions]
+        )
+
+    def role(self, role):
+        """Sub-pool de un rol ('conductor' o 'pasajero') en el orden del pool"""
+        return self.take(np.flatnonzero(self.roles == ROLE_CODES[role]))
+
+def match_compact_pool(drivers, passengers, max_distance_km=5, use_spatial_index=False, assignment="first_fit",
+                       workers=1, min_parallel_size=DEFAULT_MIN_PARALLEL_SIZE, time_window_minutes=None,
+                       pickup_mode="radius"):
+    """
+    Empareja dos sub-pools compactos con el motor vectorizado
+
+    Con workers > 1 y un pool grande cada destino se resuelve en un proceso de
+    trabajo (ver wheels.sharded_matching).
+
+    Args:
+        drivers (CompactPool): Conductores (de pool.role('conductor'))
+        passengers (CompactPool): Pasajeros del mismo pool
+        max_distance_km (float): Distancia máxima para emparejar
+        use_spatial_index (bool): Usa índices GridIndex en lugar de la matriz por bloques
+        assignment (str): Estrategia de cupos, ver ASSIGNMENT_STRATEGIES
+        workers (int): Procesos de trabajo para repartir los destinos
+        min_parallel_size (int): Registros mínimos para repartir el trabajo
+        time_window_minutes (float): Diferencia máxima entre horas de salida (None sin filtro)
+        pickup_mode (str): 'radius' o 'corridor' (trayecto hasta dropoff_lat/dropoff_lng)
+
+    Returns:
+        list: Tuplas (posición del conductor, posiciones de pasajeros, distancias en km)
+    """
+    return match_arrays_sharded(
+        drivers.lat, drivers.lng, drivers.destination_codes, drivers.seats,
+        passengers.lat, passengers.lng, passengers.destination_codes, max_distance_km,
+        use_spatial_index=use_spatial_index, assignment=assignment,
+        workers=workers, min_parallel_size=min_parallel_size,
+        driver_minutes=drivers.departure, passenger_minutes=passengers.departure,
+        time_window_minutes=time_window_minutes,
+        driver_dropoff_lat=drivers.dropoff_lat if pickup_mode == "corridor" else None,
+        driver_dropoff_lng=drivers.dropoff_lng if pickup_mode == "corridor" else None
+    )
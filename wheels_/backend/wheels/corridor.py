@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+
+from .geo import haversine_km
+from .spatial_index import KM_PER_DEGREE_LAT, candidate_radius
+
+# Modos de recogida:
+# - 'radius': el pasajero debe estar a menos de max_distance_km del punto de partida del conductor
+# - 'corridor': también sirven los pasajeros a menos de max_distance_km del trayecto en línea
+#   recta del punto de partida al destino (dropoff_lat/dropoff_lng) del conductor
+PICKUP_MODES = ("radius", "corridor")
+
+def coordinate(value):
+    """Convierte una coordenada a float (NaN si falta o no es válida)"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+class DriverCorridors:
+    """
+    Corredores de recogida de un conjunto de conductores, calculados una sola vez
+
+    Cada conductor tiene el segmento origen -> destino proyectado en kilómetros
+    (equirectangular alrededor de su origen, suficiente a escala de ciudad) y una caja
+    lat/lng del segmento ampliada con el radio de búsqueda. La caja descarta con
+    restas y comparaciones; la distancia punto-segmento solo se calcula para los
+    pares que quedan dentro. Un conductor sin destino en coordenadas tiene un
+    segmento de largo cero: su corredor es el círculo alrededor del origen.
+    """
+
+    __slots__ = ("origin_lat", "origin_lng", "cos_lat", "dx", "dy", "length_sq",
+                 "lat_min", "lat_max", "lng_min", "lng_max")
+
+    def __init__(self, origin_lat, origin_lng, dropoff_lat, dropoff_lng, max_distance_km=5):
+        """
+        Args:
+            origin_lat, origin_lng (ndarray): Punto de partida de cada conductor
+            dropoff_lat, dropoff_lng (ndarray): Destino de cada conductor (NaN si falta)
+            max_distance_km (float): Ancho del corredor a cada lado del segmento
+        """
+        origin_lat = np.asarray(origin_lat, dtype=np.float64)
+        origin_lng = np.asarray(origin_lng, dtype=np.float64)
+        dropoff_lat = np.asarray(dropoff_lat, dtype=np.float64)
+        dropoff_lng = np.asarray(dropoff_lng, dtype=np.float64)
+        missing = np.isnan(dropoff_lat) | np.isnan(dropoff_lng)
+        dropoff_lat = np.where(missing, origin_lat, dropoff_lat)
+        dropoff_lng = np.where(missing, origin_lng, dropoff_lng)
+
+        self.origin_lat = origin_lat
+        self.origin_lng = origin_lng
+        self.cos_lat = np.cos(np.radians(origin_lat))
+        self.dx = (dropoff_lng - origin_lng) * KM_PER_DEGREE_LAT * self.cos_lat
+        self.dy = (dropoff_lat - origin_lat) * KM_PER_DEGREE_LAT
+        self.length_sq = self.dx ** 2 + self.dy ** 2
+
+        radius = candidate_radius(max_distance_km)
+        lat_span = radius / KM_PER_DEGREE_LAT
+        self.lat_min = np.minimum(origin_lat, dropoff_lat) - lat_span
+        self.lat_max = np.maximum(origin_lat, dropoff_lat) + lat_span
+        widest = np.minimum(np.maximum(np.abs(self.lat_min), np.abs(self.lat_max)), 89.0)
+        lng_span = radius / (KM_PER_DEGREE_LAT * np.cos(np.radians(widest)))
+        self.lng_min = np.minimum(origin_lng, dropoff_lng) - lng_span
+        self.lng_max = np.maximum(origin_lng, dropoff_lng) + lng_span
+
+    @classmethod
+    def from_record(cls, record, max_distance_km=5):
+        """Corredor de un solo conductor a partir de su registro del searching_pool"""
+        return cls(*([coordinate(record.get(column))] for column in
+                     ("pickup_lat", "pickup_lng", "dropoff_lat", "dropoff_lng")), max_distance_km=max_distance_km)
+
+    def __len__(self):
+        return len(self.origin_lat)
+
+    def box_mask(self, drivers, lat, lng):
+        """
+        Matriz (conductores, puntos) de puntos dentro de la caja de cada corredor
+
+        Args:
+            drivers (ndarray): Posiciones de los conductores
+            lat, lng (ndarray): Coordenadas de los puntos (NaN nunca está dentro)
+
+        Returns:
+            ndarray: Matriz booleana
+        """
+        lat = np.asarray(lat, dtype=np.float64)[None, :]
+        lng = np.asarray(lng, dtype=np.float64)[None, :]
+        return (
+            (lat >= self.lat_min[drivers, None]) & (lat <= self.lat_max[drivers, None])
+            & (lng >= self.lng_min[drivers, None]) & (lng <= self.lng_max[drivers, None])
+        )
+
+    def contains_box(self, lat, lng):
+        """Conductores cuya caja contiene el punto (lat, lng)"""
+        return np.flatnonzero(self.box_mask(np.arange(len(self)), [lat], [lng])[:, 0])
+
+    def distance_km(self, drivers, lat, lng):
+        """
+        Distancia de cada punto al segmento de su conductor (arrays alineados)
+
+        Args:
+            drivers (ndarray): Posición del conductor de cada par
+            lat, lng (ndarray): Coordenadas del punto de cada par
+
+        Returns:
+            ndarray: Distancias en kilómetros
+        """
+        px = (np.asarray(lng, dtype=np.float64) - self.origin_lng[drivers]) * KM_PER_DEGREE_LAT * self.cos_lat[drivers]
+        py = (np.asarray(lat, dtype=np.float64) - self.origin_lat[drivers]) * KM_PER_DEGREE_LAT
+        dx, dy, length_sq = self.dx[drivers], self.dy[drivers], self.length_sq[drivers]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.clip(np.where(length_sq > 0, (px * dx + py * dy) / length_sq, 0.0), 0.0, 1.0)
+        return np.hypot(px - t * dx, py - t * dy)
+
+    def search_circle(self, driver, max_distance_km):
+        """
+        Círculo que contiene el corredor de un conductor, para consultar un GridIndex
+
+        Returns:
+            tuple: (lat, lng, radio en km) centrado en el punto medio del segmento
+        """
+        mid_lat = self.origin_lat[driver] + self.dy[driver] / 2 / KM_PER_DEGREE_LAT
+        mid_lng = self.origin_lng[driver] + self.dx[driver] / 2 / (KM_PER_DEGREE_LAT * self.cos_lat[driver])
+        radius = np.sqrt(self.length_sq[driver]) / 2 * 1.01 + candidate_radius(max_distance_km)
+        return float(mid_lat), float(mid_lng), float(radius)
+
+def corridor_feasible(corridors, drivers, lat, lng, max_distance_km):
+    """
+    Pares (conductor, punto) dentro del radio de partida o del corredor del conductor
+
+    Args:
+        corridors (DriverCorridors): Corredores de los conductores
+        drivers (ndarray): Posición del conductor de cada par
+        lat, lng (ndarray): Coordenadas del pasajero de cada par
+        max_distance_km (float): Distancia máxima al origen o al trayecto
+
+    Returns:
+        tuple: (máscara de pares factibles, distancia Haversine desde el punto de partida)
+    """
+    from_origin = haversine_km(corridors.origin_lat[drivers], corridors.origin_lng[drivers], lat, lng)
+    # Se compara la distancia redondeada a 10 m, igual que el algoritmo iterativo; el
+    # radio de partida se conserva, así el corredor nunca pierde pares del modo 'radius'
+    inside = (np.round(from_origin, 2) <= max_distance_km) | (
+        np.round(corridors.distance_km(drivers, lat, lng), 2) <= max_distance_km
+    )
+    return inside, from_origin
@@ -0,0 +1,100 @@
+import math
+import re
+import unicodedata
+
+import numpy as np
+
+# Columnas opcionales del searching_pool con el place_id de Google del destino
+PLACE_ID_COLUMNS = ("dropoff_place_id", "destino_place_id", "place_id")
+
+def normalize_destination_text(value):
+    """
+    Normaliza el texto de un destino: minúsculas, sin tildes ni signos y espacios simples
+
+    Args:
+        value: Texto del destino (None/NaN se tratan como vacío)
+
+    Returns:
+        str: Texto normalizado ('' si no hay destino)
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+def canonical_destination_key(text, place_id=None, lat=None, lng=None, coordinate_precision=None):
+    """
+    Calcula la clave canónica de destino de un registro del pool
+
+    Prioridad: place_id de Google, coordenadas redondeadas (si se pide una precisión)
+    y por último el texto normalizado.
+
+    Args:
+        text (str): Texto del destino ('destino' o 'dropoff_address')
+        place_id (str): place_id de Google del destino, si existe
+        lat, lng (float): Coordenadas del destino, si existen
+        coordinate_precision (int): Decimales para agrupar coordenadas (2 ≈ 1.1 km); None las ignora
+
+    Returns:
+        str: Clave canónica, o None si el registro no tiene destino
+    """
+    if place_id is not None and not (isinstance(place_id, float) and math.isnan(place_id)) and str(place_id).strip():
+        return f"place:{str(place_id).strip()}"
+
+    if coordinate_precision is not None:
+        try:
+            lat = float(lat)
+            lng = float(lng)
+        except (TypeError, ValueError):
+            lat = lng = float("nan")
+        if not (math.isnan(lat) or math.isnan(lng)):
+            return f"geo:{round(lat, coordinate_precision)},{round(lng, coordinate_precision)}"
+
+    normalized = normalize_destination_text(text)
+    return f"text:{normalized}" if normalized else None
+
+def record_destination_key(record, text_column="destino", coordinate_precision=None):
+    """
+    Clave canónica de destino de un registro suelto del pool (dict o fila)
+
+    Args:
+        record (dict): Registro del searching_pool
+        text_column (str): Columna con el texto del destino
+        coordinate_precision (int): Ver canonical_destination_key
+
+    Returns:
+        str: Clave canónica, o None si el registro no tiene destino
+    """
+    place_column = next((column for column in PLACE_ID_COLUMNS if column in record), None)
+    return canonical_destination_key(
+        record.get(text_column),
+        record.get(place_column) if place_column else None,
+        record.get("dropoff_lat"),
+        record.get("dropoff_lng"),
+        coordinate_precision
+    )
+
+def destination_keys(df, text_column="destino", coordinate_precision=None):
+    """
+    Calcula la clave canónica de destino una sola vez por fila del pool
+
+    Args:
+        df (DataFrame): Registros del searching_pool
+        text_column (str): Columna con el texto del destino
+        coordinate_precision (int): Ver canonical_destination_key
+
+    Returns:
+        ndarray: Claves (object) alineadas con las filas de df
+    """
+    place_column = next((column for column in PLACE_ID_COLUMNS if column in df.columns), None)
+    n = len(df)
+    texts = df[text_column].tolist() if text_column in df.columns else [None] * n
+    place_ids = df[place_column].tolist() if place_column else [None] * n
+    lats = df["dropoff_lat"].tolist() if "dropoff_lat" in df.columns else [None] * n
+    lngs = df["dropoff_lng"].tolist() if "dropoff_lng" in df.columns else [None] * n
+
+    return np.array([
+        canonical_destination_key(text, place_id, lat, lng, coordinate_precision)
+        for text, place_id, lat, lng in zip(texts, place_ids, lats, lngs)
+    ], dtype=object)
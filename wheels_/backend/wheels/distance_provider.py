@@ -0,0 +1,847 @@
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from . import async_distance
+from .geo import haversine_km
+from .maps_client import get_maps_client
+from .road_graph import RoadGraph
+
+logger = logging.getLogger(__name__)
+
+# Proveedores de distancia seleccionables por configuración:
+# - 'haversine': distancia en línea recta, sin red (solo coordenadas)
+# - 'google': Distance Matrix de Google; los pares sin respuesta usan Haversine
+# - 'road_graph': rutas sobre un grafo vial local (ROAD_GRAPH_PATH), sin red ni costo por consulta;
+#   los puntos lejos de la red usan Haversine
+DISTANCE_PROVIDERS = ("haversine", "google", "road_graph")
+
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+# Límites de una solicitud de Distance Matrix: 25 orígenes, 25 destinos y 100 elementos
+MAX_PLACES_PER_REQUEST = 25
+MAX_ELEMENTS_PER_REQUEST = 100
+
+# Fracción mínima de celdas pedidas en un bloque de pack_pairs: Google cobra cada elemento
+# de la matriz, así que dos orígenes solo comparten solicitud si todo el bloque se usa
+DEFAULT_MIN_FILL = 1.0
+
+# Duración supuesta de la estimación espacial: 1.5 minutos por kilómetro (40 km/h)
+HAVERSINE_SECONDS_PER_KM = 90.0
+
+# Distancia máxima de un punto al nodo más cercano del grafo vial: más lejos el punto está
+# fuera del extracto (o en una zona sin vías) y el par queda para el proveedor de respaldo
+DEFAULT_MAX_SNAP_KM = 0.5
+
+# Tiempo máximo de búsqueda en el grafo vial: ningún viaje compartido dentro de Bogotá toma
+# más de dos horas, y el límite evita recorrer todo el grafo por un par sin ruta
+DEFAULT_MAX_ROUTE_SECONDS = 2 * 3600
+
+# Decimales de las coordenadas en las claves de la caché: 4 decimales son ~11 m, así los
+# puntos casi idénticos (la misma casa geocodificada dos veces) comparten entrada
+DEFAULT_CACHE_PRECISION = 4
+
+def place_coordinates(place):
+    """
+    Coordenadas de un lugar
+
+    Args:
+        place: Tupla (lat, lng) o dirección (str)
+
+    Returns:
+        tuple: (lat, lng) como float (NaN si el lugar es una dirección o no es válido)
+    """
+    if isinstance(place, str):
+        return math.nan, math.nan
+    try:
+        lat, lng = place
+        return float(lat), float(lng)
+    except (TypeError, ValueError):
+        return math.nan, math.nan
+
+def place_parameter(place):
+    """Texto de un lugar para los parámetros de Distance Matrix ('lat,lng' o la dirección)"""
+    if isinstance(place, str):
+        return place.strip()
+    lat, lng = place_coordinates(place)
+    return f"{lat},{lng}"
+
+def place_key(place, precision=6):
+    """Clave hashable de un lugar: coordenadas redondeadas a `precision` decimales o la dirección"""
+    if isinstance(place, str):
+        return place.strip()
+    lat, lng = place_coordinates(place)
+    return (round(lat, precision), round(lng, precision))
+
+def format_duration(seconds):
+    """Texto de una duración con el formato de Google ('1 min', '12 mins', '1 hour 5 mins')"""
+    minutes = int(round(seconds / 60))
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if minutes or not hours:
+        parts.append(f"{minutes} min{'s' if minutes != 1 else ''}")
+    return " ".join(parts)
+
+def pack_pairs(pairs, max_places=MAX_PLACES_PER_REQUEST, max_elements=MAX_ELEMENTS_PER_REQUEST,
+               min_fill=DEFAULT_MIN_FILL):
+    """
+    Empaqueta pares origen -> destino en bloques origen x destino de Distance Matrix
+
+    Voraz: cada bloque empieza por el origen con más destinos pendientes y agrega los
+    orígenes que más pares pendientes cubren con las columnas del bloque (y las que
+    aportan), mientras el bloque respete los límites de la API y al menos min_fill de
+    sus celdas sean pares pedidos. Así los conductores cercanos que comparten
+    pasajeros van en una sola solicitud, y los pares dispersos no pagan el producto
+    cruzado completo.
+
+    Args:
+        pairs (iterable): Pares (clave de origen, clave de destino) hashables
+        max_places (int): Orígenes y destinos máximos por solicitud
+        max_elements (int): Elementos (orígenes x destinos) máximos por solicitud
+        min_fill (float): Fracción mínima de celdas del bloque que son pares pedidos
+
+    Returns:
+        list: Bloques (claves de origen, claves de destino); cada par queda en un solo bloque
+    """
+    # Destinos pendientes de cada origen y orígenes pendientes de cada destino, en orden
+    remaining = OrderedDict()
+    origins_of = {}
+    for origin, destination in pairs:
+        remaining.setdefault(origin, OrderedDict())[destination] = None
+        origins_of.setdefault(destination, OrderedDict())[origin] = None
+
+    tiles = []
+    while remaining:
+        seed = max(remaining, key=lambda origin: len(remaining[origin]))
+        columns = list(remaining[seed])[:max_places]
+        column_set = set(columns)
+        rows = [seed]
+        covered = len(columns)
+
+        while len(rows) < max_places:
+            max_columns = min(max_places, max_elements // (len(rows) + 1))
+            if len(columns) > max_columns:
+                break
+            # Orígenes que comparten destinos con el bloque y algunos pendientes cualquiera
+            candidates = OrderedDict()
+            for destination in columns:
+                candidates.update(origins_of[destination])
+            for origin in remaining:
+                if len(candidates) >= len(rows) + 2 * max_places:
+                    break
+                candidates[origin] = None
+
+            best = None
+            for origin in candidates:
+                if origin in rows:
+                    continue
+                wanted = remaining[origin]
+                shared = sum(1 for destination in wanted if destination in column_set)
+                extra = [destination for destination in wanted if destination not in column_set]
+                extra = extra[:max_columns - len(columns)]
+                gain = shared + len(extra) + sum(
+                    1 for row in rows for destination in extra if destination in remaining[row]
+                )
+                elements = (len(rows) + 1) * (len(columns) + len(extra))
+                if gain and (covered + gain) >= min_fill * elements and (best is None or gain > best[0]):
+                    best = (gain, origin, extra)
+            if best is None:
+                break
+
+            gain, origin, extra = best
+            rows.append(origin)
+            columns.extend(extra)
+            column_set.update(extra)
+            covered += gain
+
+        for origin in rows:
+            wanted = remaining[origin]
+            for destination in columns:
+                if destination in wanted:
+                    del wanted[destination]
+                    del origins_of[destination][origin]
+            if not wanted:
+                del remaining[origin]
+        tiles.append((rows, columns))
+    return tiles
+
+class DistanceBatch:
+    """
+    Distancias y duraciones numéricas de un lote de pares origen -> destino
+
+    metres y seconds son arrays float64 con la forma del lote (un vector para pares,
+    una matriz para matrix()); NaN indica un par sin resultado. sources guarda el
+    proveedor que respondió cada par.
+    """
+
+    __slots__ = ("metres", "seconds", "sources")
+
+    def __init__(self, metres, seconds, sources):
+        self.metres = np.asarray(metres, dtype=np.float64)
+        self.seconds = np.asarray(seconds, dtype=np.float64)
+        self.sources = np.asarray(sources, dtype=object)
+
+    @classmethod
+    def unavailable(cls, shape):
+        """Lote sin resultados (todo NaN)"""
+        return cls(np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, "error", dtype=object))
+
+    def __len__(self):
+        return self.metres.size
+
+    @property
+    def km(self):
+        return self.metres / 1000
+
+    def missing(self):
+        """Máscara de los pares sin resultado"""
+        return np.isnan(self.metres) | np.isnan(self.seconds)
+
+    def fill(self, mask, other):
+        """Copia en las posiciones de mask los resultados de otro lote (alineado con mask.sum())"""
+        self.metres[mask] = other.metres
+        self.seconds[mask] = other.seconds
+        self.sources[mask] = other.sources
+
+    def result(self, index):
+        """
+        Resultado de un par con el esquema de respuesta de la API
+
+        Returns:
+            dict: {'distance' (km), 'duration' (texto), 'duration_seconds', 'source'}
+        """
+        metres = self.metres.flat[index]
+        seconds = self.seconds.flat[index]
+        source = self.sources.flat[index]
+        if math.isnan(metres) or math.isnan(seconds):
+            return {'distance': 999, 'duration': 'N/A', 'duration_seconds': None, 'source': 'error'}
+        return {
+            'distance': round(float(metres) / 1000, 2),
+            'duration': f"~{round(seconds / 60)} min" if source == "haversine" else format_duration(seconds),
+            'duration_seconds': float(seconds),
+            'source': source
+        }
+
+    def results(self):
+        """Resultados de todos los pares, en orden"""
+        return [self.result(index) for index in range(len(self))]
+
+class DistanceProvider:
+    """
+    Interfaz de los proveedores de distancia
+
+    Las subclases implementan distances(), que recibe muchos pares a la vez; el resto
+    de métodos se construye sobre ella.
+    """
+
+    name = "base"
+
+    def distances(self, origins, destinations):
+        """
+        Distancias de cada origen a su destino (listas alineadas)
+
+        Args:
+            origins, destinations (list): Lugares como tuplas (lat, lng) o direcciones
+
+        Returns:
+            DistanceBatch: Un par por posición
+        """
+        raise NotImplementedError
+
+    def one_to_many(self, origin, destinations):
+        """Distancias de un origen a varios destinos"""
+        return self.distances([origin] * len(destinations), list(destinations))
+
+    def distance(self, origin, destination):
+        """Resultado de un solo par con el esquema de respuesta de la API"""
+        return self.distances([origin], [destination]).result(0)
+
+    def matrix(self, origins, destinations):
+        """
+        Matriz de distancias origen x destino
+
+        Returns:
+            DistanceBatch: Arrays de forma (orígenes, destinos)
+        """
+        origins, destinations = list(origins), list(destinations)
+        batch = self.distances(
+            [origin for origin in origins for _ in destinations], destinations * len(origins)
+        )
+        shape = (len(origins), len(destinations))
+        return DistanceBatch(batch.metres.reshape(shape), batch.seconds.reshape(shape), batch.sources.reshape(shape))
+
+    def stats(self):
+        """Estado del proveedor para /api/health"""
+        return {"provider": self.name}
+
+class HaversineDistanceProvider(DistanceProvider):
+    """Distancia en línea recta vectorizada; la duración se estima con una velocidad fija"""
+
+    name = "haversine"
+
+    def __init__(self, seconds_per_km=HAVERSINE_SECONDS_PER_KM, estimator=None):
+        """
+        Args:
+            seconds_per_km (float): Velocidad fija de la duración
+            estimator (TravelTimeEstimator): Estimador calibrado de la duración (None usa seconds_per_km)
+        """
+        self.seconds_per_km = seconds_per_km
+        self.estimator = estimator
+
+    def distances(self, origins, destinations):
+        origin = np.array([place_coordinates(place) for place in origins], dtype=np.float64).reshape(-1, 2)
+        destination = np.array([place_coordinates(place) for place in destinations], dtype=np.float64).reshape(-1, 2)
+        km = haversine_km(origin[:, 0], origin[:, 1], destination[:, 0], destination[:, 1])
+        if self.estimator is None:
+            seconds = km * self.seconds_per_km
+        else:
+            seconds = self.estimator.predict(origin[:, 0], origin[:, 1], destination[:, 0], destination[:, 1])
+        return DistanceBatch(km * 1000, seconds, np.full(len(km), self.name, dtype=object))
+
+class GoogleDistanceProvider(DistanceProvider):
+    """
+    Distance Matrix de Google
+
+    distances() empaqueta los pares en bloques origen x destino con pack_pairs
+    (varios orígenes por solicitud cuando comparten destinos); matrix() divide la
+    matriz en bloques dentro de los límites de la API. Con un AsyncDistanceFetcher los
+    bloques de una llamada se piden en paralelo; sin él, uno tras otro con session.
+    La duración es duration_in_traffic cuando existe. Los pares sin ruta, sin clave o
+    con error de la API quedan en NaN.
+    """
+
+    name = "google_maps"
+
+    def __init__(self, api_key=None, mode="driving", timeout=10, session=None, min_fill=DEFAULT_MIN_FILL,
+                 fetcher=None):
+        """
+        Args:
+            api_key (str): Clave de la API (None la lee de GOOGLE_MAPS_API_KEY en cada solicitud)
+            mode (str): Modo de viaje de Distance Matrix
+            timeout (float): Segundos máximos por solicitud
+            session: Objeto con get() compatible con requests (por defecto el cliente compartido
+                get_maps_client(), con pool de conexiones, reintentos y límite de tasa)
+            min_fill (float): Fracción mínima de celdas útiles de un bloque (ver pack_pairs)
+            fetcher (AsyncDistanceFetcher): Cliente asíncrono para pedir varios bloques a la vez
+        """
+        self.api_key = api_key
+        self.mode = mode
+        self.timeout = timeout
+        self.session = session or get_maps_client()
+        self.min_fill = min_fill
+        self.fetcher = fetcher
+        self.requests = 0
+
+    def _api_key(self):
+        return self.api_key or os.getenv("GOOGLE_MAPS_API_KEY")
+
+    def _params(self, origins, destinations, api_key):
+        return {
+            'origins': "|".join(place_parameter(place) for place in origins),
+            'destinations': "|".join(place_parameter(place) for place in destinations),
+            'key': api_key,
+            'units': 'metric',
+            'mode': self.mode,
+            'traffic_model': 'best_guess',
+            'departure_time': 'now'
+        }
+
+    def _get(self, params):
+        try:
+            return self.session.get(DISTANCE_MATRIX_URL, params=params, timeout=self.timeout).json()
+        except Exception as e:
+            logger.error(f"❌ Error al consultar Distance Matrix: {str(e)}")
+            return None
+
+    @staticmethod
+    def _parse(data, origins, destinations):
+        """Matrices (metros, segundos) de una respuesta, NaN donde no hay resultado"""
+        metres = np.full((len(origins), len(destinations)), np.nan)
+        seconds = np.full((len(origins), len(destinations)), np.nan)
+        if data is None:
+            return metres, seconds
+        if data.get('status') != 'OK':
+            logger.error(f"❌ Error en Google Maps API: {data.get('status')}")
+            return metres, seconds
+
+        for i, row in enumerate(data.get('rows', [])[:len(origins)]):
+            for j, element in enumerate(row.get('elements', [])[:len(destinations)]):
+                if element.get('status') != 'OK':
+                    continue
+                metres[i, j] = element['distance']['value']
+                seconds[i, j] = element.get('duration_in_traffic', element['duration'])['value']
+        return metres, seconds
+
+    def _request_many(self, tiles):
+        """
+        Solicitudes de Distance Matrix, una por bloque
+
+        Args:
+            tiles (list): Pares (orígenes, destinos) dentro de los límites de la API
+
+        Returns:
+            list: Matrices (metros, segundos) de cada bloque, NaN sin resultado
+        """
+        api_key = self._api_key()
+        if not api_key:
+            return [self._parse(None, origins, destinations) for origins, destinations in tiles]
+
+        params = [self._params(origins, destinations, api_key) for origins, destinations in tiles]
+        self.requests += len(params)
+        if self.fetcher is not None and len(params) > 1:
+            try:
+                responses = self.fetcher.fetch(DISTANCE_MATRIX_URL, params)
+            except Exception as e:
+                logger.error(f"❌ Error al consultar Distance Matrix en paralelo: {str(e)}")
+                responses = [None] * len(params)
+        else:
+            responses = [self._get(p) for p in params]
+        return [self._parse(data, origins, destinations) for data, (origins, destinations) in zip(responses, tiles)]
+
+    def _request(self, origins, destinations):
+        """
+        Una solicitud de Distance Matrix
+
+        Returns:
+            tuple: Matrices (metros, segundos) de forma (orígenes, destinos), NaN sin resultado
+        """
+        return self._request_many([(origins, destinations)])[0]
+
+    def distances(self, origins, destinations):
+        origins, destinations = list(origins), list(destinations)
+        batch = DistanceBatch.unavailable(len(origins))
+        if not origins or not self._api_key():
+            return batch
+
+        # Pares únicos por clave de lugar y un lugar representativo de cada clave
+        places = {}
+        positions = OrderedDict()
+        for position, (origin, destination) in enumerate(zip(origins, destinations)):
+            key = (place_key(origin), place_key(destination))
+            places.setdefault(key[0], origin)
+            places.setdefault(key[1], destination)
+            positions.setdefault(key, []).append(position)
+
+        blocks = pack_pairs(positions, min_fill=self.min_fill)
+        results = self._request_many([
+            ([places[k] for k in rows], [places[k] for k in columns]) for rows, columns in blocks
+        ])
+        for (rows, columns), (metres, seconds) in zip(blocks, results):
+            for i, origin in enumerate(rows):
+                for j, destination in enumerate(columns):
+                    pair = positions.get((origin, destination))
+                    if pair is not None:
+                        batch.metres[pair] = metres[i, j]
+                        batch.seconds[pair] = seconds[i, j]
+        batch.sources[~batch.missing()] = self.name
+        return batch
+
+    def matrix(self, origins, destinations):
+        origins, destinations = list(origins), list(destinations)
+        batch = DistanceBatch.unavailable((len(origins), len(destinations)))
+        if not origins or not destinations or not self._api_key():
+            return batch
+
+        columns = min(len(destinations), MAX_PLACES_PER_REQUEST)
+        rows = max(1, min(MAX_PLACES_PER_REQUEST, MAX_ELEMENTS_PER_REQUEST // columns))
+        blocks = [
+            (slice(row, row + rows), slice(column, column + columns))
+            for row in range(0, len(origins), rows) for column in range(0, len(destinations), columns)
+        ]
+        results = self._request_many([(origins[r], destinations[c]) for r, c in blocks])
+        for (r, c), (metres, seconds) in zip(blocks, results):
+            batch.metres[r, c] = metres
+            batch.seconds[r, c] = seconds
+        batch.sources[~batch.missing()] = self.name
+        return batch
+
+    def stats(self):
+        stats = {"provider": self.name, "requests": self.requests}
+        if self.fetcher is not None:
+            stats["concurrent"] = self.fetcher.stats()
+        return stats
+
+class RoadGraphDistanceProvider(DistanceProvider):
+    """
+    Tiempos de manejo sobre un grafo vial local (ver wheels.road_graph)
+
+    Cada punto se ajusta al nodo más cercano y el trayecto hasta él se suma como un
+    tramo recto a la velocidad de la estimación espacial. Los pares con un punto a más
+    de max_snap_km de la red, con direcciones en lugar de coordenadas o sin ruta dentro
+    de max_seconds quedan en NaN para el proveedor de respaldo.
+    """
+
+    name = "road_graph"
+
+    def __init__(self, graph, max_snap_km=DEFAULT_MAX_SNAP_KM, max_seconds=DEFAULT_MAX_ROUTE_SECONDS,
+                 access_seconds_per_km=HAVERSINE_SECONDS_PER_KM):
+        """
+        Args:
+            graph (RoadGraph): Grafo vial
+            max_snap_km (float): Distancia máxima de un punto a su nodo
+            max_seconds (float): Tiempo máximo de búsqueda (None sin límite)
+            access_seconds_per_km (float): Velocidad del tramo entre el punto y su nodo
+        """
+        self.graph = graph
+        self.max_snap_km = max_snap_km
+        self.max_seconds = max_seconds
+        self.access_seconds_per_km = access_seconds_per_km
+        self.pairs = 0
+
+    def _snap(self, places):
+        coordinates = np.array([place_coordinates(place) for place in places], dtype=np.float64).reshape(-1, 2)
+        nodes, snap_km = self.graph.nearest_nodes(coordinates[:, 0], coordinates[:, 1])
+        nodes[snap_km > self.max_snap_km] = -1
+        return nodes, snap_km
+
+    def distances(self, origins, destinations):
+        origins, destinations = list(origins), list(destinations)
+        batch = DistanceBatch.unavailable(len(origins))
+        if not origins:
+            return batch
+        sources, source_km = self._snap(origins)
+        targets, target_km = self._snap(destinations)
+        seconds, metres = self.graph.route_pairs(sources, targets, self.max_seconds)
+        access_km = source_km + target_km
+        batch.metres[:] = metres + access_km * 1000
+        batch.seconds[:] = seconds + access_km * self.access_seconds_per_km
+        batch.sources[~batch.missing()] = self.name
+        self.pairs += len(origins)
+        return batch
+
+    def matrix(self, origins, destinations):
+        origins, destinations = list(origins), list(destinations)
+        batch = DistanceBatch.unavailable((len(origins), len(destinations)))
+        if not origins or not destinations:
+            return batch
+        sources, source_km = self._snap(origins)
+        targets, target_km = self._snap(destinations)
+        seconds, metres = self.graph.many_to_many(sources, targets, self.max_seconds)
+        access_km = source_km[:, None] + target_km[None, :]
+        batch.metres[:] = metres + access_km * 1000
+        batch.seconds[:] = seconds + access_km * self.access_seconds_per_km
+        batch.sources[~batch.missing()] = self.name
+        self.pairs += batch.metres.size
+        return batch
+
+    def stats(self):
+        return {
+            "provider": self.name,
+            "nodes": len(self.graph),
+            "edges": self.graph.edges,
+            "pairs": self.pairs,
+            "searches": self.graph.searches
+        }
+
+class FallbackDistanceProvider(DistanceProvider):
+    """Completa los pares sin resultado del proveedor principal con otro proveedor"""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def _complete(self, batch, origins, destinations):
+        missing = batch.missing()
+        if missing.any():
+            positions = np.flatnonzero(missing.ravel())
+            batch.fill(missing, self.fallback.distances(
+                [origins[p] for p in positions], [destinations[p] for p in positions]
+            ))
+        return batch
+
+    def distances(self, origins, destinations):
+        origins, destinations = list(origins), list(destinations)
+        return self._complete(self.primary.distances(origins, destinations), origins, destinations)
+
+    def stats(self):
+        return {**self.primary.stats(), "provider": self.name}
+
+    def matrix(self, origins, destinations):
+        origins, destinations = list(origins), list(destinations)
+        return self._complete(
+            self.primary.matrix(origins, destinations),
+            [origin for origin in origins for _ in destinations], destinations * len(origins)
+        )
+
+class SqliteDistanceStore:
+    """
+    Nivel en disco de CachedDistanceProvider: pares guardados en una base SQLite
+
+    Sobrevive a los reinicios y se comparte entre los procesos que usan el mismo
+    archivo (API de matchmaking y optimizador de recogidas). stored_at es la hora
+    del sistema en que se guardó cada par.
+    """
+
+    # Pares por consulta en get_many (2 parámetros por par, bajo el límite de 999 de SQLite)
+    QUERY_CHUNK = 400
+
+    def __init__(self, path, timeout=5.0):
+        """
+        Args:
+            path (str): Archivo SQLite (se crea si no existe)
+            timeout (float): Espera máxima por el bloqueo de otro proceso
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS distances ("
+                "origin TEXT NOT NULL, destination TEXT NOT NULL, metres REAL NOT NULL, "
+                "seconds REAL NOT NULL, source TEXT NOT NULL, stored_at REAL NOT NULL, "
+                "PRIMARY KEY (origin, destination))"
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM distances").fetchone()[0]
+
+    @staticmethod
+    def _column(key):
+        return json.dumps(key)
+
+    def get_many(self, keys, max_age_seconds=None):
+        """
+        Busca varios pares
+
+        Args:
+            keys (list): Claves (place_key de origen, place_key de destino)
+            max_age_seconds (float): Antigüedad máxima (None sin límite)
+
+        Returns:
+            dict: clave -> (stored_at, metros, segundos, fuente) de los pares vigentes
+        """
+        oldest = -math.inf if max_age_seconds is None else time.time() - max_age_seconds
+        columns = {(self._column(key[0]), self._column(key[1])): key for key in keys}
+        pairs = list(columns)
+        found = {}
+        with self._lock:
+            # Una consulta por bloque: los pares van en una lista VALUES unida a la clave primaria
+            for start in range(0, len(pairs), self.QUERY_CHUNK):
+                chunk = pairs[start:start + self.QUERY_CHUNK]
+                rows = self._connection.execute(
+                    "WITH wanted(origin, destination) AS (VALUES "
+                    + ", ".join(["(?, ?)"] * len(chunk)) + ") "
+                    "SELECT distances.origin, distances.destination, stored_at, metres, seconds, source "
+                    "FROM wanted JOIN distances USING (origin, destination) WHERE stored_at >= ?",
+                    [column for pair in chunk for column in pair] + [oldest]
+                )
+                for origin, destination, *row in rows:
+                    found[columns[(origin, destination)]] = tuple(row)
+        return found
+
+    def put_many(self, entries):
+        """
+        Guarda varios pares
+
+        Args:
+            entries (list): Tuplas (clave, stored_at, metros, segundos, fuente)
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO distances VALUES (?, ?, ?, ?, ?, ?)",
+                [(self._column(key[0]), self._column(key[1]), float(metres), float(seconds), str(source), stored_at)
+                 for key, stored_at, metres, seconds, source in entries]
+            )
+
+    def rows(self, source=None):
+        """
+        Todos los pares guardados (para ajustar el estimador de tiempos)
+
+        Args:
+            source (str): Solo los pares de esta fuente (None todos)
+
+        Returns:
+            list: Tuplas (origen, destino, metros, segundos, fuente, stored_at) con las claves decodificadas
+        """
+        query, params = "SELECT origin, destination, metres, seconds, source, stored_at FROM distances", ()
+        if source is not None:
+            query, params = query + " WHERE source = ?", (source,)
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        return [(json.loads(origin), json.loads(destination), metres, seconds, row_source, stored_at)
+                for origin, destination, metres, seconds, row_source, stored_at in rows]
+
+    def purge(self, max_age_seconds):
+        """Elimina los pares más antiguos que max_age_seconds y devuelve cuántos eran"""
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "DELETE FROM distances WHERE stored_at < ?", (time.time() - max_age_seconds,)
+            ).rowcount
+
+class CachedDistanceProvider(DistanceProvider):
+    """
+    Caché de dos niveles con antigüedad máxima delante de otro proveedor
+
+    Los pares se indexan por las coordenadas de origen y destino redondeadas a
+    `precision` decimales (o la dirección). El primer nivel es un LRU en memoria; el
+    segundo, opcional, una SqliteDistanceStore. En cada lote solo los pares que faltan
+    en ambos niveles (sin repetir) se piden al proveedor, en una sola llamada. Los
+    pares sin resultado y las estimaciones de respaldo (Haversine cuando Google no
+    respondió) no se guardan, para volver a consultarlos en la siguiente pasada.
+    """
+
+    def __init__(self, provider, max_entries=10000, max_age_seconds=3600, precision=DEFAULT_CACHE_PRECISION,
+                 store=None):
+        """
+        Args:
+            provider (DistanceProvider): Proveedor consultado en los fallos de caché
+            max_entries (int): Número máximo de pares guardados en memoria
+            max_age_seconds (float): Antigüedad máxima de un par (None sin límite)
+            precision (int): Decimales de las coordenadas en las claves
+            store (SqliteDistanceStore): Nivel en disco (None solo memoria)
+        """
+        self.provider = provider
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.precision = precision
+        self.store = store
+        self.name = provider.name
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Fuentes que solo son estimaciones de respaldo del proveedor
+        self._estimate_sources = {provider.fallback.name} if isinstance(provider, FallbackDistanceProvider) else set()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if store is not None and max_age_seconds is not None:
+            store.purge(max_age_seconds)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, entry):
+        # Llamar con self._lock tomado
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def distances(self, origins, destinations):
+        origins, destinations = list(origins), list(destinations)
+        batch = DistanceBatch.unavailable(len(origins))
+        keys = [(place_key(o, self.precision), place_key(d, self.precision)) for o, d in zip(origins, destinations)]
+
+        pending = OrderedDict()
+        now = time.monotonic()
+        with self._lock:
+            for position, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and (self.max_age_seconds is None or now - entry[0] < self.max_age_seconds):
+                    self._entries.move_to_end(key)
+                    _, batch.metres[position], batch.seconds[position], batch.sources[position] = entry
+                    self.hits += 1
+                    continue
+                if entry is not None:
+                    del self._entries[key]
+                pending.setdefault(key, []).append(position)
+
+        if pending and self.store is not None:
+            stored = self.store.get_many(list(pending), self.max_age_seconds)
+            # Las horas del disco se pasan al reloj monotónico de la memoria
+            offset = time.monotonic() - time.time()
+            with self._lock:
+                for key, (stored_at, metres, seconds, source) in stored.items():
+                    positions = pending.pop(key)
+                    batch.metres[positions], batch.seconds[positions], batch.sources[positions] = metres, seconds, source
+                    self.disk_hits += len(positions)
+                    self._remember(key, (stored_at + offset, metres, seconds, source))
+
+        if not pending:
+            return batch
+
+        firsts = [positions[0] for positions in pending.values()]
+        fresh = self.provider.distances([origins[p] for p in firsts], [destinations[p] for p in firsts])
+        now, stored_at = time.monotonic(), time.time()
+        persisted = []
+        with self._lock:
+            for i, (key, positions) in enumerate(pending.items()):
+                self.misses += len(positions)
+                batch.metres[positions] = fresh.metres[i]
+                batch.seconds[positions] = fresh.seconds[i]
+                batch.sources[positions] = fresh.sources[i]
+                if np.isnan(fresh.metres[i]) or np.isnan(fresh.seconds[i]) or fresh.sources[i] in self._estimate_sources:
+                    continue
+                self._remember(key, (now, fresh.metres[i], fresh.seconds[i], fresh.sources[i]))
+                persisted.append((key, stored_at, fresh.metres[i], fresh.seconds[i], fresh.sources[i]))
+        if persisted and self.store is not None:
+            try:
+                self.store.put_many(persisted)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ No se pudieron guardar distancias en {self.store.path}: {e}")
+        return batch
+
+    def stats(self):
+        """Aciertos por nivel, fallos y tasa de aciertos"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "provider": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_age_seconds": self.max_age_seconds,
+                "precision": self.precision,
+                "disk_path": self.store.path if self.store is not None else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "upstream": self.provider.stats()
+            }
+
+def build_distance_provider(name="google", api_key=None, cache_entries=0, cache_max_age_seconds=3600, session=None,
+                            cache_precision=DEFAULT_CACHE_PRECISION, cache_path=None, concurrency=1, graph_path=None,
+                            travel_time=None):
+    """
+    Construye el proveedor de distancia configurado
+
+    La caché solo se pone delante de Google: Haversine y el grafo local no cuestan por consulta.
+
+    Args:
+        name (str): Uno de DISTANCE_PROVIDERS
+        api_key (str): Clave de Google Maps (None la lee del entorno en cada solicitud)
+        cache_entries (int): Pares guardados en la caché en memoria (0 sin ese nivel)
+        cache_max_age_seconds (float): Antigüedad máxima de un par en caché
+        session: Cliente HTTP para Google (por defecto get_maps_client())
+        cache_precision (int): Decimales de las coordenadas en las claves de la caché
+        cache_path (str): Archivo SQLite del nivel en disco (None sin ese nivel)
+        concurrency (int): Solicitudes a Google en paralelo por llamada (1 en serie con session)
+        graph_path (str): Grafo vial de 'road_graph' (.npz de RoadGraph.save o CSV de aristas)
+        travel_time (TravelTimeEstimator): Duración de las estimaciones Haversine (None 1.5 min/km)
+
+    Returns:
+        DistanceProvider: Proveedor listo para usar
+    """
+    if name == "haversine":
+        provider = HaversineDistanceProvider(estimator=travel_time)
+    elif name == "google":
+        fetcher = None
+        if concurrency and concurrency > 1:
+            fetcher = async_distance.AsyncDistanceFetcher(max_concurrency=concurrency)
+        provider = FallbackDistanceProvider(
+            GoogleDistanceProvider(api_key=api_key, session=session, fetcher=fetcher),
+            HaversineDistanceProvider(estimator=travel_time)
+        )
+    elif name == "road_graph":
+        if not graph_path:
+            raise ValueError("El proveedor 'road_graph' requiere la ruta del grafo vial (ROAD_GRAPH_PATH)")
+        provider = FallbackDistanceProvider(RoadGraphDistanceProvider(RoadGraph.load(graph_path)),
+                                            HaversineDistanceProvider(estimator=travel_time))
+    else:
+        raise ValueError(f"Proveedor de distancia desconocido: {name} (opciones: {', '.join(DISTANCE_PROVIDERS)})")
+    if name == "google" and ((cache_entries and cache_entries > 0) or cache_path):
+        provider = CachedDistanceProvider(
+            provider, max_entries=max(0, cache_entries or 0), max_age_seconds=cache_max_age_seconds,
+            precision=cache_precision, store=SqliteDistanceStore(cache_path) if cache_path else None
+        )
+    return provider
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Radio medio de la Tierra en kilómetros
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Calcula la distancia Haversine en kilómetros entre puntos
+
+    Acepta escalares o arrays de NumPy y respeta las reglas de broadcasting,
+    por lo que sirve tanto para pares sueltos como para matrices completas.
+
+    Args:
+        lat1, lng1: Latitud y longitud de origen (grados)
+        lat2, lng2: Latitud y longitud de destino (grados)
+
+    Returns:
+        ndarray: Distancias en kilómetros
+    """
+    lat1 = np.radians(lat1)
+    lng1 = np.radians(lng1)
+    lat2 = np.radians(lat2)
+    lng2 = np.radians(lng2)
+
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix(origin_lat, origin_lng, target_lat, target_lng):
+    """
+    Calcula la matriz completa de distancias origen x destino
+
+    Args:
+        origin_lat, origin_lng (ndarray): Coordenadas de los N orígenes
+        target_lat, target_lng (ndarray): Coordenadas de los M destinos
+
+    Returns:
+        ndarray: Matriz (N, M) con distancias en kilómetros
+    """
+    origin_lat = np.asarray(origin_lat, dtype=np.float64)[:, None]
+    origin_lng = np.asarray(origin_lng, dtype=np.float64)[:, None]
+    target_lat = np.asarray(target_lat, dtype=np.float64)[None, :]
+    target_lng = np.asarray(target_lng, dtype=np.float64)[None, :]
+    return haversine_km(origin_lat, origin_lng, target_lat, target_lng)
@@ -0,0 +1,265 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto de config_google_maps.API_CONFIG; el cliente compartido los toma
+# de MAPS_REQUEST_TIMEOUT_SECONDS, MAPS_RATE_LIMIT_DELAY y MAPS_MAX_RETRIES
+DEFAULT_REQUEST_TIMEOUT = 30
+DEFAULT_RATE_LIMIT_DELAY = 0.1
+DEFAULT_MAX_RETRIES = 3
+
+# Ráfaga del límite de tasa del cliente compartido (MAPS_RATE_LIMIT_BURST): los bloques de
+# Distance Matrix de una pasada salen juntos y la tasa sostenida sigue en 1/rate_limit_delay
+DEFAULT_RATE_LIMIT_BURST = 8
+
+# Espera base y máxima del backoff exponencial entre reintentos
+DEFAULT_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 8.0
+
+# Conexiones keep-alive que conserva la sesión por host
+DEFAULT_POOL_SIZE = 10
+
+# Respuestas que vale la pena reintentar: códigos HTTP transitorios y estados de la API
+# que Google documenta como temporales (cuota por segundo excedida, error interno)
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+RETRY_API_STATUSES = frozenset({"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"})
+
+def backoff_delay(attempt, backoff_seconds=DEFAULT_BACKOFF_SECONDS, retry_after=None):
+    """
+    Espera antes del reintento `attempt` (0 el primero)
+
+    Args:
+        attempt (int): Reintentos ya hechos
+        backoff_seconds (float): Espera base, se duplica en cada reintento
+        retry_after (str): Cabecera Retry-After de la respuesta, si la hay
+
+    Returns:
+        float: Segundos (full jitter hasta MAX_BACKOFF_SECONDS, o Retry-After si es un entero)
+    """
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_BACKOFF_SECONDS)
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, backoff_seconds * 2 ** attempt))
+
+def is_retryable(status_code, data):
+    """True si una respuesta (código HTTP y JSON, o None) es un error transitorio"""
+    if status_code in RETRY_STATUS_CODES:
+        return True
+    return isinstance(data, dict) and data.get("status") in RETRY_API_STATUSES
+
+class TokenBucket:
+    """
+    Limitador de tasa de tipo token bucket, seguro entre hilos
+
+    Se recargan `rate` fichas por segundo hasta `capacity`; cada solicitud consume una.
+    Con capacity=1 reproduce el time.sleep(rate_limit_delay) entre solicitudes, pero
+    solo espera cuando de verdad llegan más rápido que la tasa permitida.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate (float): Fichas por segundo (<= 0 o None desactiva el límite)
+            capacity (int): Ráfaga máxima de solicitudes sin espera
+            clock (callable): Reloj monotónico (inyectable en pruebas)
+            sleep (callable): Función de espera (inyectable en pruebas)
+        """
+        self.rate = rate if rate and rate > 0 else None
+        self.capacity = max(1, capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def reserve(self):
+        """
+        Consume una ficha sin esperar
+
+        Returns:
+            float: Segundos que hay que esperar antes de usarla (para esperas asíncronas)
+        """
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # La ficha se descuenta aunque aún no exista: los hilos siguientes esperan en fila
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited_seconds += wait
+            return wait
+
+    def acquire(self):
+        """
+        Espera hasta que haya una ficha disponible
+
+        Returns:
+            float: Segundos esperados
+        """
+        wait = self.reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+class MapsClient:
+    """
+    Cliente HTTP compartido para las APIs de Google Maps
+
+    Usa una requests.Session con un pool de conexiones keep-alive, aplica un timeout a
+    cada solicitud, limita la tasa con un TokenBucket y reintenta los errores de red,
+    los códigos 429/5xx y los estados OVER_QUERY_LIMIT/UNKNOWN_ERROR con backoff
+    exponencial con jitter. get() tiene la firma de requests.get, así que puede pasarse
+    como session a GoogleDistanceProvider.
+    """
+
+    def __init__(self, timeout=DEFAULT_REQUEST_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 rate_limit_delay=DEFAULT_RATE_LIMIT_DELAY, backoff_seconds=DEFAULT_BACKOFF_SECONDS,
+                 pool_size=DEFAULT_POOL_SIZE, session=None, sleep=time.sleep, rate_limit_burst=1):
+        """
+        Args:
+            timeout (float): Segundos máximos por solicitud si la llamada no indica otro
+            max_retries (int): Reintentos después del primer intento
+            rate_limit_delay (float): Segundos entre solicitudes (0 sin límite de tasa)
+            backoff_seconds (float): Espera base del backoff (se duplica en cada reintento)
+            pool_size (int): Conexiones keep-alive por host
+            session: Sesión compatible con requests (por defecto una requests.Session nueva)
+            sleep (callable): Función de espera (inyectable en pruebas)
+            rate_limit_burst (int): Solicitudes seguidas sin espera (1 = una cada rate_limit_delay)
+        """
+        self.timeout = timeout
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_seconds = backoff_seconds
+        self.session = session or self._build_session(pool_size)
+        self.rate_limiter = TokenBucket(
+            1.0 / rate_limit_delay if rate_limit_delay else None, capacity=rate_limit_burst, sleep=sleep
+        )
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        Cliente con los valores de un diccionario como config_google_maps.API_CONFIG
+
+        Args:
+            config (dict): request_timeout, rate_limit_delay y max_retries
+
+        Returns:
+            MapsClient: Cliente configurado
+        """
+        return cls(
+            timeout=config.get("request_timeout", DEFAULT_REQUEST_TIMEOUT),
+            max_retries=config.get("max_retries", DEFAULT_MAX_RETRIES),
+            rate_limit_delay=config.get("rate_limit_delay", DEFAULT_RATE_LIMIT_DELAY),
+            **kwargs
+        )
+
+    @staticmethod
+    def _build_session(pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        self._sleep(backoff_delay(attempt, self.backoff_seconds, retry_after))
+
+    @staticmethod
+    def _should_retry(response):
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        return is_retryable(response.status_code, data)
+
+    def get(self, url, params=None, timeout=None):
+        """
+        GET con límite de tasa, timeout y reintentos
+
+        Args:
+            url (str): URL de la API
+            params (dict): Parámetros de la consulta
+            timeout (float): Segundos máximos de esta solicitud (por defecto self.timeout)
+
+        Returns:
+            requests.Response: Última respuesta recibida (también si agotó los reintentos)
+
+        Raises:
+            requests.RequestException: Si el último intento falló por un error de red
+        """
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            self._count(requests=1)
+            last = attempt == self.max_retries
+            try:
+                response = self.session.get(url, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    self._count(failures=1)
+                    raise
+                logger.warning(f"⚠️ Error de red en Google Maps (intento {attempt + 1}): {e}")
+                self._count(retries=1)
+                self._backoff(attempt)
+                continue
+            if last or not self._should_retry(response):
+                if last and self._should_retry(response):
+                    self._count(failures=1)
+                return response
+            logger.warning(f"⚠️ Respuesta transitoria de Google Maps (intento {attempt + 1}), reintentando")
+            self._count(retries=1)
+            self._backoff(attempt, response)
+
+    def stats(self):
+        """Solicitudes enviadas, reintentos, fallos definitivos y espera por límite de tasa"""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "timeout": self.timeout,
+            "max_retries": self.max_retries,
+            "rate_limit_waited_seconds": round(self.rate_limiter.waited_seconds, 3)
+        }
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+def get_maps_client():
+    """
+    Cliente compartido por los servicios del backend
+
+    Se crea con la primera llamada, así todas las solicitudes a Google del proceso
+    comparten el pool de conexiones y el límite de tasa.
+
+    Returns:
+        MapsClient: Cliente del proceso
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = MapsClient(
+                timeout=float(os.getenv("MAPS_REQUEST_TIMEOUT_SECONDS", DEFAULT_REQUEST_TIMEOUT)),
+                max_retries=int(os.getenv("MAPS_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                rate_limit_delay=float(os.getenv("MAPS_RATE_LIMIT_DELAY", DEFAULT_RATE_LIMIT_DELAY)),
+                rate_limit_burst=int(os.getenv("MAPS_RATE_LIMIT_BURST", DEFAULT_RATE_LIMIT_BURST))
+            )
+        return _shared_client
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+
+def pool_snapshot_version(supabase):
+    """
+    Versión del estado del searching_pool: número de filas y updated_at más reciente
+
+    Una sola consulta de una fila (count='exact' + orden por updated_at). Cambia con
+    cada inserción o eliminación (conteo) y con cada actualización (updated_at). Los
+    updated_at NULL van al final: en Postgres el orden descendente los pone primero y
+    una sola fila sin updated_at dejaría la versión fija en None.
+
+    Args:
+        supabase: Cliente de Supabase
+
+    Returns:
+        tuple: (número de filas, updated_at más reciente o None)
+    """
+    response = (
+        supabase.table("searching_pool").select("updated_at", count="exact")
+        .order("updated_at", desc=True, nullsfirst=False).limit(1).execute()
+    )
+    latest = response.data[0].get("updated_at") if response.data else None
+    return (response.count, latest)
+
+class MatchResultCache:
+    """
+    Caché LRU de resultados de matchmaking indexada por la versión del pool
+
+    Las claves incluyen la versión del searching_pool, así un cambio en el pool
+    invalida todos los resultados sin borrarlos explícitamente (las entradas viejas
+    salen por LRU). bump() aumenta una generación local para las notificaciones del
+    canal LISTEN, que pueden llegar antes de que el cambio sea visible en la versión.
+    """
+
+    def __init__(self, max_entries=256, max_age_seconds=300):
+        """
+        Args:
+            max_entries (int): Número máximo de resultados guardados (0 desactiva la caché)
+            max_age_seconds (float): Antigüedad máxima de un resultado, por si un cambio
+                del pool no se refleja en la versión (None sin límite)
+        """
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """Invalida todos los resultados guardados (p. ej. al recibir una notificación)"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def get(self, key):
+        """
+        Busca un resultado
+
+        Returns:
+            tuple: (encontrado, valor)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.max_age_seconds is None or time.monotonic() - stored_at < self.max_age_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, generation=None):
+        """
+        Guarda un resultado, descartando el menos usado si se supera max_entries
+
+        Args:
+            generation (int): Generación leída antes de calcular el valor; si hubo un
+                bump() mientras tanto el valor ya está desactualizado y no se guarda
+        """
+        with self._lock:
+            if self.max_entries <= 0 or (generation is not None and generation != self.generation):
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """
+        Devuelve el resultado guardado o lo calcula con compute() y lo guarda
+
+        Args:
+            key: Clave que incluye la versión del pool
+            compute (callable): Función sin argumentos que calcula el resultado
+
+        Returns:
+            Resultado guardado o recién calculado
+        """
+        generation = self.generation
+        found, value = self.get(key)
+        if found:
+            return value
+        value = compute()
+        self.put(key, value, generation)
+        return value
+
+    def iter_or_compute(self, key, iterate):
+        """
+        Versión en streaming de get_or_compute: entrega los elementos guardados o los de
+        iterate() a medida que se producen
+
+        La lista solo se guarda si la iteración termina; si el consumidor la abandona
+        (p. ej. el cliente se desconecta) el resultado parcial se descarta.
+
+        Args:
+            key: Clave que incluye la versión del pool
+            iterate (callable): Función sin argumentos que devuelve un iterable
+
+        Yields:
+            Elementos del resultado
+        """
+        generation = self.generation
+        found, value = self.get(key)
+        if found:
+            yield from value
+            return
+        items = []
+        for item in iterate():
+            items.append(item)
+            yield item
+        self.put(key, items, generation)
+
+    def stats(self):
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "generation": self.generation
+            }
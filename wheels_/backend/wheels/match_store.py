@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def freeze_version(version):
+    """Versión del pool como tupla (las listas vienen de un snapshot leído de JSON)"""
+    if isinstance(version, (list, tuple)):
+        return tuple(freeze_version(part) for part in version)
+    return version
+
+def index_matches_by_email(matches):
+    """
+    Emparejamientos de cada usuario, con el mismo formato de /api/matches/<user_email>
+
+    Args:
+        matches (iterable): Matches de conductor (correo_conductor, pasajeros_asignados)
+
+    Returns:
+        dict: correo -> tupla de {"role", "match"[, "passenger_details"]}
+    """
+    index = {}
+    for match in matches:
+        index.setdefault(match["correo_conductor"], []).append({"role": "driver", "match": match})
+        for passenger in match["pasajeros_asignados"]:
+            index.setdefault(passenger["correo"], []).append({
+                "role": "passenger",
+                "match": match,
+                "passenger_details": passenger
+            })
+    return {email: tuple(entries) for email, entries in index.items()}
+
+class MatchSnapshot:
+    """
+    Resultado inmutable de una pasada de matchmaking
+
+    Guarda los matches, la versión del pool con la que se calcularon, el instante del
+    cálculo y un índice por correo para responder las consultas de un usuario en O(1).
+    """
+
+    __slots__ = ("version", "matches", "computed_at", "_by_email")
+
+    def __init__(self, version, matches, computed_at=None):
+        """
+        Args:
+            version: Versión del searching_pool (ver get_pool_version)
+            matches (iterable): Matches de conductor de la pasada
+            computed_at (float): Instante del cálculo (time.time(); por defecto ahora)
+        """
+        self.version = freeze_version(version)
+        self.matches = tuple(matches)
+        self.computed_at = time.time() if computed_at is None else computed_at
+        self._by_email = index_matches_by_email(self.matches)
+
+    def for_user(self, user_email):
+        """Emparejamientos de un usuario como conductor o pasajero"""
+        return self._by_email.get(user_email, ())
+
+    def age_seconds(self):
+        """Segundos desde que se calculó el snapshot"""
+        return max(0.0, time.time() - self.computed_at)
+
+    def describe(self):
+        """Metadatos que acompañan las respuestas servidas desde el snapshot"""
+        return {
+            "version": self.version,
+            "computed_at": datetime.fromtimestamp(self.computed_at).isoformat(),
+            "age_seconds": round(self.age_seconds(), 3),
+            "total_matches": len(self.matches)
+        }
+
+class MatchStore:
+    """
+    Último snapshot publicado por el trabajador de fondo
+
+    publish() reemplaza la referencia al snapshot de una sola vez, así los lectores
+    nunca ven un resultado a medio construir. Con path el snapshot también se
+    escribe en disco (archivo temporal + os.replace) y se lee al crear el almacén,
+    para servir resultados desde el primer request tras un reinicio.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Archivo JSON donde persistir el snapshot (None solo en memoria)
+        """
+        self.path = path
+        self.publications = 0
+        # Último instante en que una pasada confirmó el snapshot vigente
+        self.checked_at = None
+        self._snapshot = None
+        self._source = None
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def latest(self):
+        """Último snapshot publicado (None si aún no hay ninguno)"""
+        return self._snapshot
+
+    def publish(self, version, matches):
+        """
+        Publica el resultado de una pasada
+
+        Si la pasada devolvió la misma lista (p. ej. desde match_cache) para la misma
+        versión, solo se actualiza checked_at y se conserva el snapshot.
+
+        Args:
+            version: Versión del searching_pool usada en el cálculo
+            matches (list): Matches de conductor
+
+        Returns:
+            MatchSnapshot: Snapshot vigente
+        """
+        with self._lock:
+            current = self._snapshot
+            self.checked_at = time.time()
+            if current is not None and current.version == freeze_version(version) and self._source is matches:
+                return current
+            snapshot = MatchSnapshot(version, matches, computed_at=self.checked_at)
+            self._snapshot, self._source = snapshot, matches
+            self.publications += 1
+            if self.path:
+                self._save(snapshot)
+            return snapshot
+
+    def _save(self, snapshot):
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as handle:
+                json.dump({
+                    "version": snapshot.version,
+                    "computed_at": snapshot.computed_at,
+                    "matches": list(snapshot.matches)
+                }, handle, default=str)
+            os.replace(temporary, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ No se pudo guardar el snapshot de matches en {self.path}: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                data = json.load(handle)
+            self._snapshot = MatchSnapshot(data["version"], data["matches"], computed_at=data["computed_at"])
+            logger.info(f"📦 Snapshot de matches cargado de {self.path}: {len(self._snapshot.matches)} matches")
+        except FileNotFoundError:
+            pass
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ No se pudo leer el snapshot de matches en {self.path}: {e}")
+
+    def stats(self):
+        """Estado del snapshot vigente"""
+        snapshot = self._snapshot
+        return {
+            "has_snapshot": snapshot is not None,
+            "age_seconds": round(snapshot.age_seconds(), 3) if snapshot is not None else None,
+            "checked_seconds_ago": round(time.time() - self.checked_at, 3) if self.checked_at is not None else None,
+            "total_matches": len(snapshot.matches) if snapshot is not None else 0,
+            "publications": self.publications,
+            "persistent": bool(self.path)
+        }
+
+class MatchRefresher:
+    """
+    Hilo de fondo que refresca el almacén de matches con una cadencia fija
+
+    Complementa los disparos por cambios del pool: aunque no llegue ninguna
+    notificación, cada interval_seconds se vuelve a revisar la versión del pool.
+    """
+
+    def __init__(self, refresh, interval_seconds, name="match-refresher"):
+        """
+        Args:
+            refresh (callable): Función sin argumentos que calcula y publica un snapshot
+            interval_seconds (float): Cadencia del refresco (<= 0 lo desactiva)
+            name (str): Nombre del hilo
+        """
+        self.refresh = refresh
+        self.interval_seconds = interval_seconds
+        self.name = name
+        self.refreshes = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.interval_seconds is not None and self.interval_seconds > 0
+
+    def start(self):
+        """
+        Arranca el hilo si está habilitado y no está corriendo
+
+        Returns:
+            bool: True si el hilo está corriendo
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+                logger.info(f"🔄 Refresco de matches cada {self.interval_seconds}s")
+            return True
+
+    def stop(self, timeout=None):
+        """Detiene el hilo de refresco"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def refresh_now(self):
+        """Ejecuta un refresco (uno a la vez, también fuera del hilo)"""
+        with self._refresh_lock:
+            try:
+                self.refresh()
+            except Exception:
+                self.failures += 1
+                raise
+            self.refreshes += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.refresh_now()
+            except Exception as e:
+                logger.error(f"❌ Error refrescando el almacén de matches: {e}")
@@ -3,10 +3,18 @@ from supabase import create_client
 import os
 from geopy.distance import geodesic
 
+from .vector_matching import match_pool_vectorized, available_seats_array
+from .spatial_index import GridIndex, candidate_radius
+from .profile_directory import profile_name_map
+from .travel_time import load_travel_time_estimator
+
 # Configuración de Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://ozvjmkvmpxxviveniuwt.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "your-supabase-key")
 
+# Duración estimada de cada pasajero asignado (TRAVEL_TIME_MODEL_PATH, ver wheels.travel_time)
+travel_time_estimator = load_travel_time_estimator()
+
 def get_wheels_dataframes():
     """
     Obtiene los DataFrames principales del sistema
@@ -48,51 +56,118 @@ def calculate_distance(origin, destination):
     except:
         return float('inf')
 
-def get_passenger_name(passenger, profiles_df):
+def get_passenger_name(passenger, profile_names):
     """
-    Obtiene el nombre de un pasajero desde el DataFrame de perfiles
+    Obtiene el nombre de un pasajero desde los perfiles
     
     Args:
         passenger (dict): Datos del pasajero
-        profiles_df (DataFrame): DataFrame con perfiles
+        profile_names (dict): Correo -> nombre (ver profile_name_map)
         
     Returns:
         str: Nombre del pasajero o 'Pasajero desconocido'
     """
     if "correo_usuario" not in passenger:
         return "Pasajero desconocido"
-        
-    email = passenger["correo_usuario"]
-    matching_profiles = profiles_df[profiles_df["email"] == email]
     
-    if not matching_profiles.empty:
-        return matching_profiles.iloc[0].get("full_name", "Pasajero desconocido")
-    
-    return "Pasajero desconocido"
+    return profile_names.get(passenger["correo_usuario"], "Pasajero desconocido")
 
-def get_driver_name(driver, profiles_df):
+def get_driver_name(driver, profile_names):
     """
-    Obtiene el nombre de un conductor desde el DataFrame de perfiles
+    Obtiene el nombre de un conductor desde los perfiles
     
     Args:
         driver (dict): Datos del conductor
-        profiles_df (DataFrame): DataFrame con perfiles
+        profile_names (dict): Correo -> nombre (ver profile_name_map)
         
     Returns:
         str: Nombre del conductor o 'Conductor desconocido'
     """
     if "correo_usuario" not in driver:
         return "Conductor desconocido"
+    
+    return profile_names.get(driver["correo_usuario"], "Conductor desconocido")
+
+def build_passenger_match(passenger, profile_names, distance_km):
+    """
+    Construye la entrada de un pasajero dentro de 'pasajeros_asignados'
+    
+    Args:
+        passenger (Series): Registro del pasajero
+        profile_names (dict): Correo -> nombre (ver profile_name_map)
+        distance_km (float): Distancia desde el punto de partida del conductor
         
-    email = driver["correo_usuario"]
-    matching_profiles = profiles_df[profiles_df["email"] == email]
+    Returns:
+        dict: Datos del pasajero asignado
+    """
+    return {
+        "pasajero_correo": passenger.get("correo_usuario"),
+        "nombre": get_passenger_name(passenger, profile_names),
+        "pickup": passenger["pickup_address"],
+        "destino": passenger["dropoff_address"],
+        "distance_km": round(float(distance_km), 2),
+        "duration": f"{round(float(travel_time_estimator.predict_km(distance_km)) / 60)} min"
+    }
+
+def build_driver_match(driver, profile_names, available_seats, matched_passengers):
+    """
+    Construye el emparejamiento de un conductor con sus pasajeros
     
-    if not matching_profiles.empty:
-        return matching_profiles.iloc[0].get("full_name", "Conductor desconocido")
+    Args:
+        driver (Series): Registro del conductor
+        profile_names (dict): Correo -> nombre (ver profile_name_map)
+        available_seats (int): Cupos disponibles del conductor
+        matched_passengers (list): Pasajeros asignados
+        
+    Returns:
+        dict: Emparejamiento del conductor
+    """
+    return {
+        "conductor_correo": driver.get("correo_usuario"),
+        "nombre_conductor": get_driver_name(driver, profile_names),
+        "pickup": driver["pickup_address"],
+        "destino": driver["dropoff_address"],
+        "available_seats": available_seats,
+        "price_per_seat": float(driver.get("price_per_seat", 0)),
+        "pasajeros_asignados": matched_passengers
+    }
+
+def match_rides_vectorized(drivers, passengers, profile_names, max_distance_km=5,
+                           use_spatial_index=False, assignment="first_fit"):
+    """
+    Variante vectorizada del emparejamiento: calcula la matriz Haversine
+    conductor x pasajero con NumPy y asigna cupos sobre arrays
+    
+    Args:
+        drivers (DataFrame): Conductores activos
+        passengers (DataFrame): Pasajeros activos
+        profile_names (dict): Correo -> nombre (ver profile_name_map)
+        max_distance_km (float): Distancia máxima para emparejar
+        use_spatial_index (bool): Busca candidatos con un GridIndex en vez de la matriz completa
+        assignment (str): 'first_fit', 'optimal' o 'greedy' (ver wheels.vector_matching)
+        
+    Returns:
+        list: Lista de emparejamientos encontrados
+    """
+    seats = available_seats_array(drivers)
+    matches = []
     
-    return "Conductor desconocido"
+    for driver_pos, passenger_positions, distances in match_pool_vectorized(
+        drivers, passengers, max_distance_km,
+        destination_column="dropoff_address", normalize_destinations=False,
+        use_spatial_index=use_spatial_index, assignment=assignment
+    ):
+        matched_passengers = [
+            build_passenger_match(passengers.iloc[pos], profile_names, distance)
+            for pos, distance in zip(passenger_positions, distances)
+        ]
+        matches.append(build_driver_match(
+            drivers.iloc[driver_pos], profile_names, int(seats[driver_pos]), matched_passengers
+        ))
+    
+    return matches
 
-def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
+def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5, engine="legacy", assignment="first_fit"):
     """
     Algoritmo de emparejamiento mejorado que utiliza email como identificador
     
@@ -100,10 +175,16 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
         searching_pool_df (DataFrame): DataFrame con datos del pool de búsqueda
         profiles_df (DataFrame): DataFrame con datos de perfiles
         max_distance_km (float): Distancia máxima para emparejar
+        engine (str): 'legacy' (par a par), 'vectorized' (matriz NumPy) o 'indexed' (índice espacial)
+        assignment (str): 'first_fit' (orden del pool), 'optimal' (asignación global de costo
+            mínimo, un conductor por pasajero) o 'greedy'; las dos últimas usan el motor vectorizado
         
     Returns:
         list: Lista de emparejamientos encontrados
     """
+    # Diccionario correo -> nombre, construido una vez para todo el emparejamiento
+    profile_names = profile_name_map(profiles_df)
+    
     # Filtrar registros activos
     active_pool = searching_pool_df[
         (searching_pool_df["status"] == "searching") |
@@ -114,6 +195,20 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
     drivers = active_pool[active_pool["tipo_de_usuario"] == "conductor"]
     passengers = active_pool[active_pool["tipo_de_usuario"] == "pasajero"]
     
+    if assignment != "first_fit" and engine == "legacy":
+        engine = "vectorized"
+    
+    if engine in ("vectorized", "indexed"):
+        return match_rides_vectorized(
+            drivers, passengers, profile_names, max_distance_km,
+            use_spatial_index=(engine == "indexed"), assignment=assignment
+        )
+    
+    # Índice espacial de pasajeros: cada conductor solo revisa las celdas vecinas
+    passenger_index = GridIndex.from_points(
+        passengers.index, passengers["pickup_lat"], passengers["pickup_lng"], cell_km=candidate_radius(max_distance_km)
+    )
+    
     matches = []
     
     for _, driver in drivers.iterrows():
@@ -122,8 +217,11 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
         available_seats = int(driver.get("available_seats", 1))
         
         matched_passengers = []
+        nearby, _ = passenger_index.query_radius(
+            driver["pickup_lat"], driver["pickup_lng"], candidate_radius(max_distance_km)
+        )
         
-        for _, passenger in passengers.iterrows():
+        for _, passenger in passengers[passengers.index.isin(nearby)].iterrows():
             # Verificar compatibilidad de destino
             if passenger["dropoff_address"] != driver_destination:
                 continue
@@ -137,25 +235,10 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
                 
             # Verificar cupos disponibles
             if len(matched_passengers) < available_seats:
-                matched_passengers.append({
-                    "pasajero_correo": passenger.get("correo_usuario"),
-                    "nombre": get_passenger_name(passenger, profiles_df),
-                    "pickup": passenger["pickup_address"],
-                    "destino": passenger["dropoff_address"],
-                    "distance_km": round(distance_km, 2),
-                    "duration": f"{round(distance_km * 2)} min"  # Estimación simple
-                })
+                matched_passengers.append(build_passenger_match(passenger, profile_names, distance_km))
         
         if matched_passengers:
-            matches.append({
-                "conductor_correo": driver.get("correo_usuario"),
-                "nombre_conductor": get_driver_name(driver, profiles_df),
-                "pickup": driver["pickup_address"],
-                "destino": driver_destination,
-                "available_seats": available_seats,
-                "price_per_seat": float(driver.get("price_per_seat", 0)),
-                "pasajeros_asignados": matched_passengers
-            })
+            matches.append(build_driver_match(driver, profile_names, available_seats, matched_passengers))
     
     return matches
 
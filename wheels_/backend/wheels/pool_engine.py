@@ -0,0 +1,587 @@
+import itertools
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from .assignment import nearest_first
+from .corridor import DriverCorridors, coordinate, corridor_feasible
+from .destinations import record_destination_key
+from .spatial_index import GridIndex, bounding_box, candidate_radius
+from .time_windows import record_departure_minutes, time_compatible
+
+logger = logging.getLogger(__name__)
+
+# Roles del searching_pool que participan en el matchmaking
+POOL_ROLES = ("conductor", "pasajero")
+
+# Estados que cuentan como búsqueda activa (igual que el filtro de match_rides_enhanced)
+ACTIVE_STATUSES = (None, "", "searching")
+
+def is_missing(value):
+    """True si el valor es None o NaN"""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def is_active_record(record):
+    """
+    Indica si un registro del searching_pool participa en el matchmaking
+
+    Args:
+        record (dict): Registro del searching_pool
+
+    Returns:
+        bool: True si está buscando, tiene rol conocido y correo
+    """
+    status = record.get("status")
+    if not (is_missing(status) or status in ACTIVE_STATUSES):
+        return False
+    email = record.get("correo_usuario")
+    return record.get("tipo_de_usuario") in POOL_ROLES and not is_missing(email) and email != ""
+
+def recency_key(record):
+    """Orden del pool: created_at más reciente primero (desempate estable por id)"""
+    created_at = record.get("created_at")
+    return ("" if is_missing(created_at) else str(created_at), str(record.get("id")))
+
+def record_seats(driver):
+    """Cupos disponibles de un conductor (1 si no se indican), como available_seats_array"""
+    try:
+        seats = float(driver.get("available_seats"))
+    except (TypeError, ValueError):
+        return 1
+    return 1 if math.isnan(seats) else max(0, int(seats))
+
+def dataframe_records(df):
+    """
+    Convierte un DataFrame del pool en una lista de dicts con None en lugar de NaN
+
+    Args:
+        df (DataFrame): Registros del searching_pool
+
+    Returns:
+        list: Registros como dicts
+    """
+    if df.empty:
+        return []
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+def fetch_user_neighborhood(supabase, email, max_distance_km=5, latest_per_user=True):
+    """
+    Lee del searching_pool solo los registros que pueden afectar los emparejamientos de un usuario
+
+    Para un conductor basta con los registros a menos del radio de su punto de
+    partida; para un pasajero, los conductores a menos del radio y los pasajeros
+    que compiten por sus cupos (a menos de dos radios). Los registros se filtran
+    en la base de datos por una caja de pickup_lat/pickup_lng. Después se leen, en
+    una sola consulta, todos los registros de los correos encontrados (incluido el
+    usuario): así la deduplicación por correo usa el registro más reciente de cada
+    usuario y, sin deduplicar, los registros llegan en el orden de la tabla como en
+    la lectura completa.
+
+    Args:
+        supabase: Cliente de Supabase
+        email (str): Correo del usuario
+        max_distance_km (float): Distancia máxima para emparejar
+        latest_per_user (bool): Solo cuenta el registro más reciente del usuario en cada
+            rol; si es False se busca alrededor de todos sus registros activos
+
+    Returns:
+        list: Registros del searching_pool (vacía si el usuario no está buscando)
+    """
+    user_rows = supabase.table("searching_pool").select("*").eq("correo_usuario", email).execute().data or []
+    radius = candidate_radius(max_distance_km)
+
+    emails = set()
+    for role in POOL_ROLES:
+        rows = [row for row in user_rows if row.get("tipo_de_usuario") == role and is_active_record(row)]
+        if rows and latest_per_user:
+            # El más reciente de los activos; en empates el primero de la tabla, como CompactPool
+            rows = [max(rows, key=lambda row: recency_key(row)[0])]
+        for row in rows:
+            try:
+                lat, lng = float(row.get("pickup_lat")), float(row.get("pickup_lng"))
+            except (TypeError, ValueError):
+                continue
+            if math.isnan(lat) or math.isnan(lng):
+                continue
+
+            lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius if role == "conductor" else 2 * radius)
+            nearby = (
+                supabase.table("searching_pool").select("*")
+                .gte("pickup_lat", lat_min).lte("pickup_lat", lat_max)
+                .gte("pickup_lng", lng_min).lte("pickup_lng", lng_max)
+                .execute().data or []
+            )
+            emails.update(other.get("correo_usuario") for other in nearby if is_active_record(other))
+
+    emails.discard(email)
+    if not emails:
+        return user_rows
+    response = supabase.table("searching_pool").select("*").in_("correo_usuario", sorted(emails | {email})).execute()
+    return response.data or []
+
+class IncrementalMatchEngine:
+    """
+    Motor de matchmaking en memoria que se actualiza con los cambios del searching_pool
+
+    Mantiene los registros activos, la vista deduplicada por correo (el registro más
+    reciente de cada usuario, o todos los registros con latest_per_user=False) y un
+    índice espacial por rol y destino. Cada inserción, actualización o eliminación
+    marca solo los conductores afectados (el propio conductor o los conductores a
+    menos del radio del pasajero modificado, antes y después del cambio) y solo esos
+    se recalculan en la siguiente lectura.
+
+    La asignación es la del motor vectorizado con 'first_fit': distancia Haversine
+    desde el punto de partida del conductor, mismo destino y cupos en orden del pool
+    (como CompactPool.from_records con las mismas opciones), por lo que el resultado
+    de cada conductor no depende de los demás. Con assignment='nearest' los cupos se
+    llenan con los pasajeros más cercanos, que tampoco dependen de los demás
+    conductores.
+    """
+
+    def __init__(self, max_distance_km=5, destination_column="destino", time_window_minutes=None,
+                 pickup_mode="radius", assignment="first_fit", latest_per_user=True, normalize_destinations=True):
+        """
+        Args:
+            max_distance_km (float): Distancia máxima para emparejar
+            destination_column (str): Columna usada para la clave de destino
+            time_window_minutes (float): Diferencia máxima entre las horas de salida
+                de conductor y pasajero (None sin filtro, ver wheels.time_windows)
+            pickup_mode (str): 'radius' o 'corridor' (ver wheels.corridor); en modo
+                corredor cada conductor guarda su geometría al indexarse
+            assignment (str): 'first_fit' (orden del pool) o 'nearest' (más cercanos
+                primero); las asignaciones globales no son incrementales y usan 'first_fit'
+            latest_per_user (bool): Conserva solo el registro más reciente de cada correo y
+                rol, con el pool ordenado por created_at descendente; si es False cuentan
+                todos los registros, en el orden en que llegaron al motor (el de la tabla
+                en una carga completa)
+            normalize_destinations (bool): Usa la clave canónica de destino; si es False
+                compara el valor exacto de destination_column
+        """
+        self.max_distance_km = max_distance_km
+        self.destination_column = destination_column
+        self.time_window_minutes = time_window_minutes
+        self.pickup_mode = pickup_mode
+        self.assignment = assignment
+        self.latest_per_user = latest_per_user
+        self.normalize_destinations = normalize_destinations
+        self.radius_km = candidate_radius(max_distance_km)
+        # Versión del estado del pool: aumenta con cada cambio efectivo
+        self.version = 0
+        self.last_synced_at = None
+        self._lock = threading.RLock()
+        self._records = {}
+        self._user_records = {}
+        # Registros vigentes (indexados) de cada usuario
+        self._current = {}
+        # Orden de llegada de cada registro (orden del pool sin deduplicar)
+        self._sequence = {}
+        self._arrivals = itertools.count()
+        self._indexed = {}
+        # Hora de salida en minutos de cada registro indexado
+        self._departures = {}
+        # Corredor de cada conductor indexado (modo 'corridor'), por destino
+        self._corridors = {}
+        self._indexes = {role: {} for role in POOL_ROLES}
+        self._matches = {}
+        self._dirty = set()
+        self._ordered = None
+        self._watermark = None
+        self._last_full_sync = None
+
+    # ------------------------------------------------------------------
+    # Cambios del pool
+    # ------------------------------------------------------------------
+
+    def upsert(self, record):
+        """
+        Inserta o actualiza un registro del searching_pool
+
+        Un registro que deja de estar activo (p. ej. status 'matched') se elimina.
+
+        Args:
+            record (dict): Registro completo del searching_pool
+
+        Returns:
+            bool: True si el estado del pool cambió
+        """
+        record_id = record.get("id")
+        if record_id is None:
+            return False
+        with self._lock:
+            if not is_active_record(record):
+                return self.remove(record_id)
+            if self._records.get(record_id) == record:
+                return False
+
+            previous = self._records.get(record_id)
+            if previous is not None and self._user_key(previous) != self._user_key(record):
+                self.remove(record_id)
+            if record_id not in self._records:
+                self._sequence[record_id] = next(self._arrivals)
+            if record_id in self._current.get(self._user_key(record), ()):
+                # El registro ya es el vigente del usuario: se reindexa con los datos nuevos
+                self._deindex(record_id)
+
+            self._records[record_id] = dict(record)
+            self._user_records.setdefault(self._user_key(record), set()).add(record_id)
+            self._refresh_user(self._user_key(record))
+            self._changed()
+            return True
+
+    def remove(self, record_id):
+        """
+        Elimina un registro del searching_pool
+
+        Args:
+            record_id: id del registro
+
+        Returns:
+            bool: True si el registro existía
+        """
+        with self._lock:
+            record = self._records.get(record_id)
+            if record is None:
+                return False
+            user = self._user_key(record)
+            if record_id in self._current.get(user, ()):
+                self._deindex(record_id)
+                self._current[user].discard(record_id)
+            del self._records[record_id]
+            del self._sequence[record_id]
+            self._user_records[user].discard(record_id)
+            if not self._user_records[user]:
+                del self._user_records[user]
+            self._refresh_user(user)
+            self._changed()
+            return True
+
+    def load_records(self, records):
+        """
+        Sincroniza el motor con una lectura completa del searching_pool
+
+        Solo se aplican las diferencias: los registros iguales no se tocan y los que
+        ya no aparecen se eliminan.
+
+        Args:
+            records (list): Registros completos del searching_pool
+
+        Returns:
+            int: Número de registros que cambiaron
+        """
+        with self._lock:
+            seen = set()
+            changes = 0
+            for record in records:
+                seen.add(record.get("id"))
+                changes += self.upsert(record)
+            for record_id in [record_id for record_id in self._records if record_id not in seen]:
+                changes += self.remove(record_id)
+            self._advance_watermark(records)
+            return changes
+
+    def load_dataframe(self, searching_pool_df):
+        """Sincroniza el motor con un DataFrame completo del searching_pool (ver load_records)"""
+        return self.load_records(dataframe_records(searching_pool_df))
+
+    def apply_notification(self, payload, fetch_record=None):
+        """
+        Aplica una notificación del canal new_searching_pool_record
+
+        Acepta el registro completo ('record'/'new', con 'operation'/'type' opcional)
+        o solo 'record_id'; en ese caso se lee el registro con fetch_record.
+
+        Args:
+            payload (dict): Contenido de la notificación
+            fetch_record (callable): fetch_record(record_id) -> dict o None si ya no existe
+
+        Returns:
+            bool: True si el estado del pool cambió
+        """
+        operation = str(payload.get("operation") or payload.get("type") or "").upper()
+        record = payload.get("record") or payload.get("new")
+        old_record = payload.get("old_record") or payload.get("old") or {}
+        record_id = payload.get("record_id")
+        if record_id is None:
+            record_id = (record or old_record).get("id")
+
+        if operation == "DELETE":
+            return self.remove(record_id)
+        if record:
+            return self.upsert(record)
+        if record_id is not None and fetch_record is not None:
+            fetched = fetch_record(record_id)
+            return self.upsert(fetched) if fetched else self.remove(record_id)
+        return False
+
+    def sync(self, supabase, full_resync_seconds=300):
+        """
+        Trae del searching_pool solo los registros modificados desde la última lectura
+
+        Usa updated_at como marca de agua. Cada full_resync_seconds (o si la tabla no
+        tiene updated_at) hace una lectura completa, que también detecta eliminaciones
+        físicas que no llegaron por el canal LISTEN.
+
+        Args:
+            supabase: Cliente de Supabase
+            full_resync_seconds (float): Intervalo máximo entre lecturas completas
+
+        Returns:
+            int: Número de registros que cambiaron
+        """
+        with self._lock:
+            now = time.monotonic()
+            full = (
+                self._watermark is None
+                or self._last_full_sync is None
+                or now - self._last_full_sync >= full_resync_seconds
+            )
+            if full:
+                response = supabase.table("searching_pool").select("*").execute()
+                changes = self.load_records(response.data or [])
+                self._last_full_sync = now
+            else:
+                response = supabase.table("searching_pool").select("*").gt("updated_at", self._watermark).execute()
+                changes = sum(self.upsert(record) for record in response.data or [])
+                self._advance_watermark(response.data or [])
+            self.last_synced_at = time.time()
+            if changes:
+                logger.info(f"🔄 Pool sincronizado ({'completo' if full else 'incremental'}): {changes} cambios")
+            return changes
+
+    # ------------------------------------------------------------------
+    # Resultados
+    # ------------------------------------------------------------------
+
+    def matches(self):
+        """
+        Emparejamientos actuales, recalculando solo los conductores afectados
+
+        Returns:
+            list: Tuplas (registro del conductor, [(registro del pasajero, distancia km)])
+                  en el orden del pool (ver latest_per_user)
+        """
+        with self._lock:
+            self.flush()
+            if self._ordered is None:
+                drivers = self._pool_sorted(self._matches)
+                self._ordered = [
+                    (self._records[driver_id], [(self._records[p], km) for p, km in self._matches[driver_id]])
+                    for driver_id in drivers
+                ]
+            return list(self._ordered)
+
+    def user_matches(self, email):
+        """
+        Emparejamientos en los que participa un usuario, sin recalcular el resto del pool
+
+        Solo se recalculan (si están pendientes) los conductores del usuario y los
+        conductores a menos del radio de sus registros de pasajero.
+
+        Args:
+            email (str): Correo del usuario
+
+        Returns:
+            list: Tuplas (registro del conductor, [(registro del pasajero, distancia km)])
+                  de los conductores que son el usuario o que lo llevan como pasajero
+        """
+        with self._lock:
+            driver_ids = self._current.get(("conductor", email), set())
+            passenger_ids = self._current.get(("pasajero", email), set())
+            drivers = set(driver_ids)
+            for passenger_id in passenger_ids:
+                if self._indexed.get(passenger_id) is not None:
+                    drivers.update(self._drivers_near(self._records[passenger_id], self._indexed[passenger_id]))
+
+            involved = []
+            for candidate in drivers:
+                if candidate in self._dirty:
+                    self._dirty.discard(candidate)
+                    self._match_driver(candidate)
+                    self._ordered = None
+                matched = self._matches.get(candidate)
+                if matched and (candidate in driver_ids or any(p in passenger_ids for p, _ in matched)):
+                    involved.append(candidate)
+
+            return [
+                (self._records[candidate], [(self._records[p], km) for p, km in self._matches[candidate]])
+                for candidate in self._pool_sorted(involved)
+            ]
+
+    def flush(self):
+        """
+        Recalcula los conductores marcados por cambios desde la última lectura
+
+        Returns:
+            int: Número de conductores recalculados
+        """
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+            for driver_id in dirty:
+                self._match_driver(driver_id)
+            if dirty:
+                self._ordered = None
+            return len(dirty)
+
+    def stats(self):
+        """Contadores del estado en memoria"""
+        with self._lock:
+            return {
+                "version": self.version,
+                "records": len(self._records),
+                "drivers": sum(len(index) for index in self._indexes["conductor"].values()),
+                "passengers": sum(len(index) for index in self._indexes["pasajero"].values()),
+                "matched_drivers": len(self._matches),
+                "pending_drivers": len(self._dirty),
+                "last_synced_at": self.last_synced_at
+            }
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _user_key(record):
+        return (record.get("tipo_de_usuario"), record.get("correo_usuario"))
+
+    def _destination_key(self, record):
+        if self.normalize_destinations:
+            return record_destination_key(record, self.destination_column)
+        key = record.get(self.destination_column)
+        return None if is_missing(key) else key
+
+    def _pool_sorted(self, items, record_id=lambda item: item):
+        """
+        Elementos en el orden del pool de CompactPool.from_records: orden de llegada y, al
+        deduplicar, created_at descendente (los empates conservan el orden de llegada)
+        """
+        items = sorted(items, key=lambda item: self._sequence[record_id(item)])
+        if self.latest_per_user:
+            items.sort(key=lambda item: recency_key(self._records[record_id(item)])[0], reverse=True)
+        return items
+
+    def _changed(self):
+        self.version += 1
+
+    def _advance_watermark(self, records):
+        stamps = [str(r["updated_at"]) for r in records if not is_missing(r.get("updated_at"))]
+        if stamps and (self._watermark is None or max(stamps) > self._watermark):
+            self._watermark = max(stamps)
+
+    def _refresh_user(self, user):
+        """Elige los registros vigentes del usuario (el más reciente, o todos) y actualiza los índices"""
+        ids = self._user_records.get(user, set())
+        if self.latest_per_user and ids:
+            selected = {self._pool_sorted(ids)[0]}
+        else:
+            selected = set(ids)
+        for record_id in self._current.get(user, set()) - selected:
+            self._deindex(record_id)
+        for record_id in selected:
+            if record_id not in self._indexed:
+                self._index(record_id)
+        if selected:
+            self._current[user] = selected
+        else:
+            self._current.pop(user, None)
+
+    def _index(self, record_id):
+        record = self._records[record_id]
+        role = record["tipo_de_usuario"]
+        key = self._destination_key(record)
+        self._indexed[record_id] = key
+        self._departures[record_id] = record_departure_minutes(record)
+        if key is None:
+            return
+        index = self._indexes[role].setdefault(key, GridIndex(cell_km=self.radius_km))
+        index.insert(record_id, record.get("pickup_lat"), record.get("pickup_lng"))
+
+        if role == "conductor":
+            if self.pickup_mode == "corridor":
+                self._corridors.setdefault(key, {})[record_id] = DriverCorridors.from_record(record, self.max_distance_km)
+            self._dirty.add(record_id)
+        else:
+            self._mark_drivers_near(record, key)
+
+    def _deindex(self, record_id):
+        if record_id not in self._indexed:
+            return
+        key = self._indexed.pop(record_id)
+        self._departures.pop(record_id, None)
+        record = self._records[record_id]
+        role = record["tipo_de_usuario"]
+        index = self._indexes[role].get(key)
+        if index is not None:
+            index.remove(record_id)
+            if not len(index):
+                del self._indexes[role][key]
+
+        if role == "conductor":
+            corridors = self._corridors.get(key)
+            if corridors is not None:
+                corridors.pop(record_id, None)
+                if not corridors:
+                    del self._corridors[key]
+            self._dirty.discard(record_id)
+            if self._matches.pop(record_id, None) is not None:
+                self._ordered = None
+        elif key is not None:
+            self._mark_drivers_near(record, key)
+
+    def _drivers_near(self, passenger, key):
+        index = self._indexes["conductor"].get(key)
+        if index is None:
+            return []
+        drivers, _ = index.query_radius(passenger.get("pickup_lat"), passenger.get("pickup_lng"), self.radius_km)
+        drivers = drivers.tolist()
+        if self.pickup_mode == "corridor":
+            # Conductores cuyo trayecto pasa cerca aunque su punto de partida esté lejos
+            lat, lng = passenger.get("pickup_lat"), passenger.get("pickup_lng")
+            drivers.extend(
+                driver_id for driver_id, corridor in self._corridors.get(key, {}).items()
+                if len(corridor.contains_box(lat, lng))
+            )
+        return drivers
+
+    def _mark_drivers_near(self, passenger, key):
+        self._dirty.update(self._drivers_near(passenger, key))
+
+    def _match_driver(self, driver_id):
+        driver = self._records.get(driver_id)
+        key = self._indexed.get(driver_id)
+        index = self._indexes["pasajero"].get(key)
+        matched = []
+        if driver is not None and index is not None:
+            seats = record_seats(driver)
+            if self.pickup_mode == "corridor":
+                corridor = self._corridors[key][driver_id]
+                passengers, _ = index.query_radius(*corridor.search_circle(0, self.max_distance_km))
+                coords = [self._records[p] for p in passengers.tolist()]
+                inside, distances = corridor_feasible(
+                    corridor, np.zeros(len(coords), dtype=np.int64),
+                    [coordinate(p.get("pickup_lat")) for p in coords],
+                    [coordinate(p.get("pickup_lng")) for p in coords],
+                    self.max_distance_km
+                )
+            else:
+                passengers, distances = index.query_radius(driver.get("pickup_lat"), driver.get("pickup_lng"), self.radius_km)
+                # Se compara la distancia redondeada a 10 m, igual que el algoritmo iterativo
+                inside = np.round(distances, 2) <= self.max_distance_km
+            if self.time_window_minutes is not None and inside.any():
+                inside[inside] = time_compatible(
+                    self._departures[driver_id],
+                    [self._departures[p] for p in passengers[inside].tolist()],
+                    self.time_window_minutes
+                )
+            candidates = self._pool_sorted(
+                zip(passengers[inside].tolist(), distances[inside].tolist()), record_id=lambda item: item[0]
+            )
+            matched = nearest_first(candidates, seats) if self.assignment == "nearest" else candidates[:seats]
+
+        if matched:
+            self._matches[driver_id] = matched
+        else:
+            self._matches.pop(driver_id, None)
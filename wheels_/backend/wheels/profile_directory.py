@@ -0,0 +1,173 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Columnas de profiles que guarda el directorio
+PROFILE_COLUMNS = "id, email, full_name"
+
+# Máximo de correos por consulta in_("email", [...]) para no exceder el largo de la URL
+MAX_EMAILS_PER_QUERY = 200
+
+def profile_name_map(profiles):
+    """
+    Diccionario correo -> nombre a partir de un DataFrame de profiles
+
+    Reemplaza los filtros profiles_df[profiles_df["email"] == email] (un recorrido
+    completo de la columna por consulta) por búsquedas O(1).
+
+    Args:
+        profiles (DataFrame | dict): Perfiles o un diccionario ya construido
+
+    Returns:
+        dict: Correo -> full_name (vacío si no hay perfiles)
+    """
+    if profiles is None:
+        return {}
+    if isinstance(profiles, dict):
+        return profiles
+    if profiles.empty or "email" not in profiles.columns or "full_name" not in profiles.columns:
+        return {}
+    names = {}
+    # El primer perfil de cada correo gana, igual que .iloc[0] sobre el filtro
+    for email, name in zip(profiles["email"].tolist(), profiles["full_name"].tolist()):
+        names.setdefault(email, name)
+    return names
+
+def profile_entry(profile):
+    """Campos de un perfil que guarda el directorio"""
+    return {"id": profile.get("id"), "email": profile.get("email"), "full_name": profile.get("full_name")}
+
+class ProfileDirectory:
+    """
+    Directorio de perfiles en memoria: correo -> id y correo -> nombre
+
+    Guarda los perfiles en un LRU acotado con TTL. Los correos que faltan se leen
+    de profiles en una sola consulta in_("email", [...]) por lote, así resolver los
+    nombres de todos los usuarios emparejados cuesta a lo sumo una ida a la base de
+    datos. Los correos sin perfil no se guardan (un usuario nuevo aparece de
+    inmediato).
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=600):
+        """
+        Args:
+            max_entries (int): Número máximo de perfiles guardados
+            ttl_seconds (float): Vigencia de un perfil guardado (None sin límite)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, email, now):
+        entry = self._entries.get(email)
+        if entry is None:
+            return None
+        stored_at, profile = entry
+        if self.ttl_seconds is not None and now - stored_at >= self.ttl_seconds:
+            del self._entries[email]
+            return None
+        self._entries.move_to_end(email)
+        return profile
+
+    def prime(self, profiles):
+        """
+        Guarda perfiles ya leídos (p. ej. de una lectura completa de profiles)
+
+        Args:
+            profiles (iterable): Dicts con al menos 'email' (e 'id', 'full_name')
+        """
+        now = time.monotonic()
+        with self._lock:
+            for profile in profiles:
+                email = profile.get("email")
+                if email is None or (isinstance(email, float) and math.isnan(email)):
+                    continue
+                self._entries[email] = (now, profile_entry(profile))
+                self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, supabase, emails):
+        """
+        Perfiles de varios correos, leyendo de profiles solo los que no están guardados
+
+        Args:
+            supabase: Cliente de Supabase
+            emails (iterable): Correos a resolver
+
+        Returns:
+            dict: Correo -> perfil ({'id', 'email', 'full_name'}) de los correos con perfil
+        """
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for email in dict.fromkeys(emails):
+                if email is None or (isinstance(email, float) and math.isnan(email)):
+                    continue
+                profile = self._get(email, now)
+                if profile is None:
+                    missing.append(email)
+                else:
+                    found[email] = profile
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        for start in range(0, len(missing), MAX_EMAILS_PER_QUERY):
+            batch = missing[start:start + MAX_EMAILS_PER_QUERY]
+            response = supabase.table("profiles").select(PROFILE_COLUMNS).in_("email", batch).execute()
+            rows = {}
+            for row in response.data or []:
+                # El primer perfil de cada correo gana
+                rows.setdefault(row.get("email"), row)
+            rows.pop(None, None)
+            self.prime(rows.values())
+            found.update((email, profile_entry(row)) for email, row in rows.items())
+        return found
+
+    def get(self, supabase, email):
+        """Perfil de un correo (None si no existe)"""
+        return self.lookup(supabase, [email]).get(email)
+
+    def get_id(self, supabase, email):
+        """id de perfil de un correo (None si no existe)"""
+        profile = self.get(supabase, email)
+        return profile["id"] if profile else None
+
+    def names(self, supabase, emails):
+        """
+        Nombres de varios correos en una sola consulta para los que falten
+
+        Returns:
+            dict: Correo -> full_name de los correos con perfil
+        """
+        return {email: profile["full_name"] for email, profile in self.lookup(supabase, emails).items()}
+
+    def invalidate(self, email=None):
+        """Olvida un perfil (p. ej. al actualizarlo) o todos si no se indica correo"""
+        with self._lock:
+            if email is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(email, None)
+
+    def stats(self):
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+# Directorio compartido por las APIs y los servicios del proceso
+profile_directory = ProfileDirectory(
+    max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "600"))
+)
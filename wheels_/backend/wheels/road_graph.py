@@ -0,0 +1,249 @@
+import logging
+import math
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from .geo import haversine_km
+from .spatial_index import DEFAULT_REFERENCE_LAT, KM_PER_DEGREE_LAT
+
+logger = logging.getLogger(__name__)
+
+# Orígenes resueltos por cada llamada a Dijkstra: cada uno ocupa dos filas de tamaño
+# (nodos del grafo), así que con el grafo de Bogotá un bloque de 16 son unos 50 MB
+SOURCE_CHUNK = 16
+
+# Decimales con los que se identifican los nodos de una lista de aristas en CSV (~1 cm)
+NODE_PRECISION = 7
+
+class RoadGraph:
+    """
+    Grafo vial dirigido en arrays compactos de NumPy (formato CSR)
+
+    Los nodos son intersecciones con coordenadas float32; las aristas salientes del nodo
+    u son indices[indptr[u]:indptr[u + 1]], ordenadas por destino, con su longitud en
+    metros y su tiempo de recorrido en segundos (float32). Las rutas minimizan el tiempo
+    y los metros son los de esa ruta más rápida.
+
+    Las búsquedas usan scipy.sparse.csgraph.dijkstra (en C, varios orígenes por llamada
+    y con un tiempo máximo de búsqueda).
+    """
+
+    def __init__(self, lat, lng, indptr, indices, metres, seconds):
+        """
+        Args:
+            lat, lng (array): Coordenadas de los nodos
+            indptr (array): Inicio de las aristas de cada nodo (longitud nodos + 1)
+            indices (array): Nodo destino de cada arista
+            metres, seconds (array): Longitud y tiempo de cada arista
+        """
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.lng = np.asarray(lng, dtype=np.float32)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.metres = np.asarray(metres, dtype=np.float32)
+        self.seconds = np.asarray(seconds, dtype=np.float32)
+        if len(self.indptr) != len(self.lat) + 1 or self.indptr[-1] != len(self.indices):
+            raise ValueError("Grafo vial inválido: indptr no corresponde a los nodos y aristas")
+        self.searches = 0
+        self._csr = None
+        self._edge_keys = None
+        self._tree = None
+
+    @classmethod
+    def from_edges(cls, lat, lng, sources, targets, metres, seconds):
+        """
+        Construye el grafo desde una lista de aristas dirigidas
+
+        Las aristas repetidas entre los mismos nodos se reducen a la más rápida.
+
+        Args:
+            lat, lng (array): Coordenadas de los nodos
+            sources, targets (array): Nodos de origen y destino de cada arista
+            metres, seconds (array): Longitud y tiempo de cada arista
+
+        Returns:
+            RoadGraph: Grafo en formato CSR
+        """
+        nodes = len(lat)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        metres = np.asarray(metres, dtype=np.float64)
+        seconds = np.asarray(seconds, dtype=np.float64)
+
+        keys = sources * nodes + targets
+        order = np.lexsort((seconds, keys))
+        keep = order[np.r_[True, keys[order][1:] != keys[order][:-1]]]
+        indptr = np.zeros(nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources[keep], minlength=nodes), out=indptr[1:])
+        return cls(lat, lng, indptr, targets[keep], metres[keep], seconds[keep])
+
+    @classmethod
+    def from_edge_csv(cls, path):
+        """
+        Grafo desde un CSV de aristas (una fila por tramo de vía)
+
+        Columnas: from_lat, from_lng, to_lat, to_lng, seconds y opcionalmente metres (si
+        falta se usa la distancia en línea recta) y oneway (0 agrega también el sentido
+        contrario; por defecto cada fila es un solo sentido). Es el formato que produce
+        el preprocesamiento de un extracto OSM (PBF) de Bogotá.
+        """
+        import pandas as pd
+
+        edges = pd.read_csv(path)
+        coordinates = np.round(np.concatenate([
+            edges[["from_lat", "from_lng"]].to_numpy(dtype=np.float64),
+            edges[["to_lat", "to_lng"]].to_numpy(dtype=np.float64)
+        ]), NODE_PRECISION)
+        nodes, inverse = np.unique(coordinates, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        sources, targets = inverse[:len(edges)], inverse[len(edges):]
+        if "metres" in edges:
+            metres = edges["metres"].to_numpy(dtype=np.float64)
+        else:
+            metres = haversine_km(edges["from_lat"], edges["from_lng"], edges["to_lat"], edges["to_lng"]).to_numpy() * 1000
+        seconds = edges["seconds"].to_numpy(dtype=np.float64)
+        if "oneway" in edges:
+            both = edges["oneway"].to_numpy() == 0
+            sources, targets = np.concatenate([sources, targets[both]]), np.concatenate([targets, sources[both]])
+            metres, seconds = np.concatenate([metres, metres[both]]), np.concatenate([seconds, seconds[both]])
+        return cls.from_edges(nodes[:, 0], nodes[:, 1], sources, targets, metres, seconds)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carga un grafo guardado con save() (.npz) o un CSV de aristas (.csv)
+
+        Returns:
+            RoadGraph: Grafo cargado
+        """
+        if os.path.splitext(path)[1].lower() == ".csv":
+            graph = cls.from_edge_csv(path)
+        else:
+            with np.load(path) as data:
+                graph = cls(data["lat"], data["lng"], data["indptr"], data["indices"], data["metres"], data["seconds"])
+        logger.info(f"🗺️ Grafo vial cargado de {path}: {len(graph)} nodos, {graph.edges} aristas")
+        return graph
+
+    def save(self, path):
+        """Guarda los arrays del grafo en un archivo .npz"""
+        np.savez(path, lat=self.lat, lng=self.lng, indptr=self.indptr, indices=self.indices,
+                 metres=self.metres, seconds=self.seconds)
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def edges(self):
+        return len(self.indices)
+
+    def _projected(self, lat, lng):
+        # Plano equirectangular en km alrededor de Bogotá: basta para buscar el nodo más cercano
+        scale = KM_PER_DEGREE_LAT * math.cos(math.radians(DEFAULT_REFERENCE_LAT))
+        return np.column_stack([np.asarray(lat, dtype=np.float64) * KM_PER_DEGREE_LAT,
+                                np.asarray(lng, dtype=np.float64) * scale])
+
+    def nearest_nodes(self, lat, lng):
+        """
+        Nodo del grafo más cercano a cada punto
+
+        Args:
+            lat, lng (array): Coordenadas de los puntos
+
+        Returns:
+            tuple: (nodos, km hasta el nodo); -1 e infinito para puntos sin coordenadas
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        nodes = np.full(len(lat), -1, dtype=np.int64)
+        valid = np.isfinite(lat) & np.isfinite(lng)
+        if valid.any() and len(self):
+            points = self._projected(lat[valid], lng[valid])
+            if self._tree is None:
+                self._tree = cKDTree(self._projected(self.lat, self.lng))
+            nodes[valid] = self._tree.query(points)[1]
+        snap_km = np.full(len(lat), np.inf)
+        found = nodes >= 0
+        snap_km[found] = haversine_km(lat[found], lng[found], self.lat[nodes[found]], self.lng[nodes[found]])
+        return nodes, snap_km
+
+    def _search(self, sources, max_seconds):
+        """Tiempos y predecesores desde cada origen a todos los nodos: arrays (orígenes, nodos)"""
+        self.searches += len(sources)
+        limit = np.inf if max_seconds is None else max_seconds
+        if self._csr is None:
+            # csgraph puede descartar los ceros explícitos: las aristas de 0 s pasan a 1 ms
+            weights = np.maximum(self.seconds.astype(np.float64), 1e-3)
+            self._csr = csr_matrix((weights, self.indices, self.indptr), shape=(len(self), len(self)))
+        return dijkstra(self._csr, directed=True, indices=sources, return_predecessors=True, limit=limit)
+
+    def _path_metres(self, predecessors, source, targets):
+        """Metros de la ruta más rápida de source a cada target, recorriendo los predecesores"""
+        if self._edge_keys is None:
+            self._edge_keys = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr)) * len(self) + self.indices
+        current = np.asarray(targets, dtype=np.int64).copy()
+        total = np.zeros(len(current))
+        active = current != source
+        while active.any():
+            previous = predecessors[current[active]].astype(np.int64)
+            edges = np.searchsorted(self._edge_keys, previous * len(self) + current[active])
+            total[active] += self.metres[edges]
+            current[active] = previous
+            active = current != source
+        return total
+
+    def route_pairs(self, sources, targets, max_seconds=None):
+        """
+        Ruta más rápida de cada origen a su destino (arrays alineados de nodos)
+
+        Los pares con el mismo origen comparten una búsqueda, y los orígenes se resuelven
+        en bloques de SOURCE_CHUNK.
+
+        Args:
+            sources, targets (array): Nodos de origen y destino (-1 sin nodo)
+            max_seconds (float): Tiempo máximo de búsqueda (None sin límite)
+
+        Returns:
+            tuple: Arrays (segundos, metros); NaN sin nodo, sin ruta o por encima del límite
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        seconds = np.full(len(sources), np.nan)
+        metres = np.full(len(sources), np.nan)
+        positions = np.flatnonzero((sources >= 0) & (targets >= 0))
+        if len(positions) == 0:
+            return seconds, metres
+
+        positions = positions[np.argsort(sources[positions], kind="stable")]
+        unique, starts = np.unique(sources[positions], return_index=True)
+        groups = np.split(positions, starts[1:])
+        for chunk in range(0, len(unique), SOURCE_CHUNK):
+            times, predecessors = self._search(unique[chunk:chunk + SOURCE_CHUNK], max_seconds)
+            for row, source in enumerate(unique[chunk:chunk + SOURCE_CHUNK]):
+                group = groups[chunk + row]
+                reached = np.isfinite(times[row, targets[group]])
+                group = group[reached]
+                seconds[group] = times[row, targets[group]]
+                metres[group] = self._path_metres(predecessors[row], source, targets[group])
+        return seconds, metres
+
+    def many_to_many(self, sources, targets, max_seconds=None):
+        """
+        Matrices de tiempo y distancia entre nodos
+
+        Returns:
+            tuple: Arrays (segundos, metros) de forma (orígenes, destinos)
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        seconds, metres = self.route_pairs(np.repeat(sources, len(targets)), np.tile(targets, len(sources)), max_seconds)
+        shape = (len(sources), len(targets))
+        return seconds.reshape(shape), metres.reshape(shape)
+
+    def one_to_many(self, source, targets, max_seconds=None):
+        """Tiempos y distancias de un nodo a varios"""
+        seconds, metres = self.many_to_many([source], targets, max_seconds)
+        return seconds[0], metres[0]
@@ -0,0 +1,143 @@
+import numpy as np
+
+from .vector_matching import assign_pairs, candidate_buckets, dense_candidate_pairs, indexed_candidate_pairs
+
+# Candidatos por conductor que pasan a la confirmación por carretera
+DEFAULT_ROAD_TOP_K = 8
+
+# Fracción de max_distance_km usada como radio en línea recta de la primera etapa. La
+# distancia por carretera nunca es menor que la distancia en línea recta, así que 1.0
+# no pierde pares; valores menores podan más a cambio de descartar algunos pares límite
+DEFAULT_PREFILTER_SLACK = 1.0
+
+def top_k_per_driver(driver_idx, distances, limits):
+    """
+    Máscara de los pares más cercanos de cada conductor
+
+    Args:
+        driver_idx (ndarray): Conductor de cada par (agrupados por conductor)
+        distances (ndarray): Distancia en línea recta (o tiempo estimado) de cada par
+        limits (ndarray): Pares a conservar por conductor, indexado por posición del conductor
+
+    Returns:
+        ndarray: Máscara booleana alineada con los pares
+    """
+    if len(driver_idx) == 0:
+        return np.zeros(0, dtype=bool)
+    order = np.lexsort((distances, driver_idx))
+    sorted_drivers = driver_idx[order]
+    group_start = np.r_[True, sorted_drivers[1:] != sorted_drivers[:-1]]
+    start_pos = np.maximum.accumulate(np.where(group_start, np.arange(len(order)), 0))
+    keep = np.zeros(len(driver_idx), dtype=bool)
+    keep[order] = np.arange(len(order)) - start_pos < limits[sorted_drivers]
+    return keep
+
+def provider_requests(provider):
+    """
+    Solicitudes que un proveedor ha enviado a Distance Matrix
+
+    Sigue la cadena de stats() (caché -> upstream, respaldo -> primario) hasta el
+    contador "requests" de GoogleDistanceProvider.
+
+    Args:
+        provider (DistanceProvider): Proveedor de distancias
+
+    Returns:
+        int: Solicitudes enviadas (0 si el proveedor no consulta Google)
+    """
+    stats = provider.stats()
+    while "requests" not in stats and isinstance(stats.get("upstream"), dict):
+        stats = stats["upstream"]
+    return int(stats.get("requests", 0))
+
+def same_destination_pairs(driver_codes, passenger_codes, driver_minutes=None, passenger_minutes=None,
+                           time_window_minutes=None):
+    """Número de pares conductor x pasajero que el algoritmo iterativo compararía"""
+    return int(sum(
+        len(drivers) * len(passengers)
+        for drivers, passengers in candidate_buckets(
+            driver_codes, passenger_codes, driver_minutes, passenger_minutes, time_window_minutes
+        )
+    ))
+
+def two_stage_match(driver_lat, driver_lng, driver_codes, seats,
+                    passenger_lat, passenger_lng, passenger_codes, road_distances,
+                    max_distance_km=5, top_k=DEFAULT_ROAD_TOP_K, prefilter_slack=DEFAULT_PREFILTER_SLACK,
+                    use_spatial_index=False, assignment="first_fit",
+                    driver_minutes=None, passenger_minutes=None, time_window_minutes=None,
+                    eta_estimator=None):
+    """
+    Matchmaking en dos etapas: prefiltro Haversine vectorizado y confirmación por carretera
+
+    La primera etapa genera los pares del mismo destino a menos de
+    max_distance_km * prefilter_slack en línea recta y conserva los top_k más cercanos
+    de cada conductor (al menos tantos como cupos tenga). La segunda etapa pide la
+    distancia por carretera solo para esos pares, en un solo lote al proveedor (que
+    los empaqueta en bloques origen x destino con pack_pairs), y los cupos se
+    asignan sobre los pares confirmados con su distancia por carretera.
+
+    Args:
+        road_distances (DistanceProvider): Proveedor de las distancias por carretera
+        top_k (int): Candidatos por conductor que pasan a la segunda etapa
+        prefilter_slack (float): Fracción de max_distance_km usada en la primera etapa
+        eta_estimator (TravelTimeEstimator): Ordena los top_k por tiempo estimado en lugar
+            de distancia en línea recta (None por distancia)
+        (resto de argumentos como match_pool_arrays)
+
+    Returns:
+        tuple: (resultados como match_pool_arrays con distancias por carretera,
+                dict (conductor, pasajero) -> DistanceBatch.result del par,
+                dict con los pares podados en cada etapa)
+    """
+    stats = {
+        "same_destination_pairs": 0,
+        "prefilter_pruned": 0,
+        "top_k_pruned": 0,
+        "road_checked": 0,
+        "road_requests": 0,
+        "road_pruned": 0,
+        "confirmed_pairs": 0
+    }
+    if len(driver_lat) == 0 or len(passenger_lat) == 0:
+        return [], {}, stats
+
+    stats["same_destination_pairs"] = same_destination_pairs(
+        driver_codes, passenger_codes, driver_minutes, passenger_minutes, time_window_minutes
+    )
+    generate = indexed_candidate_pairs if use_spatial_index else dense_candidate_pairs
+    driver_idx, passenger_idx, straight = generate(
+        driver_lat, driver_lng, driver_codes,
+        passenger_lat, passenger_lng, passenger_codes, max_distance_km * prefilter_slack,
+        driver_minutes=driver_minutes, passenger_minutes=passenger_minutes,
+        time_window_minutes=time_window_minutes
+    )
+    stats["prefilter_pruned"] = stats["same_destination_pairs"] - len(driver_idx)
+
+    rank = straight
+    if eta_estimator is not None:
+        rank = eta_estimator.predict(driver_lat[driver_idx], driver_lng[driver_idx],
+                                     passenger_lat[passenger_idx], passenger_lng[passenger_idx])
+    keep = top_k_per_driver(driver_idx, rank, np.maximum(top_k, np.asarray(seats)))
+    driver_idx, passenger_idx = driver_idx[keep], passenger_idx[keep]
+    stats["top_k_pruned"] = int((~keep).sum())
+    stats["road_checked"] = len(driver_idx)
+
+    origins = list(zip(driver_lat[driver_idx].tolist(), driver_lng[driver_idx].tolist()))
+    destinations = list(zip(passenger_lat[passenger_idx].tolist(), passenger_lng[passenger_idx].tolist()))
+    requests_before = provider_requests(road_distances)
+    batch = road_distances.distances(origins, destinations)
+    # Solicitudes de Distance Matrix enviadas por el lote: los aciertos de caché y los
+    # proveedores sin red (grafo vial, Haversine) no suman
+    stats["road_requests"] = provider_requests(road_distances) - requests_before
+    road = {(d, p): batch.result(i) for i, (d, p) in enumerate(zip(driver_idx.tolist(), passenger_idx.tolist()))}
+    # Se compara la distancia redondeada a 10 m, como el resto de motores; NaN (sin ruta) se descarta
+    road_km = np.round(batch.km, 2)
+
+    confirmed = road_km <= max_distance_km
+    stats["road_pruned"] = int((~confirmed).sum())
+    stats["confirmed_pairs"] = int(confirmed.sum())
+
+    results = assign_pairs(
+        driver_idx[confirmed], passenger_idx[confirmed], road_km[confirmed], np.asarray(seats), assignment=assignment
+    )
+    return results, road, stats
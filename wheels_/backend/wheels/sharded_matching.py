@@ -0,0 +1,199 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .vector_matching import destination_buckets, match_pool_arrays
+
+# Por debajo de este número de registros (conductores + pasajeros) el costo de
+# repartir el trabajo entre procesos supera la ganancia y se resuelve en el proceso
+DEFAULT_MIN_PARALLEL_SIZE = 2000
+
+# Columnas que se comparten con los procesos de trabajo
+SHARED_COLUMNS = ("driver_lat", "driver_lng", "driver_codes", "seats",
+                  "passenger_lat", "passenger_lng", "passenger_codes")
+
+# Columnas opcionales: horas de salida (con ventana de salida) y destino de los
+# conductores (modo corredor)
+TIME_COLUMNS = ("driver_minutes", "passenger_minutes")
+CORRIDOR_COLUMNS = ("driver_dropoff_lat", "driver_dropoff_lng")
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+def get_executor(workers):
+    """
+    ProcessPoolExecutor compartido del proceso, creado al primer uso
+
+    Usa 'spawn': hacer fork de un proceso Flask con hilos puede heredar locks tomados.
+
+    Args:
+        workers (int): Número de procesos de trabajo
+
+    Returns:
+        ProcessPoolExecutor: Ejecutor (se recrea si cambia el número de procesos)
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
+
+@atexit.register
+def shutdown_executor():
+    """Detiene los procesos de trabajo al salir"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+class SharedArrays:
+    """
+    Copia un conjunto de arrays a bloques de memoria compartida durante un bloque with
+
+    Los procesos de trabajo reciben solo los nombres de los bloques (ver spec) y
+    leen las columnas sin que se serialicen con pickle.
+    """
+
+    def __init__(self, arrays):
+        """
+        Args:
+            arrays (dict): Nombre -> ndarray numérico
+        """
+        self.arrays = arrays
+        self.blocks = []
+        self.spec = {}
+
+    def __enter__(self):
+        try:
+            for name, array in self.arrays.items():
+                array = np.ascontiguousarray(array)
+                block = SharedMemory(create=True, size=max(1, array.nbytes))
+                self.blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+                self.spec[name] = (block.name, array.shape, array.dtype.str)
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+def attach_shared(spec):
+    """
+    Abre en un proceso de trabajo los arrays descritos por SharedArrays.spec
+
+    Returns:
+        tuple: (dict nombre -> ndarray, lista de bloques a cerrar)
+    """
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in spec.items():
+        # Los procesos creados con spawn comparten el resource_tracker del principal,
+        # que es el dueño del bloque y lo borra en SharedArrays.__exit__
+        block = SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
+
+def solve_shard(spec, driver_positions, passenger_positions, max_distance_km, use_spatial_index, assignment,
+                time_window_minutes=None):
+    """
+    Resuelve un destino en un proceso de trabajo
+
+    Args:
+        spec (dict): SharedArrays.spec con las columnas de conductores y pasajeros
+        driver_positions, passenger_positions (ndarray): Filas del destino
+
+    Returns:
+        list: Tuplas (posición del conductor, posiciones de pasajeros, distancias) en
+              posiciones del pool completo
+    """
+    arrays, blocks = attach_shared(spec)
+    try:
+        results = match_pool_arrays(
+            arrays["driver_lat"][driver_positions], arrays["driver_lng"][driver_positions],
+            arrays["driver_codes"][driver_positions], arrays["seats"][driver_positions],
+            arrays["passenger_lat"][passenger_positions], arrays["passenger_lng"][passenger_positions],
+            arrays["passenger_codes"][passenger_positions], max_distance_km,
+            use_spatial_index=use_spatial_index, assignment=assignment,
+            driver_minutes=arrays["driver_minutes"][driver_positions] if "driver_minutes" in arrays else None,
+            passenger_minutes=arrays["passenger_minutes"][passenger_positions] if "passenger_minutes" in arrays else None,
+            time_window_minutes=time_window_minutes,
+            driver_dropoff_lat=arrays["driver_dropoff_lat"][driver_positions] if "driver_dropoff_lat" in arrays else None,
+            driver_dropoff_lng=arrays["driver_dropoff_lng"][driver_positions] if "driver_dropoff_lng" in arrays else None
+        )
+        return [
+            (int(driver_positions[d]), passenger_positions[p], distances)
+            for d, p, distances in results
+        ]
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+def match_arrays_sharded(driver_lat, driver_lng, driver_codes, seats,
+                         passenger_lat, passenger_lng, passenger_codes, max_distance_km=5,
+                         use_spatial_index=False, assignment="first_fit", workers=1,
+                         min_parallel_size=DEFAULT_MIN_PARALLEL_SIZE, driver_minutes=None,
+                         passenger_minutes=None, time_window_minutes=None, driver_dropoff_lat=None,
+                         driver_dropoff_lng=None):
+    """
+    match_pool_arrays repartido por destino entre procesos de trabajo
+
+    Solo hay pares candidatos dentro de un mismo destino, así que cada destino es un
+    problema independiente (también para las asignaciones globales) y el resultado
+    combinado es el mismo que el de una sola pasada. Con pocos registros, un solo
+    destino o workers <= 1 se resuelve en el proceso.
+
+    Args:
+        workers (int): Número de procesos de trabajo
+        min_parallel_size (int): Registros mínimos para repartir el trabajo
+        driver_minutes, passenger_minutes, time_window_minutes: Ventana de salida,
+            ver match_pool_arrays
+        driver_dropoff_lat, driver_dropoff_lng: Modo corredor, ver match_pool_arrays
+
+    Returns:
+        list: Tuplas (posición del conductor, posiciones de pasajeros, distancias en km)
+              ordenadas por conductor, como match_pool_arrays
+    """
+    shards = destination_buckets(driver_codes, passenger_codes) if len(driver_lat) and len(passenger_lat) else []
+    if workers <= 1 or len(shards) <= 1 or len(driver_lat) + len(passenger_lat) < min_parallel_size:
+        return match_pool_arrays(
+            driver_lat, driver_lng, driver_codes, seats,
+            passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+            use_spatial_index=use_spatial_index, assignment=assignment,
+            driver_minutes=driver_minutes, passenger_minutes=passenger_minutes,
+            time_window_minutes=time_window_minutes,
+            driver_dropoff_lat=driver_dropoff_lat, driver_dropoff_lng=driver_dropoff_lng
+        )
+
+    columns = dict(zip(SHARED_COLUMNS, (driver_lat, driver_lng, driver_codes, seats,
+                                        passenger_lat, passenger_lng, passenger_codes)))
+    if time_window_minutes is not None and driver_minutes is not None and passenger_minutes is not None:
+        columns.update(zip(TIME_COLUMNS, (driver_minutes, passenger_minutes)))
+    if driver_dropoff_lat is not None and driver_dropoff_lng is not None:
+        columns.update(zip(CORRIDOR_COLUMNS, (driver_dropoff_lat, driver_dropoff_lng)))
+    executor = get_executor(workers)
+    with SharedArrays(columns) as shared:
+        futures = [
+            executor.submit(solve_shard, shared.spec, drivers, passengers, max_distance_km, use_spatial_index,
+                            assignment, time_window_minutes)
+            for drivers, passengers in shards
+        ]
+        results = [result for future in futures for result in future.result()]
+
+    results.sort(key=lambda result: result[0])
+    return results
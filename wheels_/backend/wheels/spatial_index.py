@@ -0,0 +1,182 @@
+import math
+
+import numpy as np
+
+from .geo import haversine_km
+
+# Kilómetros por grado de latitud (esfera de radio medio)
+KM_PER_DEGREE_LAT = 111.195
+
+# Latitud de referencia para el ancho de las celdas en longitud (Bogotá)
+DEFAULT_REFERENCE_LAT = 4.65
+
+def candidate_radius(max_distance_km):
+    """
+    Radio de búsqueda en línea recta que no descarta pares válidos
+
+    La distancia por carretera nunca es menor que la distancia en línea recta, pero
+    geodesic (elipsoide) y Haversine (esfera) difieren hasta ~0.5% y el algoritmo
+    compara distancias redondeadas a 10 m, así que se deja un pequeño margen.
+
+    Args:
+        max_distance_km (float): Distancia máxima de emparejamiento
+
+    Returns:
+        float: Radio de búsqueda en kilómetros
+    """
+    return max_distance_km * 1.01 + 0.01
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Caja lat/lng que contiene el círculo de radius_km alrededor de (lat, lng)
+
+    Sirve para filtrar en la base de datos con comparaciones simples sobre
+    pickup_lat/pickup_lng antes de calcular distancias.
+
+    Args:
+        lat, lng (float): Centro del círculo
+        radius_km (float): Radio en kilómetros
+
+    Returns:
+        tuple: (lat_min, lat_max, lng_min, lng_max)
+    """
+    lat_span = radius_km / KM_PER_DEGREE_LAT
+    lng_span = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(min(abs(lat) + lat_span, 89.0))))
+    return lat - lat_span, lat + lat_span, lng - lng_span, lng + lng_span
+
+class GridIndex:
+    """
+    Índice espacial de rejilla uniforme lat/lng para consultas por radio
+
+    Cada punto se guarda en la celda que contiene sus coordenadas. Una consulta de
+    radio R solo revisa las celdas vecinas que pueden contener puntos a menos de R km,
+    por lo que el costo depende de la densidad local y no del tamaño total del pool.
+    Admite inserciones y eliminaciones para mantenerse vivo entre ejecuciones.
+    """
+
+    def __init__(self, cell_km=5.0, reference_lat=DEFAULT_REFERENCE_LAT):
+        """
+        Args:
+            cell_km (float): Tamaño de la celda en kilómetros (idealmente max_distance_km)
+            reference_lat (float): Latitud usada para convertir km a grados de longitud
+        """
+        self.cell_km = float(cell_km)
+        self.cell_lat = self.cell_km / KM_PER_DEGREE_LAT
+        self.cell_lng = self.cell_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(reference_lat)))
+        self._cells = {}
+        self._points = {}
+        # Arrays (claves, coordenadas) por celda, reconstruidos solo cuando la celda cambia
+        self._cell_arrays = {}
+
+    @classmethod
+    def from_points(cls, keys, lats, lngs, cell_km=5.0, reference_lat=DEFAULT_REFERENCE_LAT):
+        """
+        Construye un índice a partir de arrays de claves y coordenadas
+
+        Los puntos sin coordenadas válidas se ignoran.
+
+        Args:
+            keys (iterable): Claves de los puntos (p. ej. id del searching_pool)
+            lats, lngs (iterable): Coordenadas de los puntos
+
+        Returns:
+            GridIndex: Índice construido
+        """
+        index = cls(cell_km, reference_lat)
+        for key, lat, lng in zip(keys, lats, lngs):
+            index.insert(key, lat, lng)
+        return index
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_lat), math.floor(lng / self.cell_lng))
+
+    def insert(self, key, lat, lng):
+        """
+        Inserta o mueve un punto en el índice
+
+        Returns:
+            bool: False si las coordenadas no son válidas y el punto no se indexó
+        """
+        if key in self._points:
+            self.remove(key)
+        try:
+            lat = float(lat)
+            lng = float(lng)
+        except (TypeError, ValueError):
+            return False
+        if math.isnan(lat) or math.isnan(lng):
+            return False
+
+        cell = self._cell(lat, lng)
+        self._cells.setdefault(cell, {})[key] = (lat, lng)
+        self._points[key] = cell
+        self._cell_arrays.pop(cell, None)
+        return True
+
+    def remove(self, key):
+        """
+        Elimina un punto del índice
+
+        Returns:
+            bool: True si el punto existía
+        """
+        cell = self._points.pop(key, None)
+        if cell is None:
+            return False
+        bucket = self._cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+        self._cell_arrays.pop(cell, None)
+        return True
+
+    def _arrays(self, cell):
+        arrays = self._cell_arrays.get(cell)
+        if arrays is None:
+            bucket = self._cells[cell]
+            arrays = (np.array(list(bucket.keys())), np.array(list(bucket.values()), dtype=np.float64))
+            self._cell_arrays[cell] = arrays
+        return arrays
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def query_radius(self, lat, lng, radius_km):
+        """
+        Busca los puntos a menos de radius_km de (lat, lng) revisando solo celdas vecinas
+
+        Args:
+            lat, lng (float): Centro de la consulta
+            radius_km (float): Radio de búsqueda en kilómetros
+
+        Returns:
+            tuple: (ndarray de claves, ndarray de distancias en km)
+        """
+        try:
+            row, col = self._cell(float(lat), float(lng))
+        except (TypeError, ValueError):
+            # Centro sin coordenadas válidas (None o NaN)
+            return np.empty(0), np.empty(0)
+        rings = max(1, math.ceil(radius_km / self.cell_km))
+
+        keys = []
+        coords = []
+        for d_row in range(-rings, rings + 1):
+            for d_col in range(-rings, rings + 1):
+                cell = (row + d_row, col + d_col)
+                if cell in self._cells:
+                    cell_keys, cell_coords = self._arrays(cell)
+                    keys.append(cell_keys)
+                    coords.append(cell_coords)
+
+        if not keys:
+            return np.empty(0), np.empty(0)
+
+        keys = np.concatenate(keys)
+        coords = np.concatenate(coords)
+        distances = haversine_km(float(lat), float(lng), coords[:, 0], coords[:, 1])
+        inside = distances <= radius_km
+        return keys[inside], distances[inside]
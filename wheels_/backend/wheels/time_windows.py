@@ -0,0 +1,146 @@
+import math
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Columnas con la hora de salida de un registro, en orden de preferencia:
+# trip_datetime la guarda create_trip y hora_viaje la rellena la migración de profiles
+DEPARTURE_COLUMNS = ("trip_datetime", "hora_viaje")
+
+# Origen de los minutos (mismo que Timestamp.value)
+EPOCH = datetime(1970, 1, 1)
+
+def departure_minutes(value):
+    """
+    Convierte una fecha y hora a minutos (float) para comparar ventanas de salida
+
+    Las fechas con zona horaria se pasan a UTC; las que no la tienen se toman tal cual.
+
+    Args:
+        value: Fecha ISO (str), datetime o Timestamp
+
+    Returns:
+        float: Minutos desde la época (NaN si falta o no es válida)
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return math.nan
+    if isinstance(value, str):
+        # Camino rápido para los ISO 8601 de Supabase; pd.Timestamp acepta el resto
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - EPOCH).total_seconds() / 60
+    try:
+        timestamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return math.nan
+    if pd.isna(timestamp):
+        return math.nan
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+    return timestamp.value / 60e9
+
+def record_departure_minutes(record):
+    """
+    Hora de salida de un registro del searching_pool en minutos
+
+    Args:
+        record (dict | Series): Registro del searching_pool
+
+    Returns:
+        float: Minutos de la primera columna de DEPARTURE_COLUMNS con valor (NaN si ninguna)
+    """
+    for column in DEPARTURE_COLUMNS:
+        minutes = departure_minutes(record.get(column))
+        if not math.isnan(minutes):
+            return minutes
+    return math.nan
+
+def pool_departure_minutes(df):
+    """
+    Horas de salida de un DataFrame del searching_pool, alineadas con sus filas
+
+    Returns:
+        ndarray: Minutos por fila (NaN sin hora de salida)
+    """
+    columns = [column for column in DEPARTURE_COLUMNS if column in df.columns]
+    if not columns:
+        return np.full(len(df), np.nan)
+    return np.array([
+        record_departure_minutes(dict(zip(columns, values)))
+        for values in zip(*(df[column].tolist() for column in columns))
+    ], dtype=np.float64)
+
+def time_compatible(driver_minutes, passenger_minutes, tolerance_minutes):
+    """
+    Indica si las ventanas de salida de un conductor y un pasajero se solapan
+
+    Un registro sin hora de salida es compatible con cualquier hora (los registros
+    anteriores a trip_datetime siguen emparejándose como antes).
+
+    Args:
+        driver_minutes, passenger_minutes (float | ndarray): Horas de salida en minutos
+        tolerance_minutes (float): Diferencia máxima entre las horas de salida
+
+    Returns:
+        bool | ndarray: True para los pares compatibles
+    """
+    driver_minutes = np.asarray(driver_minutes, dtype=np.float64)
+    passenger_minutes = np.asarray(passenger_minutes, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        within = np.abs(driver_minutes - passenger_minutes) <= tolerance_minutes
+    return np.isnan(driver_minutes) | np.isnan(passenger_minutes) | within
+
+def time_window_buckets(buckets, driver_minutes, passenger_minutes, tolerance_minutes):
+    """
+    Divide cada grupo (conductores, pasajeros) por franjas de hora de salida
+
+    Los pasajeros de cada grupo se ordenan por hora una vez; los conductores se agrupan
+    en franjas del ancho de la tolerancia y cada franja recibe, con dos búsquedas
+    binarias, solo los pasajeros cuya hora puede estar dentro de la ventana (más los
+    pasajeros sin hora). Los conductores sin hora reciben todos los pasajeros del grupo.
+    Cada conductor queda en un solo subgrupo, así que no se repiten pares; la
+    comparación exacta se hace después con time_compatible.
+
+    Args:
+        buckets (list): Tuplas (posiciones de conductores, posiciones de pasajeros),
+            p. ej. de destination_buckets
+        driver_minutes, passenger_minutes (ndarray): Horas de salida en minutos
+        tolerance_minutes (float): Diferencia máxima entre las horas de salida
+
+    Returns:
+        list: Tuplas (posiciones de conductores, posiciones de pasajeros ordenadas)
+    """
+    width = tolerance_minutes if tolerance_minutes > 0 else 1.0
+    refined = []
+    for drivers, passengers in buckets:
+        p_minutes = passenger_minutes[passengers]
+        known = ~np.isnan(p_minutes)
+        unknown_passengers = passengers[~known]
+        order = np.argsort(p_minutes[known], kind="stable")
+        sorted_passengers = passengers[known][order]
+        sorted_minutes = p_minutes[known][order]
+
+        d_minutes = driver_minutes[drivers]
+        unknown_drivers = np.isnan(d_minutes)
+        if unknown_drivers.any():
+            refined.append((drivers[unknown_drivers], passengers))
+
+        known_drivers = drivers[~unknown_drivers]
+        known_minutes = d_minutes[~unknown_drivers]
+        if len(known_drivers) == 0:
+            continue
+        slots = pd.Series(np.arange(len(known_drivers))).groupby(np.floor(known_minutes / width)).indices
+        for positions in slots.values():
+            slot_minutes = known_minutes[positions]
+            low = np.searchsorted(sorted_minutes, slot_minutes.min() - tolerance_minutes, side="left")
+            high = np.searchsorted(sorted_minutes, slot_minutes.max() + tolerance_minutes, side="right")
+            candidates = np.sort(np.concatenate([sorted_passengers[low:high], unknown_passengers]))
+            if len(candidates):
+                refined.append((known_drivers[positions], candidates))
+    return refined
@@ -0,0 +1,366 @@
+import argparse
+import json
+import logging
+import math
+import os
+import time
+
+import numpy as np
+
+from .distance_provider import SqliteDistanceStore
+from .geo import haversine_km
+from .spatial_index import DEFAULT_REFERENCE_LAT, KM_PER_DEGREE_LAT
+
+logger = logging.getLogger(__name__)
+
+# Estimación sin calibrar: 1.5 minutos por kilómetro en línea recta (40 km/h), la misma de
+# HAVERSINE_SECONDS_PER_KM y de los textos '~N min' de las APIs
+DEFAULT_SECONDS_PER_KM = 90.0
+
+# Ningún tramo se estima más rápido que 120 km/h en línea recta (evita tiempos negativos
+# cuando las correcciones de hora y zona restan)
+MIN_SECONDS_PER_KM = 30.0
+
+# Bogotá está en UTC-5 todo el año; stored_at y los minutos de salida son UTC
+BOGOTA_UTC_OFFSET_HOURS = -5
+
+# Celdas de zona de origen/destino (km) y observaciones mínimas para que una zona tenga coeficiente
+DEFAULT_ZONE_KM = 2.0
+MIN_ZONE_SAMPLES = 20
+
+# Penalización ridge de las correcciones por hora y zona: las horas y zonas con pocas
+# observaciones quedan cerca de la velocidad global
+DEFAULT_RIDGE = 50.0
+
+# Filas del diseño que se arman a la vez al ajustar (acota la memoria con muchas observaciones)
+FIT_CHUNK_ROWS = 20000
+
+# Fuente de las observaciones de entrenamiento en la caché de distancias
+GOOGLE_SOURCE = "google_maps"
+
+def hour_of_day(timestamps):
+    """
+    Hora local de Bogotá (0-23) de instantes Unix en segundos
+
+    Args:
+        timestamps (array): Segundos desde 1970 UTC (NaN se conserva)
+
+    Returns:
+        ndarray: Hora del día como float
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    return np.floor((timestamps / 3600 + BOGOTA_UTC_OFFSET_HOURS) % 24)
+
+class TravelTimeEstimator:
+    """
+    Tiempo de manejo estimado a partir de la distancia en línea recta
+
+    segundos = base[hora] + km * (velocidad[hora] + zona_origen + zona_destino)
+
+    La tabla de coeficientes se ajusta fuera de línea con observaciones de Google
+    guardadas en la caché de distancias (fit_from_store) y se guarda como JSON. Las
+    predicciones son operaciones de NumPy con broadcasting, así que una matriz completa
+    de candidatos conductor x pasajero se estima en una sola llamada. Sin tabla
+    (default()) se reproduce la estimación fija de 1.5 minutos por kilómetro.
+    """
+
+    def __init__(self, intercept=0.0, seconds_per_km=DEFAULT_SECONDS_PER_KM, hour_intercept=None,
+                 hour_seconds_per_km=None, zones=(), origin_seconds_per_km=(), destination_seconds_per_km=(),
+                 zone_km=DEFAULT_ZONE_KM, report=None):
+        """
+        Args:
+            intercept (float): Segundos fijos de cualquier trayecto
+            seconds_per_km (float): Segundos por km en línea recta
+            hour_intercept, hour_seconds_per_km (list): Correcciones de cada hora (24 valores)
+            zones (list): Códigos de las zonas con coeficiente (ver zone_codes)
+            origin_seconds_per_km, destination_seconds_per_km (list): Corrección por km de cada zona
+            zone_km (float): Tamaño de las celdas de zona
+            report (dict): Error medido contra observaciones apartadas al entrenar
+        """
+        self.intercept = float(intercept)
+        self.seconds_per_km = float(seconds_per_km)
+        self.hour_intercept = np.zeros(24) if hour_intercept is None else np.asarray(hour_intercept, dtype=np.float64)
+        self.hour_seconds_per_km = (np.zeros(24) if hour_seconds_per_km is None
+                                    else np.asarray(hour_seconds_per_km, dtype=np.float64))
+        order = np.argsort(np.asarray(zones, dtype=np.int64))
+        self.zones = np.asarray(zones, dtype=np.int64)[order]
+        self.origin_seconds_per_km = np.asarray(origin_seconds_per_km, dtype=np.float64)[order]
+        self.destination_seconds_per_km = np.asarray(destination_seconds_per_km, dtype=np.float64)[order]
+        self.zone_km = float(zone_km)
+        self.report = report or {}
+
+    @classmethod
+    def default(cls):
+        """Estimador sin calibrar (DEFAULT_SECONDS_PER_KM)"""
+        return cls()
+
+    @property
+    def calibrated(self):
+        return bool(self.report)
+
+    def zone_codes(self, lat, lng):
+        """Código entero de la celda de zona de cada punto"""
+        cell_lat = self.zone_km / KM_PER_DEGREE_LAT
+        cell_lng = self.zone_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(DEFAULT_REFERENCE_LAT)))
+        rows = np.floor(np.asarray(lat, dtype=np.float64) / cell_lat)
+        cols = np.floor(np.asarray(lng, dtype=np.float64) / cell_lng)
+        codes = np.where(np.isfinite(rows) & np.isfinite(cols), rows * 100000 + cols, 0)
+        return codes.astype(np.int64)
+
+    def _zone_rates(self, lat, lng, rates):
+        codes = self.zone_codes(lat, lng)
+        if len(self.zones) == 0:
+            return np.zeros(codes.shape)
+        positions = np.minimum(np.searchsorted(self.zones, codes), len(self.zones) - 1)
+        return np.where(self.zones[positions] == codes, rates[positions], 0.0)
+
+    @staticmethod
+    def _hours(hour):
+        if hour is None:
+            hour = hour_of_day(time.time())
+        hour = np.asarray(hour, dtype=np.float64)
+        # Sin hora conocida se usa la hora actual
+        hour = np.where(np.isnan(hour), hour_of_day(time.time()), hour)
+        return hour.astype(np.int64) % 24
+
+    def predict_km(self, km, hour=None):
+        """
+        Segundos estimados solo con la distancia (sin corrección de zona)
+
+        Args:
+            km (array): Distancia en línea recta
+            hour (array): Hora local de salida (None la actual)
+
+        Returns:
+            ndarray: Segundos
+        """
+        km = np.asarray(km, dtype=np.float64)
+        hours = self._hours(hour)
+        seconds = self.intercept + self.hour_intercept[hours] + km * (self.seconds_per_km + self.hour_seconds_per_km[hours])
+        return np.maximum(seconds, km * MIN_SECONDS_PER_KM)
+
+    def predict(self, origin_lat, origin_lng, destination_lat, destination_lng, hour=None):
+        """
+        Segundos estimados de cada origen a cada destino (con broadcasting)
+
+        Para una matriz de candidatos basta pasar los orígenes como columna
+        (origin_lat[:, None]) y los destinos como fila.
+
+        Args:
+            origin_lat, origin_lng, destination_lat, destination_lng (array): Coordenadas
+            hour (array): Hora local de salida (None o NaN la actual)
+
+        Returns:
+            ndarray: Segundos (NaN si faltan coordenadas)
+        """
+        km = haversine_km(origin_lat, origin_lng, destination_lat, destination_lng)
+        hours = self._hours(hour)
+        rate = (self.seconds_per_km + self.hour_seconds_per_km[hours]
+                + self._zone_rates(origin_lat, origin_lng, self.origin_seconds_per_km)
+                + self._zone_rates(destination_lat, destination_lng, self.destination_seconds_per_km))
+        seconds = self.intercept + self.hour_intercept[hours] + km * rate
+        return np.maximum(seconds, km * MIN_SECONDS_PER_KM)
+
+    @classmethod
+    def fit(cls, origin_lat, origin_lng, destination_lat, destination_lng, hours, seconds,
+            zone_km=DEFAULT_ZONE_KM, ridge=DEFAULT_RIDGE, min_zone_samples=MIN_ZONE_SAMPLES):
+        """
+        Ajusta la tabla de coeficientes por mínimos cuadrados con penalización ridge
+
+        Args:
+            origin_lat, origin_lng, destination_lat, destination_lng (array): Coordenadas observadas
+            hours (array): Hora local de cada observación
+            seconds (array): Duración observada (Google)
+            zone_km (float): Tamaño de las celdas de zona
+            ridge (float): Penalización de las correcciones por hora y zona
+            min_zone_samples (int): Observaciones mínimas de una zona para tener coeficiente
+
+        Returns:
+            TravelTimeEstimator: Estimador ajustado
+        """
+        origin_lat, origin_lng, destination_lat, destination_lng, hours, seconds = (
+            np.asarray(values, dtype=np.float64)
+            for values in (origin_lat, origin_lng, destination_lat, destination_lng, hours, seconds)
+        )
+        km = haversine_km(origin_lat, origin_lng, destination_lat, destination_lng)
+        hours = hours.astype(np.int64) % 24
+        layout = cls(zone_km=zone_km)
+        origin_codes = layout.zone_codes(origin_lat, origin_lng)
+        destination_codes = layout.zone_codes(destination_lat, destination_lng)
+        codes, counts = np.unique(np.concatenate([origin_codes, destination_codes]), return_counts=True)
+        zones = codes[counts >= min_zone_samples]
+
+        # Columnas: base, km, base por hora, km por hora, km por zona de origen y de destino
+        width = 2 + 48 + 2 * len(zones)
+        gram = np.zeros((width, width))
+        moment = np.zeros(width)
+        for start in range(0, len(km), FIT_CHUNK_ROWS):
+            rows = slice(start, start + FIT_CHUNK_ROWS)
+            design = np.zeros((len(km[rows]), width))
+            index = np.arange(len(km[rows]))
+            design[:, 0] = 1.0
+            design[:, 1] = km[rows]
+            design[index, 2 + hours[rows]] = 1.0
+            design[index, 26 + hours[rows]] = km[rows]
+            for offset, zone_codes in ((50, origin_codes[rows]), (50 + len(zones), destination_codes[rows])):
+                positions = np.minimum(np.searchsorted(zones, zone_codes), max(len(zones) - 1, 0))
+                known = (zones[positions] == zone_codes) if len(zones) else np.zeros(len(zone_codes), dtype=bool)
+                design[index[known], offset + positions[known]] = km[rows][known]
+            gram += design.T @ design
+            moment += design.T @ seconds[rows]
+
+        penalty = np.full(width, float(ridge))
+        penalty[:2] = 0.0
+        coefficients = np.linalg.solve(gram + np.diag(penalty) + np.eye(width) * 1e-9, moment)
+        return cls(
+            intercept=coefficients[0], seconds_per_km=coefficients[1],
+            hour_intercept=coefficients[2:26], hour_seconds_per_km=coefficients[26:50],
+            zones=zones, origin_seconds_per_km=coefficients[50:50 + len(zones)],
+            destination_seconds_per_km=coefficients[50 + len(zones):], zone_km=zone_km
+        )
+
+    def evaluate(self, origin_lat, origin_lng, destination_lat, destination_lng, hours, seconds):
+        """
+        Error contra observaciones de Google, junto al de la estimación fija
+
+        Returns:
+            dict: samples, mae/rmse/bias en segundos, mape, y baseline_mae/baseline_mape
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        predicted = self.predict(origin_lat, origin_lng, destination_lat, destination_lng, hours)
+        baseline = haversine_km(origin_lat, origin_lng, destination_lat, destination_lng) * DEFAULT_SECONDS_PER_KM
+        error, baseline_error = predicted - seconds, baseline - seconds
+        positive = seconds > 0
+        return {
+            "samples": int(len(seconds)),
+            "mae_seconds": round(float(np.mean(np.abs(error))), 1),
+            "rmse_seconds": round(float(np.sqrt(np.mean(error ** 2))), 1),
+            "bias_seconds": round(float(np.mean(error)), 1),
+            "mape": round(float(np.mean(np.abs(error[positive]) / seconds[positive])), 3),
+            "baseline_mae_seconds": round(float(np.mean(np.abs(baseline_error))), 1),
+            "baseline_mape": round(float(np.mean(np.abs(baseline_error[positive]) / seconds[positive])), 3)
+        }
+
+    def to_dict(self):
+        return {
+            "intercept": self.intercept,
+            "seconds_per_km": self.seconds_per_km,
+            "hour_intercept": self.hour_intercept.tolist(),
+            "hour_seconds_per_km": self.hour_seconds_per_km.tolist(),
+            "zone_km": self.zone_km,
+            "zones": self.zones.tolist(),
+            "origin_seconds_per_km": self.origin_seconds_per_km.tolist(),
+            "destination_seconds_per_km": self.destination_seconds_per_km.tolist(),
+            "report": self.report
+        }
+
+    def save(self, path):
+        """Guarda la tabla de coeficientes en JSON"""
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(self.to_dict(), handle, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Carga una tabla guardada con save()"""
+        with open(path, encoding="utf-8") as handle:
+            return cls(**json.load(handle))
+
+    def stats(self):
+        """Resumen del estimador para /api/health"""
+        return {
+            "calibrated": self.calibrated,
+            "seconds_per_km": round(self.seconds_per_km, 1),
+            "zones": len(self.zones),
+            "holdout": self.report.get("holdout")
+        }
+
+def load_travel_time_estimator(path=None):
+    """
+    Estimador de TRAVEL_TIME_MODEL_PATH (o de path), o el estimador fijo si no hay tabla
+
+    Returns:
+        TravelTimeEstimator: Estimador listo para usar
+    """
+    path = path or os.getenv("TRAVEL_TIME_MODEL_PATH")
+    if not path:
+        return TravelTimeEstimator.default()
+    try:
+        estimator = TravelTimeEstimator.load(path)
+        logger.info(f"⏱️ Estimador de tiempos cargado de {path}: {estimator.report.get('holdout')}")
+        return estimator
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"⚠️ No se pudo cargar el estimador de tiempos de {path}: {e}")
+        return TravelTimeEstimator.default()
+
+def load_observations(store, source=GOOGLE_SOURCE):
+    """
+    Observaciones guardadas en la caché de distancias en disco
+
+    Solo se usan los pares de Google con coordenadas (no direcciones de texto). La hora
+    de cada observación es la de stored_at, cuando Google respondió.
+
+    Args:
+        store (SqliteDistanceStore | str): Nivel en disco de la caché o su archivo
+        source (str): Fuente de las observaciones
+
+    Returns:
+        dict: Arrays origin_lat, origin_lng, destination_lat, destination_lng, hours, seconds
+    """
+    if isinstance(store, str):
+        store = SqliteDistanceStore(store)
+    fields = ("origin_lat", "origin_lng", "destination_lat", "destination_lng", "stored_at", "seconds")
+    columns = {name: [] for name in fields}
+    for origin, destination, _, seconds, _, stored_at in store.rows(source):
+        if isinstance(origin, str) or isinstance(destination, str):
+            continue
+        for name, value in zip(fields, (*origin, *destination, stored_at, seconds)):
+            columns[name].append(value)
+    observations = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    observations["hours"] = hour_of_day(observations.pop("stored_at"))
+    return observations
+
+def fit_observations(observations, holdout_fraction=0.2, seed=0, **fit_kwargs):
+    """
+    Ajusta con una parte de las observaciones y mide el error con el resto
+
+    Args:
+        observations (dict): Arrays como los de load_observations
+        holdout_fraction (float): Fracción apartada para medir el error
+        seed (int): Semilla de la partición
+
+    Returns:
+        TravelTimeEstimator: Estimador con el error de la partición apartada en report["holdout"]
+    """
+    count = len(observations["seconds"])
+    if count == 0:
+        raise ValueError("No hay observaciones de Google para ajustar el estimador")
+    order = np.random.default_rng(seed).permutation(count)
+    split = int(round(count * (1 - holdout_fraction)))
+    train, test = order[:split], order[split:]
+    fields = ("origin_lat", "origin_lng", "destination_lat", "destination_lng", "hours", "seconds")
+    estimator = TravelTimeEstimator.fit(*(observations[name][train] for name in fields), **fit_kwargs)
+    estimator.report = {"train_samples": int(len(train))}
+    if len(test):
+        estimator.report["holdout"] = estimator.evaluate(*(observations[name][test] for name in fields))
+    return estimator
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ajusta el estimador de tiempos con la caché de distancias de Google")
+    parser.add_argument("store", help="Archivo SQLite de DISTANCE_CACHE_PATH")
+    parser.add_argument("output", help="Archivo JSON de la tabla de coeficientes (TRAVEL_TIME_MODEL_PATH)")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fracción de observaciones para medir el error")
+    parser.add_argument("--zone-km", type=float, default=DEFAULT_ZONE_KM)
+    parser.add_argument("--ridge", type=float, default=DEFAULT_RIDGE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    estimator = fit_observations(
+        load_observations(args.store), holdout_fraction=args.holdout, seed=args.seed,
+        zone_km=args.zone_km, ridge=args.ridge
+    )
+    estimator.save(args.output)
+    print(json.dumps(estimator.report, indent=2))
+    return estimator
+
+if __name__ == '__main__':
+    main()
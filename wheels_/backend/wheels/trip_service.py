@@ -2,6 +2,8 @@ from supabase import create_client
 import os
 from datetime import datetime
 
+from .profile_directory import profile_directory
+
 # Configuración de Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://ozvjmkvmpxxviveniuwt.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "your-supabase-key")
@@ -22,16 +24,14 @@ def create_trip(driver_email, trip_data):
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         
         # Obtener perfil del conductor
-        driver_profile = supabase.table("profiles").select("*").eq("email", driver_email).execute()
+        driver_id = profile_directory.get_id(supabase, driver_email)
         
-        if not driver_profile.data:
+        if driver_id is None:
             return {
                 "success": False,
                 "error": "Perfil de conductor no encontrado"
             }
         
-        driver_id = driver_profile.data[0]["id"]
-        
         # Datos para insertar en searching_pool
         trip_insert_data = {
             "driver_id": driver_id,
@@ -104,16 +104,14 @@ def book_trip(trip_id, passenger_email, seats_requested=1):
             }
         
         # Obtener perfil del pasajero
-        passenger_profile = supabase.table("profiles").select("*").eq("email", passenger_email).execute()
+        passenger_id = profile_directory.get_id(supabase, passenger_email)
         
-        if not passenger_profile.data:
+        if passenger_id is None:
             return {
                 "success": False,
                 "error": "Perfil de pasajero no encontrado"
             }
         
-        passenger_id = passenger_profile.data[0]["id"]
-        
         # Insertar solicitud en trip_requests
         request_data = {
             "passenger_id": passenger_id,
@@ -0,0 +1,499 @@
+import numpy as np
+import pandas as pd
+
+from .geo import haversine_km
+from .spatial_index import GridIndex, KM_PER_DEGREE_LAT, candidate_radius
+from .assignment import (
+    DEFAULT_MAX_CANDIDATES_PER_PASSENGER, greedy_assignment, nearest_assignment, optimal_assignment
+)
+from .corridor import DriverCorridors, corridor_feasible
+from .destinations import destination_keys
+from .time_windows import pool_departure_minutes, time_compatible, time_window_buckets
+
+# Número máximo de celdas de la matriz conductor x pasajero calculadas a la vez
+# (~32 MB en float64). Los conductores se procesan por bloques para no exceder este límite.
+MAX_MATRIX_CELLS = 4_000_000
+
+# Estrategias de asignación de cupos:
+# - 'first_fit': cada conductor toma los primeros pasajeros factibles (comportamiento histórico,
+#   un pasajero puede aparecer en varios conductores)
+# - 'optimal': asignación global con capacidades, cada pasajero a lo sumo en un conductor
+#   y distancia total mínima
+# - 'greedy': asignación global voraz por distancia creciente
+# - 'nearest': cada conductor toma sus pasajeros factibles más cercanos (como 'first_fit',
+#   cada conductor por separado, pero por distancia en lugar del orden del pool)
+ASSIGNMENT_STRATEGIES = ("first_fit", "optimal", "greedy", "nearest")
+
+def filter_active_pool(searching_pool_df):
+    """
+    Filtra los registros activos del searching_pool (status NULL, vacío o 'searching')
+
+    Args:
+        searching_pool_df (DataFrame): Registros crudos del searching_pool
+
+    Returns:
+        DataFrame: Registros activos
+    """
+    status = searching_pool_df["status"]
+    return searching_pool_df[status.isna() | (status == "searching") | (status == "")]
+
+def split_unique_users(active_pool):
+    """
+    Separa conductores y pasajeros, conservando el registro más reciente de cada correo
+
+    Args:
+        active_pool (DataFrame): Registros activos del searching_pool
+
+    Returns:
+        tuple: DataFrames (drivers, passengers)
+    """
+    ordered = active_pool.sort_values("created_at", ascending=False)
+    drivers = ordered[ordered["tipo_de_usuario"] == "conductor"].drop_duplicates(subset=["correo_usuario"])
+    passengers = ordered[ordered["tipo_de_usuario"] == "pasajero"].drop_duplicates(subset=["correo_usuario"])
+    return drivers, passengers
+
+def pool_coordinates(df, lat_column="pickup_lat", lng_column="pickup_lng"):
+    """
+    Extrae las coordenadas de un DataFrame como arrays float64 (NaN si faltan)
+
+    Args:
+        df (DataFrame): Registros del pool
+        lat_column (str): Columna de latitud
+        lng_column (str): Columna de longitud
+
+    Returns:
+        tuple: Arrays (lat, lng)
+    """
+    lat = pd.to_numeric(df[lat_column], errors="coerce").to_numpy(dtype=np.float64)
+    lng = pd.to_numeric(df[lng_column], errors="coerce").to_numpy(dtype=np.float64)
+    return lat, lng
+
+def available_seats_array(drivers):
+    """
+    Extrae los cupos disponibles de los conductores (1 por defecto)
+
+    Args:
+        drivers (DataFrame): Conductores
+
+    Returns:
+        ndarray: Cupos por conductor
+    """
+    if "available_seats" not in drivers.columns:
+        return np.ones(len(drivers), dtype=np.int64)
+    seats = pd.to_numeric(drivers["available_seats"], errors="coerce").fillna(1)
+    return np.clip(seats.to_numpy(dtype=np.float64), 0, None).astype(np.int64)
+
+def destination_codes(driver_keys, passenger_keys):
+    """
+    Codifica las claves de destino de ambos lados con un mismo diccionario de enteros
+
+    Args:
+        driver_keys (array-like): Clave de destino de cada conductor
+        passenger_keys (array-like): Clave de destino de cada pasajero
+
+    Returns:
+        tuple: Arrays (códigos de conductores, códigos de pasajeros); -1 si falta el destino
+    """
+    values = pd.Series(list(driver_keys) + list(passenger_keys), dtype=object)
+    codes, _ = pd.factorize(values)
+    return codes[:len(driver_keys)], codes[len(driver_keys):]
+
+def pool_destination_keys(df, destination_column="destino", normalize=True):
+    """
+    Claves de destino por fila: canónicas (ver wheels.destinations) o el valor tal cual
+
+    Args:
+        df (DataFrame): Registros del pool
+        destination_column (str): Columna con el texto del destino
+        normalize (bool): Usa la clave canónica; si es False compara el valor exacto
+
+    Returns:
+        ndarray: Claves alineadas con las filas de df
+    """
+    if normalize:
+        return destination_keys(df, destination_column)
+    return df[destination_column].to_numpy(dtype=object)
+
+def destination_buckets(driver_codes, passenger_codes):
+    """
+    Agrupa conductores y pasajeros por código de destino (hash join)
+
+    Args:
+        driver_codes (ndarray): Código de destino de cada conductor
+        passenger_codes (ndarray): Código de destino de cada pasajero
+
+    Returns:
+        list: Tuplas (posiciones de conductores, posiciones de pasajeros) por destino compartido
+    """
+    passenger_groups = pd.Series(np.arange(len(passenger_codes))).groupby(passenger_codes).indices
+    driver_groups = pd.Series(np.arange(len(driver_codes))).groupby(driver_codes).indices
+
+    buckets = []
+    for code, drivers in driver_groups.items():
+        if code < 0 or code not in passenger_groups:
+            continue
+        buckets.append((drivers, passenger_groups[code]))
+    return buckets
+
+def candidate_buckets(driver_codes, passenger_codes, driver_minutes=None, passenger_minutes=None,
+                      time_window_minutes=None):
+    """
+    Grupos (conductores, pasajeros) que pueden formar pares: mismo destino y, con
+    time_window_minutes, horas de salida cercanas (ver time_window_buckets)
+
+    Returns:
+        list: Tuplas (posiciones de conductores, posiciones de pasajeros)
+    """
+    buckets = destination_buckets(driver_codes, passenger_codes)
+    if time_window_minutes is None or driver_minutes is None or passenger_minutes is None:
+        return buckets
+    return time_window_buckets(buckets, driver_minutes, passenger_minutes, time_window_minutes)
+
+def allocate_seats(feasible, seats):
+    """
+    Asigna cupos en orden de aparición: cada conductor toma los primeros pasajeros factibles
+
+    Args:
+        feasible (ndarray): Matriz (D, P) de pares factibles
+        seats (ndarray): Cupos por conductor
+
+    Returns:
+        ndarray: Matriz (D, P) con los pares asignados
+    """
+    rank = np.cumsum(feasible, axis=1)
+    return feasible & (rank <= seats[:, None])
+
+def allocate_seats_sparse(driver_idx, passenger_idx, seats):
+    """
+    Versión dispersa de allocate_seats para listas de pares ordenadas por (conductor, pasajero)
+
+    Args:
+        driver_idx (ndarray): Posición del conductor de cada par
+        passenger_idx (ndarray): Posición del pasajero de cada par
+        seats (ndarray): Cupos por conductor
+
+    Returns:
+        ndarray: Máscara booleana de los pares asignados
+    """
+    if len(driver_idx) == 0:
+        return np.zeros(0, dtype=bool)
+    group_start = np.r_[True, driver_idx[1:] != driver_idx[:-1]]
+    start_pos = np.maximum.accumulate(np.where(group_start, np.arange(len(driver_idx)), 0))
+    rank = np.arange(len(driver_idx)) - start_pos + 1
+    return rank <= seats[driver_idx]
+
+def _sort_pairs(pairs_d, pairs_p, pairs_km):
+    if not pairs_d:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    driver_idx = np.concatenate(pairs_d)
+    passenger_idx = np.concatenate(pairs_p)
+    distances = np.concatenate(pairs_km)
+    order = np.lexsort((passenger_idx, driver_idx))
+    return driver_idx[order], passenger_idx[order], distances[order]
+
+def dense_candidate_pairs(driver_lat, driver_lng, driver_codes,
+                          passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+                          driver_minutes=None, passenger_minutes=None, time_window_minutes=None):
+    """
+    Genera los pares factibles comparando solo filas con el mismo destino
+
+    Dentro de cada destino recorre la matriz conductor x pasajero por bloques: primero
+    descarta con una caja de latitud/longitud (restas y comparaciones) y solo calcula la
+    distancia Haversine para los pares que sobreviven. Con time_window_minutes también
+    descarta, antes de la distancia, los pares cuyas horas de salida no se solapan.
+
+    Returns:
+        tuple: Arrays (conductor, pasajero, distancia) ordenados por conductor y pasajero
+    """
+    radius = candidate_radius(max_distance_km)
+    lat_span = radius / KM_PER_DEGREE_LAT
+    lng_span = radius / (KM_PER_DEGREE_LAT * np.cos(np.radians(np.minimum(np.abs(driver_lat) + lat_span, 89.0))))
+    pairs_d, pairs_p, pairs_km = [], [], []
+    use_time = time_window_minutes is not None and driver_minutes is not None and passenger_minutes is not None
+
+    for bucket_drivers, bucket_passengers in candidate_buckets(
+        driver_codes, passenger_codes, driver_minutes, passenger_minutes, time_window_minutes
+    ):
+        p_lat = passenger_lat[bucket_passengers]
+        p_lng = passenger_lng[bucket_passengers]
+        p_minutes = passenger_minutes[bucket_passengers] if use_time else None
+        chunk = max(1, MAX_MATRIX_CELLS // len(bucket_passengers))
+
+        for start in range(0, len(bucket_drivers), chunk):
+            block = bucket_drivers[start:start + chunk]
+            # NaN (coordenadas faltantes) nunca cumple las comparaciones
+            near = (
+                (np.abs(driver_lat[block, None] - p_lat[None, :]) <= lat_span)
+                & (np.abs(driver_lng[block, None] - p_lng[None, :]) <= lng_span[block, None])
+            )
+            if use_time:
+                near &= time_compatible(driver_minutes[block, None], p_minutes[None, :], time_window_minutes)
+            rows, cols = np.nonzero(near)
+            rows = block[rows]
+            cols = bucket_passengers[cols]
+
+            distances = haversine_km(driver_lat[rows], driver_lng[rows], passenger_lat[cols], passenger_lng[cols])
+            # Se compara la distancia redondeada a 10 m, igual que el algoritmo iterativo
+            inside = np.round(distances, 2) <= max_distance_km
+            pairs_d.append(rows[inside])
+            pairs_p.append(cols[inside])
+            pairs_km.append(distances[inside])
+
+    return _sort_pairs(pairs_d, pairs_p, pairs_km)
+
+def indexed_candidate_pairs(driver_lat, driver_lng, driver_codes,
+                            passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+                            index=None, passenger_keys=None,
+                            driver_minutes=None, passenger_minutes=None, time_window_minutes=None):
+    """
+    Genera los pares factibles consultando índices espaciales de pasajeros
+
+    Sin índice externo se construye un GridIndex por destino (y franja de salida con
+    time_window_minutes), así cada consulta solo ve pasajeros del mismo destino. Con un
+    índice vivo (indexado por id) se consulta ese índice y se filtra por destino.
+
+    Args:
+        index (GridIndex): Índice de pasajeros mantenido por el llamador
+        passenger_keys (list): Clave en el índice de cada pasajero, por posición
+
+    Returns:
+        tuple: Arrays (conductor, pasajero, distancia) ordenados por conductor y pasajero
+    """
+    radius = candidate_radius(max_distance_km)
+    pairs_d, pairs_p, pairs_km = [], [], []
+    use_time = time_window_minutes is not None and driver_minutes is not None and passenger_minutes is not None
+
+    if index is None:
+        searches = []
+        for bucket_drivers, bucket_passengers in candidate_buckets(
+            driver_codes, passenger_codes, driver_minutes, passenger_minutes, time_window_minutes
+        ):
+            bucket_index = GridIndex.from_points(
+                bucket_passengers, passenger_lat[bucket_passengers], passenger_lng[bucket_passengers], cell_km=radius
+            )
+            searches.append((bucket_drivers, bucket_index, None))
+    else:
+        searches = [(np.flatnonzero(driver_codes >= 0), index, pd.Index(passenger_keys))]
+
+    for drivers, search_index, position in searches:
+        for d in drivers:
+            keys, km = search_index.query_radius(driver_lat[d], driver_lng[d], radius)
+            if len(keys) == 0:
+                continue
+            if position is None:
+                cols = keys.astype(np.int64)
+            else:
+                # Un índice vivo puede contener claves que no están en este lote de pasajeros
+                cols = position.get_indexer(keys)
+                present = cols >= 0
+                cols, km = cols[present], km[present]
+                same_destination = passenger_codes[cols] == driver_codes[d]
+                cols, km = cols[same_destination], km[same_destination]
+            if use_time:
+                compatible = time_compatible(driver_minutes[d], passenger_minutes[cols], time_window_minutes)
+                cols, km = cols[compatible], km[compatible]
+            inside = np.round(km, 2) <= max_distance_km
+            pairs_d.append(np.full(int(inside.sum()), d, dtype=np.int64))
+            pairs_p.append(cols[inside])
+            pairs_km.append(km[inside])
+
+    return _sort_pairs(pairs_d, pairs_p, pairs_km)
+
+def corridor_candidate_pairs(driver_lat, driver_lng, driver_dropoff_lat, driver_dropoff_lng, driver_codes,
+                             passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+                             driver_minutes=None, passenger_minutes=None, time_window_minutes=None):
+    """
+    Genera los pares factibles en modo corredor (ver wheels.corridor)
+
+    Igual que dense_candidate_pairs, pero la caja de cada conductor cubre todo su
+    trayecto origen -> destino y la prueba exacta es la distancia al segmento (o al
+    punto de partida). La geometría de los corredores se calcula una vez por lote.
+
+    Returns:
+        tuple: Arrays (conductor, pasajero, distancia desde el punto de partida)
+               ordenados por conductor y pasajero
+    """
+    corridors = DriverCorridors(driver_lat, driver_lng, driver_dropoff_lat, driver_dropoff_lng, max_distance_km)
+    pairs_d, pairs_p, pairs_km = [], [], []
+    use_time = time_window_minutes is not None and driver_minutes is not None and passenger_minutes is not None
+
+    for bucket_drivers, bucket_passengers in candidate_buckets(
+        driver_codes, passenger_codes, driver_minutes, passenger_minutes, time_window_minutes
+    ):
+        p_lat = passenger_lat[bucket_passengers]
+        p_lng = passenger_lng[bucket_passengers]
+        p_minutes = passenger_minutes[bucket_passengers] if use_time else None
+        chunk = max(1, MAX_MATRIX_CELLS // len(bucket_passengers))
+
+        for start in range(0, len(bucket_drivers), chunk):
+            block = bucket_drivers[start:start + chunk]
+            near = corridors.box_mask(block, p_lat, p_lng)
+            if use_time:
+                near &= time_compatible(driver_minutes[block, None], p_minutes[None, :], time_window_minutes)
+            rows, cols = np.nonzero(near)
+            rows = block[rows]
+            cols = bucket_passengers[cols]
+
+            inside, distances = corridor_feasible(
+                corridors, rows, passenger_lat[cols], passenger_lng[cols], max_distance_km
+            )
+            pairs_d.append(rows[inside])
+            pairs_p.append(cols[inside])
+            pairs_km.append(distances[inside])
+
+    return _sort_pairs(pairs_d, pairs_p, pairs_km)
+
+def match_pool_arrays(driver_lat, driver_lng, driver_codes, seats,
+                      passenger_lat, passenger_lng, passenger_codes, max_distance_km=5,
+                      use_spatial_index=False, index=None, passenger_ids=None, assignment="first_fit",
+                      max_candidates_per_passenger=DEFAULT_MAX_CANDIDATES_PER_PASSENGER,
+                      driver_minutes=None, passenger_minutes=None, time_window_minutes=None,
+                      driver_dropoff_lat=None, driver_dropoff_lng=None):
+    """
+    Núcleo del motor vectorizado sobre columnas NumPy ya extraídas
+
+    Con el destino en coordenadas de los conductores (driver_dropoff_lat/lng) se usa el
+    modo corredor: la caja de cada corredor reemplaza al índice espacial.
+
+    Args:
+        driver_lat, driver_lng (ndarray): Punto de partida de cada conductor
+        driver_codes (ndarray): Código de destino de cada conductor (-1 sin destino)
+        seats (ndarray): Cupos por conductor
+        passenger_lat, passenger_lng (ndarray): Punto de recogida de cada pasajero
+        passenger_codes (ndarray): Código de destino de cada pasajero, mismo diccionario
+        max_distance_km (float): Distancia máxima para emparejar
+        use_spatial_index (bool): Construye índices GridIndex de pasajeros para este lote
+        index (GridIndex): Índice de pasajeros mantenido por el llamador, indexado por id
+        passenger_ids (list): id de cada pasajero (requerido con index)
+        assignment (str): Estrategia de cupos, ver ASSIGNMENT_STRATEGIES
+        max_candidates_per_passenger (int): Poda del grafo para assignment='optimal'
+        driver_minutes, passenger_minutes (ndarray): Horas de salida en minutos (NaN sin hora)
+        time_window_minutes (float): Diferencia máxima entre horas de salida (None sin filtro)
+        driver_dropoff_lat, driver_dropoff_lng (ndarray): Destino de cada conductor para
+            el modo corredor (None usa solo el radio desde el punto de partida)
+
+    Returns:
+        list: Tuplas (posición del conductor, posiciones de pasajeros, distancias en km)
+    """
+    if len(driver_lat) == 0 or len(passenger_lat) == 0:
+        return []
+
+    if driver_dropoff_lat is not None and driver_dropoff_lng is not None:
+        pairs = corridor_candidate_pairs(
+            driver_lat, driver_lng, driver_dropoff_lat, driver_dropoff_lng, driver_codes,
+            passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+            driver_minutes=driver_minutes, passenger_minutes=passenger_minutes,
+            time_window_minutes=time_window_minutes
+        )
+    elif use_spatial_index or index is not None:
+        pairs = indexed_candidate_pairs(
+            driver_lat, driver_lng, driver_codes,
+            passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+            index=index, passenger_keys=passenger_ids if index is not None else None,
+            driver_minutes=driver_minutes, passenger_minutes=passenger_minutes,
+            time_window_minutes=time_window_minutes
+        )
+    else:
+        pairs = dense_candidate_pairs(
+            driver_lat, driver_lng, driver_codes,
+            passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+            driver_minutes=driver_minutes, passenger_minutes=passenger_minutes,
+            time_window_minutes=time_window_minutes
+        )
+
+    return assign_pairs(*pairs, seats, assignment=assignment, max_candidates_per_passenger=max_candidates_per_passenger)
+
+def assign_pairs(driver_idx, passenger_idx, distances, seats, assignment="first_fit",
+                 max_candidates_per_passenger=DEFAULT_MAX_CANDIDATES_PER_PASSENGER):
+    """
+    Asigna cupos sobre una lista de pares factibles y agrupa el resultado por conductor
+
+    Args:
+        driver_idx, passenger_idx, distances (ndarray): Pares ordenados por conductor y pasajero
+        seats (ndarray): Cupos por conductor
+        assignment (str): Estrategia de cupos, ver ASSIGNMENT_STRATEGIES
+        max_candidates_per_passenger (int): Poda del grafo para assignment='optimal'
+
+    Returns:
+        list: Tuplas (posición del conductor, posiciones de pasajeros, distancias en km)
+    """
+    if assignment == "optimal":
+        assigned = optimal_assignment(driver_idx, passenger_idx, distances, seats, max_candidates_per_passenger)
+    elif assignment == "greedy":
+        assigned = greedy_assignment(driver_idx, passenger_idx, distances, seats)
+    elif assignment == "nearest":
+        assigned = nearest_assignment(driver_idx, passenger_idx, distances, seats)
+    else:
+        assigned = allocate_seats_sparse(driver_idx, passenger_idx, seats)
+    driver_idx, passenger_idx, distances = driver_idx[assigned], passenger_idx[assigned], distances[assigned]
+    if assignment == "nearest":
+        # Pasajeros de cada conductor del más cercano al más lejano
+        order = np.lexsort((distances, driver_idx))
+        driver_idx, passenger_idx, distances = driver_idx[order], passenger_idx[order], distances[order]
+
+    results = []
+    boundaries = np.flatnonzero(np.r_[True, driver_idx[1:] != driver_idx[:-1], True]) if len(driver_idx) else []
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        results.append((int(driver_idx[start]), passenger_idx[start:stop], distances[start:stop]))
+    return results
+
+def match_pool_vectorized(drivers, passengers, max_distance_km=5, destination_column="destino",
+                          normalize_destinations=True, use_spatial_index=False, index=None,
+                          assignment="first_fit",
+                          max_candidates_per_passenger=DEFAULT_MAX_CANDIDATES_PER_PASSENGER,
+                          time_window_minutes=None, pickup_mode="radius"):
+    """
+    Empareja conductores y pasajeros calculando las distancias Haversine con NumPy
+
+    Reproduce el criterio del algoritmo iterativo (radio desde el punto de partida del
+    conductor, mismo destino y cupos en orden del DataFrame) sin bucles por par. La
+    clave de destino se calcula una vez por fila y solo se comparan filas del mismo
+    destino. Con use_spatial_index (o un índice dado) solo se calculan distancias a los
+    pasajeros de las celdas vecinas de cada conductor en lugar de la matriz completa.
+    Con assignment='optimal' los cupos se resuelven como una asignación global con
+    capacidades sobre el grafo disperso de candidatos (ver wheels.assignment).
+
+    Args:
+        drivers (DataFrame): Conductores a procesar
+        passengers (DataFrame): Pasajeros candidatos
+        max_distance_km (float): Distancia máxima para emparejar
+        destination_column (str): Columna usada para comparar destinos
+        normalize_destinations (bool): Compara claves canónicas en lugar del valor exacto
+        use_spatial_index (bool): Construye índices GridIndex de pasajeros para este lote
+        index (GridIndex): Índice de pasajeros mantenido por el llamador, indexado por 'id'
+        assignment (str): Estrategia de cupos, ver ASSIGNMENT_STRATEGIES
+        max_candidates_per_passenger (int): Poda del grafo para assignment='optimal'
+        time_window_minutes (float): Diferencia máxima entre las horas de salida de
+            conductor y pasajero (None sin filtro, ver wheels.time_windows)
+        pickup_mode (str): 'radius' o 'corridor' (ver wheels.corridor.PICKUP_MODES)
+
+    Returns:
+        list: Tuplas (posición del conductor, posiciones de pasajeros, distancias en km)
+    """
+    if len(drivers) == 0 or len(passengers) == 0:
+        return []
+
+    driver_lat, driver_lng = pool_coordinates(drivers)
+    passenger_lat, passenger_lng = pool_coordinates(passengers)
+    driver_codes, passenger_codes = destination_codes(
+        pool_destination_keys(drivers, destination_column, normalize_destinations),
+        pool_destination_keys(passengers, destination_column, normalize_destinations)
+    )
+    dropoff_lat = dropoff_lng = None
+    if pickup_mode == "corridor":
+        if "dropoff_lat" in drivers.columns and "dropoff_lng" in drivers.columns:
+            dropoff_lat, dropoff_lng = pool_coordinates(drivers, "dropoff_lat", "dropoff_lng")
+        else:
+            dropoff_lat = dropoff_lng = np.full(len(drivers), np.nan)
+
+    return match_pool_arrays(
+        driver_lat, driver_lng, driver_codes, available_seats_array(drivers),
+        passenger_lat, passenger_lng, passenger_codes, max_distance_km,
+        use_spatial_index=use_spatial_index, index=index,
+        passenger_ids=passengers["id"].tolist() if index is not None else None,
+        assignment=assignment, max_candidates_per_passenger=max_candidates_per_passenger,
+        driver_minutes=pool_departure_minutes(drivers) if time_window_minutes is not None else None,
+        passenger_minutes=pool_departure_minutes(passengers) if time_window_minutes is not None else None,
+        time_window_minutes=time_window_minutes,
+        driver_dropoff_lat=dropoff_lat, driver_dropoff_lng=dropoff_lng
+    )
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se espera desde el primer disparo de un lote antes de ejecutarlo
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+
+class CoalescingWorkQueue:
+    """
+    Cola de trabajo que fusiona disparos cercanos en una sola ejecución
+
+    Cada disparo (notificación LISTEN o POST a /api/trigger-matchmaking) entra al lote
+    abierto. El lote se ejecuta debounce_seconds después de su primer disparo, en
+    cuanto haya un trabajador libre; mientras todos los trabajadores están ocupados el
+    lote sigue acumulando disparos. Así una ráfaga de inserciones produce una pasada
+    de matchmaking y nunca hay más de `workers` pasadas simultáneas.
+
+    Todos los disparos de un lote comparten el mismo Future con el resultado de
+    run(payloads). Los disparos que llegan durante una ejecución abren un lote nuevo,
+    porque esa ejecución pudo leer el pool antes del cambio.
+    """
+
+    def __init__(self, run, workers=1, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS, name="matchmaking"):
+        """
+        Args:
+            run (callable): Función que recibe la lista de payloads de un lote
+            workers (int): Ejecuciones simultáneas como máximo
+            debounce_seconds (float): Ventana para fusionar disparos en un lote
+            name (str): Prefijo de los hilos trabajadores
+        """
+        self.run = run
+        self.workers = max(1, int(workers))
+        self.debounce_seconds = max(0.0, float(debounce_seconds))
+        self.name = name
+        self._condition = threading.Condition()
+        self._threads = []
+        self._closed = False
+        # Lote abierto: (instante del primer disparo, payloads, Future)
+        self._batch = None
+        self._running = 0
+        self.triggers = 0
+        self.runs = 0
+        # Disparos que no generaron una ejecución propia (tamaño del lote - 1)
+        self.merged = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_run_ms = None
+        self.max_run_ms = 0.0
+        self._total_run_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    def submit(self, payload=None):
+        """
+        Agrega un disparo al lote abierto (o abre uno)
+
+        Args:
+            payload: Datos del disparo, se entregan a run() junto con los del lote
+
+        Returns:
+            Future: Resultado de la ejecución que cubre este disparo
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("La cola de trabajo está cerrada")
+            if self._batch is None:
+                self._batch = (time.monotonic(), [], Future())
+            self._batch[1].append(payload)
+            self.triggers += 1
+            self._start_workers()
+            self._condition.notify()
+            return self._batch[2]
+
+    def _start_workers(self):
+        # Los hilos se crean con el primer disparo, no al importar la API
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}-worker-{len(self._threads)}", daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._batch is None:
+                    if self._closed:
+                        return None
+                    self._condition.wait()
+                    continue
+                remaining = self._batch[0] + self.debounce_seconds - time.monotonic()
+                if remaining > 0 and not self._closed:
+                    self._condition.wait(remaining)
+                    continue
+                batch, self._batch = self._batch, None
+                self._running += 1
+                return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            first_at, payloads, future = batch
+            started = time.monotonic()
+            result, error = None, None
+            try:
+                result = self.run(payloads)
+            except Exception as e:
+                error = e
+                logger.error(f"❌ Error en la ejecución de la cola {self.name}: {e}")
+            # Las estadísticas se actualizan antes de entregar el resultado a los disparos
+            self._finish(len(payloads), (started - first_at) * 1000, (time.monotonic() - started) * 1000, error is not None)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _finish(self, batch_size, wait_ms, run_ms, failed):
+        with self._condition:
+            self._running -= 1
+            self.runs += 1
+            self.merged += batch_size - 1
+            self.failures += int(failed)
+            self.last_batch_size = batch_size
+            self.max_batch_size = max(self.max_batch_size, batch_size)
+            self.last_run_ms = run_ms
+            self.max_run_ms = max(self.max_run_ms, run_ms)
+            self._total_run_ms += run_ms
+            self._total_wait_ms += wait_ms
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Espera a que no queden lotes pendientes ni ejecuciones en curso
+
+        Returns:
+            bool: True si la cola quedó vacía antes del timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._batch is not None or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """Ejecuta el lote pendiente sin esperar la ventana y detiene los trabajadores"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """Profundidad de la cola, disparos fusionados y latencia de las ejecuciones"""
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "debounce_seconds": self.debounce_seconds,
+                "queue_depth": len(self._batch[1]) if self._batch is not None else 0,
+                "running": self._running,
+                "triggers": self.triggers,
+                "runs": self.runs,
+                "merged_triggers": self.merged,
+                "failures": self.failures,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "last_run_ms": round(self.last_run_ms, 1) if self.last_run_ms is not None else None,
+                "avg_run_ms": round(self._total_run_ms / self.runs, 1) if self.runs else None,
+                "max_run_ms": round(self.max_run_ms, 1),
+                "avg_wait_ms": round(self._total_wait_ms / self.runs, 1) if self.runs else None
+            }
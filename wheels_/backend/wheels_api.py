@@ -22,16 +22,31 @@ print()
 # Ahora continúa con los otros imports
 import json
 import logging
+import time
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+import numpy as np
 import pandas as pd
 from supabase import create_client, Client
-from geopy.distance import geodesic
-import requests
 
 # Importar el optimizador
 from pickup_optimization_service import PickupOptimizer, get_trip_data_for_driver
+from wheels.compact_pool import CompactPool, match_compact_pool
+from wheels.sharded_matching import DEFAULT_MIN_PARALLEL_SIZE
+from wheels.time_windows import record_departure_minutes, time_compatible
+from wheels.distance_provider import DEFAULT_CACHE_PRECISION, build_distance_provider
+from wheels.geo import haversine_km
+from wheels.travel_time import load_travel_time_estimator
+from wheels.async_distance import DEFAULT_MAX_CONCURRENCY
+from wheels.maps_client import get_maps_client
+from wheels.road_matching import DEFAULT_PREFILTER_SLACK, DEFAULT_ROAD_TOP_K, top_k_per_driver, two_stage_match
+from wheels.destinations import destination_keys
+from wheels.spatial_index import GridIndex, candidate_radius
+from wheels.pool_engine import IncrementalMatchEngine, fetch_user_neighborhood, record_seats
+from wheels.match_cache import MatchResultCache, pool_snapshot_version
+from wheels.match_store import MatchRefresher, MatchStore
+from wheels.profile_directory import profile_directory
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -45,72 +60,121 @@ CORS(app)
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://ozvjmkvmpxxviveniuwt.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "your-supabase-key")
 
+# Motor de matchmaking por defecto: 'legacy' (iterrows + Google Maps), 'vectorized' (matriz NumPy),
+# 'indexed' (NumPy + índice espacial de rejilla), 'incremental' (pool en memoria que solo
+# recalcula los conductores afectados por cada cambio del searching_pool) o 'road' (prefiltro
+# Haversine y confirmación por carretera en lotes de Distance Matrix, ver wheels.road_matching)
+MATCHMAKING_ENGINE = os.getenv("MATCHMAKING_ENGINE", "legacy")
+
+# Asignación de cupos: 'first_fit' (orden del pool), 'optimal' (asignación global de costo mínimo,
+# un conductor por pasajero), 'greedy' (asignación global voraz por distancia) o 'nearest' (cada
+# conductor toma sus pasajeros más cercanos; también en los motores incremental y road)
+MATCHMAKING_ASSIGNMENT = os.getenv("MATCHMAKING_ASSIGNMENT", "first_fit")
+
+# Procesos de trabajo de los motores vectorizados: con más de uno, los pools de al menos
+# MATCHMAKING_PARALLEL_MIN_POOL registros se reparten por destino entre procesos
+MATCHMAKING_WORKERS = int(os.getenv("MATCHMAKING_WORKERS", "1"))
+MATCHMAKING_PARALLEL_MIN_POOL = int(os.getenv("MATCHMAKING_PARALLEL_MIN_POOL", str(DEFAULT_MIN_PARALLEL_SIZE)))
+
+# Ventana de salida en minutos: solo se emparejan conductores y pasajeros cuyas horas de salida
+# (trip_datetime / hora_viaje) difieren a lo sumo en este valor. Vacío desactiva el filtro;
+# los registros sin hora de salida se emparejan con cualquier hora
+MATCHMAKING_TIME_WINDOW_MINUTES = (
+    float(os.getenv("MATCHMAKING_TIME_WINDOW_MINUTES")) if os.getenv("MATCHMAKING_TIME_WINDOW_MINUTES") else None
+)
+
+# Motores 'road' y 'legacy': candidatos por conductor que pasan a Distance Matrix (los más cercanos
+# en línea recta, al menos tantos como cupos) y, en 'road', fracción de la distancia máxima usada
+# como radio en línea recta del prefiltro (1.0 no descarta pares válidos)
+MATCHMAKING_ROAD_TOP_K = int(os.getenv("MATCHMAKING_ROAD_TOP_K", str(DEFAULT_ROAD_TOP_K)))
+MATCHMAKING_PREFILTER_SLACK = float(os.getenv("MATCHMAKING_PREFILTER_SLACK", str(DEFAULT_PREFILTER_SLACK)))
+
+# Modo de recogida: 'radius' (a menos de la distancia máxima del punto de partida del conductor)
+# o 'corridor' (también a lo largo del trayecto hasta dropoff_lat/dropoff_lng, ver wheels.corridor)
+MATCHMAKING_PICKUP_MODE = os.getenv("MATCHMAKING_PICKUP_MODE", "radius")
+
+# Segundos entre lecturas completas del searching_pool en el motor incremental
+# (entre ellas solo se leen las filas con updated_at posterior a la última lectura)
+POOL_FULL_RESYNC_SECONDS = int(os.getenv("POOL_FULL_RESYNC_SECONDS", "300"))
+
+# Consulta de /api/matches/<user_email>: 'targeted' (solo los registros cercanos al usuario)
+# o 'global' (matchmaking completo filtrado por correo). Solo los motores en línea recta de
+# TARGETED_ENGINES usan 'targeted': 'legacy' y 'road' confirman los pares por carretera con
+# distance_provider, y las asignaciones globales ('optimal', 'greedy') y el modo corredor
+# dependen de todo el pool; todos ellos siempre usan 'global'.
+USER_MATCHES_MODE = os.getenv("USER_MATCHES_MODE", "targeted")
+TARGETED_ENGINES = ("vectorized", "indexed", "incremental")
+
+# Caché de resultados de matchmaking indexada por la versión del searching_pool
+# (MATCH_CACHE_MAX_ENTRIES=0 la desactiva)
+match_cache = MatchResultCache(
+    max_entries=int(os.getenv("MATCH_CACHE_MAX_ENTRIES", "256")),
+    max_age_seconds=float(os.getenv("MATCH_CACHE_MAX_AGE_SECONDS", "300"))
+)
+
+# Tiempo de manejo de las estimaciones en línea recta: con TRAVEL_TIME_MODEL_PATH la tabla de
+# coeficientes ajustada con las observaciones de Google de la caché en disco
+# (python -m wheels.travel_time DISTANCE_CACHE_PATH salida.json); sin ella 1.5 min/km
+travel_time_estimator = load_travel_time_estimator()
+
+# Proveedor de distancias por carretera de los motores 'legacy' y 'road': 'google' (Distance
+# Matrix, con Haversine para los pares sin respuesta o sin clave), 'road_graph' (rutas sobre el
+# grafo vial local de ROAD_GRAPH_PATH, sin red ni costo) o 'haversine' (sin red).
+# Las consultas a Google pasan por una caché de dos niveles: DISTANCE_CACHE_MAX_ENTRIES pares en
+# memoria y, con DISTANCE_CACHE_PATH, un archivo SQLite que sobrevive a los reinicios. Los pares
+# duran DISTANCE_CACHE_MAX_AGE_SECONDS (el cache_expiry de config_google_maps) y las coordenadas
+# se redondean a DISTANCE_CACHE_PRECISION decimales (ver wheels.distance_provider). Los bloques
+# de Distance Matrix que faltan se piden en paralelo, hasta DISTANCE_CONCURRENCY a la vez
+distance_provider = build_distance_provider(
+    os.getenv("DISTANCE_PROVIDER", "google"),
+    cache_entries=int(os.getenv("DISTANCE_CACHE_MAX_ENTRIES", "10000")),
+    cache_max_age_seconds=float(os.getenv("DISTANCE_CACHE_MAX_AGE_SECONDS", "3600")),
+    cache_precision=int(os.getenv("DISTANCE_CACHE_PRECISION", str(DEFAULT_CACHE_PRECISION))),
+    cache_path=os.getenv("DISTANCE_CACHE_PATH") or None,
+    concurrency=int(os.getenv("DISTANCE_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY))),
+    graph_path=os.getenv("ROAD_GRAPH_PATH") or None,
+    travel_time=travel_time_estimator
+)
+
+# Resultados precalculados: con MATCH_STORE_REFRESH_SECONDS > 0 un hilo recalcula el matchmaking
+# con esa cadencia y publica un snapshot en match_store; /api/python-matchmaking y
+# /api/matches/<user_email> leen el último snapshot en lugar de calcular en la petición.
+# MATCH_STORE_PATH guarda el snapshot en disco (ver wheels.match_store)
+MATCH_STORE_REFRESH_SECONDS = float(os.getenv("MATCH_STORE_REFRESH_SECONDS", "0"))
+match_store = MatchStore(path=os.getenv("MATCH_STORE_PATH") or None)
+match_refresher = MatchRefresher(lambda: refresh_match_store(), MATCH_STORE_REFRESH_SECONDS)
+
+# Pares descartados por cada etapa en el último cálculo del motor 'road'
+road_pipeline_stats = {}
+
+# Opciones del pool de esta API: el registro más reciente de cada correo y la clave canónica
+# de destino (las mismas de CompactPool en los motores vectorizados)
+POOL_OPTIONS = {"latest_per_user": True, "normalize_destinations": True}
+
+# Motor incremental compartido por todas las peticiones del proceso
+pool_engine = IncrementalMatchEngine(
+    time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES, pickup_mode=MATCHMAKING_PICKUP_MODE,
+    assignment=MATCHMAKING_ASSIGNMENT, **POOL_OPTIONS
+)
+
 def get_supabase_client():
     """Create and return Supabase client"""
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def calculate_google_maps_distance(origin, destination, api_key=None):
-    """Calcula distancia real usando Google Maps Distance Matrix API"""
-    try:
-        if not api_key:
-            api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-        
-        if not api_key:
-            logger.warning("⚠️ Google Maps API key no configurada, usando distancia espacial")
-            return calculate_haversine_distance(origin, destination)
-        
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-        params = {
-            'origins': f"{origin[0]},{origin[1]}",
-            'destinations': f"{destination[0]},{destination[1]}",
-            'key': api_key,
-            'units': 'metric',
-            'mode': 'driving',
-            'traffic_model': 'best_guess',
-            'departure_time': 'now'
-        }
-        
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if data['status'] != 'OK':
-            logger.error(f"❌ Error en Google Maps API: {data['status']}")
-            return calculate_haversine_distance(origin, destination)
-        
-        element = data['rows'][0]['elements'][0]
-        if element['status'] != 'OK':
-            logger.warning("⚠️ No se pudo calcular ruta, usando distancia espacial")
-            return calculate_haversine_distance(origin, destination)
-        
-        distance_km = element['distance']['value'] / 1000
-        duration = element['duration']['text']
-        duration_in_traffic = element.get('duration_in_traffic', {}).get('text', duration)
-        
-        return {
-            'distance': round(distance_km, 2),
-            'duration': duration_in_traffic,
-            'source': 'google_maps'
-        }
-        
-    except Exception as e:
-        logger.error(f"❌ Error al calcular distancia con Google Maps: {str(e)}")
-        return calculate_haversine_distance(origin, destination)
+def format_haversine_distance(distance_km, seconds=None):
+    """
+    Formatea una distancia espacial con el mismo esquema que DistanceBatch.result
 
-def calculate_haversine_distance(origin, destination):
-    """Fallback: Calcula distancia espacial usando fórmula de Haversine"""
-    try:
-        distance_km = geodesic(origin, destination).km
-        return {
-            'distance': round(distance_km, 2),
-            'duration': f"~{round(distance_km * 1.5)} min",
-            'source': 'haversine'
-        }
-    except:
-        return {
-            'distance': 999,
-            'duration': 'N/A',
-            'source': 'error'
-        }
+    Sin seconds la duración se estima solo con la distancia (travel_time_estimator.predict_km).
+    """
+    if seconds is None:
+        seconds = travel_time_estimator.predict_km(distance_km)
+    return {
+        'distance': round(float(distance_km), 2),
+        'duration': f"~{round(float(seconds) / 60)} min",
+        'duration_seconds': float(seconds),
+        'source': 'haversine'
+    }
 
 def get_wheels_dataframes():
     """Fetch all necessary data from Supabase"""
@@ -124,6 +188,9 @@ def get_wheels_dataframes():
         profiles_df = pd.DataFrame(profiles_response.data)
         searching_pool_df = pd.DataFrame(searching_pool_response.data)
         
+        # La lectura completa deja el directorio de perfiles al día
+        profile_directory.prime(profiles_response.data or [])
+        
         logger.info(f"✅ Loaded {len(profiles_df)} profiles, {len(searching_pool_df)} searching pool records")
         return profiles_df, searching_pool_df
         
@@ -131,13 +198,239 @@ def get_wheels_dataframes():
         logger.error(f"❌ Error fetching data: {str(e)}")
         raise
 
-# wheels_api.py - Actualizar la función match_rides_enhanced
+def build_passenger_match(passenger, distance_result):
+    """Construye la entrada de un pasajero dentro de 'pasajeros_asignados'"""
+    return {
+        "pasajero_correo": passenger.get("correo_usuario"),
+        "nombre": passenger.get("nombre_usuario", "Pasajero"),
+        "correo": passenger.get("correo_usuario"),
+        "pickup": passenger["pickup_address"],
+        "destino": passenger["destino"],
+        "distance_km": distance_result['distance'],
+        "duration": distance_result['duration'],
+        "distance_source": distance_result['source'],
+        "pickup_address": passenger["pickup_address"],
+        "dropoff_address": passenger["destino"],
+    }
+
+def build_driver_match(driver, available_seats, matched_passengers):
+    """Construye el match de un conductor con sus pasajeros asignados"""
+    driver_email = driver.get("correo_usuario")
+    return {
+        "conductor_correo": driver_email,
+        "conductor_id": driver["id"],
+        "nombre_conductor": driver.get("nombre_usuario", "Conductor"),
+        "correo_conductor": driver_email,
+        "pickup": driver["pickup_address"],
+        "destino": driver["destino"],
+        "available_seats": available_seats,
+        "price_per_seat": float(driver.get("price_per_seat") or 0),
+        "driver_pool_id": driver["id"],
+        "pasajeros_asignados": matched_passengers
+    }
+
+def match_rides_vectorized(pool, max_distance_km=5, use_spatial_index=False, assignment="first_fit"):
+    """Matchmaking vectorizado sobre el pool compacto: matriz Haversine conductor x pasajero en NumPy"""
+    drivers = pool.role("conductor")
+    passengers = pool.role("pasajero")
+    
+    matches = []
+    for driver_pos, passenger_positions, distances in match_compact_pool(
+        drivers, passengers, max_distance_km,
+        use_spatial_index=use_spatial_index, assignment=assignment,
+        workers=MATCHMAKING_WORKERS, min_parallel_size=MATCHMAKING_PARALLEL_MIN_POOL,
+        time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES, pickup_mode=MATCHMAKING_PICKUP_MODE
+    ):
+        positions = np.asarray(passenger_positions, dtype=np.int64)
+        seconds = travel_time_estimator.predict(
+            drivers.lat[driver_pos], drivers.lng[driver_pos], passengers.lat[positions], passengers.lng[positions]
+        )
+        matched_passengers = [
+            build_passenger_match(passengers.records[pos], format_haversine_distance(distance, duration))
+            for pos, distance, duration in zip(passenger_positions, distances, seconds)
+        ]
+        matches.append(build_driver_match(drivers.records[driver_pos], int(drivers.seats[driver_pos]), matched_passengers))
+    
+    return matches
+
+def match_rides_road(pool, max_distance_km=5, use_spatial_index=False, assignment="first_fit"):
+    """
+    Matchmaking en dos etapas sobre el pool compacto: prefiltro Haversine con los top-k
+    candidatos por conductor y confirmación por carretera en lotes de Distance Matrix.
+    Guarda en road_pipeline_stats cuántos pares descartó cada etapa.
+    """
+    drivers = pool.role("conductor")
+    passengers = pool.role("pasajero")
+    assigned, road, stats = two_stage_match(
+        drivers.lat, drivers.lng, drivers.destination_codes, drivers.seats,
+        passengers.lat, passengers.lng, passengers.destination_codes, distance_provider,
+        max_distance_km=max_distance_km, top_k=MATCHMAKING_ROAD_TOP_K, prefilter_slack=MATCHMAKING_PREFILTER_SLACK,
+        use_spatial_index=use_spatial_index, assignment=assignment,
+        driver_minutes=drivers.departure, passenger_minutes=passengers.departure,
+        time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES, eta_estimator=travel_time_estimator
+    )
+    road_pipeline_stats.clear()
+    road_pipeline_stats.update(stats)
+    logger.info(f"🛣️ Pipeline road: {stats}")
+    
+    matches = []
+    for driver_pos, passenger_positions, _ in assigned:
+        matched_passengers = [
+            build_passenger_match(passengers.records[pos], road[(driver_pos, int(pos))])
+            for pos in passenger_positions
+        ]
+        matches.append(build_driver_match(drivers.records[driver_pos], int(drivers.seats[driver_pos]), matched_passengers))
+    
+    return matches
+
+def get_searching_pool_records():
+    """Lee los registros crudos del searching_pool (sin convertirlos a DataFrame)"""
+    return get_supabase_client().table('searching_pool').select("*").execute().data or []
+
+def get_pool_engine():
+    """Sincroniza el motor incremental con los cambios del searching_pool y lo devuelve"""
+    pool_engine.sync(get_supabase_client(), full_resync_seconds=POOL_FULL_RESYNC_SECONDS)
+    return pool_engine
+
+def get_pool_version():
+    """
+    Versión del searching_pool usada en las claves de match_cache
+
+    Con el motor incremental es su contador de cambios (tras sincronizarlo, así
+    el cálculo posterior puede usar pool_engine sin volver a leer el pool); si no,
+    el número de filas y el updated_at más reciente.
+    """
+    if MATCHMAKING_ENGINE == "incremental":
+        return ("incremental", get_pool_engine().version)
+    return pool_snapshot_version(get_supabase_client())
+
+def build_engine_matches(driver_matches):
+    """Convierte los emparejamientos del motor en memoria al formato de respuesta"""
+    matches = []
+    for driver, passengers in driver_matches:
+        matched_passengers = [
+            build_passenger_match(passenger, format_haversine_distance(distance))
+            for passenger, distance in passengers
+        ]
+        matches.append(build_driver_match(driver, record_seats(driver), matched_passengers))
+    return matches
+
+def match_rides_incremental(engine):
+    """Matchmaking desde el motor en memoria: solo se recalculan los conductores afectados por cambios"""
+    matches = build_engine_matches(engine.matches())
+    logger.info(f"🎉 Total unique matches created (incremental, v{engine.version}): {len(matches)}")
+    return matches
+
+def use_targeted_user_matches():
+    """True si /api/matches/<user_email> da el mismo resultado leyendo solo el vecindario del usuario"""
+    return (
+        USER_MATCHES_MODE == "targeted" and MATCHMAKING_ENGINE in TARGETED_ENGINES
+        and MATCHMAKING_ASSIGNMENT in ("first_fit", "nearest") and MATCHMAKING_PICKUP_MODE == "radius"
+    )
+
+def match_rides_for_user(user_email, max_distance_km=5):
+    """Emparejamientos de un solo usuario leyendo solo los registros cercanos (o el motor en memoria)"""
+    if MATCHMAKING_ENGINE == "incremental":
+        # Ya sincronizado por get_pool_version
+        driver_matches = pool_engine.user_matches(user_email)
+    else:
+        records = fetch_user_neighborhood(
+            get_supabase_client(), user_email, max_distance_km, latest_per_user=POOL_OPTIONS["latest_per_user"]
+        )
+        engine = IncrementalMatchEngine(
+            max_distance_km=max_distance_km, time_window_minutes=MATCHMAKING_TIME_WINDOW_MINUTES,
+            assignment=MATCHMAKING_ASSIGNMENT, **POOL_OPTIONS
+        )
+        engine.load_records(records)
+        driver_matches = engine.user_matches(user_email)
+    
+    matches = build_engine_matches(driver_matches)
+    logger.info(f"🎯 Targeted matches for {user_email}: {len(matches)}")
+    return matches
+
+def iter_all_matches():
+    """Matchmaking completo con el motor configurado, un match de conductor a la vez"""
+    if MATCHMAKING_ENGINE == "incremental":
+        # Ya sincronizado por get_pool_version
+        yield from match_rides_incremental(pool_engine)
+        return
+    
+    if MATCHMAKING_ENGINE in ("vectorized", "indexed", "road"):
+        # Los registros se leen directo al pool compacto, sin DataFrames
+        match_rides = match_rides_road if MATCHMAKING_ENGINE == "road" else match_rides_vectorized
+        matches = match_rides(
+            CompactPool.from_records(get_searching_pool_records(), **POOL_OPTIONS),
+            use_spatial_index=(MATCHMAKING_ENGINE == "indexed"), assignment=MATCHMAKING_ASSIGNMENT
+        )
+        logger.info(f"🎉 Total unique matches created ({MATCHMAKING_ENGINE}, compact): {len(matches)}")
+        yield from matches
+        return
+    
+    profiles_df, searching_pool_df = get_wheels_dataframes()
+    if searching_pool_df.empty:
+        return
+    yield from iter_rides_enhanced(searching_pool_df, profiles_df)
+
+def compute_all_matches():
+    """Matchmaking completo con el motor configurado (lo que guarda match_cache)"""
+    return list(iter_all_matches())
+
+def refresh_match_store():
+    """Calcula el matchmaking completo (o lo toma de match_cache) y publica el snapshot"""
+    version = get_pool_version()
+    matches = [] if version == (0, None) else match_cache.get_or_compute((version, "all"), compute_all_matches)
+    match_store.publish(version, matches)
+    return matches
+
+def latest_snapshot():
+    """
+    Último snapshot para las lecturas (None si MATCH_STORE_REFRESH_SECONDS lo desactiva)
+
+    La primera lectura arranca el hilo de refresco y, si todavía no hay snapshot,
+    calcula el primero.
+    """
+    if not match_refresher.start():
+        return None
+    snapshot = match_store.latest()
+    if snapshot is None:
+        match_refresher.refresh_now()
+        snapshot = match_store.latest()
+    return snapshot
 
-def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
-    """Algoritmo de matchmaking mejorado que previene duplicados y simplifica la lógica de distancia."""
+def iter_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5, engine=None, assignment=None):
+    """
+    Algoritmo de matchmaking mejorado que previene duplicados y simplifica la lógica de distancia.
+    Es un generador: cada match de conductor se entrega en cuanto está completo.
+    """
     try:
         logger.info(f"📊 Total registros en searching_pool: {len(searching_pool_df)}")
         
+        if (engine or MATCHMAKING_ENGINE) == "incremental":
+            # El motor compara la lectura con su estado y solo recalcula lo que cambió
+            pool_engine.load_dataframe(searching_pool_df)
+            yield from match_rides_incremental(pool_engine)
+            return
+        
+        engine = engine or MATCHMAKING_ENGINE
+        assignment = assignment or MATCHMAKING_ASSIGNMENT
+        if (assignment != "first_fit" or MATCHMAKING_PICKUP_MODE == "corridor") and engine == "legacy":
+            # La asignación global y el modo corredor se resuelven sobre el grafo de candidatos
+            # del motor vectorizado
+            engine = "vectorized"
+        
+        if engine in ("vectorized", "indexed", "road"):
+            # Filtro, deduplicación por correo y columnas NumPy en una sola pasada, sin copias del pool
+            pool = CompactPool.from_dataframe(searching_pool_df, **POOL_OPTIONS)
+            logger.info(f"📊 Registros activos y únicos en el pool compacto: {len(pool)}")
+            match_rides = match_rides_road if engine == "road" else match_rides_vectorized
+            matches = match_rides(
+                pool, max_distance_km,
+                use_spatial_index=(engine == "indexed"), assignment=assignment
+            )
+            logger.info(f"🎉 Total unique matches created ({engine}): {len(matches)}")
+            yield from matches
+            return
+        
         # Filtro inicial para registros activos
         active_pool = searching_pool_df[
             (searching_pool_df["status"].isna()) |
@@ -149,7 +442,7 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
         
         if active_pool.empty:
             logger.warning("⚠️ No hay registros activos en searching pool")
-            return []
+            return
         
         # --- INICIO DE LA CORRECCIÓN CLAVE #1: ELIMINAR DUPLICADOS ---
         # Limpiamos los datos ANTES de procesarlos para evitar bucles innecesarios.
@@ -162,54 +455,102 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
         logger.info(f"🔍 Found {len(drivers)} unique drivers and {len(passengers)} unique passengers after deduplication.")
         
         if len(drivers) == 0 or len(passengers) == 0:
-            return []
-        
-        matches = []
-        
-        # Itera sobre los conductores únicos
+            return
+        
+        # Clave canónica de destino calculada una vez por fila; los pasajeros se agrupan
+        # por destino (hash join) y cada grupo tiene su índice espacial, así cada conductor
+        # solo revisa pasajeros de su mismo destino en las celdas vecinas
+        drivers["destination_key"] = destination_keys(drivers, "destino")
+        passengers["destination_key"] = destination_keys(passengers, "destino")
+        passenger_buckets = {}
+        for key, bucket in passengers.groupby("destination_key", sort=False):
+            passenger_buckets[key] = (bucket, GridIndex.from_points(
+                bucket.index, bucket["pickup_lat"], bucket["pickup_lng"], cell_km=candidate_radius(max_distance_km)
+            ))
+        
+        total_matches = 0
+        
+        # Primera pasada: candidatos de cada conductor único (mismo destino, cercanos y en la
+        # ventana de salida) sin consultar distancias todavía
+        plans = []
         for _, driver in drivers.iterrows():
             try:
                 if pd.isna(driver.get("pickup_lat")) or pd.isna(driver.get("pickup_lng")):
                     continue
                 
                 driver_location = (driver["pickup_lat"], driver["pickup_lng"])
-                driver_destination = driver["destino"]
                 available_seats = int(driver.get("available_seats", 1))
                 driver_email = driver.get("correo_usuario")
                 
                 if not driver_email:
                     continue
                 
+                if driver["destination_key"] not in passenger_buckets:
+                    continue
+                
+                bucket, bucket_index = passenger_buckets[driver["destination_key"]]
+                nearby, _ = bucket_index.query_radius(
+                    driver["pickup_lat"], driver["pickup_lng"], candidate_radius(max_distance_km)
+                )
+                
+                # Pasajeros únicos cercanos con el mismo destino (en el orden original)
+                candidates = []
+                for _, passenger in bucket[bucket.index.isin(nearby)].iterrows():
+                    if pd.isna(passenger.get("pickup_lat")) or pd.isna(passenger.get("pickup_lng")):
+                        continue
+                    
+                    # Ventana de salida: se descarta antes de consultar la distancia
+                    if MATCHMAKING_TIME_WINDOW_MINUTES is not None and not time_compatible(
+                        record_departure_minutes(driver), record_departure_minutes(passenger), MATCHMAKING_TIME_WINDOW_MINUTES
+                    ):
+                        continue
+                    candidates.append(passenger)
+                
+                plans.append((driver, driver_location, available_seats, driver_email, candidates))
+                
+            except Exception as e:
+                logger.error(f"❌ Error processing outer driver loop: {e}")
+                continue
+        
+        # Google cobra cada elemento: antes del lote cada conductor conserva solo sus
+        # MATCHMAKING_ROAD_TOP_K candidatos más cercanos en línea recta (al menos tantos como
+        # cupos), en el orden original, como el prefiltro del motor 'road'
+        origins = np.array([driver_location for _, driver_location, _, _, candidates in plans for _ in candidates],
+                           dtype=float).reshape(-1, 2)
+        destinations = np.array([(passenger["pickup_lat"], passenger["pickup_lng"])
+                                 for *_, candidates in plans for passenger in candidates], dtype=float).reshape(-1, 2)
+        keep = top_k_per_driver(
+            np.repeat(np.arange(len(plans)), [len(candidates) for *_, candidates in plans]),
+            haversine_km(origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1]),
+            np.maximum(MATCHMAKING_ROAD_TOP_K, np.array([seats for _, _, seats, _, _ in plans], dtype=int))
+        )
+        kept = iter(keep.tolist())
+        plans = [(driver, driver_location, available_seats, driver_email,
+                  [passenger for passenger in candidates if next(kept)])
+                 for driver, driver_location, available_seats, driver_email, candidates in plans]
+        
+        # --- INICIO DE LA CORRECCIÓN CLAVE #2: CÁLCULO DE DISTANCIA ---
+        # Siempre calculamos la distancia desde el PUNTO DE PARTIDA del conductor al pasajero.
+        # Esto evita el error de "0.0km" de comparar un pasajero consigo mismo.
+        # Los pares de todos los conductores se piden en un solo lote al proveedor, que los
+        # empaqueta en bloques origen x destino de Distance Matrix sin celdas de relleno
+        # (ver pack_pairs): nunca se cobran más elementos que pidiendo conductor por conductor.
+        distances = distance_provider.distances(
+            [tuple(origin) for origin in origins[keep].tolist()],
+            [tuple(destination) for destination in destinations[keep].tolist()]
+        )
+        # --- FIN DE LA CORRECCIÓN CLAVE #2 ---
+        
+        offset = 0
+        for driver, driver_location, available_seats, driver_email, candidates in plans:
+            try:
                 logger.info(f"🚗 Processing driver: {driver_email}")
                 
                 matched_passengers = []
-                
-                # Itera sobre los pasajeros únicos
-                for _, passenger in passengers.iterrows():
+                for position, passenger in enumerate(candidates, start=offset):
                     try:
-                        if pd.isna(passenger.get("pickup_lat")) or pd.isna(passenger.get("pickup_lng")):
-                            continue
-                        
                         passenger_email = passenger.get("correo_usuario")
-                        passenger_destination = passenger.get("destino")
-                        
-                        # Comprobación de destinos (sin cambios)
-                        destinations_match = False
-                        if str(driver_destination).lower().strip() == str(passenger_destination).lower().strip():
-                            destinations_match = True
-                        elif "universidad" in str(driver_destination).lower() and "universidad" in str(passenger_destination).lower():
-                            destinations_match = True
-                        
-                        if not destinations_match:
-                            continue
-                        
-                        passenger_location = (passenger["pickup_lat"], passenger["pickup_lng"])
-                        
-                        # --- INICIO DE LA CORRECCIÓN CLAVE #2: CÁLCULO DE DISTANCIA ---
-                        # Siempre calculamos la distancia desde el PUNTO DE PARTIDA del conductor al pasajero.
-                        # Esto evita el error de "0.0km" de comparar un pasajero consigo mismo.
-                        distance_result = calculate_google_maps_distance(driver_location, passenger_location)
-                        # --- FIN DE LA CORRECCIÓN CLAVE #2 ---
+                        distance_result = distances.result(position)
                         
                         logger.info(f"   👤 Checking passenger: {passenger_email} -> Distance: {distance_result['distance']}km")
 
@@ -221,20 +562,7 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
                             logger.info(f"      ❌ No more seats.")
                             break
                         
-                        passenger_name = passenger.get("nombre_usuario", "Pasajero")
-                        
-                        matched_passengers.append({
-                            "pasajero_correo": passenger_email,
-                            "nombre": passenger_name,
-                            "correo": passenger_email,
-                            "pickup": passenger["pickup_address"],
-                            "destino": passenger["destino"],
-                            "distance_km": distance_result['distance'],
-                            "duration": distance_result['duration'],
-                            "distance_source": distance_result['source'],
-                            "pickup_address": passenger["pickup_address"],
-                            "dropoff_address": passenger["destino"],
-                        })
+                        matched_passengers.append(build_passenger_match(passenger, distance_result))
                         
                         logger.info(f"      ✅ Matched passenger: {passenger_email}")
                         
@@ -243,35 +571,26 @@ def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5):
                         continue
                 
                 if matched_passengers:
-                    driver_name = driver.get("nombre_usuario", "Conductor")
-                    
-                    matches.append({
-                        "conductor_correo": driver_email,
-                        "conductor_id": driver["id"],
-                        "nombre_conductor": driver_name,
-                        "correo_conductor": driver_email,
-                        "pickup": driver["pickup_address"],
-                        "destino": driver_destination,
-                        "available_seats": available_seats,
-                        "price_per_seat": float(driver.get("price_per_seat", 0)),
-                        "driver_pool_id": driver["id"],
-                        "pasajeros_asignados": matched_passengers
-                    })
+                    total_matches += 1
+                    yield build_driver_match(driver, available_seats, matched_passengers)
                     
                     logger.info(f"🎯 Match created for driver {driver_email} with {len(matched_passengers)} passengers")
                 
             except Exception as e:
                 logger.error(f"❌ Error processing outer driver loop: {e}")
-                continue
+            finally:
+                offset += len(candidates)
         
-        logger.info(f"🎉 Total unique matches created: {len(matches)}")
-        return matches
+        logger.info(f"🎉 Total unique matches created: {total_matches}")
         
     except Exception as e:
         logger.error(f"❌ FATAL Error in matching algorithm: {str(e)}")
         import traceback
         traceback.print_exc()
-        return []
+
+def match_rides_enhanced(searching_pool_df, profiles_df, max_distance_km=5, engine=None, assignment=None):
+    """Lista completa de matches de iter_rides_enhanced ([] si falla el algoritmo)"""
+    return list(iter_rides_enhanced(searching_pool_df, profiles_df, max_distance_km, engine, assignment))
 # ============================================================================
 # 🔹 ENDPOINTS - MATCHMAKING
 # ============================================================================
@@ -293,7 +612,12 @@ def health_check():
                 "matchmaking": "enabled",
                 "route_optimization": "enabled",
                 "trip_management": "enabled"
-            }
+            },
+            "match_cache": match_cache.stats(),
+            "distance_cache": distance_provider.stats(),
+            "match_store": match_store.stats(),
+            "maps_client": get_maps_client().stats(),
+            "travel_time": travel_time_estimator.stats()
         })
     except Exception as e:
         logger.error(f"❌ Health check failed: {str(e)}")
@@ -304,15 +628,92 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+def wants_ndjson():
+    """Indica si la petición pide los matches en streaming NDJSON (?stream=1 o Accept: application/x-ndjson)"""
+    return (
+        request.args.get("stream", "").lower() in ("1", "true", "yes")
+        or "application/x-ndjson" in request.headers.get("Accept", "")
+    )
+
+def ndjson_line(record):
+    """Serializa un registro como una línea NDJSON (mismo codificador que jsonify)"""
+    return app.json.dumps(record) + "\n"
+
+def stream_matchmaking(version):
+    """
+    Respuesta NDJSON de /api/python-matchmaking: una línea {"type": "match"} por conductor
+    en cuanto su match está completo y una línea final {"type": "summary"} con el total y
+    los tiempos ({"type": "error"} si el cálculo falla después de enviar el código HTTP)
+    """
+    started = time.perf_counter()
+    
+    def generate():
+        total = 0
+        first_match_ms = None
+        try:
+            if version != (0, None):
+                for match in match_cache.iter_or_compute((version, "all"), iter_all_matches):
+                    if first_match_ms is None:
+                        first_match_ms = round((time.perf_counter() - started) * 1000, 1)
+                    total += 1
+                    yield ndjson_line({"type": "match", "match": match})
+            
+            summary = {
+                "type": "summary",
+                "success": True,
+                "total_matches": total,
+                "first_match_ms": first_match_ms,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                "timestamp": datetime.now().isoformat(),
+                "message": f"Matchmaking completed. Found {total} matches."
+            }
+            if MATCHMAKING_ENGINE == "road":
+                summary["pipeline"] = dict(road_pipeline_stats)
+            logger.info(f"✅ Matchmaking streamed: {total} matches found")
+            yield ndjson_line(summary)
+        
+        except Exception as e:
+            logger.error(f"❌ Error streaming matchmaking: {str(e)}")
+            yield ndjson_line({
+                "type": "error",
+                "success": False,
+                "error": str(e),
+                "total_matches": total,
+                "timestamp": datetime.now().isoformat()
+            })
+    
+    # X-Accel-Buffering evita que un proxy nginx junte las líneas antes de enviarlas
+    return Response(
+        stream_with_context(generate()), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"}
+    )
+
 @app.route('/api/python-matchmaking', methods=['POST', 'GET'])
 def run_matchmaking():
-    """Main matchmaking endpoint"""
+    """Main matchmaking endpoint (NDJSON con ?stream=1)"""
     try:
         logger.info("🚀 Starting matchmaking process...")
         
-        profiles_df, searching_pool_df = get_wheels_dataframes()
+        snapshot = None if wants_ndjson() else latest_snapshot()
+        if snapshot is not None:
+            # Lectura del resultado precalculado por el trabajador de fondo
+            response = {
+                "success": True,
+                "matches": snapshot.matches,
+                "total_matches": len(snapshot.matches),
+                "snapshot": snapshot.describe(),
+                "timestamp": datetime.now().isoformat(),
+                "message": f"Matchmaking snapshot served. Found {len(snapshot.matches)} matches."
+            }
+            if MATCHMAKING_ENGINE == "road":
+                response["pipeline"] = dict(road_pipeline_stats)
+            return jsonify(response)
+        
+        version = get_pool_version()
+        
+        if wants_ndjson():
+            return stream_matchmaking(version)
         
-        if searching_pool_df.empty:
+        if version == (0, None):
             return jsonify({
                 "success": True,
                 "matches": [],
@@ -321,7 +722,8 @@ def run_matchmaking():
                 "timestamp": datetime.now().isoformat()
             })
         
-        matches = match_rides_enhanced(searching_pool_df, profiles_df)
+        # Run matching algorithm (o resultado guardado si el pool no cambió)
+        matches = match_cache.get_or_compute((version, "all"), compute_all_matches)
         
         response = {
             "success": True,
@@ -330,6 +732,8 @@ def run_matchmaking():
             "timestamp": datetime.now().isoformat(),
             "message": f"Matchmaking completed. Found {len(matches)} matches."
         }
+        if MATCHMAKING_ENGINE == "road":
+            response["pipeline"] = dict(road_pipeline_stats)
         
         logger.info(f"✅ Matchmaking completed: {len(matches)} matches found")
         return jsonify(response)
@@ -350,8 +754,26 @@ def get_user_matches(user_email):
     try:
         logger.info(f"🔍 Getting matches for user: {user_email}")
         
-        profiles_df, searching_pool_df = get_wheels_dataframes()
-        all_matches = match_rides_enhanced(searching_pool_df, profiles_df)
+        snapshot = latest_snapshot()
+        if snapshot is not None:
+            # Índice por correo del resultado precalculado
+            user_matches = list(snapshot.for_user(user_email))
+            return jsonify({
+                "success": True,
+                "user_email": user_email,
+                "matches": user_matches,
+                "total_matches": len(user_matches),
+                "snapshot": snapshot.describe(),
+                "timestamp": datetime.now().isoformat()
+            })
+        
+        version = get_pool_version()
+        if use_targeted_user_matches():
+            all_matches = match_cache.get_or_compute(
+                (version, "user", user_email), lambda: match_rides_for_user(user_email)
+            )
+        else:
+            all_matches = match_cache.get_or_compute((version, "all"), compute_all_matches)
         
         user_matches = []
         
@@ -391,11 +813,10 @@ def get_passenger_trip(user_email):
         supabase = get_supabase_client()
 
         # 1. Encuentra el ID de perfil del pasajero
-        profile_response = supabase.table('profiles').select("id").eq("email", user_email).execute()
-        if not profile_response.data:
+        passenger_id = profile_directory.get_id(supabase, user_email)
+        if passenger_id is None:
             logger.warning(f"⚠️ No se encontró el perfil para el pasajero: {user_email}")
             return jsonify({"success": False, "error": "Pasajero no encontrado"}), 404
-        passenger_id = profile_response.data[0]['id']
         logger.info(f"📄 ID de perfil del pasajero: {passenger_id} para el email: {user_email}")
 
         # 2. Busca todos los viajes en estado 'in_progress'
@@ -894,13 +1315,12 @@ def get_driver_active_trip(driver_email):
         # --- INICIO DE LA CORRECCIÓN ---
 
         # 1. Obtener el ID de perfil (UUID) del conductor a partir de su email.
-        profile_response = supabase.table('profiles').select("id").eq("email", driver_email).execute()
+        driver_id = profile_directory.get_id(supabase, driver_email)
         
-        if not profile_response.data:
+        if driver_id is None:
             logger.warning(f"⚠️ No se encontró el perfil para el conductor: {driver_email}")
             return jsonify({"success": False, "message": "Conductor no encontrado"}), 404
         
-        driver_id = profile_response.data[0]['id']
         logger.info(f"📄 ID de perfil del conductor: {driver_id}")
 
         # 2. Buscar directamente en 'trip_data' un viaje 'in_progress' para este driver_id.
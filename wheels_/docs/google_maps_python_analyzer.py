@@ -5,20 +5,27 @@ Análisis de direcciones usando Google Maps APIs
 """
 
 import os
+import sys
 import json
-import requests
 import pandas as pd
 from typing import Dict, List, Optional, Tuple
-import time
 from datetime import datetime
 
+# Añadir el directorio backend al path para importar la configuración y el paquete wheels
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+
+from config_google_maps import API_CONFIG
+from wheels.maps_client import MapsClient
+
 class GoogleMapsAnalyzer:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, client: MapsClient = None):
         """
         Inicializar el analizador de Google Maps
         
         Args:
             api_key (str): Tu API key de Google Maps
+            client (MapsClient): Cliente HTTP (por defecto uno con los valores de API_CONFIG:
+                timeout, reintentos y límite de tasa en lugar de pausas fijas)
         """
         self.api_key = api_key or os.getenv('GOOGLE_MAPS_API_KEY')
         if not self.api_key:
@@ -30,6 +37,9 @@ class GoogleMapsAnalyzer:
         self.places_url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
         self.directions_url = "https://maps.googleapis.com/maps/api/directions/json"
         
+        # Sesión con keep-alive, timeout, reintentos y límite de tasa compartidos por todas las APIs
+        self.client = client or MapsClient.from_config(API_CONFIG)
+        
         # Cache para evitar llamadas repetidas
         self.cache = {}
         
@@ -53,7 +63,7 @@ class GoogleMapsAnalyzer:
         }
         
         try:
-            response = requests.get(self.geocoding_url, params=params)
+            response = self.client.get(self.geocoding_url, params=params)
             data = response.json()
             
             if data['status'] == 'OK':
@@ -95,7 +105,7 @@ class GoogleMapsAnalyzer:
         }
         
         try:
-            response = requests.get(self.geocoding_url, params=params)
+            response = self.client.get(self.geocoding_url, params=params)
             data = response.json()
             
             if data['status'] == 'OK':
@@ -143,7 +153,7 @@ class GoogleMapsAnalyzer:
         }
         
         try:
-            response = requests.get(self.distance_matrix_url, params=params)
+            response = self.client.get(self.distance_matrix_url, params=params)
             data = response.json()
             
             if data['status'] == 'OK':
@@ -197,7 +207,7 @@ class GoogleMapsAnalyzer:
             params['radius'] = radius
         
         try:
-            response = requests.get(self.places_url, params=params)
+            response = self.client.get(self.places_url, params=params)
             data = response.json()
             
             if data['status'] == 'OK':
@@ -243,7 +253,7 @@ class GoogleMapsAnalyzer:
         }
         
         try:
-            response = requests.get(self.directions_url, params=params)
+            response = self.client.get(self.directions_url, params=params)
             data = response.json()
             
             if data['status'] == 'OK':
@@ -326,9 +336,6 @@ class GoogleMapsAnalyzer:
                 }
             
             results.append(result)
-            
-            # Pequeña pausa para evitar límites de rate
-            time.sleep(0.1)
         
         return pd.DataFrame(results)
     
@@ -382,9 +389,6 @@ class GoogleMapsAnalyzer:
                         }
                     
                     results.append(result)
-                    
-                    # Pequeña pausa para evitar límites de rate
-                    time.sleep(0.1)
         
         return pd.DataFrame(results)
     